@@ -1,5 +1,6 @@
 import asyncio
 import logging.config
+import multiprocessing
 import os
 import signal
 import sys
@@ -128,6 +129,9 @@ def init_boot_logger():
 
 
 if __name__ == "__main__":
+    # The channel processing workers are spawned processes, which re-run the frozen (PyInstaller) executable
+    multiprocessing.freeze_support()
+
     init_boot_logger()
     init_sentry_reporter()
 
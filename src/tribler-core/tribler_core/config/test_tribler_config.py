@@ -273,6 +273,10 @@ def test_get_set_chant_methods(tribler_config, state_dir):
     assert tribler_config.get_chant_channels_dir() == state_dir / 'test'
     tribler_config.set_chant_testnet(True)
     assert tribler_config.get_chant_testnet()
+    tribler_config.set_chant_signature_verification_workers(4)
+    assert tribler_config.get_chant_signature_verification_workers() == 4
+    tribler_config.set_chant_channel_processing_workers(0)
+    assert tribler_config.get_chant_channel_processing_workers() == 0
 
 
 def test_get_set_methods_popularity_community(tribler_config):
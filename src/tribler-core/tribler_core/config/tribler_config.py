@@ -185,6 +185,18 @@ class TriblerConfig:
     def get_chant_testnet(self):
         return 'TESTNET' in os.environ or 'CHANT_TESTNET' in os.environ or self.config['chant']['testnet']
 
+    def set_chant_signature_verification_workers(self, value):
+        self.config['chant']['signature_verification_workers'] = value
+
+    def get_chant_signature_verification_workers(self):
+        return self.config['chant']['signature_verification_workers']
+
+    def set_chant_channel_processing_workers(self, value):
+        self.config['chant']['channel_processing_workers'] = value
+
+    def get_chant_channel_processing_workers(self):
+        return self.config['chant']['channel_processing_workers']
+
     def get_state_dir(self):
         return self._state_dir
 
@@ -36,6 +36,8 @@ manager_enabled = boolean(default=True)
 channel_edit = boolean(default=False)
 channels_dir = string(default='channels')
 testnet = boolean(default=False)
+signature_verification_workers = integer(min=0, default=0)
+channel_processing_workers = integer(min=0, default=2)
 
 [torrent_checking]
 enabled = boolean(default=True)
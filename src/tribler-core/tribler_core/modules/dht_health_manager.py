@@ -1,7 +1,6 @@
 import math
 from asyncio import Future
 
-from ipv8.dht.routing import distance
 from ipv8.taskmanager import TaskManager
 
 from tribler_core.utilities.libtorrent_helper import libtorrent as lt
@@ -19,9 +18,10 @@ class DHTHealthManager(TaskManager):
         :param lt_session: The session used to perform health lookups.
         """
         TaskManager.__init__(self)
-        self.lookup_futures = {}    # Map from binary infohash to future
-        self.bf_seeders = {}        # Map from infohash to (final) seeders bloomfilter
-        self.bf_peers = {}          # Map from infohash to (final) peers bloomfilter
+        self.lookup_futures = {}       # Map from binary infohash to future
+        self.bf_seeders = {}           # Map from infohash to (final) seeders bloomfilter
+        self.bf_peers = {}             # Map from infohash to (final) peers bloomfilter
+        self.lookup_transactions = {}  # Map from the transaction ID of a get_peers request to binary infohashes
         self.lt_session = lt_session
 
     def get_health(self, infohash, timeout=15):
@@ -69,6 +69,10 @@ class DHTHealthManager(TaskManager):
             })
 
         self.lookup_futures.pop(infohash, None)
+        for transaction_id, infohashes in list(self.lookup_transactions.items()):
+            infohashes.discard(infohash)
+            if not infohashes:
+                self.lookup_transactions.pop(transaction_id)
 
     @staticmethod
     def combine_bloomfilters(bf1, bf2):
@@ -79,10 +83,8 @@ class DHTHealthManager(TaskManager):
         :return: A bytearray with the combined bloomfilter.
         """
         final_bf_len = min(len(bf1), len(bf2))
-        final_bf = bytearray(final_bf_len)
-        for bf_index in range(final_bf_len):
-            final_bf[bf_index] = bf1[bf_index] | bf2[bf_index]
-        return final_bf
+        final_bf = int.from_bytes(bf1[:final_bf_len], 'big') | int.from_bytes(bf2[:final_bf_len], 'big')
+        return bytearray(final_bf.to_bytes(final_bf_len, 'big'))
 
     @staticmethod
     def get_size_from_bloomfilter(bf):
@@ -91,51 +93,50 @@ class DHTHealthManager(TaskManager):
         :param bf: The bloom filter of which we estimate the size.
         :return: A rounded integer, approximating the number of items in the filter.
         """
-        def tobits(s):
-            result = []
-            for c in s:
-                num = ord(c) if isinstance(c, str) else c
-                bits = bin(num)[2:]
-                bits = '00000000'[len(bits):] + bits
-                result.extend([int(b) for b in bits])
-            return result
-
-        bits_array = tobits(bytes(bf))
-        total_zeros = 0
-        for bit in bits_array:
-            if bit == 0:
-                total_zeros += 1
-
+        m = 256 * 8
+        total_zeros = len(bf) * 8 - bin(int.from_bytes(bf, 'big')).count('1')
         if total_zeros == 0:
             return 6000  # The maximum capacity of the bloom filter used in BEP33
 
-        m = 256 * 8
         c = min(m - 1, total_zeros)
         return int(math.log(c / float(m)) / (2 * math.log(1 - 1 / float(m))))
 
-    def received_bloomfilters(self, node_id, bf_seeds=bytearray(256), bf_peers=bytearray(256)):
+    def sent_get_peers(self, transaction_id, infohash):
+        """
+        We have seen a get_peers request in the libtorrent DHT. Remember the transaction of the request, so that we
+        can match the responses to the lookup they belong to.
+        The requests of other nodes to us show up as well, and their transaction IDs are chosen by these nodes.
+        Only the requests for the infohashes of our lookups are remembered, and a transaction ID may end up being
+        used by several of our lookups at once, as the IDs are short.
+        :param transaction_id: The transaction ID of the request.
+        :param infohash: The infohash that is the target of the request.
+        """
+        if infohash in self.lookup_futures:
+            self.lookup_transactions.setdefault(transaction_id, set()).add(infohash)
+
+    def received_bloomfilters(self, node_id, bf_seeds=bytearray(256), bf_peers=bytearray(256), transaction_id=None):
         """
         We have received bloom filters from the libtorrent DHT. Register the bloom filters and process them.
         :param node_id: The ID of the node that sent the bloom filter.
         :param bf_seeds: The bloom filter indicating the IP addresses of the seeders.
         :param bf_peers: The bloom filter indicating the IP addresses of the peers (leechers).
+        :param transaction_id: The transaction ID of the get_peers request that the response belongs to.
         """
-        min_distance = -1
-        closest_infohash = None
-
-        # We do not know to which infohash the received get_peers response belongs so we have to manually go through
-        # the infohashes and find the infohash that is the closest to the node id that sent us the message.
-        for infohash in self.lookup_futures:
-            ih_distance = distance(infohash, node_id)
-            if ih_distance < min_distance or min_distance == -1:
-                min_distance = ih_distance
-                closest_infohash = infohash
-
-        if not closest_infohash:
-            self._logger.info("Could not find lookup infohash for incoming BEP33 bloomfilters")
+        infohashes = self.lookup_transactions.pop(transaction_id, None)
+        if infohashes is None:
+            # With a single lookup in progress, the response can not belong to another lookup
+            infohash = next(iter(self.lookup_futures)) if len(self.lookup_futures) == 1 else None
+        elif len(infohashes) == 1:
+            infohash = next(iter(infohashes))
+        else:
+            self._logger.info("Dropping BEP33 bloomfilters from %s: the transaction ID is used by %i lookups",
+                              hexlify(node_id), len(infohashes))
+            return
+
+        if infohash not in self.lookup_futures:
+            self._logger.info("Could not find lookup infohash for incoming BEP33 bloomfilters from %s",
+                              hexlify(node_id))
             return
 
-        self.bf_seeders[closest_infohash] = DHTHealthManager.combine_bloomfilters(
-            self.bf_seeders[closest_infohash], bf_seeds)
-        self.bf_peers[closest_infohash] = DHTHealthManager.combine_bloomfilters(
-            self.bf_peers[closest_infohash], bf_peers)
+        self.bf_seeders[infohash] = DHTHealthManager.combine_bloomfilters(self.bf_seeders[infohash], bf_seeds)
+        self.bf_peers[infohash] = DHTHealthManager.combine_bloomfilters(self.bf_peers[infohash], bf_peers)
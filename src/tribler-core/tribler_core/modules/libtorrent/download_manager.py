@@ -384,12 +384,17 @@ class DownloadManager(TaskManager):
 
         elif alert_type == "dht_pkt_alert":
             # We received a raw DHT message - decode it and check whether it is a BEP33 message.
+            # The get_peers requests are tracked, so that the responses can be matched by their transaction ID.
+            # These include the requests of other nodes to us, which the DHT health manager filters out.
             decoded = bdecode_compat(alert.pkt_buf)
-            if decoded and b'r' in decoded:
+            if decoded and decoded.get(b'q') == b'get_peers' and b'info_hash' in decoded.get(b'a', {}):
+                self.dht_health_manager.sent_get_peers(decoded.get(b't'), decoded[b'a'][b'info_hash'])
+            elif decoded and b'r' in decoded:
                 if b'BFsd' in decoded[b'r'] and b'BFpe' in decoded[b'r']:
                     self.dht_health_manager.received_bloomfilters(decoded[b'r'][b'id'],
                                                                   bytearray(decoded[b'r'][b'BFsd']),
-                                                                  bytearray(decoded[b'r'][b'BFpe']))
+                                                                  bytearray(decoded[b'r'][b'BFpe']),
+                                                                  transaction_id=decoded.get(b't'))
 
     def update_ip_filter(self, lt_session, ip_addresses):
         self._logger.debug('Updating IP filter %s', ip_addresses)
@@ -0,0 +1,278 @@
+# In-memory index of the search terms for autocompletion.
+#
+# Looking up completions in the database on every keystroke costs a full-text query and loading a bunch of ORM
+# objects, just to cut the terms out of their titles. Instead, all the terms of the titles are kept in memory along
+# with the number of titles containing them. The index is initially loaded from the vocabulary of FtsTerms, the
+# full-text index of the titles without stemming, and then follows the changes of the titles: SQL triggers log every
+# inserted, updated or deleted title to the AutocompleteLog table, which is passed to update_title before completing.
+# The terms are stored as a flattened trie: a sorted list of terms, where the terms starting with a prefix form
+# a contiguous range, found by binary search. New terms go to a small sorted list first, which is merged into
+# the large one when it grows too long, so adding a term does not move the whole list. The most frequent terms
+# of the prefixes with large ranges (which are the short ones) are cached and kept up to date.
+import heapq
+import logging
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+# The prefixes matching more terms than this have their most frequent terms cached
+TOP_TERMS_CACHE_THRESHOLD = 256
+# The number of the most frequent terms cached for a prefix. Requests for more terms bypass the cache.
+TOP_TERMS_CACHE_SIZE = 32
+# The number of new terms that are merged into the sorted list of all the terms at once
+NEW_TERMS_MERGE_SIZE = 1024
+# The number of the changes of the titles logged before the index gives up on them and reloads all the terms instead
+TERMS_LOG_SIZE_LIMIT = 100000
+
+# Sorts after any character that can appear in a term
+_MAX_CHAR = chr(0x10FFFF)
+
+# Same as the unicode61 tokenizer of FtsTerms: the terms are sequences of letters and digits
+_TERM_RE = re.compile(r"[^\W_]+")
+
+# The full-text index of the titles without stemming. It only serves as the vocabulary of the terms (FtsIndex
+# stems them), so it stores no positions. Like FtsIndex, it is maintained by SQL triggers.
+sql_create_terms_index = [
+    """CREATE VIRTUAL TABLE FtsTerms USING FTS5
+        (title, content='ChannelNode', detail=none, tokenize='unicode61 remove_diacritics 1')""",
+    "CREATE VIRTUAL TABLE FtsTermsVocab USING fts5vocab(FtsTerms, row)",
+    "INSERT INTO FtsTerms(FtsTerms) VALUES('rebuild')",
+    """CREATE TRIGGER terms_ai AFTER INSERT ON ChannelNode BEGIN
+        INSERT INTO FtsTerms(rowid, title) VALUES (new.rowid, new.title);
+    END""",
+    """CREATE TRIGGER terms_ad AFTER DELETE ON ChannelNode BEGIN
+        INSERT INTO FtsTerms(FtsTerms, rowid, title) VALUES ('delete', old.rowid, old.title);
+    END""",
+    """CREATE TRIGGER terms_au AFTER UPDATE OF title ON ChannelNode WHEN old.title IS NOT new.title BEGIN
+        INSERT INTO FtsTerms(FtsTerms, rowid, title) VALUES ('delete', old.rowid, old.title);
+        INSERT INTO FtsTerms(rowid, title) VALUES (new.rowid, new.title);
+    END""",
+]
+
+# The log of the changes of the titles, read by the in-memory index to follow them. The triggers only log the changes
+# while AutocompleteLogEnabled holds a row, that is while the index is loaded. Being written in the same transactions as
+# the titles, the log only ever shows the committed changes. If it grows too long, the logging is disabled and
+# the log is cleared, which makes the index reload the terms from FtsTermsVocab instead.
+sql_log_condition = "WHEN EXISTS (SELECT 1 FROM AutocompleteLogEnabled)"
+sql_log_overflow = f"""
+        DELETE FROM AutocompleteLogEnabled WHERE (SELECT max(id) FROM AutocompleteLog) >= {TERMS_LOG_SIZE_LIMIT};
+        DELETE FROM AutocompleteLog WHERE NOT EXISTS (SELECT 1 FROM AutocompleteLogEnabled);"""
+sql_create_terms_log = [
+    "CREATE TABLE AutocompleteLog (id INTEGER PRIMARY KEY, old_title TEXT, new_title TEXT)",
+    "CREATE TABLE AutocompleteLogEnabled (id INTEGER PRIMARY KEY)",
+    f"""CREATE TRIGGER terms_log_ai AFTER INSERT ON ChannelNode {sql_log_condition} BEGIN
+        INSERT INTO AutocompleteLog(old_title, new_title) VALUES (NULL, new.title);
+        {sql_log_overflow}
+    END""",
+    f"""CREATE TRIGGER terms_log_ad AFTER DELETE ON ChannelNode {sql_log_condition} BEGIN
+        INSERT INTO AutocompleteLog(old_title, new_title) VALUES (old.title, NULL);
+        {sql_log_overflow}
+    END""",
+    f"""CREATE TRIGGER terms_log_au AFTER UPDATE OF title ON ChannelNode
+        {sql_log_condition} AND old.title IS NOT new.title BEGIN
+        INSERT INTO AutocompleteLog(old_title, new_title) VALUES (old.title, new.title);
+        {sql_log_overflow}
+    END""",
+]
+
+# The index is up to date if it logs the changes and there are no changes in the log
+sql_terms_log_is_empty = """SELECT EXISTS (SELECT 1 FROM AutocompleteLogEnabled)
+    AND NOT EXISTS (SELECT 1 FROM AutocompleteLog)"""
+# Changes nothing if the logging is already enabled, but takes the write lock anyway
+sql_enable_terms_log = "INSERT OR IGNORE INTO AutocompleteLogEnabled(id) VALUES (1)"
+sql_select_terms_log = "SELECT old_title, new_title FROM AutocompleteLog ORDER BY id"
+sql_select_terms_vocab = "SELECT term, doc FROM FtsTermsVocab"
+sql_clear_terms_log = "DELETE FROM AutocompleteLog"
+sql_disable_terms_log = "DELETE FROM AutocompleteLogEnabled"
+
+
+def _table_exists(cursor, name):
+    cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return bool(cursor.fetchone()[0])
+
+
+def create_terms_index(connection):
+    """
+    Create the FtsTerms index, the log of the changes of the titles and the triggers that maintain them,
+    if they do not exist yet. The index of an existing database is filled in from the ChannelNode table.
+    :return: True if the index was created, False if it already existed
+    """
+    cursor = connection.cursor()
+    created = False
+    if not _table_exists(cursor, 'FtsTerms'):
+        for sql in sql_create_terms_index:
+            cursor.execute(sql)
+        created = True
+    if not _table_exists(cursor, 'AutocompleteLog'):
+        for sql in sql_create_terms_log:
+            cursor.execute(sql)
+        created = True
+    return created
+
+
+def reset_terms_log(connection):
+    """
+    Stop logging the changes of the titles and clear the log. Called on startup, as the index is not loaded yet.
+    """
+    cursor = connection.cursor()
+    cursor.execute(sql_disable_terms_log)
+    cursor.execute(sql_clear_terms_log)
+
+
+def drop_terms_index(connection):
+    cursor = connection.cursor()
+    cursor.execute("select name from sqlite_master where type='trigger' and name like 'terms_%'")
+    for [trigger_name] in cursor.fetchall():
+        cursor.execute(f"drop trigger {trigger_name}")
+    cursor.execute("DROP TABLE IF EXISTS AutocompleteLogEnabled")
+    cursor.execute("DROP TABLE IF EXISTS AutocompleteLog")
+    cursor.execute("DROP TABLE IF EXISTS FtsTermsVocab")
+    cursor.execute("DROP TABLE IF EXISTS FtsTerms")
+
+
+def _remove_diacritics(text):
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def split_terms(text):
+    """
+    Split the text into lowercase terms with no diacritics, like the FtsTerms full-text index does.
+    """
+    return _TERM_RE.findall(_remove_diacritics(text.lower()))
+
+
+class AutocompleteIndex:
+    """
+    This class holds the search terms with their frequencies and looks up the most frequent terms by prefix.
+    It is thread-safe, as the completions are requested by several threads of the REST API. The updates from
+    the database must hold sync_lock, so they are applied in the order they were read.
+    """
+
+    def __init__(self):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.loaded = False
+        self.counts = {}  # term -> number of titles with the term
+        # All the terms, including those with no titles left, which are skipped. A term is in one of the lists.
+        self.terms = []
+        self.new_terms = []
+        # prefix -> list of (-count, term) tuples, sorted
+        self._top_terms = {}
+        self._lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def load(self, term_counts):
+        """
+        Replace the contents of the index with the given terms.
+        :param term_counts: an iterable of (term, number of titles with the term) tuples
+        """
+        counts = {term: count for term, count in term_counts if count > 0}
+        with self._lock:
+            self.counts = counts
+            self.terms = sorted(counts)
+            self.new_terms = []
+            self._top_terms = {}
+            self.loaded = True
+
+    def add_titles(self, titles):
+        """
+        Add the terms of the given titles to the index.
+        """
+        for title in titles:
+            self.update_title(None, title)
+
+    def update_title(self, old_title, new_title):
+        """
+        Update the terms of a title that was changed, added (old_title is None) or deleted (new_title is None).
+        Does nothing if the index is not loaded yet, as the titles will then be loaded along with the rest of
+        the vocabulary.
+        """
+        if not self.loaded:
+            return
+        old_terms = set(split_terms(old_title)) if old_title else set()
+        new_terms = set(split_terms(new_title)) if new_title else set()
+        with self._lock:
+            for term in old_terms - new_terms:
+                self._remove_term(term)
+            for term in new_terms - old_terms:
+                self._add_term(term)
+
+    def _contains(self, terms, term):
+        index = bisect_left(terms, term)
+        return index < len(terms) and terms[index] == term
+
+    def _add_term(self, term):
+        count = self.counts.get(term, 0) + 1
+        self.counts[term] = count
+        if count == 1 and not self._contains(self.terms, term) and not self._contains(self.new_terms, term):
+            insort(self.new_terms, term)
+            if len(self.new_terms) >= NEW_TERMS_MERGE_SIZE:
+                self._merge_new_terms()
+
+        # The count only grew, so the term is the only one that can enter the top terms of its prefixes
+        for length in range(1, len(term) + 1):
+            top_terms = self._top_terms.get(term[:length])
+            if top_terms is None:
+                continue
+            top_terms[:] = [entry for entry in top_terms if entry[1] != term]
+            top_terms.append((-count, term))
+            top_terms.sort()
+            del top_terms[TOP_TERMS_CACHE_SIZE:]
+
+    def _remove_term(self, term):
+        count = self.counts.get(term, 0) - 1
+        if count < 0:
+            return
+        if count:
+            self.counts[term] = count
+        else:
+            self.counts.pop(term)
+
+        # Another term can take the place of this one in the top terms of its prefixes, so these are recomputed
+        for length in range(1, len(term) + 1):
+            top_terms = self._top_terms.get(term[:length])
+            if top_terms is not None and any(entry[1] == term for entry in top_terms):
+                self._top_terms.pop(term[:length])
+
+    def _merge_new_terms(self):
+        # The terms without titles are dropped here
+        self.terms = [term for term in heapq.merge(self.terms, self.new_terms) if term in self.counts]
+        self.new_terms = []
+
+    def _iter_prefix(self, prefix):
+        for terms in (self.terms, self.new_terms):
+            start = bisect_left(terms, prefix)
+            end = bisect_left(terms, prefix + _MAX_CHAR, start)
+            for index in range(start, end):
+                count = self.counts.get(terms[index])
+                if count:
+                    yield -count, terms[index]
+
+    def _get_top_terms(self, prefix, max_terms):
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix + _MAX_CHAR, start)
+        if end - start <= TOP_TERMS_CACHE_THRESHOLD or max_terms > TOP_TERMS_CACHE_SIZE:
+            return heapq.nsmallest(max_terms, self._iter_prefix(prefix))
+        top_terms = self._top_terms.get(prefix)
+        if top_terms is None:
+            top_terms = self._top_terms[prefix] = heapq.nsmallest(TOP_TERMS_CACHE_SIZE, self._iter_prefix(prefix))
+        return top_terms[:max_terms]
+
+    def complete(self, text, max_terms):
+        """
+        Get the completions for the last term of the text, the most frequent terms first.
+        :return: a list of copies of the (lowercase, without diacritics) text with the last term completed
+        """
+        text = _remove_diacritics(text.lower())
+        match = None
+        for match in _TERM_RE.finditer(text):
+            pass
+        # Nothing to complete if the text does not end with a term
+        if match is None or match.end() != len(text) or max_terms <= 0:
+            return []
+        with self._lock:
+            top_terms = self._get_top_terms(match.group(), max_terms)
+        return [text[: match.start()] + term for _, term in top_terms]
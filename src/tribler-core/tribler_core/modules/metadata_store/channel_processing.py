@@ -0,0 +1,137 @@
+# Concurrent processing of downloaded channel directories.
+#
+# Reading, decompressing and verifying channel blobs is CPU-heavy, but independent for every blob, so it runs in
+# a pool of worker processes. Writing to the database, on the other hand, is done by a single writer thread,
+# one blob per transaction, to avoid fighting for the database lock.
+import logging
+import multiprocessing
+from asyncio import gather, get_event_loop
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import (
+    LZ4DecompressionException,
+    read_mdblob_file_pieces,
+)
+from tribler_core.modules.metadata_store.serialization import iter_signed_payloads_from_stream
+from tribler_core.modules.metadata_store.signature_verifier import verify_signatures
+from tribler_core.utilities.unicode import hexlify
+
+
+def load_verified_payloads(filepath):
+    """
+    Read, decompress and parse an mdblob file, and check the signatures of the payloads in it.
+    Runs in worker processes, so it must stay a top-level function.
+    :param filepath: the path to the mdblob file
+    :return: a tuple of (list of payloads with valid signatures, number of payloads with invalid signatures)
+    """
+    payloads = []
+    signed_entries = []
+    for payload, signed_data in iter_signed_payloads_from_stream(read_mdblob_file_pieces(filepath), False):
+        payloads.append(payload)
+        signed_entries.append((payload.public_key, bytes(signed_data), payload.signature))
+    verified = verify_signatures(signed_entries)
+    return [payload for payload, valid in zip(payloads, verified) if valid], verified.count(False)
+
+
+class ChannelProcessingScheduler:
+    """
+    This class processes several channel directories at once. The blobs of every channel are loaded by a pool of
+    worker processes and written to the database by a single writer thread. While a blob is being written,
+    the next blob of the same channel is already being loaded.
+    """
+
+    def __init__(self, mds, workers=2):
+        """
+        :param mds: the MetadataStore to write the channels' contents to
+        :param workers: the number of worker processes to use. If 0, the blobs are loaded in a thread instead.
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.mds = mds
+        # Forking a process that runs several threads can deadlock the child, so the workers are spawned instead
+        self.loader_pool = (
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            if workers > 0
+            else None
+        )
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ChannelWriter")
+
+    async def process_channels(self, channels):
+        """
+        Process the directories of the given channels concurrently.
+        :param channels: a list of channel ORM objects (used read-only!)
+        """
+        try:
+            await gather(*[self.process_channel(channel) for channel in channels])
+        finally:
+            # The writer thread has to close its connection to the database, see MetadataStore.disconnect_thread
+            await get_event_loop().run_in_executor(self.writer, self.mds.disconnect_thread)
+
+    async def process_channel(self, channel):
+        """
+        Process the directory of a single channel, blob by blob, in the order of their sequence numbers.
+        :param channel: the channel ORM object (used read-only!)
+        """
+        loop = get_event_loop()
+        next_load = None
+        try:
+            dirname = self.mds.get_channel_dir_path(channel)
+            blobs_to_process, total_blobs_size = self.mds.get_list_of_channel_blobs_to_process(
+                dirname, channel.start_timestamp
+            )
+            blobs_to_process = [
+                blob for blob in blobs_to_process if channel.local_version < blob[0] <= channel.timestamp
+            ]
+            self._logger.debug(
+                "Starting processing channel dir %s, %i blobs to process", dirname, len(blobs_to_process)
+            )
+
+            processed_blobs_size = total_blobs_size - sum(blob[2] for blob in blobs_to_process)
+            for index, (blob_sequence_number, full_filename, blob_size) in enumerate(blobs_to_process):
+                load = next_load or loop.run_in_executor(self.loader_pool, load_verified_payloads, str(full_filename))
+                try:
+                    payloads, num_rejected = await load
+                except LZ4DecompressionException:
+                    # Just like MetadataStore.process_mdblob_file, skip the blobs that fail to decompress
+                    self._logger.warning("Unable to decompress mdblob %s", full_filename)
+                    payloads, num_rejected = [], 0
+                # Start loading the next blob while this one is written to the database
+                next_load = None
+                if index + 1 < len(blobs_to_process):
+                    next_filename = str(blobs_to_process[index + 1][1])
+                    next_load = loop.run_in_executor(self.loader_pool, load_verified_payloads, next_filename)
+                if num_rejected:
+                    self._logger.warning(
+                        "Dropped %i payloads with invalid signatures in %s", num_rejected, full_filename
+                    )
+
+                processed_blobs_size += blob_size
+                progress = float(processed_blobs_size) / total_blobs_size if total_blobs_size else 1.0
+                proceed = await loop.run_in_executor(
+                    self.writer,
+                    self.mds.process_verified_channel_blob,
+                    channel.public_key,
+                    channel.id_,
+                    blob_sequence_number,
+                    payloads,
+                    progress,
+                )
+                if not proceed:
+                    break
+        except Exception as e:  # pylint: disable=broad-except
+            self._logger.error("Error when processing channel %s dir: %s", hexlify(channel.public_key), e)
+        finally:
+            # Also when the processing is cancelled, so the loader pool does not waste time on the next blob
+            if next_load is not None:
+                next_load.cancel()
+
+    async def shutdown(self):
+        """
+        Stop the loader processes and the writer thread, without blocking the event loop.
+        """
+        # The processes and the thread finish the blob they are working on, the queued blobs are cancelled
+        # along with the processing of their channels. The writer has to finish before the database is closed.
+        loop = get_event_loop()
+        if self.loader_pool is not None:
+            await loop.run_in_executor(None, self.loader_pool.shutdown)
+            self.loader_pool = None
+        await loop.run_in_executor(None, self.writer.shutdown)
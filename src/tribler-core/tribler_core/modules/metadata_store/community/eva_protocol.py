@@ -30,6 +30,7 @@
 
 import logging
 import math
+import tempfile
 import time
 from collections import defaultdict, deque
 from enum import Enum, auto
@@ -40,6 +41,9 @@ from ipv8.messaging.lazy_payload import VariablePayload, vp_compile
 
 logger = logging.getLogger('EVA')
 
+# The lower bound of the retransmit timeout that is derived from the round-trip time
+MIN_RETRANSMIT_TIMEOUT_IN_SEC = 0.2
+
 
 # fmt: off
 
@@ -67,6 +71,88 @@ class Error(VariablePayload):
     names = ['message']
 
 
+@vp_compile
+class SelectiveAcknowledgement(VariablePayload):
+    """The blocks received ahead of `number`. It is sent right before
+    the acknowledgement with the same number, which the peers that do not
+    know this message handle on their own.
+    """
+    format_list = ['I', 'I', 'raw']
+    names = ['number', 'nonce', 'received_blocks']
+
+
+@vp_compile
+class TransferError(VariablePayload):
+    """The error of the transfer with the given nonce. It is sent right before
+    the Error with the same message, which the peers that do not know this
+    message handle on their own.
+    """
+    format_list = ['I', 'raw']
+    names = ['nonce', 'message']
+
+
+def encode_received_blocks(first_block_number, block_numbers):
+    """Encode the numbers of the received blocks as a bitmap, where the bit i
+    (little-endian) marks the block `first_block_number + i`.
+    """
+    bitmap = 0
+    for block_number in block_numbers:
+        bitmap |= 1 << (block_number - first_block_number)
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+
+
+def decode_received_blocks(first_block_number, received_blocks, block_count):
+    """Decode the numbers of the received blocks among `block_count` blocks
+    starting from `first_block_number` from a bitmap produced by
+    `encode_received_blocks`.
+    """
+    bitmap = int.from_bytes(received_blocks[:block_count // 8 + 1], 'little')
+    return {first_block_number + i for i in range(block_count) if bitmap >> i & 1}
+
+
+class ReceiveBuffer:
+    """A buffer for the incoming data. The consecutive blocks are appended to
+    it in place.
+
+    The buffer only grows (geometrically) as the data comes, rather than being
+    allocated for the size announced in the write request, so a peer can not
+    make us allocate a large buffer just by announcing a large transfer.
+    The data bigger than `in_memory_size_limit` is written to a temporary file.
+    """
+
+    def __init__(self, data_size, in_memory_size_limit):
+        self.data_size = data_size
+        self.size = 0
+        self.data = None
+        self.file = None
+        if data_size > in_memory_size_limit:
+            self.file = tempfile.TemporaryFile()
+        else:
+            self.data = bytearray()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, block):
+        if self.file:
+            self.file.write(block)
+        else:
+            self.data += block
+        self.size += len(block)
+
+    def getvalue(self):
+        if self.file:
+            self.file.seek(0)
+            return self.file.read(self.size)
+        return bytes(self.data)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        self.data = None
+        self.file = None
+
+
 class TransferException(Exception):
     def __init__(self, transfer_type, info_binary, nonce, message):
         super().__init__(message)
@@ -91,6 +177,15 @@ class EVAProtocolMixin:
         * timeout
         * retransmit
         * dynamic window size
+        * selective acknowledgement: the receiver buffers the blocks that arrived
+            out of order and reports them along with the acknowledgement, so
+            the sender retransmits only the missing blocks
+        * congestion control: the receiver adapts the window size to the losses
+            (AIMD with slow start)
+        * concurrent transfers: the transfers are identified by the peer and
+            the nonce, so several transfers to a peer can be in flight at once.
+            The peers running the previous versions of the protocol get a single
+            transfer at a time, until they send a selective acknowledgement
 
     The maximum data size that can be transferred through the protocol can be
     calculated as "block_size * 4294967295" where 4294967295 is the max segment
@@ -101,18 +196,23 @@ class EVAProtocolMixin:
             self,
             block_size=1000,
             window_size_in_blocks=16,
+            max_window_size_in_blocks=128,
             start_message_id=186,
             retransmit_interval_in_sec=3,
             retransmit_attempt_count=3,
             timeout_interval_in_sec=10,
             binary_size_limit=1024 * 1024 * 1024,
+            in_memory_size_limit=32 * 1024 * 1024,
+            peer_budget_in_bytes=16 * 1024 * 1024,
     ):
         """Init should be called manually within his parent class.
 
         Args:
             block_size: a single block size in bytes. Please keep in mind that
                 ipv8 adds approx. 177 bytes to each packet.
-            window_size_in_blocks: size of consecutive blocks to send
+            window_size_in_blocks: the initial size of consecutive blocks to send
+            max_window_size_in_blocks: the limit for the window size that is
+                adapted by the congestion control
             start_message_id: a started id that will be used to assigning
                 protocol's messages ids
             retransmit_interval_in_sec: an interval until the next attempt
@@ -123,6 +223,13 @@ class EVAProtocolMixin:
             binary_size_limit: limit for binary data size. If this limit will be
                 exceeded, the exception will be returned through a registered
                 error handler
+            in_memory_size_limit: incoming data bigger than this limit is
+                received into a temporary file instead of the memory
+            peer_budget_in_bytes: limit for the total data size of the concurrent
+                transfers from (or to) a single peer. A transfer that does not
+                fit in the budget waits for the previous transfers to finish
+                (or is rejected, if it is an incoming one). A single transfer
+                can always exceed the budget.
         """
         self.last_message_id = start_message_id
         self.eva_messages = dict()
@@ -131,30 +238,35 @@ class EVAProtocolMixin:
             community=self,
             block_size=block_size,
             window_size_in_blocks=window_size_in_blocks,
+            max_window_size_in_blocks=max_window_size_in_blocks,
             retransmit_interval_in_sec=retransmit_interval_in_sec,
             retransmit_attempt_count=retransmit_attempt_count,
             scheduled_send_interval_in_sec=5,
             timeout_interval_in_sec=timeout_interval_in_sec,
             binary_size_limit=binary_size_limit,
+            in_memory_size_limit=in_memory_size_limit,
+            peer_budget_in_bytes=peer_budget_in_bytes,
         )
 
         # note:
         # The order in which _eva_register_message_handler is called defines
-        # the message wire format. Do not change it.
+        # the message wire format. Do not change it. New messages go after
+        # the existing ones, so the peers running the previous versions of
+        # the protocol can still talk to us.
         self._eva_register_message_handler(WriteRequest, self.on_eva_write_request)
         self._eva_register_message_handler(Acknowledgement, self.on_eva_acknowledgement)
         self._eva_register_message_handler(Data, self.on_eva_data)
         self._eva_register_message_handler(Error, self.on_eva_error)
+        self._eva_register_message_handler(SelectiveAcknowledgement, self.on_eva_selective_acknowledgement)
+        self._eva_register_message_handler(TransferError, self.on_eva_transfer_error)
 
     def eva_send_binary(self, peer, info_binary, data_binary, nonce=None):
         """Send a big binary data.
 
-        Due to ipv8 specifics, we can use only one socket port per one peer.
-        Therefore, at one point in time, the protocol can only transmit one particular
-        piece of data for one particular peer.
-
         In case "eva_send_binary" is invoked multiply times for a single peer, the data
-        transfer will be scheduled and performed when the current sending session is finished.
+        transfers are performed concurrently, as long as their total size fits
+        in the peer budget. The rest of the transfers will be scheduled and
+        performed as soon as the budget frees up.
 
         An example:
 
@@ -169,7 +281,8 @@ class EVAProtocolMixin:
                 It is limited by several GB, but the protocol is slow by design, so
                 try to send less rather than more.
             nonce: a uniq number for identifying the session. If not specified,
-                then `self.nonce + 1` will be used
+                then `self.nonce + 1` will be used. The transfers with the same
+                nonce to the same peer are performed one after another
         """
         self.eva_protocol.send_binary(peer, info_binary, data_binary, nonce)
 
@@ -228,6 +341,14 @@ class EVAProtocolMixin:
     async def on_eva_error(self, peer, payload):
         await self.eva_protocol.on_error(peer, payload)
 
+    @lazy_wrapper(SelectiveAcknowledgement)
+    async def on_eva_selective_acknowledgement(self, peer, payload):
+        await self.eva_protocol.on_selective_acknowledgement(peer, payload)
+
+    @lazy_wrapper(TransferError)
+    async def on_eva_transfer_error(self, peer, payload):
+        await self.eva_protocol.on_transfer_error(peer, payload)
+
     def _eva_register_message_handler(self, message_class, handler):
         self.add_message_handler(self.last_message_id, handler)
         self.eva_messages[message_class] = self.last_message_id
@@ -253,13 +374,60 @@ class Transfer:  # pylint: disable=too-many-instance-attributes
         self.attempt = 0
         self.nonce = nonce
         self.window_size = 0
+        self.slow_start_threshold = 0
+        # the window is not decreased again until the block before this one is received
+        self.recovery_block_number = 0
         self.acknowledgement_number = 0
-        self.updated = time.time()
+        # the buffer for the data of an incoming transfer
+        self.buffer = None
+        # the blocks received ahead of `block_number + 1`: block number -> data
+        self.out_of_order_blocks = dict()
+        # the acknowledgement number and the received blocks bitmap from
+        # the last selective acknowledgement of an outgoing transfer
+        self.received_blocks = None
+        # whether the peer of an outgoing transfer has sent a selective
+        # acknowledgement, so it handles concurrent transfers and errors with nonces
+        self.peer_is_concurrent = False
+        self.data_size = 0
+        self.transferred_size = 0
+        # the time when the last acknowledgement of an incoming transfer has
+        # been sent, for measuring the round-trip time. The sender does not
+        # measure it: the time between its acknowledgements includes the
+        # transmission of the whole window, so the outgoing transfers have no rtt
+        self.request_time = None
+        self.rtt = None
+        self.min_rtt = None
+        self.started = time.time()
+        self.updated = self.started
         self.released = False
 
+    def update_rtt(self, sample):
+        """Update the smoothed round-trip time with a new sample (RFC 6298)"""
+        self.rtt = sample if self.rtt is None else 0.875 * self.rtt + 0.125 * sample
+        self.min_rtt = sample if self.min_rtt is None else min(self.min_rtt, sample)
+
+    def get_stats(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        return {
+            'type': self.type.name.lower(),
+            'nonce': self.nonce,
+            'data_size': self.data_size,
+            'transferred_size': self.transferred_size,
+            'throughput': self.transferred_size / elapsed,
+            'window_size': self.window_size,
+            'rtt': self.rtt,
+            'min_rtt': self.min_rtt,
+            'attempt': self.attempt,
+        }
+
     def release(self):
         self.info_binary = None
         self.data_binary = None
+        self.out_of_order_blocks = dict()
+        self.received_blocks = None
+        if self.buffer:
+            self.buffer.close()
+            self.buffer = None
         self.released = True
 
     def __str__(self):
@@ -275,33 +443,41 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
             community,
             block_size=1000,
             window_size_in_blocks=16,
+            max_window_size_in_blocks=128,
             start_message_id=186,
             retransmit_interval_in_sec=3,
             retransmit_attempt_count=3,
             scheduled_send_interval_in_sec=5,
             timeout_interval_in_sec=10,
             binary_size_limit=1024 * 1024 * 1024,
+            in_memory_size_limit=32 * 1024 * 1024,
+            peer_budget_in_bytes=16 * 1024 * 1024,
     ):
         self.community = community
 
         self.scheduled = defaultdict(deque)
         self.block_size = block_size
         self.window_size = window_size_in_blocks
+        self.max_window_size = max_window_size_in_blocks
         self.retransmit_interval_in_sec = retransmit_interval_in_sec
         self.retransmit_attempt_count = retransmit_attempt_count
         self.timeout_interval_in_sec = timeout_interval_in_sec
         self.scheduled_send_interval_in_sec = scheduled_send_interval_in_sec
         self.binary_size_limit = binary_size_limit
+        self.in_memory_size_limit = in_memory_size_limit
+        self.peer_budget_in_bytes = peer_budget_in_bytes
 
         self.send_complete_callbacks = set()
         self.receive_callbacks = set()
         self.error_callbacks = set()
 
+        # (peer, nonce) -> transfer
         self.incoming = dict()
         self.outgoing = dict()
 
         self.retransmit_enabled = True
         self.terminate_by_timeout_enabled = True
+        self.congestion_control_enabled = True
 
         self.nonce = 0
 
@@ -309,11 +485,13 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
         community.register_task('scheduled send', self.send_scheduled, interval=scheduled_send_interval_in_sec)
 
         logger.info(
-            f'Initialized. Block size: {block_size}. Window size: {window_size_in_blocks}. '
+            f'Initialized. Block size: {block_size}. Window size: {window_size_in_blocks}'
+            f'(max: {max_window_size_in_blocks}). '
             f'Start message id: {start_message_id}. Retransmit interval: {retransmit_interval_in_sec}sec. '
             f'Max retransmit attempts: {retransmit_attempt_count}. Timeout: {timeout_interval_in_sec}sec. '
             f'Scheduled send interval: {scheduled_send_interval_in_sec}sec. '
-            f'Binary size limit: {binary_size_limit}.'
+            f'Binary size limit: {binary_size_limit}. In-memory size limit: {in_memory_size_limit}. '
+            f'Peer budget: {peer_budget_in_bytes}.'
         )
 
     def send_binary(self, peer, info_binary, data_binary, nonce=None):
@@ -328,13 +506,32 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
 
         nonce = nonce or self.nonce
 
-        if peer in self.outgoing:
+        if self.scheduled.get(peer) or not self._can_start_outgoing_transfer(peer, len(data_binary), nonce):
             scheduled_transfer = SimpleNamespace(info_binary=info_binary, data_binary=data_binary, nonce=nonce)
             self.scheduled[peer].append(scheduled_transfer)
             return
 
         self.start_outgoing_transfer(peer, info_binary, data_binary, nonce)
 
+    @staticmethod
+    def _get_transfers(container, peer):
+        return [transfer for (transfer_peer, _), transfer in container.items() if transfer_peer == peer]
+
+    def _get_transfers_size(self, container, peer):
+        return sum(transfer.data_size for transfer in self._get_transfers(container, peer))
+
+    def _fits_in_peer_budget(self, container, peer, data_size):
+        transfers_size = self._get_transfers_size(container, peer)
+        return transfers_size == 0 or transfers_size + data_size <= self.peer_budget_in_bytes
+
+    def _can_start_outgoing_transfer(self, peer, data_size, nonce):
+        if (peer, nonce) in self.outgoing:
+            return False
+        transfers = self._get_transfers(self.outgoing, peer)
+        if transfers and not any(transfer.peer_is_concurrent for transfer in transfers):
+            return False
+        return self._fits_in_peer_budget(self.outgoing, peer, data_size)
+
     def start_outgoing_transfer(self, peer, info_binary, data_binary, nonce):
         transfer = Transfer(TransferType.OUTGOING, info_binary, b'', nonce)
 
@@ -346,8 +543,10 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
 
         transfer.block_count = math.ceil(data_size / self.block_size)
         transfer.data_binary = data_binary
+        transfer.data_size = data_size
+        transfer.peer_is_concurrent = any(t.peer_is_concurrent for t in self._get_transfers(self.outgoing, peer))
 
-        self.outgoing[peer] = transfer
+        self.outgoing[peer, nonce] = transfer
 
         self._schedule_terminate(self.outgoing, peer, transfer)
 
@@ -360,13 +559,26 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
 
         transfer = Transfer(TransferType.INCOMING, payload.info_binary, b'', payload.nonce)
         transfer.window_size = self.window_size
+        transfer.slow_start_threshold = self.max_window_size
+        transfer.data_size = payload.data_size
         transfer.attempt = 0
 
         if payload.data_size > self.binary_size_limit:
             self._incoming_error_size_limit_exceeded(peer, transfer)
             return
 
-        self.incoming[peer] = transfer
+        # a repeated write request replaces the transfer
+        previous_transfer = self.incoming.get((peer, payload.nonce), None)
+        if previous_transfer:
+            EVAProtocol.terminate(self.incoming, peer, previous_transfer)
+
+        if not self._fits_in_peer_budget(self.incoming, peer, payload.data_size):
+            message = f'Current peer budget({self.peer_budget_in_bytes}) has been exceeded'
+            self._incoming_error_size_limit_exceeded(peer, transfer, message)
+            return
+
+        transfer.buffer = ReceiveBuffer(payload.data_size, self.in_memory_size_limit)
+        self.incoming[peer, payload.nonce] = transfer
 
         self._schedule_terminate(self.incoming, peer, transfer)
         self._schedule_resend_acknowledge(peer, transfer)
@@ -377,15 +589,16 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
         logger.debug(f'On acknowledgement({payload.number}). Window size: {payload.window_size}. '
                      f'Peer hash: {hash(peer)}.')
 
-        transfer = self.outgoing.get(peer, None)
+        transfer = self.outgoing.get((peer, payload.nonce), None)
         if not transfer:
             return
 
         can_be_handled = transfer.block_number <= payload.number
-        if not can_be_handled or transfer.nonce != payload.nonce:
+        if not can_be_handled:
             return
 
         transfer.block_number = payload.number
+        transfer.transferred_size = min(transfer.block_number * self.block_size, transfer.data_size)
         if transfer.block_number > transfer.block_count:
             self.finish_outgoing_transfer(peer, transfer)
             return
@@ -393,45 +606,97 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
         transfer.window_size = payload.window_size
         transfer.updated = time.time()
 
-        for block_number in range(transfer.block_number, transfer.block_number + transfer.window_size):
+        # the last block (the number `block_count`) is an empty one, it marks the end of the data
+        window_end = min(transfer.block_number + transfer.window_size, transfer.block_count + 1)
+        received_blocks = set()
+        if transfer.received_blocks and transfer.received_blocks[0] == payload.number:
+            received_blocks = decode_received_blocks(transfer.block_number, transfer.received_blocks[1],
+                                                     window_end - transfer.block_number)
+        transfer.received_blocks = None
+        # the blocks are sent as slices of the data, without copying them
+        data_view = memoryview(transfer.data_binary)
+        for block_number in range(transfer.block_number, window_end):
+            if block_number in received_blocks:
+                continue
             start_position = block_number * self.block_size
             stop_position = start_position + self.block_size
-            data = transfer.data_binary[start_position:stop_position]
+            data = data_view[start_position:stop_position]
             logger.debug(f'Transmit({block_number}). Peer hash: {hash(peer)}.')
             self.community.eva_send_message(peer, Data(block_number, transfer.nonce, data))
-            if len(data) == 0:
-                break
 
-    async def on_data(self, peer, payload):
-        logger.debug(
-            f'On data({payload.block_number}). Peer hash: {hash(peer)}. Data hash: {hash(payload.data_binary)}')
-        transfer = self.incoming.get(peer, None)
+    async def on_selective_acknowledgement(self, peer, payload):
+        logger.debug(f'On selective acknowledgement({payload.number}). Peer hash: {hash(peer)}.')
+
+        transfer = self.outgoing.get((peer, payload.nonce), None)
         if not transfer:
             return
 
-        can_be_handled = transfer.block_number == payload.block_number - 1
-        if not can_be_handled or transfer.nonce != payload.nonce:
+        if not transfer.peer_is_concurrent:
+            transfer.peer_is_concurrent = True
+            self.send_scheduled(peer)
+
+        if payload.number < transfer.block_number:
             return
 
-        transfer.block_number = payload.block_number
+        # the blocks are skipped when the acknowledgement that follows comes
+        transfer.received_blocks = payload.number, payload.received_blocks
 
-        is_final_data_packet = len(payload.data_binary) == 0
-        if is_final_data_packet:
-            self.send_acknowledgement(peer, transfer)
-            self.finish_incoming_transfer(peer, transfer)
+    async def on_data(self, peer, payload):
+        logger.debug(
+            f'On data({payload.block_number}). Peer hash: {hash(peer)}. Data hash: {hash(payload.data_binary)}')
+        transfer = self.incoming.get((peer, payload.nonce), None)
+        if not transfer:
             return
 
-        data_size = len(transfer.data_binary) + len(payload.data_binary)
+        window_end = transfer.acknowledgement_number + transfer.window_size
+        is_duplicate = payload.block_number <= transfer.block_number or \
+            payload.block_number in transfer.out_of_order_blocks
+        can_be_handled = not is_duplicate and payload.block_number < window_end
+        if not can_be_handled:
+            return
+
+        buffered_size = sum(len(data) for data in transfer.out_of_order_blocks.values())
+        data_size = len(transfer.buffer) + buffered_size + len(payload.data_binary)
         if data_size > self.binary_size_limit:
             self._incoming_error_size_limit_exceeded(peer, transfer)
             return
 
-        transfer.data_binary += payload.data_binary
+        if data_size > transfer.buffer.data_size:
+            message = f'Current data size limit({transfer.buffer.data_size}) has been exceeded'
+            self._incoming_error_size_limit_exceeded(peer, transfer, message)
+            return
+
+        transfer.out_of_order_blocks[payload.block_number] = payload.data_binary
         transfer.attempt = 0
         transfer.updated = time.time()
-
-        time_to_acknowledge = transfer.acknowledgement_number + transfer.window_size <= transfer.block_number + 1
+        if transfer.request_time is not None:
+            transfer.update_rtt(transfer.updated - transfer.request_time)
+            transfer.request_time = None
+
+        # move the consecutive blocks from the receive buffer to the data
+        while transfer.block_number + 1 in transfer.out_of_order_blocks:
+            transfer.block_number += 1
+            data = transfer.out_of_order_blocks.pop(transfer.block_number)
+
+            is_final_data_packet = len(data) == 0
+            if is_final_data_packet:
+                self.send_acknowledgement(peer, transfer)
+                self.finish_incoming_transfer(peer, transfer)
+                return
+
+            transfer.buffer.append(data)
+            transfer.transferred_size = len(transfer.buffer)
+
+        time_to_acknowledge = window_end <= transfer.block_number + 1
+        # the last block of the window (or the final block of the transfer)
+        # has come while some blocks are still missing: they were most likely
+        # lost, so ask for them without waiting for the retransmit interval
+        blocks_are_lost = payload.block_number == window_end - 1 or len(payload.data_binary) == 0
         if time_to_acknowledge:
+            self._increase_window(transfer)
+            self.send_acknowledgement(peer, transfer)
+        elif blocks_are_lost:
+            self._decrease_window(transfer)
             self.send_acknowledgement(peer, transfer)
 
     def send_acknowledgement(self, peer, transfer):
@@ -440,23 +705,106 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
         logger.debug(f'Acknowledgement ({transfer.acknowledgement_number}). Window size: {transfer.window_size}. '
                      f'Peer hash: {hash(peer)}')
 
+        # the first acknowledgement of a transfer tells the peer that we
+        # know the selective acknowledgements
+        if transfer.out_of_order_blocks or transfer.acknowledgement_number == 0:
+            received_blocks = encode_received_blocks(transfer.acknowledgement_number, transfer.out_of_order_blocks)
+            self.community.eva_send_message(peer, SelectiveAcknowledgement(transfer.acknowledgement_number,
+                                                                           transfer.nonce, received_blocks))
+
         acknowledgement = Acknowledgement(transfer.acknowledgement_number, transfer.window_size, transfer.nonce)
+        transfer.request_time = time.time()
         self.community.eva_send_message(peer, acknowledgement)
 
+    def get_transfers_stats(self):
+        """Return the stats of the current transfers: their progress, throughput,
+        round-trip time and window size.
+        """
+        return [dict(transfer.get_stats(), peer=peer.mid.hex())
+                for container in (self.incoming, self.outgoing)
+                for (peer, _), transfer in container.items()]
+
+    def _increase_window(self, transfer):
+        """Grow the window of an incoming transfer after a window has been
+        received without losses: exponentially in the slow start, then by
+        a block per window.
+        """
+        if not self.congestion_control_enabled:
+            return
+
+        if transfer.window_size < transfer.slow_start_threshold:
+            window_size = transfer.window_size * 2
+        else:
+            window_size = transfer.window_size + 1
+        transfer.window_size = min(window_size, self.max_window_size)
+
+    def _decrease_window(self, transfer, timeout=False):
+        """Shrink the window of an incoming transfer after a loss: by half (once
+        per window, but not below the initial window size), or down to a single
+        block if the retransmitted acknowledgements remain unanswered.
+        """
+        if not self.congestion_control_enabled:
+            return
+
+        if timeout:
+            transfer.slow_start_threshold = max(transfer.window_size // 2, 1)
+            transfer.window_size = 1
+            return
+
+        if transfer.block_number + 1 < transfer.recovery_block_number:
+            return
+
+        transfer.recovery_block_number = transfer.acknowledgement_number + transfer.window_size
+        # losses happen on the links that are not congested too: the initial
+        # window size is considered safe, so the window is only decreased
+        # below it by the timeouts
+        min_window_size = min(self.window_size, transfer.window_size)
+        transfer.slow_start_threshold = max(transfer.window_size // 2, min_window_size, 1)
+        transfer.window_size = transfer.slow_start_threshold
+
+    def _get_retransmit_timeout(self, transfer):
+        """Return the time since the last received block after which the
+        acknowledgement is retransmitted. It is derived from the round-trip
+        time, with an exponential backoff for the subsequent attempts, and
+        limited by the retransmit interval.
+        """
+        timeout = self.retransmit_interval_in_sec * (transfer.attempt + 1)
+        if transfer.rtt is None:
+            return timeout
+
+        rtt_timeout = max(2 * transfer.rtt, MIN_RETRANSMIT_TIMEOUT_IN_SEC) * (2 ** (transfer.attempt + 1) - 1)
+        return min(rtt_timeout, timeout)
+
     async def on_error(self, peer, payload):
         message = payload.message.decode('utf-8')
         logger.info(f'On error. Peer hash: {hash(peer)}. Message: "{message}"')
-        transfer = self.outgoing.get(peer, None)
+
+        # the peers that handle concurrent transfers send a transfer error
+        # before this one. The rest get a single transfer at a time.
+        transfers = self._get_transfers(self.outgoing, peer)
+        if any(transfer.peer_is_concurrent for transfer in transfers):
+            return
+
+        for transfer in transfers:
+            self._on_outgoing_error(peer, transfer, message)
+
+    async def on_transfer_error(self, peer, payload):
+        message = payload.message.decode('utf-8')
+        logger.info(f'On transfer error. Peer hash: {hash(peer)}. Nonce: {payload.nonce}. Message: "{message}"')
+        transfer = self.outgoing.get((peer, payload.nonce), None)
         if not transfer:
             return
 
+        self._on_outgoing_error(peer, transfer, message)
+
+    def _on_outgoing_error(self, peer, transfer, message):
         EVAProtocol.terminate(self.outgoing, peer, transfer)
 
         self._notify_error(peer, TransferException(transfer.type, transfer.info_binary, transfer.nonce, message))
-        self.send_scheduled()
+        self.send_scheduled(peer)
 
     def finish_incoming_transfer(self, peer, transfer):
-        data = transfer.data_binary
+        data = transfer.buffer.getvalue()
         info = transfer.info_binary
         nonce = transfer.nonce
 
@@ -475,34 +823,43 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
         for callback in self.send_complete_callbacks:
             callback(peer, info, data, nonce)
 
-        self.send_scheduled()
+        self.send_scheduled(peer)
 
-    def send_scheduled(self):
+    def send_scheduled(self, peer=None):
+        """Start the scheduled transfers (to the given peer or to all peers),
+        in the order they were scheduled, while they fit in the peer budget.
+        """
         logger.debug('Looking for scheduled transfers for send...')
 
-        free_peers = [peer for peer in self.scheduled if peer not in self.outgoing]
-
-        for peer in free_peers:
-            if not self.scheduled[peer]:
-                self.scheduled.pop(peer, None)
-                continue
+        peers = [peer] if peer else list(self.scheduled)
+        for scheduled_peer in peers:
+            queue = self.scheduled.get(scheduled_peer)
+            while queue:
+                transfer = queue[0]
+                if not self._can_start_outgoing_transfer(scheduled_peer, len(transfer.data_binary), transfer.nonce):
+                    break
 
-            transfer = self.scheduled[peer].popleft()
+                queue.popleft()
+                logger.info(f'Scheduled send: {transfer.info_binary}')
+                self.start_outgoing_transfer(scheduled_peer, transfer.info_binary, transfer.data_binary,
+                                             transfer.nonce)
 
-            logger.info(f'Scheduled send: {transfer.info_binary}')
-            self.start_outgoing_transfer(peer, transfer.info_binary, transfer.data_binary, transfer.nonce)
+            if not queue:
+                self.scheduled.pop(scheduled_peer, None)
 
     @staticmethod
     def terminate(container, peer, transfer):
         logger.info(f'Finish. Peer hash: {hash(peer)}. Transfer: {transfer}')
 
         transfer.release()
-        container.pop(peer, None)
+        if container.get((peer, transfer.nonce), None) is transfer:
+            container.pop((peer, transfer.nonce))
 
-    def _incoming_error_size_limit_exceeded(self, peer, transfer):
+    def _incoming_error_size_limit_exceeded(self, peer, transfer, message=None):
         EVAProtocol.terminate(self.incoming, peer, transfer)
 
-        message = f'Current data size limit({self.binary_size_limit}) has been exceeded'
+        message = message or f'Current data size limit({self.binary_size_limit}) has been exceeded'
+        self.community.eva_send_message(peer, TransferError(transfer.nonce, message.encode('utf-8')))
         self.community.eva_send_message(peer, Error(message.encode('utf-8')))
         self._notify_error(peer, SizeLimitException(transfer.type, transfer.info_binary, transfer.nonce, message))
 
@@ -535,6 +892,9 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
         message = f'Terminated by timeout. Timeout is: {timeout} sec'
         self._notify_error(peer, TimeoutException(transfer.type, transfer.info_binary, transfer.nonce, message))
 
+        if container is self.outgoing:
+            self.send_scheduled(peer)
+
     def _schedule_resend_acknowledge(self, peer, transfer):
         if not self.retransmit_enabled:
             return
@@ -550,15 +910,21 @@ class EVAProtocol:  # pylint: disable=too-many-instance-attributes
         if attempts_are_over:
             return
 
-        resend_needed = time.time() - transfer.updated >= self.retransmit_interval_in_sec
+        idle_time = time.time() - transfer.updated
+        resend_needed = idle_time >= self._get_retransmit_timeout(transfer)
         if resend_needed:
             transfer.acknowledgement_number = transfer.block_number + 1
             transfer.attempt += 1
+            self._decrease_window(transfer, timeout=transfer.attempt > 1)
 
             logger.debug(f'Re-acknowledgement({transfer.acknowledgement_number}). '
                          f'Attempt: {transfer.attempt + 1}/{self.retransmit_attempt_count} for peer: {hash(peer)}')
 
             self.send_acknowledgement(peer, transfer)
+            # the round-trip time can not be measured from a retransmitted
+            # acknowledgement: the data can be a response to the previous one
+            transfer.request_time = None
 
+        delay = self._get_retransmit_timeout(transfer) - idle_time
         self.community.register_anonymous_task('eva_resend_acknowledge', self._resend_acknowledge_task, peer,
-                                               transfer, delay=self.retransmit_interval_in_sec, )
+                                               transfer, delay=delay, )
@@ -9,7 +9,7 @@ from ipv8.requestcache import NumberCache, RandomNumberCache, RequestCache
 
 from pony.orm.dbapiprovider import OperationalError
 
-from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import entries_to_chunk
+from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import entries_to_chunks
 from tribler_core.modules.metadata_store.store import GOT_NEWER_VERSION, UNKNOWN_CHANNEL, UNKNOWN_COLLECTION
 from tribler_core.utilities.unicode import hexlify
 
@@ -129,9 +129,7 @@ class RemoteQueryCommunity(Community):
         return await self.mds.MetadataNode.get_entries_threaded(**request_sanitized)
 
     def send_db_results(self, peer, request_payload_id, db_results):
-        index = 0
-        while index < len(db_results):
-            data, index = entries_to_chunk(db_results, self.settings.maximum_payload_size, start_index=index)
+        for data, _ in entries_to_chunks(db_results, self.settings.maximum_payload_size):
             self.ez_send(peer, SelectResponsePayload(request_payload_id, data))
 
     @lazy_wrapper(RemoteSelectPayload)
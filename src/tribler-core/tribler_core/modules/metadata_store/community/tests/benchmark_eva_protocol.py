@@ -0,0 +1,113 @@
+"""
+Benchmark for EVA transfers over simulated links. Every link has a bandwidth, a latency, a random packet loss and
+a drop-tail queue of a limited size. It compares the goodput of the adaptive window size (congestion control)
+against the fixed window size of 16 blocks.
+
+Usage: python benchmark_eva_protocol.py [--size 2097152]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from ipv8.community import Community
+from ipv8.test.mocking.ipv8 import MockIPv8
+
+from tribler_core.modules.metadata_store.community.eva_protocol import EVAProtocolMixin
+
+# name, bandwidth (bytes/s), one-way latency (s), packet loss probability, queue size (bytes)
+LINKS = [
+    ("fast", 10 * 1024 * 1024, 0.01, 0, 256 * 1024),
+    ("slow", 256 * 1024, 0.05, 0, 32 * 1024),
+    ("long", 2 * 1024 * 1024, 0.15, 0, 512 * 1024),
+    ("lossy", 2 * 1024 * 1024, 0.025, 0.02, 128 * 1024),
+]
+
+
+class SimulatedLink:
+    """
+    Replaces the send method of an endpoint to pass the packets through a link with the given properties.
+    """
+
+    def __init__(self, endpoint, bandwidth, latency, loss, queue_size):
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.loss = loss
+        self.queue_size = queue_size
+        self.busy_until = 0
+        self.dropped = 0
+        self.random = random.Random(42)
+        self.real_send = endpoint.send
+        endpoint.send = self.send
+
+    def send(self, socket_address, packet):
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        start = max(now, self.busy_until)
+        queue_is_full = (start - now) * self.bandwidth > self.queue_size
+        if queue_is_full or self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        self.busy_until = start + len(packet) / self.bandwidth
+        loop.call_at(self.busy_until + self.latency, self.real_send, socket_address, packet)
+
+
+class BenchmarkCommunity(EVAProtocolMixin, Community):  # pylint: disable=too-many-ancestors
+    community_id = os.urandom(20)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.eva_init()
+        self.received = asyncio.get_event_loop().create_future()
+        self.eva_register_receive_callback(lambda *_: self.received.set_result(None))
+
+
+async def run(link, data_size, congestion_control):
+    name, bandwidth, latency, loss, queue_size = link
+    sender = MockIPv8("curve25519", BenchmarkCommunity)
+    receiver = MockIPv8("curve25519", BenchmarkCommunity)
+    links = [SimulatedLink(ipv8.endpoint, bandwidth, latency, loss, queue_size) for ipv8 in (sender, receiver)]
+    receiver.overlay.eva_protocol.congestion_control_enabled = congestion_control
+
+    stats = {}
+
+    async def watch_stats():
+        while True:
+            stats.update(next(iter(receiver.overlay.eva_protocol.get_transfers_stats()), {}))
+            await asyncio.sleep(0.01)
+
+    watcher = asyncio.ensure_future(watch_stats())
+    start = time.time()
+    sender.overlay.eva_send_binary(receiver.my_peer, b'benchmark', os.urandom(data_size))
+    await receiver.overlay.received
+    duration = time.time() - start
+    watcher.cancel()
+
+    label = "adaptive" if congestion_control else "fixed"
+    print(
+        f"  {name:5s} {label:8s}: {duration:6.2f}s, {data_size / duration / 1024:7.0f} KB/s, "
+        f"window: {stats.get('window_size')}, rtt: {stats.get('rtt') or 0:.3f}s, "
+        f"dropped packets: {sum(link.dropped for link in links)}"
+    )
+    await sender.stop()
+    await receiver.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmark EVA transfers over simulated links')
+    parser.add_argument('--size', type=int, default=2 * 1024 * 1024, help='size of the transferred data')
+    args = parser.parse_args()
+
+    for link in LINKS:
+        _, bandwidth, latency, loss, queue_size = link
+        print(
+            f"Link: {bandwidth / 1024:.0f} KB/s, latency {latency * 1000:.0f}ms, loss {loss:.0%}, "
+            f"queue {queue_size / 1024:.0f} KB"
+        )
+        for congestion_control in (False, True):
+            await run(link, args.size, congestion_control)
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -2,6 +2,7 @@ import asyncio
 import logging
 import os
 import random
+import time
 from collections import defaultdict
 from itertools import permutations
 from types import SimpleNamespace
@@ -12,13 +13,20 @@ from ipv8.test.base import TestBase
 import pytest
 
 from tribler_core.modules.metadata_store.community.eva_protocol import (
+    Acknowledgement,
+    Data,
     EVAProtocolMixin,
     Error,
+    ReceiveBuffer,
+    SelectiveAcknowledgement,
     SizeLimitException,
     TimeoutException,
     Transfer,
+    TransferError,
     TransferException,
     TransferType,
+    decode_received_blocks,
+    encode_received_blocks,
 )
 
 # fmt: off
@@ -78,6 +86,38 @@ class MockCommunity(EVAProtocolMixin, Community):  # pylint: disable=too-many-an
         self.most_recent_received_exception = exception
 
 
+def test_received_blocks_encoding():
+    assert encode_received_blocks(10, []) == b''
+    assert decode_received_blocks(10, b'', 16) == set()
+
+    received_blocks = encode_received_blocks(10, [11, 12, 25])
+    assert received_blocks == bytes([0b110, 0b10000000])
+    assert decode_received_blocks(10, received_blocks, 16) == {11, 12, 25}
+    assert decode_received_blocks(10, received_blocks, 8) == {11, 12}
+
+
+def test_receive_buffer():
+    buffer = ReceiveBuffer(5, in_memory_size_limit=10)
+    assert not buffer.file
+    assert not buffer.data
+    buffer.append(b'123')
+    buffer.append(b'45')
+    assert len(buffer) == 5
+    assert buffer.getvalue() == b'12345'
+    buffer.close()
+
+
+def test_receive_buffer_in_file():
+    buffer = ReceiveBuffer(15, in_memory_size_limit=10)
+    assert buffer.file
+    buffer.append(b'12345')
+    buffer.append(b'67890')
+    assert len(buffer) == 10
+    assert buffer.getvalue() == b'1234567890'
+    buffer.close()
+    assert not buffer.file
+
+
 class TestEVA(TestBase):
     def setUp(self):
         super().setUp()
@@ -137,6 +177,17 @@ class TestEVA(TestBase):
         assert len(self.overlay(1).most_recent_received_data[1]) == data_size
         assert self.overlay(1).most_recent_received_data == data
 
+    async def test_transfer_through_temporary_file(self):
+        self.overlay(1).eva_protocol.in_memory_size_limit = 1024
+
+        data = os.urandom(1), os.urandom(10 * 1024), 42
+        self.overlay(0).eva_send_binary(self.peer(1), *data)
+
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).most_recent_received_data == data
+        assert isinstance(self.overlay(1).most_recent_received_data[1], bytes)
+
     @pytest.mark.timeout(15)
     async def test_termination_by_timeout(self):
         # breaks "on_data" function in community2 to make this community silent
@@ -181,7 +232,7 @@ class TestEVA(TestBase):
         assert len(self.overlay(0).eva_protocol.outgoing) == 1
         assert len(self.overlay(1).eva_protocol.incoming) == 1
 
-        assert self.overlay(1).eva_protocol.incoming[self.peer(0)].attempt == attempts
+        assert self.overlay(1).eva_protocol.incoming[self.peer(0), 1].attempt == attempts
 
     async def test_retransmit_disabled(self):
         self.overlay(0).eva_protocol.terminate_by_timeout_enabled = False
@@ -202,7 +253,7 @@ class TestEVA(TestBase):
         assert len(self.overlay(0).eva_protocol.outgoing) == 1
         assert len(self.overlay(1).eva_protocol.incoming) == 1
 
-        assert self.overlay(1).eva_protocol.incoming[self.peer(0)].attempt == 0
+        assert self.overlay(1).eva_protocol.incoming[self.peer(0), 1].attempt == 0
 
     async def test_size_limit(self):
         # test on a sender side
@@ -269,7 +320,8 @@ class TestEVA(TestBase):
 
         await drain_loop(asyncio.get_event_loop())
 
-        assert self.overlay(1).received_data[self.peer(0)] == data_list
+        # the concurrent transfers can finish in any order
+        assert sorted(self.overlay(1).received_data[self.peer(0)]) == sorted(data_list)
         assert not self.overlay(0).eva_protocol.scheduled
 
     async def test_multiply_duplex(self):
@@ -303,7 +355,7 @@ class TestEVA(TestBase):
 
         data_sets_checked = 0
         for ((peer, _), (_, community)), data_set in data:
-            assert community.received_data[peer] == data_set
+            assert sorted(community.received_data[peer]) == sorted(data_set)
             data_sets_checked += 1
 
         assert data_sets_checked == 6
@@ -384,7 +436,7 @@ class TestEVA(TestBase):
         async def fake_on_acknowledgement0(peer, payload):
             await real_on_acknowledgement0(peer, payload)
 
-            transfer = self.overlay(0).eva_protocol.outgoing.get(peer, None)
+            transfer = self.overlay(0).eva_protocol.outgoing.get((peer, payload.nonce), None)
             if transfer:
                 # check that windows size is updated
                 assert self.test_store.actual_window_size == transfer.window_size
@@ -414,7 +466,7 @@ class TestEVA(TestBase):
         real_on_acknowledgement0 = self.overlay(0).decode_map[acknowledgement_message_id]
 
         def fake_on_acknowledgement0(peer, payload):
-            transfer = self.overlay(0).eva_protocol.outgoing[self.peer(1)]
+            transfer = self.overlay(0).eva_protocol.outgoing[self.peer(1), 1]
             transfer.data_binary = b'1' * 100
             transfer.count = 100
             return real_on_acknowledgement0(peer, payload)
@@ -496,8 +548,462 @@ class TestEVA(TestBase):
         self.overlay(0).most_recent_received_exception = None
         self.overlay(1).most_recent_received_exception = None
 
+        self.overlay(0).eva_send_message(self.peer(1), TransferError(0, 'message'.encode('utf-8')))
         self.overlay(0).eva_send_message(self.peer(1), Error('message'.encode('utf-8')))
         await self.deliver_messages(timeout=0.1)
 
         assert not self.overlay(0).most_recent_received_exception
         assert not self.overlay(1).most_recent_received_exception
+
+    def drop_data_packets(self, community, should_drop):
+        """Drop the data packets sent by the community that satisfy `should_drop`.
+        Return the lists of numbers of the sent (including the dropped ones) and
+        the dropped blocks.
+        """
+        blocks = SimpleNamespace(sent=[], dropped=[])
+        real_eva_send_message = community.eva_send_message
+
+        def fake_eva_send_message(peer, message):
+            if isinstance(message, Data):
+                blocks.sent.append(message.block_number)
+                if should_drop(message):
+                    blocks.dropped.append(message.block_number)
+                    return
+            real_eva_send_message(peer, message)
+
+        community.eva_send_message = fake_eva_send_message
+        return blocks
+
+    async def test_out_of_order_blocks(self):
+        self.overlay(0).eva_protocol.block_size = 10
+        self.overlay(1).eva_protocol.window_size = 16
+
+        data = os.urandom(1), os.urandom(10 * 40), 42
+
+        # send the blocks of every window in the reverse order
+        self.test_store.window = []
+        real_eva_send_message = self.overlay(0).eva_send_message
+
+        def send_window_reversed(peer):
+            for block in reversed(self.test_store.window):
+                real_eva_send_message(peer, block)
+            self.test_store.window = []
+
+        def fake_eva_send_message(peer, message):
+            if not isinstance(message, Data):
+                real_eva_send_message(peer, message)
+                return
+            if not self.test_store.window:
+                asyncio.get_event_loop().call_soon(send_window_reversed, peer)
+            self.test_store.window.append(message)
+
+        self.overlay(0).eva_send_message = fake_eva_send_message
+
+        self.overlay(0).eva_send_binary(self.peer(1), *data)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).most_recent_received_data == data
+
+    async def test_selective_retransmit(self):
+        self.overlay(0).eva_protocol.block_size = 10
+        self.overlay(1).eva_protocol.window_size = 16
+
+        data = os.urandom(1), os.urandom(10 * 40), 42
+
+        # lose the blocks 3 and 20 once
+        self.test_store.lost_blocks = {3, 20}
+
+        def should_drop(message):
+            if message.block_number in self.test_store.lost_blocks:
+                self.test_store.lost_blocks.remove(message.block_number)
+                return True
+            return False
+
+        blocks = self.drop_data_packets(self.overlay(0), should_drop)
+
+        self.overlay(0).eva_send_binary(self.peer(1), *data)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).most_recent_received_data == data
+
+        # only the lost blocks have been sent twice
+        assert sorted(blocks.sent) == sorted(list(range(41)) + [3, 20])
+
+    async def test_selective_acknowledgement_mixed_versions(self):
+        self.overlay(0).eva_protocol.block_size = 10
+        self.overlay(1).eva_protocol.block_size = 10
+
+        # the peers of the previous versions do not know the selective
+        # acknowledgements: they neither send nor handle them
+        real_eva_send_message = self.overlay(1).eva_send_message
+
+        def send_no_selective_acknowledgements(peer, message):
+            if not isinstance(message, SelectiveAcknowledgement):
+                real_eva_send_message(peer, message)
+
+        self.overlay(1).eva_send_message = send_no_selective_acknowledgements
+        self.overlay(1).decode_map[self.overlay(1).eva_messages[SelectiveAcknowledgement]] = lambda *_: None
+
+        # the old receiver: the sender retransmits the whole window
+        self.test_store.lost_blocks = {3}
+
+        def should_drop(message):
+            if message.block_number in self.test_store.lost_blocks:
+                self.test_store.lost_blocks.remove(message.block_number)
+                return True
+            return False
+
+        blocks = self.drop_data_packets(self.overlay(0), should_drop)
+        data = os.urandom(1), os.urandom(10 * 40), 1
+        self.overlay(0).eva_send_binary(self.peer(1), *data)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).received_data[self.peer(0)] == [data]
+        assert len(blocks.sent) > 41 + 1
+
+        # the old sender
+        self.test_store.lost_blocks = {3}
+        self.drop_data_packets(self.overlay(1), should_drop)
+        data = os.urandom(1), os.urandom(10 * 40), 2
+        self.overlay(1).eva_send_binary(self.peer(0), *data)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(0).received_data[self.peer(1)] == [data]
+
+    async def test_transfers_to_old_peer(self):
+        # the peers of the previous versions neither send the selective
+        # acknowledgements and the transfer errors, nor handle them
+        real_eva_send_message = self.overlay(1).eva_send_message
+
+        def send_old_messages(peer, message):
+            if not isinstance(message, (SelectiveAcknowledgement, TransferError)):
+                real_eva_send_message(peer, message)
+
+        self.overlay(1).eva_send_message = send_old_messages
+        for message_class in (SelectiveAcknowledgement, TransferError):
+            self.overlay(1).decode_map[self.overlay(1).eva_messages[message_class]] = lambda *_: None
+
+        protocol = self.overlay(0).eva_protocol
+        self.test_store.transfer_count = 0
+        real_start_outgoing_transfer = protocol.start_outgoing_transfer
+
+        def start_outgoing_transfer(*args):
+            real_start_outgoing_transfer(*args)
+            self.test_store.transfer_count = max(self.test_store.transfer_count, len(protocol.outgoing))
+
+        protocol.start_outgoing_transfer = start_outgoing_transfer
+
+        # the old peer gets a single transfer at a time
+        data_list = [(os.urandom(1), os.urandom(1000), nonce) for nonce in range(1, 4)]
+        for data in data_list:
+            self.overlay(0).eva_send_binary(self.peer(1), *data)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).received_data[self.peer(0)] == data_list
+        assert self.test_store.transfer_count == 1
+
+        # the errors without the nonce terminate the transfer to the old peer
+        self.overlay(1).eva_protocol.binary_size_limit = 100
+        self.overlay(0).eva_send_binary(self.peer(1), b'too big', os.urandom(1000), 4)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert isinstance(self.overlay(0).most_recent_received_exception, TransferException)
+        assert not protocol.outgoing
+
+        # and the old peer gets the errors without the nonce
+        self.overlay(0).eva_protocol.binary_size_limit = 100
+        self.overlay(1).eva_send_binary(self.peer(0), b'too big', os.urandom(1000), 5)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert isinstance(self.overlay(1).most_recent_received_exception, TransferException)
+        assert not self.overlay(1).eva_protocol.outgoing
+
+    async def test_error_without_nonce_from_concurrent_peer(self):
+        self.overlay(1).eva_protocol.peer_budget_in_bytes = 1500
+
+        # the error without the nonce that follows the transfer error is ignored
+        real_eva_send_message = self.overlay(1).eva_send_message
+
+        def send_error_after_delay(peer, message):
+            if isinstance(message, Error):
+                asyncio.get_event_loop().call_later(0.05, real_eva_send_message, peer, message)
+            else:
+                real_eva_send_message(peer, message)
+
+        self.overlay(1).eva_send_message = send_error_after_delay
+
+        self.overlay(0).eva_send_binary(self.peer(1), b'first', os.urandom(100000), 1)
+        await self.deliver_messages(timeout=0.01)
+        self.overlay(0).eva_send_binary(self.peer(1), b'second', os.urandom(1000), 2)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(0).most_recent_received_exception.nonce == 2
+        assert self.overlay(1).received_data[self.peer(0)][0][0] == b'first'
+
+    async def measure_goodput(self, packet_loss_probability):
+        block_size = 1000
+        block_count = 200
+
+        self.overlay(0).eva_protocol.block_size = block_size
+        self.overlay(1).eva_protocol.retransmit_attempt_count = 10
+
+        rand = random.Random(42)
+        blocks = self.drop_data_packets(self.overlay(0), lambda _: rand.random() < packet_loss_probability)
+
+        data = os.urandom(1), os.urandom(block_size * block_count), 42
+
+        started = time.time()
+        self.overlay(0).eva_send_binary(self.peer(1), *data)
+        while not self.overlay(0).sent_data[self.peer(1)]:
+            await asyncio.sleep(0.01)
+
+        duration = time.time() - started
+        goodput = len(data[1]) / duration
+        logging.info(f'Packet loss: {packet_loss_probability:.0%}. Goodput: {goodput / 1024:.0f} KB/s. '
+                     f'Blocks sent: {len(blocks.sent)}. Blocks lost: {len(blocks.dropped)}')
+
+        assert self.overlay(1).received_data[self.peer(0)] == [data]
+
+        # nothing but the lost blocks has been retransmitted
+        assert len(blocks.sent) == block_count + 1 + len(blocks.dropped)
+
+    @pytest.mark.timeout(20)
+    async def test_goodput_with_1_percent_packet_loss(self):
+        await self.measure_goodput(0.01)
+
+    @pytest.mark.timeout(20)
+    async def test_goodput_with_5_percent_packet_loss(self):
+        await self.measure_goodput(0.05)
+
+    @pytest.mark.timeout(20)
+    async def test_goodput_with_10_percent_packet_loss(self):
+        await self.measure_goodput(0.1)
+
+    def record_acknowledged_window_sizes(self, community):
+        window_sizes = []
+        real_eva_send_message = community.eva_send_message
+
+        def fake_eva_send_message(peer, message):
+            if isinstance(message, Acknowledgement):
+                window_sizes.append(message.window_size)
+            real_eva_send_message(peer, message)
+
+        community.eva_send_message = fake_eva_send_message
+        return window_sizes
+
+    async def test_window_growth(self):
+        self.overlay(0).eva_protocol.block_size = 10
+        self.overlay(1).eva_protocol.window_size = 2
+        self.overlay(1).eva_protocol.max_window_size = 50
+
+        window_sizes = self.record_acknowledged_window_sizes(self.overlay(1))
+
+        data = os.urandom(1), os.urandom(10 * 500), 42
+        self.overlay(0).eva_send_binary(self.peer(1), *data)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).most_recent_received_data == data
+
+        # slow start up to the window size limit
+        assert window_sizes[:6] == [2, 4, 8, 16, 32, 50]
+        assert set(window_sizes[6:]) == {50}
+
+    async def test_window_decrease_on_loss(self):
+        self.overlay(0).eva_protocol.block_size = 10
+        self.overlay(1).eva_protocol.window_size = 16
+
+        window_sizes = self.record_acknowledged_window_sizes(self.overlay(1))
+
+        # lose the block in the third window once
+        self.test_store.lost_blocks = {16 + 32 + 10}
+
+        def should_drop(message):
+            if message.block_number in self.test_store.lost_blocks:
+                self.test_store.lost_blocks.remove(message.block_number)
+                return True
+            return False
+
+        self.drop_data_packets(self.overlay(0), should_drop)
+
+        data = os.urandom(1), os.urandom(10 * 200), 42
+        self.overlay(0).eva_send_binary(self.peer(1), *data)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).most_recent_received_data == data
+
+        # the window is halved, and then grows by a block per window
+        assert window_sizes[:7] == [16, 32, 64, 32, 33, 34, 35]
+
+    async def test_congestion_control_disabled(self):
+        self.overlay(0).eva_protocol.block_size = 10
+        self.overlay(1).eva_protocol.congestion_control_enabled = False
+
+        window_sizes = self.record_acknowledged_window_sizes(self.overlay(1))
+
+        data = os.urandom(1), os.urandom(10 * 200), 42
+        self.overlay(0).eva_send_binary(self.peer(1), *data)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).most_recent_received_data == data
+        assert set(window_sizes) == {16}
+
+    async def test_transfers_stats(self):
+        self.overlay(0).eva_protocol.terminate_by_timeout_enabled = False
+        self.overlay(1).eva_protocol.terminate_by_timeout_enabled = False
+        self.overlay(1).eva_protocol.retransmit_enabled = False
+
+        # stop the transfer after the first window
+        real_on_acknowledgement0 = self.overlay(0).eva_protocol.on_acknowledgement
+
+        async def fake_on_acknowledgement0(peer, payload):
+            if payload.number == 0:
+                await real_on_acknowledgement0(peer, payload)
+
+        self.overlay(0).eva_protocol.on_acknowledgement = fake_on_acknowledgement0
+        self.overlay(0).eva_protocol.block_size = 10
+
+        self.overlay(0).eva_send_binary(self.peer(1), b'info', os.urandom(1000), 42)
+        await drain_loop(asyncio.get_event_loop())
+
+        assert not self.overlay(0).eva_protocol.get_transfers_stats()[0]['transferred_size']
+
+        incoming_stats = self.overlay(1).eva_protocol.get_transfers_stats()
+        assert len(incoming_stats) == 1
+        assert incoming_stats[0]['peer'] == self.peer(0).mid.hex()
+        assert incoming_stats[0]['type'] == 'incoming'
+        assert incoming_stats[0]['nonce'] == 42
+        assert incoming_stats[0]['data_size'] == 1000
+        assert incoming_stats[0]['transferred_size'] == 160
+        assert incoming_stats[0]['throughput'] > 0
+        assert incoming_stats[0]['window_size'] == 32
+        assert incoming_stats[0]['rtt'] is not None
+
+    async def test_transfers_stats_outgoing_rtt(self):
+        self.overlay(0).eva_protocol.terminate_by_timeout_enabled = False
+        self.overlay(1).eva_protocol.terminate_by_timeout_enabled = False
+        self.overlay(1).eva_protocol.retransmit_enabled = False
+
+        # stop the transfer after the second window
+        real_on_acknowledgement0 = self.overlay(0).eva_protocol.on_acknowledgement
+
+        async def fake_on_acknowledgement0(peer, payload):
+            if payload.number <= 16:
+                await real_on_acknowledgement0(peer, payload)
+
+        self.overlay(0).eva_protocol.on_acknowledgement = fake_on_acknowledgement0
+        self.overlay(0).eva_protocol.block_size = 10
+
+        self.overlay(0).eva_send_binary(self.peer(1), b'info', os.urandom(1000), 42)
+        await drain_loop(asyncio.get_event_loop())
+
+        # the interval between the acknowledgements is not a round-trip time
+        outgoing_stats = self.overlay(0).eva_protocol.get_transfers_stats()
+        assert outgoing_stats[0]['transferred_size'] == 160
+        assert outgoing_stats[0]['rtt'] is None
+        assert self.overlay(1).eva_protocol.get_transfers_stats()[0]['rtt'] is not None
+
+    async def test_concurrent_transfers(self):
+        data_list = [(os.urandom(1), os.urandom(1000), nonce) for nonce in range(1, 4)]
+        for data in data_list:
+            self.overlay(0).eva_send_binary(self.peer(1), *data)
+
+        # the rest of the transfers wait until the peer turns out to handle concurrent transfers
+        protocol = self.overlay(0).eva_protocol
+        assert len(protocol.outgoing) == 1
+
+        self.test_store.transfer_count = 0
+        real_start_outgoing_transfer = protocol.start_outgoing_transfer
+
+        def start_outgoing_transfer(*args):
+            real_start_outgoing_transfer(*args)
+            self.test_store.transfer_count = max(self.test_store.transfer_count, len(protocol.outgoing))
+
+        protocol.start_outgoing_transfer = start_outgoing_transfer
+
+        await drain_loop(asyncio.get_event_loop())
+
+        # then all the transfers are in flight at once
+        assert self.test_store.transfer_count == 3
+
+        assert sorted(self.overlay(1).received_data[self.peer(0)]) == sorted(data_list)
+        assert not self.overlay(0).eva_protocol.outgoing
+        assert not self.overlay(1).eva_protocol.incoming
+
+    async def test_peer_budget(self):
+        self.overlay(0).eva_protocol.peer_budget_in_bytes = 2500
+
+        data_list = [(os.urandom(1), os.urandom(1000), nonce) for nonce in range(1, 5)]
+        for data in data_list:
+            self.overlay(0).eva_send_binary(self.peer(1), *data)
+        # a single transfer can exceed the budget
+        big_data = os.urandom(1), os.urandom(5000), 5
+        self.overlay(0).eva_send_binary(self.peer(2), *big_data)
+
+        assert len(self.overlay(0).eva_protocol.outgoing) == 2
+        assert len(self.overlay(0).eva_protocol.scheduled[self.peer(1)]) == 3
+
+        protocol = self.overlay(0).eva_protocol
+        self.test_store.transfers_size = 0
+        real_start_outgoing_transfer = protocol.start_outgoing_transfer
+
+        def start_outgoing_transfer(*args):
+            real_start_outgoing_transfer(*args)
+            transfers_size = protocol._get_transfers_size(protocol.outgoing, self.peer(1))
+            self.test_store.transfers_size = max(self.test_store.transfers_size, transfers_size)
+
+        protocol.start_outgoing_transfer = start_outgoing_transfer
+
+        await drain_loop(asyncio.get_event_loop())
+
+        assert sorted(self.overlay(1).received_data[self.peer(0)]) == sorted(data_list)
+        assert self.overlay(2).received_data[self.peer(0)] == [big_data]
+        assert not self.overlay(0).eva_protocol.scheduled
+        # the transfers have been concurrent, within the budget
+        assert self.test_store.transfers_size == 2000
+
+    async def test_same_nonce_transfers_are_sequential(self):
+        data_list = [(os.urandom(1), os.urandom(1000), 42) for _ in range(3)]
+        for data in data_list:
+            self.overlay(0).eva_send_binary(self.peer(1), *data)
+
+        assert len(self.overlay(0).eva_protocol.outgoing) == 1
+
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).received_data[self.peer(0)] == data_list
+
+    @pytest.mark.timeout(10)
+    async def test_scheduled_transfer_starts_after_timeout(self):
+        self.overlay(0).eva_protocol.peer_budget_in_bytes = 1000
+        self.overlay(1).eva_protocol.terminate_by_timeout_enabled = False
+
+        # the first transfer hangs
+        async def void(*_):
+            await asyncio.sleep(0)
+
+        self.overlay(1).eva_protocol.on_write_request = void
+
+        self.overlay(0).eva_send_binary(self.peer(1), b'first', b'1' * 1000, 1)
+        self.overlay(0).eva_send_binary(self.peer(1), b'second', b'2' * 1000, 2)
+        assert len(self.overlay(0).eva_protocol.scheduled[self.peer(1)]) == 1
+
+        await self.deliver_messages(timeout=TEST_DEFAULT_TERMINATE_INTERVAL_IN_SEC + 0.5)
+
+        # the second transfer has been started without waiting for the scheduled send task
+        assert isinstance(self.overlay(0).most_recent_received_exception, TimeoutException)
+        assert list(self.overlay(0).eva_protocol.outgoing) == [(self.peer(1), 2)]
+
+    async def test_incoming_peer_budget_exceeded(self):
+        self.overlay(1).eva_protocol.peer_budget_in_bytes = 1500
+
+        self.overlay(0).eva_send_binary(self.peer(1), b'first', b'1' * 1000, 1)
+        self.overlay(0).eva_send_binary(self.peer(1), b'second', b'2' * 1000, 2)
+
+        await drain_loop(asyncio.get_event_loop())
+
+        assert self.overlay(1).received_data[self.peer(0)] == [(b'first', b'1' * 1000, 1)]
+        assert isinstance(self.overlay(1).most_recent_received_exception, SizeLimitException)
+        exception = self.overlay(0).most_recent_received_exception
+        assert isinstance(exception, TransferException)
+        assert exception.nonce == 2
+        assert not self.overlay(0).eva_protocol.outgoing
@@ -0,0 +1,224 @@
+# Fast counting of the entries for the REST listings.
+#
+# Counting the entries that match a query with COUNT(*) re-runs the whole query, which is as slow as the listing
+# itself. Instead, the numbers of entries are kept in two counter tables maintained by SQL triggers on ChannelNode:
+# one per channel (public key) and parent (origin_id), and a global one. The counters are split by the values of
+# the columns used by the simple REST filters (metadata type, status and the xxx flag), so the queries that only
+# use these filters are answered by summing up a handful of counter rows.
+# Full-text search queries are answered with a count capped at the number of full-text search matches considered
+# by the queries, which is reported as an estimate if the matches were actually cut off.
+from functools import lru_cache
+
+from tribler_core.modules.metadata_store.entries_query import FTS_MATCHES_LIMIT, SELECT_COUNT, get_query_plan
+from tribler_core.modules.metadata_store.orm_bindings.channel_node import LEGACY_ENTRY, TODELETE
+from tribler_core.modules.metadata_store.orm_bindings.torrent_metadata import NULL_KEY_SUBST
+
+# NULLs can not be a part of the counters' keys, so NULL statuses are counted under this value
+NULL_STATUS = -1
+
+# These tables should never be used from ORM directly. They are created by raw SQL and maintained by SQL triggers.
+sql_create_count_tables = [
+    """
+    CREATE TABLE IF NOT EXISTS ChannelNodeCount (
+        public_key BLOB NOT NULL,
+        origin_id INTEGER NOT NULL,
+        metadata_type INTEGER NOT NULL,
+        status INTEGER NOT NULL,
+        xxx_free INTEGER NOT NULL,
+        num INTEGER NOT NULL,
+        PRIMARY KEY (public_key, origin_id, metadata_type, status, xxx_free)
+    ) WITHOUT ROWID;""",
+    """
+    CREATE TABLE IF NOT EXISTS ChannelNodeTypeCount (
+        metadata_type INTEGER NOT NULL,
+        root INTEGER NOT NULL,
+        status INTEGER NOT NULL,
+        xxx_free INTEGER NOT NULL,
+        num INTEGER NOT NULL,
+        PRIMARY KEY (metadata_type, root, status, xxx_free)
+    ) WITHOUT ROWID;""",
+]
+
+# The key columns of the counters, computed from the ChannelNode row
+_CHANNEL_KEY = (
+    "{row}.public_key, ifnull({row}.origin_id, 0), {row}.metadata_type, ifnull({row}.status, %i), "
+    "ifnull({row}.xxx = 0, 0)" % NULL_STATUS
+)
+_CHANNEL_KEY_MATCH = (
+    "public_key = {row}.public_key AND origin_id = ifnull({row}.origin_id, 0) "
+    "AND metadata_type = {row}.metadata_type AND status = ifnull({row}.status, %i) "
+    "AND xxx_free = ifnull({row}.xxx = 0, 0)" % NULL_STATUS
+)
+_TYPE_KEY = (
+    "{row}.metadata_type, ifnull({row}.origin_id, 0) = 0, ifnull({row}.status, %i), ifnull({row}.xxx = 0, 0)"
+    % (NULL_STATUS)
+)
+_TYPE_KEY_MATCH = (
+    "metadata_type = {row}.metadata_type AND root = (ifnull({row}.origin_id, 0) = 0) "
+    "AND status = ifnull({row}.status, %i) AND xxx_free = ifnull({row}.xxx = 0, 0)" % NULL_STATUS
+)
+
+
+def _count_statements(row, delta):
+    # UPSERT is not available in older versions of SQLite, hence the INSERT OR IGNORE + UPDATE pair
+    return f"""
+        INSERT OR IGNORE INTO ChannelNodeCount VALUES ({_CHANNEL_KEY.format(row=row)}, 0);
+        UPDATE ChannelNodeCount SET num = num + ({delta}) WHERE {_CHANNEL_KEY_MATCH.format(row=row)};
+        INSERT OR IGNORE INTO ChannelNodeTypeCount VALUES ({_TYPE_KEY.format(row=row)}, 0);
+        UPDATE ChannelNodeTypeCount SET num = num + ({delta}) WHERE {_TYPE_KEY_MATCH.format(row=row)};"""
+
+
+sql_add_count_triggers = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS count_ai AFTER INSERT ON ChannelNode
+    BEGIN {_count_statements("new", 1)}
+    END;""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS count_ad AFTER DELETE ON ChannelNode
+    BEGIN {_count_statements("old", -1)}
+    END;""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS count_au AFTER UPDATE OF public_key, origin_id, metadata_type, status, xxx
+    ON ChannelNode BEGIN {_count_statements("old", -1)} {_count_statements("new", 1)}
+    END;""",
+]
+
+sql_fill_count_tables = [
+    f"""
+    INSERT INTO ChannelNodeCount SELECT {_CHANNEL_KEY.format(row="g")}, count(*) FROM ChannelNode g
+    GROUP BY 1, 2, 3, 4, 5;""",
+    f"""
+    INSERT INTO ChannelNodeTypeCount SELECT {_TYPE_KEY.format(row="g")}, count(*) FROM ChannelNode g
+    GROUP BY 1, 2, 3, 4;""",
+]
+
+
+def create_count_tables(connection):
+    """
+    Create the counter tables and the triggers that maintain them, if they do not exist yet.
+    The counters of an existing database are filled in from the ChannelNode table.
+    :return: True if the tables were created, False if they already existed
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'ChannelNodeCount'")
+    if cursor.fetchone()[0]:
+        return False
+    for sql in sql_create_count_tables + sql_fill_count_tables + sql_add_count_triggers:
+        cursor.execute(sql)
+    return True
+
+
+def drop_count_tables(connection):
+    cursor = connection.cursor()
+    cursor.execute("select name from sqlite_master where type='trigger' and name like 'count_%'")
+    for [trigger_name] in cursor.fetchall():
+        cursor.execute(f"drop trigger {trigger_name}")
+    cursor.execute("DROP TABLE IF EXISTS ChannelNodeCount")
+    cursor.execute("DROP TABLE IF EXISTS ChannelNodeTypeCount")
+
+
+@lru_cache(maxsize=64)
+def compile_counters_query(per_channel, by_origin_id, metadata_types, exclude_deleted, exclude_legacy, hide_xxx):
+    """
+    Compile the raw SQL statement that sums up the counters matching the given filters.
+    The public key and the origin_id are bound as $public_key and $origin_id.
+    """
+    if per_channel:
+        sql = "SELECT ifnull(sum(num), 0) FROM ChannelNodeCount WHERE public_key = $public_key"
+        if by_origin_id:
+            sql += " AND origin_id = $origin_id"
+    else:
+        sql = "SELECT ifnull(sum(num), 0) FROM ChannelNodeTypeCount WHERE 1"
+        if by_origin_id:
+            sql += " AND root"
+    sql += f" AND metadata_type IN ({', '.join(str(t) for t in metadata_types)})"
+    if exclude_deleted or exclude_legacy:
+        # "status <> x" does not match NULL statuses, so neither should the counters
+        excluded = (
+            (NULL_STATUS,) + ((TODELETE,) if exclude_deleted else ()) + ((LEGACY_ENTRY,) if exclude_legacy else ())
+        )
+        sql += f" AND status NOT IN ({', '.join(str(s) for s in excluded)})"
+    if hide_xxx:
+        sql += " AND xxx_free"
+    return sql
+
+
+def get_counters_query(
+    cls,
+    metadata_type=None,
+    channel_pk=None,
+    origin_id=None,
+    exclude_deleted=False,
+    hide_xxx=False,
+    exclude_legacy=False,
+    **kwargs,
+):
+    """
+    Get the query that sums up the counters for the given MetadataNode.get_entries parameters.
+    :return: a tuple of (sql, dict of values), or None if the filters can not be answered from the counters
+    """
+    # Any other filter, e.g. full-text search or category, requires running the query. Note that subscribed=False
+    # and self_checked_torrent=False are filters too, while complete_channel=False is not.
+    if kwargs.pop("complete_channel", None) or any(value is not None for value in kwargs.values()):
+        return None
+    if channel_pk is None and origin_id not in (None, 0):
+        return None
+
+    metadata_types = {cls._discriminator_, *(c._discriminator_ for c in cls._subclasses_)}
+    if metadata_type is not None:
+        try:
+            metadata_types &= {int(t) for t in metadata_type}
+        except TypeError:
+            metadata_types &= {int(metadata_type)}
+    params = {}
+    if channel_pk is not None:
+        params["public_key"] = b"" if channel_pk == NULL_KEY_SUBST else bytes(channel_pk)
+    if origin_id is not None:
+        params["origin_id"] = int(origin_id)
+    sql = compile_counters_query(
+        channel_pk is not None,
+        origin_id is not None,
+        tuple(sorted(metadata_types)),
+        bool(exclude_deleted),
+        bool(exclude_legacy),
+        bool(hide_xxx),
+    )
+    return sql, params
+
+
+def count_entries(cls, **kwargs):
+    """
+    Count the entries that would be returned by MetadataNode.get_entries with the given parameters, if there
+    would be no pagination. The count is taken from the counters if possible, and is capped for full-text queries.
+    Should be run in a db_session.
+    :return: a tuple of (count, whether the count is exact)
+    """
+    for p in ["first", "last", "sort_by", "sort_desc", "cursor"]:
+        kwargs.pop(p, None)
+    db = cls._database_
+
+    counters_query = get_counters_query(cls, **kwargs)
+    if counters_query is not None:
+        sql, params = counters_query
+        # Raw SQL queries do not flush the pending changes to the database by themselves
+        db.flush()
+        return db.select(sql, {}, params)[0], True
+
+    query_plan = get_query_plan(cls, select=SELECT_COUNT, **kwargs)
+    if query_plan is None:
+        return 0, True
+    sql, params = query_plan
+    db.flush()
+    count = db.select(sql, {}, params)[0]
+
+    txt_filter = kwargs.get("txt_filter")
+    if not txt_filter:
+        return count, True
+    # The full-text query only considers the first FTS_MATCHES_LIMIT matches. If there are that many, there are
+    # probably more entries matching the query than counted.
+    num_matches = db.select(
+        "SELECT count(*) FROM (SELECT rowid FROM FtsIndex WHERE FtsIndex MATCH $txt_filter LIMIT $limit)",
+        {},
+        {"txt_filter": txt_filter, "limit": FTS_MATCHES_LIMIT},
+    )[0]
+    return count, num_matches < FTS_MATCHES_LIMIT
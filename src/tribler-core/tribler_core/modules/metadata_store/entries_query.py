@@ -0,0 +1,382 @@
+# Cached raw SQL query plans for MetadataNode.get_entries and friends.
+#
+# Building the equivalent Pony query requires decompiling and translating a chain of lambdas on every call, which
+# becomes a visible CPU cost under a heavy remote query load. Instead, the query parameters are normalized into
+# a hashable signature, which is compiled into a raw SQL statement once and kept in an LRU cache. The values of
+# the parameters are bound to the statement on execution, so all the queries of the same shape share the same
+# statement text (and hence the same sqlite prepared statement).
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import lru_cache
+from itertools import count
+
+from pony.orm.core import Attribute
+from pony.orm.dbapiprovider import OperationalError
+
+from tribler_core.modules.metadata_store.orm_bindings.channel_node import LEGACY_ENTRY, TODELETE
+from tribler_core.modules.metadata_store.orm_bindings.torrent_metadata import NULL_KEY_SUBST
+from tribler_core.modules.metadata_store.serialization import CHANNEL_TORRENT, COLLECTION_NODE
+from tribler_core.utilities.unicode import hexlify
+
+QUERY_PLANS_CACHE_SIZE = 256
+
+# The maximum number of full-text search matches considered by a query, same as in MetadataNode.search_keyword
+FTS_MATCHES_LIMIT = 1000
+
+MAX_CURSOR_LENGTH = 1024
+
+SELECT_ENTRIES = "entries"
+SELECT_ROWS = "rows"
+SELECT_COUNT = "count"
+
+
+def _column(cls, attr_name):
+    """
+    Get the name of the database column for the given attribute of the entity or any of its descendants.
+    This is also the check against code injection: only the names of real attributes pass.
+    """
+    attr = getattr(cls, attr_name, None)
+    if attr is None:
+        attr = next((a for a in cls._subclass_attrs_ if a.name == attr_name), None)
+    if not isinstance(attr, Attribute) or not attr.columns:
+        raise AttributeError(f"Entity {cls.__name__} does not have a column for attribute {attr_name}")
+    return attr
+
+
+def _db_value(attr, value):
+    # Validation rejects the values of wrong types or out of range with a TypeError/ValueError, as Pony queries do
+    converter = attr.converters[0]
+    return converter.py2sql(converter.validate(value))
+
+
+def entity_columns(cls):
+    return tuple(column for attr in (*cls._attrs_with_columns_, *cls._subclass_attrs_) for column in attr.columns)
+
+
+# Search results with no explicit sort order: channels first, then collections, then torrents with seeders
+TXT_PRIORITY_SQL = (
+    f'CASE WHEN "g"."metadata_type" = {CHANNEL_TORRENT} THEN 1 WHEN "g"."metadata_type" = {COLLECTION_NODE} THEN 2 '
+    f'WHEN "h"."seeders" > 0 THEN 3 ELSE 4 END'
+)
+
+
+def _order_terms(cls, sort_by, sort_desc, txt_filter):
+    """
+    Get the sort order for the query as a tuple of (SQL expression, descending) terms.
+    The earlier terms take precedence, just like with the chained sort_by calls of the Pony query.
+    The rowid always comes last, so the order is total.
+    """
+    order = ()
+    if txt_filter and sort_by is None:
+        order += ((TXT_PRIORITY_SQL, False),)
+    if sort_by == "HEALTH":
+        order += (('"h"."seeders"', sort_desc), ('"h"."leechers"', sort_desc))
+    elif sort_by == "size" and not issubclass(cls, cls._database_.ChannelMetadata):
+        # When querying for mixed channels / torrents lists, channels should have priority over torrents
+        order += (('"g"."num_entries"', sort_desc), (f'"g"."{_column(cls, "size").column}"', sort_desc))
+    elif sort_by:
+        order += ((f'"g"."{_column(cls, sort_by).column}"', sort_desc),)
+    return order + (('"g"."rowid"', sort_desc),)
+
+
+def _encode_cursor_value(value):
+    if isinstance(value, bytes):
+        return {"hex": hexlify(value)}
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, type(None))):
+        raise TypeError(f"Can not encode value {value!r} in a cursor")
+    return value
+
+
+def _decode_cursor_value(value):
+    if isinstance(value, dict):
+        if set(value) != {"hex"} or not isinstance(value["hex"], str):
+            raise ValueError("Malformed cursor")
+        return binascii.unhexlify(value["hex"])
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, type(None))):
+        raise ValueError("Malformed cursor")
+    return value
+
+
+def _reject_constant(name):
+    raise ValueError(f"Malformed cursor: {name}")
+
+
+def encode_cursor(values):
+    """
+    Encode the sort key of an entry into an opaque string for the REST API.
+    The values are encoded as a JSON list, with the binary values as {"hex": ...} objects.
+    """
+    encoded = json.dumps([_encode_cursor_value(v) for v in values], separators=(',', ':'), allow_nan=False)
+    return urlsafe_b64encode(encoded.encode('utf8')).decode('utf8')
+
+
+def decode_cursor(cursor):
+    """
+    Decode the sort key encoded by encode_cursor.
+    :raises ValueError: if the cursor is malformed
+    """
+    if len(cursor) > MAX_CURSOR_LENGTH:
+        raise ValueError("The cursor is too long")
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode('utf8')).decode('utf8'), parse_constant=_reject_constant)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"Malformed cursor: {e}") from e
+    if not isinstance(values, list):
+        raise ValueError("Malformed cursor")
+    return tuple(_decode_cursor_value(v) for v in values)
+
+
+def build_query_signature(
+    cls,
+    select=SELECT_ENTRIES,
+    columns=None,
+    first=1,
+    last=None,
+    metadata_type=None,
+    channel_pk=None,
+    exclude_deleted=False,
+    hide_xxx=False,
+    exclude_legacy=False,
+    origin_id=None,
+    sort_by=None,
+    sort_desc=True,
+    txt_filter=None,
+    cursor=None,
+    subscribed=None,
+    category=None,
+    attribute_ranges=None,
+    infohash=None,
+    id_=None,
+    complete_channel=None,
+    self_checked_torrent=None,
+):
+    """
+    Normalize the parameters of MetadataNode.get_entries into a query signature and the list of values to bind.
+    The signature only depends on the shape of the query, not on the values of the parameters, so it can be used
+    as the key for the cache of compiled query plans.
+    The cursor, as produced by encode_cursor for the last entry of the previous page, makes the query return
+    the entries that follow that entry in the sort order (keyset pagination).
+    :return: a tuple of (signature, list of the parameter values), or None if the query can return nothing
+    """
+    params = []
+    conditions = []
+
+    def bind(attr, value):
+        params.append(_db_value(attr, value))
+
+    if txt_filter:
+        if txt_filter == "*":
+            # Consistent with MetadataNode.search_keyword, the "match everything" query matches nothing
+            return None
+        if not isinstance(txt_filter, str):
+            raise OperationalError(None, f"Invalid full-text search query: {txt_filter!r}")
+        conditions.append(("fts",))
+        params.extend((txt_filter, FTS_MATCHES_LIMIT))
+
+    if metadata_type is not None:
+        try:
+            types = sorted(int(t) for t in metadata_type)
+        except TypeError:
+            types = [int(metadata_type)]
+        conditions.append(("metadata_type_in", len(types)))
+        params.extend(types)
+
+    if channel_pk is not None:
+        conditions.append(("eq", "public_key"))
+        bind(cls.public_key, b"" if channel_pk == NULL_KEY_SUBST else channel_pk)
+
+    for attr_name, left, right in attribute_ranges or ():
+        attr = _column(cls, attr_name)
+        if left is not None:
+            conditions.append(("ge", attr.column))
+            bind(attr, left)
+        if right is not None:
+            conditions.append(("lt", attr.column))
+            bind(attr, right)
+
+    # origin_id can be zero, for e.g. root channel
+    if id_ is not None:
+        conditions.append(("eq", "id_"))
+        bind(cls.id_, id_)
+    if origin_id is not None:
+        conditions.append(("eq", "origin_id"))
+        bind(cls.origin_id, origin_id)
+    if subscribed is not None:
+        conditions.append(("is_true", _column(cls, "subscribed").column))
+    if category:
+        conditions.append(("eq", "tags"))
+        bind(cls.tags, category)
+    if exclude_deleted:
+        conditions.append(("ne_const", "status", TODELETE))
+    if hide_xxx:
+        conditions.append(("eq_const", _column(cls, "xxx").column, 0))
+    if exclude_legacy:
+        conditions.append(("ne_const", "status", LEGACY_ENTRY))
+    if infohash:
+        attr = _column(cls, "infohash")
+        conditions.append(("eq", attr.column))
+        bind(attr, infohash)
+    if self_checked_torrent is not None:
+        conditions.append(("health_self_checked",))
+        params.append(int(bool(self_checked_torrent)))
+    # ACHTUNG! Setting complete_channel to True forces the metadata type to Channels only!
+    if complete_channel:
+        conditions.append(("complete_channel",))
+
+    order = _order_terms(cls, sort_by, sort_desc, txt_filter) if select != SELECT_COUNT else ()
+    if cursor is not None and order:
+        cursor_values = decode_cursor(cursor)
+        if len(cursor_values) != len(order):
+            raise ValueError("The cursor does not match the sort order of the query")
+        # The leading sort key can only narrow down the index range if it is known to be not NULL
+        conditions.append(("keyset", cursor_values[0] is None))
+        params.extend(cursor_values)
+        # The cursor replaces the offset, so first and last only define the size of the page
+        first, last = 1, None if last is None else last - (first or 1) + 1
+
+    offset = (first or 1) - 1
+    if offset < 0:
+        raise TypeError("Parameter 'first' cannot be less than 1")
+    if last is not None and last <= offset:
+        return None
+    paginated = select != SELECT_COUNT and (last is not None or offset > 0)
+    if paginated:
+        params.extend((-1 if last is None else last - offset, offset))
+
+    if select == SELECT_ENTRIES:
+        selected = entity_columns(cls)
+    elif select == SELECT_ROWS:
+        selected = tuple(_column(cls, name).column for name in columns)
+    else:
+        selected = ()
+
+    discriminators = tuple(sorted({cls._discriminator_, *(c._discriminator_ for c in cls._subclasses_)}))
+    signature = (cls._table_, discriminators, select, selected, tuple(conditions), order, paginated)
+    return signature, params
+
+
+@lru_cache(maxsize=QUERY_PLANS_CACHE_SIZE)
+def compile_query_plan(signature):
+    """
+    Compile the query signature produced by build_query_signature into a raw SQL statement.
+    The values are referenced as $p0, $p1, ... in the order of the parameters list, as Pony's raw SQL expects.
+    """
+    table, discriminators, select, selected, conditions, order, paginated = signature
+    param_names = (f"$p{index}" for index in count())
+    join_health = any(c[0] == "health_self_checked" for c in conditions) or any('"h".' in e for e, _ in order)
+    where = compile_conditions(table, discriminators, conditions, order, param_names)
+    order_by = [expression + (" DESC" if descending else "") for expression, descending in order]
+
+    if select == SELECT_COUNT:
+        sql = "SELECT count(*)"
+    else:
+        sql = "SELECT " + ", ".join(f'"g"."{column}"' for column in selected)
+    sql += f' FROM "{table}" "g"'
+    if join_health:
+        sql += ' LEFT JOIN "TorrentState" "h" ON "g"."health" = "h"."rowid"'
+    sql += " WHERE " + " AND ".join(where)
+    if order_by:
+        sql += " ORDER BY " + ", ".join(order_by)
+    if paginated:
+        sql += f" LIMIT {next(param_names)} OFFSET {next(param_names)}"
+    return sql
+
+
+def compile_conditions(table, discriminators, conditions, order, param_names):
+    """
+    Compile the conditions of a query signature into the list of SQL conditions on the "g" (ChannelNode) and
+    "h" (TorrentState) tables.
+    :param param_names: the iterator over the names of the parameters, consumed in the order of the conditions
+    """
+    where = [f'"g"."metadata_type" IN ({", ".join(str(d) for d in discriminators)})']
+    for condition in conditions:
+        kind = condition[0]
+        if kind == "fts":
+            where.append(
+                f'"g"."rowid" IN (SELECT rowid FROM "{table}" WHERE rowid IN '
+                f'(SELECT rowid FROM FtsIndex WHERE FtsIndex MATCH {next(param_names)} '
+                f'ORDER BY bm25(FtsIndex) LIMIT {next(param_names)}) GROUP BY coalesce(infohash, rowid))'
+            )
+        elif kind == "metadata_type_in":
+            placeholders = ", ".join(next(param_names) for _ in range(condition[1]))
+            where.append(f'"g"."metadata_type" IN ({placeholders})' if placeholders else "0")
+        elif kind == "eq":
+            where.append(f'"g"."{condition[1]}" = {next(param_names)}')
+        elif kind == "ge":
+            where.append(f'"g"."{condition[1]}" >= {next(param_names)}')
+        elif kind == "lt":
+            where.append(f'"g"."{condition[1]}" < {next(param_names)}')
+        elif kind == "is_true":
+            where.append(f'"g"."{condition[1]}"')
+        elif kind == "eq_const":
+            where.append(f'"g"."{condition[1]}" = {int(condition[2])}')
+        elif kind == "ne_const":
+            where.append(f'"g"."{condition[1]}" <> {int(condition[2])}')
+        elif kind == "health_self_checked":
+            where.append(f'"h"."self_checked" = {next(param_names)}')
+        elif kind == "complete_channel":
+            where.append(f'"g"."metadata_type" = {CHANNEL_TORRENT} AND "g"."timestamp" = "g"."local_version"')
+        elif kind == "keyset":
+            where.append(_keyset_condition(order, [next(param_names) for _ in order], leading_null=condition[1]))
+    return where
+
+
+def _keyset_condition(order, names, leading_null):
+    """
+    Build the condition that selects the entries following the given sort key in the given sort order.
+    This is the row value comparison (key, rowid) > (?, ?), expanded term by term, as the terms can be sorted in
+    different directions and can be NULL. SQLite sorts NULLs before any other values.
+    """
+    condition = None
+    for (expression, descending), name in reversed(list(zip(order, names))):
+        if expression == '"g"."rowid"':
+            after = f"{expression} {'<' if descending else '>'} {name}"
+        elif descending:
+            after = f"({expression} < {name} OR ({expression} IS NULL AND {name} IS NOT NULL))"
+        else:
+            after = f"({expression} > {name} OR ({expression} IS NOT NULL AND {name} IS NULL))"
+        condition = after if condition is None else f"({after} OR ({expression} IS {name} AND {condition}))"
+
+    # The expanded condition can not be used to look up the index, so add the implied range of the leading key
+    expression, descending = order[0]
+    if expression.startswith('"g".') and not leading_null:
+        if not descending:
+            condition = f"{expression} >= {names[0]} AND {condition}"
+        elif expression == '"g"."rowid"':
+            condition = f"{expression} <= {names[0]} AND {condition}"
+        else:
+            condition = f"({expression} <= {names[0]} OR {expression} IS NULL) AND {condition}"
+    return condition
+
+
+@lru_cache(maxsize=QUERY_PLANS_CACHE_SIZE)
+def compile_sort_key_query(table, order):
+    """
+    Compile the raw SQL statement that gets the sort key of the entry with the given rowid ($p0).
+    """
+    sql = "SELECT " + ", ".join(expression for expression, _ in order) + f' FROM "{table}" "g"'
+    if any('"h".' in expression for expression, _ in order):
+        sql += ' LEFT JOIN "TorrentState" "h" ON "g"."health" = "h"."rowid"'
+    return sql + ' WHERE "g"."rowid" = $p0'
+
+
+def get_sort_key_query(cls, rowid, sort_by=None, sort_desc=True, txt_filter=None):
+    """
+    Get the raw SQL statement and the values to bind to it for getting the sort key of the given entry,
+    for building the cursor of the keyset pagination.
+    :return: a tuple of (sql, dict of values)
+    """
+    return compile_sort_key_query(cls._table_, _order_terms(cls, sort_by, sort_desc, txt_filter)), {"p0": rowid}
+
+
+def get_query_plan(cls, **kwargs):
+    """
+    Get the raw SQL statement and the values to bind to it for the given MetadataNode.get_entries parameters.
+    :return: a tuple of (sql, dict of values), or None if the query can return nothing
+    """
+    normalized = build_query_signature(cls, **kwargs)
+    if normalized is None:
+        return None
+    signature, params = normalized
+    return compile_query_plan(signature), {f"p{index}": value for index, value in enumerate(params)}
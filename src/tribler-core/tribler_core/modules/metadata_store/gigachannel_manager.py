@@ -1,5 +1,5 @@
 import asyncio
-from asyncio import CancelledError, get_event_loop, wait_for
+from asyncio import CancelledError, wait_for
 
 from ipv8.database import database_blob
 from ipv8.taskmanager import TaskManager, task
@@ -10,6 +10,7 @@ from tribler_common.simpledefs import DLSTATUS_SEEDING, NTFY
 
 from tribler_core.modules.libtorrent.download_config import DownloadConfig
 from tribler_core.modules.libtorrent.torrentdef import TorrentDef
+from tribler_core.modules.metadata_store.channel_processing import ChannelProcessingScheduler
 from tribler_core.modules.metadata_store.orm_bindings.channel_node import COMMITTED
 from tribler_core.utilities.unicode import hexlify
 
@@ -32,6 +33,9 @@ class GigaChannelManager(TaskManager):
         # to run more that one of these simultaneously
         self.channels_processing_queue = {}
         self.processing = False
+        self.channel_processing_scheduler = ChannelProcessingScheduler(
+            session.mds, workers=session.config.get_chant_channel_processing_workers()
+        )
 
     def start(self):
         """
@@ -80,13 +84,16 @@ class GigaChannelManager(TaskManager):
             if channel is None:
                 self._logger.warning("Tried to regenerate non-existing channel %s %i", hexlify(channel_pk), channel_id)
                 return None
-            for d in self.session.dlmgr.get_downloads_by_name(channel.dirname):
-                await self.session.dlmgr.remove_download(d, remove_content=True)
-            regenerated = channel.consolidate_channel_torrent()
-            # If the user created their channel, but added no torrents to it,
-            # the channel torrent will not be created.
-            if regenerated is None:
-                return None
+            dirname = channel.dirname
+            regenerated = channel.rebuild_channel_torrent()
+        # The rebuilt torrent reuses the files of the stale downloads, so they are only removed afterwards,
+        # and without their contents
+        for d in self.session.dlmgr.get_downloads_by_name(dirname):
+            await self.session.dlmgr.remove_download(d, remove_content=False)
+        # If the user created their channel, but added no torrents to it,
+        # the channel torrent will not be created.
+        if regenerated is None:
+            return None
         tdef = TorrentDef.load_from_dict(regenerated)
         self.updated_my_channel(tdef)
         return tdef
@@ -103,6 +110,7 @@ class GigaChannelManager(TaskManager):
         Stop the gigachannel manager.
         """
         await self.shutdown_task_manager()
+        await self.channel_processing_scheduler.shutdown()
 
     def remove_cruft_channels(self):
         """
@@ -152,15 +160,19 @@ class GigaChannelManager(TaskManager):
     @task
     async def process_queued_channels(self):
         self.processing = True
+        channels_to_process = []
         while self.channels_processing_queue:
             infohash, (action, data) = next(iter(self.channels_processing_queue.items()))
             self.channels_processing_queue.pop(infohash)
             if action == PROCESS_CHANNEL_DIR:
-                await self.process_channel_dir_threaded(data)  # data is a channel object (used read-only!)
+                # Channel dirs are processed concurrently, after the rest of the queue
+                channels_to_process.append(data)  # data is a channel object (used read-only!)
             elif action == REMOVE_CHANNEL_DOWNLOAD:
                 await self.remove_channel_download(data)  # data is a tuple (download, remove_content bool)
             elif action == CLEANUP_UNSUBSCRIBED_CHANNEL:
                 self.cleanup_channel(data)  # data is a tuple (public_key, id_)
+        if channels_to_process:
+            await self.process_channel_dirs(channels_to_process)
         self.processing = False
 
     def check_channels_updates(self):
@@ -282,25 +294,20 @@ class GigaChannelManager(TaskManager):
             self.channels_processing_queue[channel.infohash] = (PROCESS_CHANNEL_DIR, channel)
         return download
 
-    async def process_channel_dir_threaded(self, channel):
-        def _process_download():
-            try:
-                channel_dirname = self.session.mds.get_channel_dir_path(channel)
-                self.session.mds.process_channel_dir(
-                    channel_dirname, channel.public_key, channel.id_, external_thread=True
-                )
-            except Exception as e:
-                self._logger.error("Error when processing channel dir download: %s", e)
-                return
-            finally:
-                self.session.mds._db.disconnect()
-
-        await get_event_loop().run_in_executor(None, _process_download)
+    async def process_channel_dirs(self, channels):
+        """
+        Process the downloaded directories of the given channels, all at once.
+        :param channels: a list of channel ORM objects (used read-only!)
+        """
+        await self.channel_processing_scheduler.process_channels(channels)
 
-        with db_session:
-            channel_upd = self.session.mds.ChannelMetadata.get(public_key=channel.public_key, id_=channel.id_)
-            channel_upd_dict = channel_upd.to_simple_dict()
-        self.session.notifier.notify(NTFY.CHANNEL_ENTITY_UPDATED, channel_upd_dict)
+        for channel in channels:
+            with db_session:
+                channel_upd = self.session.mds.ChannelMetadata.get(public_key=channel.public_key, id_=channel.id_)
+                if channel_upd is None:
+                    continue
+                channel_upd_dict = channel_upd.to_simple_dict()
+            self.session.notifier.notify(NTFY.CHANNEL_ENTITY_UPDATED, channel_upd_dict)
 
     def updated_my_channel(self, tdef):
         """
@@ -1,5 +1,7 @@
 import os
+import time
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
 from ipv8.database import database_blob
@@ -20,7 +22,13 @@ from tribler_core.modules.metadata_store.orm_bindings.channel_node import (
     TODELETE,
     UPDATED,
 )
-from tribler_core.modules.metadata_store.serialization import CHANNEL_TORRENT, ChannelMetadataPayload
+from tribler_core.modules.metadata_store.serialization import (
+    CHANNEL_TORRENT,
+    DELETED,
+    SIGNATURE_SIZE,
+    ChannelMetadataPayload,
+    iter_signed_payloads_from_stream,
+)
 from tribler_core.utilities import path_util
 from tribler_core.utilities.libtorrent_helper import libtorrent as lt
 from tribler_core.utilities.path_util import str_path
@@ -32,6 +40,13 @@ CHANNEL_DIR_NAME_ID_LENGTH = 16  # Zero-padded long int in hex form
 CHANNEL_DIR_NAME_LENGTH = CHANNEL_DIR_NAME_PK_LENGTH + CHANNEL_DIR_NAME_ID_LENGTH
 BLOB_EXTENSION = '.mdblob'
 LZ4_END_MARK_SIZE = 4  # in bytes, from original specification. We don't use CRC
+MDBLOB_PIECE_SIZE = 1 << 20  # in bytes, the size limit for the pieces mdblobs are read and decompressed in
+# The blobs with a lower ratio of live entries are rewritten when compacting a channel torrent
+COMPACTION_LIVE_RATIO_THRESHOLD = 0.5
+
+
+# Stay well below SQLite's default limit of 999 host parameters per statement
+SQL_VARIABLES_LIMIT = 900
 
 
 def chunks(l, n):
@@ -64,38 +79,117 @@ def get_mdblob_sequence_number(filename):
     return None
 
 
+class LZ4DecompressionException(RuntimeError):
+    pass
+
+
+def lz4_decompress_pieces(compressed_pieces, max_piece_size=MDBLOB_PIECE_SIZE):
+    """
+    Decompress an LZ4 frame on the fly, without ever holding the whole frame in memory.
+    :param compressed_pieces: an iterable of bytes objects that form the LZ4 frame when concatenated together
+    :param max_piece_size: the size limit for the produced pieces of decompressed data, in bytes
+    :return: a generator of pieces of decompressed data
+    :raise LZ4DecompressionException: if the frame is corrupted or incomplete
+    """
+    decompressor = lz4.frame.LZ4FrameDecompressor()
+
+    def decompress(data):
+        # The errors are told apart from the ones raised by the consumers of the pieces
+        try:
+            return decompressor.decompress(data, max_length=max_piece_size)
+        except RuntimeError as e:
+            raise LZ4DecompressionException(str(e)) from e
+
+    for compressed_piece in compressed_pieces:
+        yield decompress(compressed_piece)
+        # The decompressor holds back the output that did not fit into the size limit
+        while not (decompressor.eof or decompressor.needs_input):
+            yield decompress(b'')
+        if decompressor.eof:
+            return
+    raise LZ4DecompressionException("LZ4 frame incomplete")
+
+
+def read_mdblob_file_pieces(filepath, max_piece_size=MDBLOB_PIECE_SIZE):
+    """
+    Read an mdblob file in pieces, decompressing it on the fly if it is an .lz4 file.
+    :param filepath: the path to the mdblob file
+    :param max_piece_size: the size limit for the produced pieces of (decompressed) data, in bytes
+    :return: a generator of pieces of the mdblob contents
+    :raise LZ4DecompressionException: if the file is lz4-compressed, and the compressed data is corrupted or incomplete
+    """
+    with open(str_path(filepath), 'rb') as f:
+        file_pieces = iter(lambda: f.read(max_piece_size), b'')
+        if str(filepath).endswith('.lz4'):
+            yield from lz4_decompress_pieces(file_pieces, max_piece_size)
+        else:
+            yield from file_pieces
+
+
+def serialized_entries_to_chunks(serialized_entries, chunk_size):
+    """
+    Pack the serialized metadata entries into lz4-compressed chunks, in a single pass over the entries.
+    An entry that does not fit into the current chunk starts the next one.
+    :param serialized_entries: an iterable of the serialized entries (with signatures) to process.
+    :param chunk_size: the desired chunk size limit, in bytes. The produced chunks' size will never exceed this value.
+    :return: a generator of (chunk, end_index) tuples, where chunk is the resulting chunk in bytes form and end_index
+        is the index of the element of the input following the last element put into the chunk.
+    """
+    compressor = None
+    out_list = []
+    offset = 0
+    index = -1
+    for index, data in enumerate(serialized_entries):
+        while True:
+            if compressor is None:
+                compressor = lz4.frame.LZ4FrameCompressor(auto_flush=True)
+                header = compressor.begin()
+                out_list, offset = [header], len(header)  # LZ4 header
+            blob = compressor.compress(data)
+            # Does it fit within the chunk size limit?
+            if offset + len(blob) <= chunk_size - LZ4_END_MARK_SIZE:
+                break
+            if len(out_list) == 1:
+                raise Exception('Serialized entry size > blob size limit!', hexlify(data[-SIGNATURE_SIZE:]))
+            # The blob that did not fit is dropped, so the chunk is finished with just the LZ4 end mark
+            out_list.append(compressor.flush())
+            yield b''.join(out_list), index
+            compressor = None
+        offset += len(blob)
+        out_list.append(blob)
+    if compressor is not None:
+        out_list.append(compressor.flush())  # LZ4 end mark
+        yield b''.join(out_list), index + 1
+
+
+def entries_to_chunks(metadata_list, chunk_size):
+    """
+    Serialize the metadata entries and pack them into lz4-compressed chunks, in a single pass over the entries.
+    Every entry is serialized exactly once, and its signature is not re-checked.
+    :param metadata_list: an iterable of the metadata to process.
+    :param chunk_size: the desired chunk size limit, in bytes. The produced chunks' size will never exceed this value.
+    :return: a generator of (chunk, end_index) tuples, see serialized_entries_to_chunks
+    """
+    return serialized_entries_to_chunks(
+        (
+            metadata.serialized_delete() if metadata.status == TODELETE else metadata.serialized(check_signature=False)
+            for metadata in metadata_list
+        ),
+        chunk_size,
+    )
+
+
 def entries_to_chunk(metadata_list, chunk_size, start_index=0):
     """
-    For efficiency reasons, this is deliberately written in C style
+    Pack a single chunk of entries, see entries_to_chunks.
     :param metadata_list: the list of metadata to process.
     :param chunk_size: the desired chunk size limit, in bytes. The produced chunk's size will never exceed this value.
     :param start_index: the index of the element of metadata_list from which the processing should start.
     :return: (chunk, last_entry_index) tuple, where chunk is the resulting chunk in string form and
         last_entry_index is the index of the element of the input list that was put into the chunk the last.
     """
-    # Try to fit as many blobs into this chunk as permitted by chunk_size and
-    # calculate their ends' offsets in the blob
-
-    last_entry_index = None
-    with lz4.frame.LZ4FrameCompressor(auto_flush=True) as c:
-        header = c.begin()
-        offset = len(header)
-        out_list = [header]  # LZ4 header
-        for index, metadata in enumerate(metadata_list[start_index:], start_index):
-            blob = c.compress(metadata.serialized_delete() if metadata.status == TODELETE else metadata.serialized())
-            # Chunk size limit reached?
-            if offset + len(blob) > (chunk_size - LZ4_END_MARK_SIZE):
-                break
-            # Now that we now it will fit in, we can safely append it
-            offset += len(blob)
-            last_entry_index = index
-            out_list.append(blob)
-        out_list.append(c.flush())  # LZ4 end mark
-
-    chunk = b''.join(out_list)
-    if last_entry_index is None:
-        raise Exception('Serialized entry size > blob size limit!', hexlify(metadata_list[start_index].signature))
-    return chunk, last_entry_index + 1
+    chunk, end_index = next(entries_to_chunks(islice(metadata_list, start_index, None), chunk_size))
+    return chunk, start_index + end_index
 
 
 def define_binding(db):
@@ -210,6 +304,135 @@ def define_binding(db):
 
             return self.commit_channel_torrent(new_start_timestamp=start_timestamp)
 
+        @db_session
+        def compact_channel_torrent(self, live_ratio_threshold=COMPACTION_LIVE_RATIO_THRESHOLD):
+            """
+            Compact the channel torrent dir incrementally. Unlike consolidate_channel_torrent, this only rewrites
+            the blobs where the ratio of the live entries (the entries that are neither updated nor deleted since,
+            and the delete commands for the entries in the blobs that are kept) is below the threshold.
+            The live entries of these blobs are copied to the new blobs as they are, without re-signing them, and
+            the rest of the blobs are left untouched, so the subscribers only have to download the new blobs.
+            The pending changes are committed first.
+            :param live_ratio_threshold: the blobs with a lower ratio of the live entries are rewritten
+            :return The new channel torrent, or None if there was nothing to compact
+            """
+            self.commit_channel_torrent()
+
+            channel_dir = path_util.abspath(self._channels_dir / self.dirname)
+            if not channel_dir.is_dir():
+                return None
+            blobs = []
+            for filename in sorted(channel_dir.iterdir()):
+                blob_sequence_number = get_mdblob_sequence_number(filename)
+                if blob_sequence_number is not None and blob_sequence_number > self.start_timestamp:
+                    blobs.append(filename)
+
+            def read_blob(filename):
+                # Yields (signature, signature of the deleted entry or None, serialized entry) tuples
+                for payload, signed_data in iter_signed_payloads_from_stream(read_mdblob_file_pieces(filename), False):
+                    deleted_signature = payload.delete_signature if payload.metadata_type == DELETED else None
+                    yield payload.signature, deleted_signature, signed_data
+
+            # The first pass only collects the signatures, to avoid holding the whole channel in memory
+            blobs_signatures = [[(signature, deleted) for signature, deleted, _ in read_blob(f)] for f in blobs]
+            entries_signatures = [signature for blob in blobs_signatures for signature, deleted in blob if not deleted]
+            live_signatures = set()
+            for chunk in chunks(entries_signatures, SQL_VARIABLES_LIMIT):
+                chunk = [database_blob(signature) for signature in chunk]
+                live_signatures.update(
+                    bytes(s) for s in select(g.signature for g in db.ChannelNode if g.signature in chunk)
+                )
+
+            # The delete commands are only needed for the entries that stay in the kept blobs. The deleted entries
+            # always come in the blobs before their delete commands, so the blobs are decided on in their order.
+            rewritten_blobs = []
+            empty_blobs = []
+            kept_signatures = set()
+
+            def is_live(signature, deleted):
+                return deleted in kept_signatures if deleted else signature in live_signatures
+
+            for filename, blob in zip(blobs, blobs_signatures):
+                num_live = sum(1 for signature, deleted in blob if is_live(signature, deleted))
+                if not blob:
+                    empty_blobs.append(filename)
+                elif num_live < live_ratio_threshold * len(blob):
+                    rewritten_blobs.append(filename)
+                else:
+                    kept_signatures.update(signature for signature, _ in blob)
+            # The empty blobs (e.g. left by compacting a channel with no live entries) are only removed along with
+            # the other rewritten blobs, otherwise every compaction would replace them with a new version
+            if not rewritten_blobs:
+                return None
+            rewritten_blobs.extend(empty_blobs)
+
+            # The second pass collects the live entries from the rewritten blobs.
+            # Delete commands always go after the other entries, as they do in the commits.
+            live_entries = []
+            delete_commands = []
+            for filename in rewritten_blobs:
+                for signature, deleted, signed_data in read_blob(filename):
+                    if signature in kept_signatures or not is_live(signature, deleted):
+                        continue
+                    kept_signatures.add(signature)
+                    (live_entries if deleted is None else delete_commands).append(bytes(signed_data) + signature)
+
+            # There must be at least one new blob, because the channel's timestamp is the last blob's sequence number
+            chunks_data = [
+                data for data, _ in serialized_entries_to_chunks(live_entries + delete_commands, self._CHUNK_SIZE_LIMIT)
+            ]
+            last_blob_number = get_mdblob_sequence_number(blobs[-1])
+            for data in chunks_data or [lz4.frame.compress(b'')]:
+                blob_timestamp = clock.tick()
+                assert blob_timestamp > last_blob_number
+                blob_filename = Path(channel_dir, str(blob_timestamp).zfill(12) + BLOB_EXTENSION + '.lz4')
+                assert not blob_filename.exists()  # Never ever write over existing files.
+                blob_filename.write_bytes(data)
+                last_blob_number = blob_timestamp
+            for filename in rewritten_blobs:
+                os.unlink(str_path(filename))
+
+            update_dict, torrent = self.create_channel_torrent(channel_dir, last_blob_number)
+            for attr, val in update_dict.items():
+                setattr(self, attr, val)
+            self.local_version = self.timestamp
+            self.sign()
+            self.to_file(self._channels_dir / (self.dirname + BLOB_EXTENSION))
+
+            self._logger.info(
+                "Channel %s compacted: rewrote %i of %i blobs with %i live entries into %i blobs. New version is %i",
+                hexlify(self.public_key),
+                len(rewritten_blobs),
+                len(blobs),
+                len(live_entries) + len(delete_commands),
+                max(len(chunks_data), 1),
+                self.timestamp,
+            )
+            return torrent
+
+        @db_session
+        def rebuild_channel_torrent(self):
+            """
+            Make the channel torrent anew, e.g. when it was lost or its download is damaged. The channel is compacted
+            instead of being consolidated, so the intact blobs and the signatures of the entries are kept. The channel
+            dir is only consolidated from scratch if the blobs of the current version of the channel are missing.
+            :return The new channel torrent, or None if the channel is empty
+            """
+            torrent = self.compact_channel_torrent()
+            if torrent is not None:
+                return torrent
+
+            channel_dir = path_util.abspath(self._channels_dir / self.dirname)
+            if (
+                self.local_version == self.timestamp
+                and channel_dir.is_dir()
+                and any(get_mdblob_sequence_number(filename) == self.timestamp for filename in channel_dir.iterdir())
+            ):
+                # Nothing to compact and the blobs are all there, so the channel entry stays the same
+                _, torrent = self.create_channel_torrent(channel_dir, self.timestamp)
+                return torrent
+            return self.consolidate_channel_torrent()
+
         def update_channel_torrent(self, metadata_list):
             """
             Channel torrents are append-only to support seeding the old versions
@@ -230,10 +453,10 @@ def define_binding(db):
             existing_contents = sorted(channel_dir.iterdir())
             last_existing_blob_number = get_mdblob_sequence_number(existing_contents[-1]) if existing_contents else None
 
-            index = 0
-            while index < len(metadata_list):
-                # Squash several serialized and signed metadata entries into a single file
-                data, index = entries_to_chunk(metadata_list, self._CHUNK_SIZE_LIMIT, start_index=index)
+            start_time = time.time()
+            total_size = 0
+            # Squash several serialized and signed metadata entries into a single file
+            for data, index in entries_to_chunks(metadata_list, self._CHUNK_SIZE_LIMIT):
                 # Blobs ending with TODELETE entries increase the final timestamp as a workaround for delete commands
                 # possessing no timestamp.
                 if metadata_list[index - 1].status == TODELETE:
@@ -254,14 +477,33 @@ def define_binding(db):
                 assert not blob_filename.exists()  # Never ever write over existing files.
                 blob_filename.write_bytes(data)
                 last_existing_blob_number = blob_timestamp
+                total_size += len(data)
+
+            duration = time.time() - start_time
+            self._logger.info(
+                "Committed %i entries into %i bytes of mdblobs in %.2f s (%.0f entries/s, %.2f MB/s)",
+                len(metadata_list),
+                total_size,
+                duration,
+                len(metadata_list) / duration if duration else 0,
+                total_size / duration / 1e6 if duration else 0,
+            )
 
             # TODO: add error-handling routines to make sure the timestamp is not messed up in case of an error
 
-            # Make torrent out of dir with metadata files
+            return self.create_channel_torrent(channel_dir, last_existing_blob_number)
+
+        def create_channel_torrent(self, channel_dir, timestamp):
+            """
+            Make the channel torrent out of the dir with the metadata files.
+            :param channel_dir: the channel dir
+            :param timestamp: the sequence number of the last blob in the dir, the new timestamp of the channel
+            :return The newly create channel torrent infohash, final timestamp for the channel and torrent date
+            """
             torrent, infohash = create_torrent_from_dir(channel_dir, self._channels_dir / (self.dirname + ".torrent"))
             torrent_date = datetime.utcfromtimestamp(torrent[b'creation date'])
 
-            return {"infohash": infohash, "timestamp": last_existing_blob_number, "torrent_date": torrent_date}, torrent
+            return {"infohash": infohash, "timestamp": timestamp, "torrent_date": torrent_date}, torrent
 
         def commit_channel_torrent(self, new_start_timestamp=None, commit_list=None):
             """
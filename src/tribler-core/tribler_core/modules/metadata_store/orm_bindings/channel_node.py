@@ -173,21 +173,30 @@ def define_binding(db, logger=None, key=None):
 
             super().__init__(*args, **kwargs)
 
-        def _serialized(self, key=None):
+        def _serialized(self, key=None, check_signature=True):
             """
             Serializes the object and returns the result with added signature (tuple output)
             :param key: private key to sign object with
+            :param check_signature: if False, the signature of the entry is not checked when it is not re-signed.
+                Checking the signature is the costliest part of serializing, and it is pointless for e.g. the entries
+                that were checked when they were added to the database.
             :return: (serialized_data, signature) tuple
             """
-            return self._payload_class(key=key, unsigned=(self.signature is None), **self.to_dict())._serialized()
-
-        def serialized(self, key=None):
+            return self._payload_class(
+                key=key,
+                unsigned=(self.signature is None),
+                skip_key_check=(key is None and not check_signature),
+                **self.to_dict(),
+            )._serialized()
+
+        def serialized(self, key=None, check_signature=True):
             """
             Serializes the object and returns the result with added signature (blob output)
             :param key: private key to sign object with
+            :param check_signature: if False, the signature of the entry is not checked, see _serialized
             :return: serialized_data+signature binary string
             """
-            return b''.join(self._serialized(key))
+            return b''.join(self._serialized(key, check_signature=check_signature))
 
         def _serialized_delete(self):
             """
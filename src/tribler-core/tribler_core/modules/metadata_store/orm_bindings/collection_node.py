@@ -4,12 +4,12 @@ from pathlib import Path
 from ipv8.database import database_blob
 
 from pony import orm
-from pony.orm import db_session, select
+from pony.orm import db_session
 
 from tribler_core.exceptions import DuplicateTorrentFileError
 from tribler_core.modules.libtorrent.torrentdef import TorrentDef
 from tribler_core.modules.metadata_store.discrete_clock import clock
-from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import chunks
+from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import SQL_VARIABLES_LIMIT, chunks
 from tribler_core.modules.metadata_store.orm_bindings.channel_node import (
     COMMITTED,
     DIRTY_STATUSES,
@@ -18,9 +18,98 @@ from tribler_core.modules.metadata_store.orm_bindings.channel_node import (
     UPDATED,
 )
 from tribler_core.modules.metadata_store.orm_bindings.torrent_metadata import tdef_to_metadata_dict
-from tribler_core.modules.metadata_store.serialization import COLLECTION_NODE, CollectionNodePayload
+from tribler_core.modules.metadata_store.serialization import CHANNEL_TORRENT, COLLECTION_NODE, CollectionNodePayload
 from tribler_core.utilities.random_utils import random_infohash
 
+# The personal channel trees are traversed with recursive SQL queries. Only collections (including channels) can have
+# contents, so the paths go through them. Entries that are their own parent are not considered their own contents.
+_COLLECTION_TYPES = f"{COLLECTION_NODE}, {CHANNEL_TORRENT}"
+
+# The dirty personal entries and all of their ancestors. The unary plus makes SQLite look up the few dirty entries
+# by the status index, instead of scanning all the personal entries by the public key index.
+sql_dirty_paths_cte = f"""
+    dirty_path(rowid_, id_, origin_id) AS (
+        SELECT rowid, id_, origin_id FROM ChannelNode
+        WHERE status IN ({", ".join(str(s) for s in DIRTY_STATUSES)}) AND +public_key = $public_key
+        UNION
+        SELECT p.rowid, p.id_, p.origin_id FROM dirty_path c
+        JOIN ChannelNode p ON p.public_key = $public_key AND p.id_ = c.origin_id
+        WHERE p.metadata_type IN ({_COLLECTION_TYPES})
+    )"""
+
+sql_select_dirty_paths = "SELECT g.* FROM ChannelNode g WHERE g.rowid IN (SELECT rowid_ FROM dirty_path)"
+
+# The entries matching the roots condition, along with all of their contents
+sql_subtrees_cte = f"""
+    subtree(rowid_, id_, metadata_type) AS (
+        SELECT rowid, id_, metadata_type FROM ChannelNode g WHERE public_key = $public_key AND {{roots_condition}}
+        UNION
+        SELECT g.rowid, g.id_, g.metadata_type FROM subtree s
+        JOIN ChannelNode g ON g.public_key = $public_key AND g.origin_id = s.id_ AND g.id_ != g.origin_id
+        WHERE s.metadata_type IN ({_COLLECTION_TYPES})
+    )"""
+
+sql_select_subtrees = "SELECT rowid_ FROM subtree"
+sql_select_votes = "SELECT rowid FROM ChannelVote WHERE channel IN ({rowids})"
+sql_delete_votes = "DELETE FROM ChannelVote WHERE rowid IN ({rowids})"
+sql_delete_nodes = "DELETE FROM ChannelNode WHERE rowid IN ({rowids})"
+
+# The direct contents of the dirty paths whose parent does not exist (and is not the root)
+sql_orphans_condition = f"""origin_id IN (
+        SELECT c.origin_id FROM dirty_path c WHERE c.origin_id != 0 AND NOT EXISTS (
+            SELECT 1 FROM ChannelNode p
+            WHERE p.public_key = $public_key AND p.id_ = c.origin_id AND p.metadata_type IN ({_COLLECTION_TYPES})
+        )
+    )"""
+
+# The contents of the collections marked for deletion
+sql_deleted_collections_condition = f"""id_ != origin_id AND origin_id IN (
+        SELECT id_ FROM ChannelNode
+        WHERE public_key = $public_key AND status = {TODELETE} AND metadata_type IN ({_COLLECTION_TYPES})
+    )"""
+
+# The actual contents of the collections: their child collections with their num_entries, and the number of
+# the other children, with a NULL child id_
+sql_select_children_sums = f"""
+    SELECT origin_id, CASE WHEN metadata_type = {COLLECTION_NODE} THEN id_ END AS child_id,
+        sum(CASE WHEN metadata_type = {COLLECTION_NODE} THEN ifnull(num_entries, 0) ELSE 1 END)
+    FROM ChannelNode
+    WHERE public_key = ? AND origin_id IN ({{ids}}) AND id_ != origin_id AND status != {TODELETE}
+    GROUP BY origin_id, child_id"""
+
+
+def forget_deleted_objects(entity, rowids):
+    """
+    Mark the cached ORM objects of the entity whose rows were deleted with raw SQL as deleted, like Pony does when
+    it deletes the objects itself (see Entity._delete_ and Entity._save_deleted_): they are removed from the indexes
+    of the db_session cache, and the collections of the related objects that may contain them are unloaded.
+    Pony has no public API for this, so the tests of the deleted subtrees in test_channel_metadata.py check it
+    against the Pony version in use. The pending changes must be flushed before the rows are deleted.
+    """
+    cache = entity._database_._get_cache()
+    pk_index = cache.indexes.get(entity._pk_attrs_, {})
+    for rowid in rowids:
+        obj = pk_index.get(rowid)
+        if obj is None or obj._status_ in ('deleted', 'cancelled'):
+            continue
+        for attr in obj._attrs_:
+            if attr.is_collection or not attr.reverse or not attr.reverse.is_collection:
+                continue
+            related_obj = obj._vals_.get(attr)
+            if related_obj is not None:
+                related_obj._vals_.pop(attr.reverse, None)
+        for attr in obj._simple_keys_:
+            val = obj._vals_.get(attr)
+            if val is not None and cache.indexes.get(attr, {}).get(val) is obj:
+                cache.indexes[attr].pop(val)
+        for attrs in obj._composite_keys_:
+            vals = tuple(obj._vals_.get(attr) for attr in attrs)
+            if None not in vals and cache.indexes.get(attrs, {}).get(vals) is obj:
+                cache.indexes[attrs].pop(vals)
+        pk_index.pop(rowid)
+        obj._status_ = 'deleted'
+    cache.query_results.clear()
+
 
 def define_binding(db):
     class CollectionNode(db.MetadataNode):
@@ -237,46 +326,24 @@ def define_binding(db):
         @staticmethod
         @db_session
         def get_children_dict_to_commit():
+            """
+            Find all the nodes of the personal channels affected by the changes, i.e. the dirty nodes and all of
+            their ancestors, and delete the orphans found on the way.
+            The subtrees are deleted with raw SQL, and the ORM objects of the deleted entries that are already loaded
+            in the db_session cache are then marked as deleted (see forget_deleted_objects).
+            :return: a dict of origin_id -> set of the affected nodes with that origin_id, or {} if there is nothing
+            to commit
+            """
             db.CollectionNode.collapse_deleted_subtrees()
-            upd_dict = {}
+            params = {"public_key": database_blob(db.ChannelNode._my_key.pub().key_to_bin()[10:])}
+            # Normally, the paths of the dirty nodes only end in the 0 node, which is root.
+            # Otherwise, we got some orphans.
+            db.CollectionNode.delete_subtrees(sql_orphans_condition, params, ctes=(sql_dirty_paths_cte,))
             children = {}
-            # TODO: optimize me by rewriting in pure SQL with recursive CTEs
-
-            def update_node_info(n):
-                # Add the node to its parent's set of children
-                if n.origin_id not in children:
-                    children[n.origin_id] = {n}
-                else:
-                    children[n.origin_id].add(n)
-                upd_dict[n.id_] = n
-
-            dead_parents = set()
-            # First we traverse the tree upwards from changed leaves to find all nodes affected by changes
-            for node in db.ChannelNode.select(
-                lambda g: g.public_key == db.ChannelNode._my_key.pub().key_to_bin()[10:] and g.status in DIRTY_STATUSES
-            ):
-                update_node_info(node)
-                # This process resolves the parents completely.
-                # Therefore, if a parent is already in the dict, its path has already been resolved.
-                while node and (node.origin_id not in upd_dict):
-                    # Add the node to its parent's set of children
-                    update_node_info(node)
-                    # Get parent node
-                    parent = db.CollectionNode.get(public_key=node.public_key, id_=node.origin_id)
-                    if not parent:
-                        dead_parents.add(node.origin_id)
-                    node = parent
-
-            # Normally, dead_parents should consist only of 0 node, which is root. Otherwise, we got some orphans.
-            if 0 in dead_parents:
-                dead_parents.remove(0)
-            # Delete orphans
-            db.ChannelNode.select(
-                lambda g: database_blob(db.ChannelNode._my_key.pub().key_to_bin()[10:]) == g.public_key
-                and g.origin_id in dead_parents
-            ).delete()
-            orm.flush()  # Just in case...
-            if not children or 0 not in children:
+            dirty_paths_sql = f"WITH RECURSIVE {sql_dirty_paths_cte} {sql_select_dirty_paths}"
+            for node in db.ChannelNode.select_by_sql(dirty_paths_sql, {}, params):
+                children.setdefault(node.origin_id, set()).add(node)
+            if 0 not in children:
                 return {}
             return children
 
@@ -326,19 +393,24 @@ def define_binding(db):
             :param commit_queue:
             :return:
             """
-            for node in commit_queue:
-                # Avoid updating entries that must be deleted:
-                # soft delete payloads require signatures of unmodified entries
-                if issubclass(type(node), db.CollectionNode) and node.status != TODELETE:
-                    # Update recursive count of actual non-collection contents
-                    node.num_entries = select(
-                        # For each subnode, if it is a collection, add the count of its contents to the recursive sum.
-                        # Otherwise, add just 1 to the sum (to count the subnode itself).
-                        (g.num_entries if g.metadata_type == COLLECTION_NODE else 1)
-                        for g in node.actual_contents
-                    ).sum()
-                    node.timestamp = clock.tick()
-                    node.sign()
+            # Avoid updating entries that must be deleted:
+            # soft delete payloads require signatures of unmodified entries
+            collections = [
+                node for node in commit_queue if issubclass(type(node), db.CollectionNode) and node.status != TODELETE
+            ]
+            children_sums = db.CollectionNode.get_children_sums(collections)
+            # The queue lists the children before their parents, so the changed subcollections are updated first
+            num_entries = {}
+            for node in collections:
+                # Update recursive count of actual non-collection contents: for each subnode, if it is a collection,
+                # add the count of its contents to the recursive sum. Otherwise, add just 1 to the sum (to count
+                # the subnode itself). The counts of the subcollections that are not in the queue are up to date.
+                node.num_entries = sum(
+                    num_entries.get(child_id, child_sum) for child_id, child_sum in children_sums.get(node.id_, ())
+                )
+                num_entries[node.id_] = node.num_entries
+                node.timestamp = clock.tick()
+                node.sign()
             # This perverted comparator lambda is necessary to ensure that delete entries are always
             # sorted to the end of the list, as required by the channel serialization routine.
             return sorted(commit_queue[:-1], key=lambda x: int(x.status == TODELETE) - 1 / x.timestamp)
@@ -359,29 +431,53 @@ def define_binding(db):
             in the future.
             This procedure should be always run _before_ committing personal channels.
             """
-            # TODO: optimize with SQL recursive CTEs
-
-            def get_highest_deleted_parent(node, highest_deleted_parent=None):
-                if node.origin_id == 0:
-                    return highest_deleted_parent
-                parent = db.CollectionNode.get(public_key=node.public_key, id_=node.origin_id)
-                if not parent:
-                    return highest_deleted_parent
-                if parent.status == TODELETE:
-                    highest_deleted_parent = parent
-                return get_highest_deleted_parent(parent, highest_deleted_parent)
-
-            deletion_set = {
-                get_highest_deleted_parent(node, highest_deleted_parent=node).rowid
-                for node in db.CollectionNode.select(
-                    lambda g: g.public_key == db.CollectionNode._my_key.pub().key_to_bin()[10:] and g.status == TODELETE
-                )
-                if node
-            }
+            params = {"public_key": database_blob(db.CollectionNode._my_key.pub().key_to_bin()[10:])}
+            db.CollectionNode.delete_subtrees(sql_deleted_collections_condition, params)
 
-            for node in [db.CollectionNode[rowid] for rowid in deletion_set]:
-                for subnode in node.contents:
-                    subnode.delete()
+        @staticmethod
+        def delete_subtrees(roots_condition, params, ctes=()):
+            """
+            Delete the personal entries matching the given SQL condition, along with all of their contents,
+            using raw SQL. The votes for the deleted channels are deleted too, as ORM would do.
+            The ORM objects of the deleted entries and votes in the db_session cache are marked as deleted.
+            :param roots_condition: the SQL condition on the "g" ChannelNode row selecting the subtrees' roots
+            :param params: the SQL parameters, including the $public_key of the personal channels
+            :param ctes: the additional common table expressions used by the condition
+            """
+            # Raw SQL queries do not flush the pending changes to the database by themselves
+            orm.flush()
+            ctes = ", ".join((*ctes, sql_subtrees_cte.format(roots_condition=roots_condition)))
+            cursor = db.execute(f"WITH RECURSIVE {ctes} {sql_select_subtrees}", {}, params)
+            node_rowids = [rowid for rowid, in cursor.fetchall()]
+            vote_rowids = []
+            # The rowids come from the database, so they are safe to put into the queries
+            for chunk in chunks(node_rowids, SQL_VARIABLES_LIMIT):
+                cursor = db.execute(sql_select_votes.format(rowids=",".join(map(str, chunk))))
+                vote_rowids.extend(rowid for rowid, in cursor.fetchall())
+            for entity, sql_delete, rowids in (
+                (db.ChannelVote, sql_delete_votes, vote_rowids),
+                (db.ChannelNode, sql_delete_nodes, node_rowids),
+            ):
+                for chunk in chunks(rowids, SQL_VARIABLES_LIMIT):
+                    db.execute(sql_delete.format(rowids=",".join(map(str, chunk))))
+                forget_deleted_objects(entity, rowids)
+
+        @staticmethod
+        def get_children_sums(collections):
+            """
+            Sum up the contents of the given collections, for recalculating their num_entries.
+            :return: a dict of collection id_ -> list of (child id_, num_entries) tuples for the actual child
+            collections, with the total number of the other actual children under the None id_
+            """
+            orm.flush()
+            cursor = db.get_connection().cursor()
+            public_key = database_blob(db.CollectionNode._my_key.pub().key_to_bin()[10:])
+            children_sums = {}
+            for chunk in chunks([node.id_ for node in collections], SQL_VARIABLES_LIMIT):
+                cursor.execute(sql_select_children_sums.format(ids=",".join("?" * len(chunk))), [public_key] + chunk)
+                for origin_id, child_id, child_sum in cursor.fetchall():
+                    children_sums.setdefault(origin_id, []).append((child_id, child_sum))
+            return children_sums
 
         @db_session
         def get_contents_to_commit(self):
@@ -4,8 +4,25 @@ from asyncio import get_event_loop
 from pony import orm
 from pony.orm import db_session, desc, left_join, raw_sql
 
+from tribler_core.modules.metadata_store.autocomplete import (
+    sql_clear_terms_log,
+    sql_enable_terms_log,
+    sql_select_terms_log,
+    sql_select_terms_vocab,
+    sql_terms_log_is_empty,
+)
+from tribler_core.modules.metadata_store.entries_count import count_entries
+from tribler_core.modules.metadata_store.entries_query import (
+    SELECT_COUNT,
+    SELECT_ENTRIES,
+    SELECT_ROWS,
+    encode_cursor,
+    get_query_plan,
+    get_sort_key_query,
+)
 from tribler_core.modules.metadata_store.orm_bindings.channel_node import LEGACY_ENTRY, TODELETE
 from tribler_core.modules.metadata_store.orm_bindings.torrent_metadata import NULL_KEY_SUBST
+from tribler_core.modules.metadata_store.search_engine import search
 from tribler_core.modules.metadata_store.serialization import (
     CHANNEL_TORRENT,
     COLLECTION_NODE,
@@ -15,7 +32,7 @@ from tribler_core.modules.metadata_store.serialization import (
 from tribler_core.utilities.unicode import hexlify
 
 
-def define_binding(db):
+def define_binding(db, autocomplete_index):
     class MetadataNode(db.ChannelNode):
         """
         This ORM class extends ChannelNode by adding metadata-storing attributes such as "title" and "tags".
@@ -176,10 +193,49 @@ def define_binding(db):
             """
             Get some torrents. Optionally sort the results by a specific field, or filter the channels based
             on a keyword/whether you are subscribed to it.
+            The query is run through a cached raw SQL plan, see entries_query.py. It returns the same entries
+            in the same order as the Pony query produced by get_entries_query.
+            If a cursor (see get_entries_cursor) is given, the entries following the entry it was built for are
+            returned instead, and first/last only define the number of entries to return.
             :return: A list of class members
             """
-            pony_query = cls.get_entries_query(**kwargs)
-            return pony_query[(first or 1) - 1 : last]
+            query_plan = get_query_plan(cls, select=SELECT_ENTRIES, first=first, last=last, **kwargs)
+            if query_plan is None:
+                return []
+            sql, params = query_plan
+            # Raw SQL queries do not flush the pending changes to the database by themselves
+            db.flush()
+            return cls.select_by_sql(sql, {}, params)
+
+        @classmethod
+        @db_session
+        def get_search_results(cls, txt_filter, first=1, last=None, **kwargs):
+            """
+            Search for the entries matching the full-text query, ranked by the relevance of their titles, the number
+            of seeders and the votes of their channels, with a single entry per infohash. See search_engine.py.
+            Accepts the same filters as get_entries, but the results are always sorted by their rank.
+            :return: A list of SearchResult tuples of (entry, score, title with highlighted matches)
+            """
+            return search(cls, txt_filter, first=first, last=last, **kwargs)
+
+        @classmethod
+        @db_session
+        def get_entries_rows(cls, columns, first=1, last=None, **kwargs):
+            """
+            Get the values of the given attributes of the entries, without creating ORM objects for them.
+            Accepts the same query parameters as get_entries.
+            :param columns: the names of the attributes to get
+            :return: A list of row tuples
+            """
+            columns = tuple(columns)
+            query_plan = get_query_plan(cls, select=SELECT_ROWS, columns=columns, first=first, last=last, **kwargs)
+            if query_plan is None:
+                return []
+            sql, params = query_plan
+            db.flush()
+            rows = db.select(sql, {}, params)
+            # Pony returns bare values instead of rows if there is a single column in the result
+            return [(value,) for value in rows] if len(columns) == 1 else rows
 
         @classmethod
         @db_session
@@ -187,37 +243,79 @@ def define_binding(db):
             """
             Get total count of torrents that would be returned if there would be no pagination/limits/sort
             """
-            for p in ["first", "last", "sort_by", "sort_desc"]:
-                kwargs.pop(p, None)
-            return cls.get_entries_query(**kwargs).count()
+            return count_entries(cls, **kwargs)[0]
+
+        @classmethod
+        @db_session
+        def get_total_count_estimate(cls, **kwargs):
+            """
+            Get the total count of entries like get_total_count does, along with a flag telling whether it is exact.
+            The count is not exact for the full-text queries that have more matches than the search considers.
+            :return: a tuple of (count, whether the count is exact)
+            """
+            return count_entries(cls, **kwargs)
 
         @classmethod
         @db_session
         def get_entries_count(cls, **kwargs):
-            for p in ["first", "last"]:
+            for p in ["first", "last", "cursor"]:
                 kwargs.pop(p, None)
-            return cls.get_entries_query(**kwargs).count()
+            query_plan = get_query_plan(cls, select=SELECT_COUNT, **kwargs)
+            if query_plan is None:
+                return 0
+            sql, params = query_plan
+            db.flush()
+            return db.select(sql, {}, params)[0]
 
         @classmethod
-        def get_auto_complete_terms(cls, keyword, max_terms, limit=10):
-            if not keyword:
-                return []
+        @db_session
+        def get_entries_cursor(cls, entry, sort_by=None, sort_desc=True, txt_filter=None, **kwargs):
+            """
+            Get the opaque cursor for requesting the entries that follow the given entry with get_entries.
+            The cursor holds the sort key of the entry, so it stays valid even if the entry is deleted later.
+            Only the sort parameters of the query matter, the rest of kwargs is accepted for convenience.
+            :param entry: the last entry returned by get_entries for the same query
+            :return: the cursor string
+            """
+            sql, params = get_sort_key_query(cls, entry.rowid, sort_by, sort_desc, txt_filter)
+            db.flush()
+            sort_key = db.select(sql, {}, params)[0]
+            # Pony returns a bare value instead of a row if there is a single column in the result
+            return encode_cursor(sort_key if isinstance(sort_key, tuple) else (sort_key,))
 
+        @classmethod
+        def get_auto_complete_terms(cls, text, max_terms):
+            """
+            Get the completions for the last word of the text, from the terms of the titles of all the entries.
+            The most frequent terms come first. The terms are not stemmed. See autocomplete.py.
+            """
+            if not text:
+                return []
             with db_session:
-                result = cls.search_keyword("\"" + keyword + "\"*", lim=limit)[:]
-            titles = [g.title.lower() for g in result]
-
-            # Copy-pasted from the old DBHandler (almost) completely
-            all_terms = set()
-            for line in titles:
-                if len(all_terms) >= max_terms:
-                    break
-                i1 = line.find(keyword)
-                i2 = line.find(' ', i1 + len(keyword))
-                term = line[i1:i2] if i2 >= 0 else line[i1:]
-                if term != keyword:
-                    all_terms.add(term)
-            return list(all_terms)
+                # The changes of the titles reach the log through the SQL triggers, so the pending ones are flushed
+                db.flush()
+                up_to_date = autocomplete_index.loaded and db.get(sql_terms_log_is_empty)
+            if not up_to_date:
+                cls.update_auto_complete_terms()
+            return autocomplete_index.complete(text, max_terms)
+
+        @classmethod
+        def update_auto_complete_terms(cls):
+            """
+            Apply the logged changes of the titles to the autocompletion terms, or load all the terms if the index
+            is not loaded yet or the changes were not logged. See autocomplete.py.
+            """
+            with autocomplete_index.sync_lock:
+                with db_session:
+                    # Writing first takes the write lock, so the log cannot change between reading and clearing it
+                    reload = db.execute(sql_enable_terms_log).rowcount > 0 or not autocomplete_index.loaded
+                    changes = db.select(sql_select_terms_vocab if reload else sql_select_terms_log)
+                    db.execute(sql_clear_terms_log)
+                if reload:
+                    autocomplete_index.load(changes)
+                else:
+                    for old_title, new_title in changes:
+                        autocomplete_index.update_title(old_title, new_title)
 
         def to_simple_dict(self):
             """
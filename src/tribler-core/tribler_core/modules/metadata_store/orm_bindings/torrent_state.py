@@ -15,6 +15,9 @@ def define_binding(db):
         leechers = orm.Optional(int, default=0)
         last_check = orm.Optional(int, size=64, default=0)
         self_checked = orm.Optional(bool, default=False, sql_default='0')
+        # Used to select the torrents to check and the fresh torrents that we checked ourselves
+        orm.composite_index(last_check, seeders)
+        orm.composite_index(self_checked, last_check)
         metadata = orm.Set('TorrentMetadata', reverse='health')
         trackers = orm.Set('TrackerState', reverse='torrents')
 
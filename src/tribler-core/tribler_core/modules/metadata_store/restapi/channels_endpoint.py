@@ -76,6 +76,8 @@ class ChannelsEndpoint(ChannelsEndpointBase):
                         'sort_by': String(),
                         'sort_desc': Integer(),
                         'total': Integer(),
+                        'total_exact': Boolean(),
+                        'next_cursor': String(),
                     }
                 )
             }
@@ -83,14 +85,22 @@ class ChannelsEndpoint(ChannelsEndpointBase):
     )
     # TODO: DRY it with SpecificChannel endpoint?
     async def get_channels(self, request):
-        sanitized = self.sanitize_parameters(request.query)
+        try:
+            sanitized = self.sanitize_parameters(request.query)
+        except (ValueError, KeyError):
+            return RESTResponse({"error": "Error processing request parameters"}, status=HTTP_BAD_REQUEST)
         sanitized['subscribed'] = None if 'subscribed' not in request.query else bool(int(request.query['subscribed']))
         include_total = request.query.get('include_total', '')
         sanitized.update({"origin_id": 0})
 
         with db_session:
             channels = self.session.mds.ChannelMetadata.get_entries(**sanitized)
-            total = self.session.mds.ChannelMetadata.get_total_count(**sanitized) if include_total else None
+            total, total_exact = (
+                self.session.mds.ChannelMetadata.get_total_count_estimate(**sanitized)
+                if include_total
+                else (None, None)
+            )
+            next_cursor = self.get_next_cursor(self.session.mds.ChannelMetadata, channels, sanitized)
             channels_list = []
             for channel in channels:
                 channel_dict = channel.to_simple_dict()
@@ -124,7 +134,9 @@ class ChannelsEndpoint(ChannelsEndpointBase):
             "sort_desc": int(sanitized["sort_desc"]),
         }
         if total is not None:
-            response_dict.update({"total": total})
+            response_dict.update({"total": total, "total_exact": total_exact})
+        if next_cursor is not None:
+            response_dict.update({"next_cursor": next_cursor})
         return RESTResponse(response_dict)
 
     @docs(
@@ -140,20 +152,28 @@ class ChannelsEndpoint(ChannelsEndpointBase):
                         'sort_by': String(),
                         'sort_desc': Integer(),
                         'total': Integer(),
+                        'total_exact': Boolean(),
+                        'next_cursor': String(),
                     }
                 )
             }
         },
     )
     async def get_channel_contents(self, request):
-        sanitized = self.sanitize_parameters(request.query)
+        try:
+            sanitized = self.sanitize_parameters(request.query)
+        except (ValueError, KeyError):
+            return RESTResponse({"error": "Error processing request parameters"}, status=HTTP_BAD_REQUEST)
         include_total = request.query.get('include_total', '')
         channel_pk, channel_id = self.get_channel_from_request(request)
         sanitized.update({"channel_pk": channel_pk, "origin_id": channel_id})
         with db_session:
             contents = self.session.mds.MetadataNode.get_entries(**sanitized)
             contents_list = [c.to_simple_dict() for c in contents]
-            total = self.session.mds.MetadataNode.get_total_count(**sanitized) if include_total else None
+            total, total_exact = (
+                self.session.mds.MetadataNode.get_total_count_estimate(**sanitized) if include_total else (None, None)
+            )
+            next_cursor = self.get_next_cursor(self.session.mds.MetadataNode, contents, sanitized)
         self.add_download_progress_to_metadata_list(contents_list)
         response_dict = {
             "results": contents_list,
@@ -163,7 +183,9 @@ class ChannelsEndpoint(ChannelsEndpointBase):
             "sort_desc": int(sanitized['sort_desc']),
         }
         if total is not None:
-            response_dict.update({"total": total})
+            response_dict.update({"total": total, "total_exact": total_exact})
+        if next_cursor is not None:
+            response_dict.update({"next_cursor": next_cursor})
 
         return RESTResponse(response_dict)
 
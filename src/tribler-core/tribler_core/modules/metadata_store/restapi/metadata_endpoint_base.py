@@ -1,3 +1,4 @@
+from tribler_core.modules.metadata_store.entries_query import decode_cursor
 from tribler_core.modules.metadata_store.serialization import CHANNEL_TORRENT, COLLECTION_NODE, REGULAR_TORRENT
 from tribler_core.restapi.rest_endpoint import RESTEndpoint
 
@@ -44,6 +45,10 @@ class MetadataEndpointBase(RESTEndpoint):
             "category": parameters.get('category'),
             "exclude_deleted": bool(int(parameters.get('exclude_deleted', 0)) > 0),
         }
+        if 'cursor' in parameters:
+            # Check the cursor early, so a malformed one is reported as a bad request parameter
+            decode_cursor(parameters['cursor'])
+            sanitized["cursor"] = parameters['cursor']
         if 'remote_query' in parameters:
             sanitized["remote_query"] = (bool(int(parameters.get('remote_query', 0)) > 0),)
         if 'metadata_type' in parameters:
@@ -52,3 +57,13 @@ class MetadataEndpointBase(RESTEndpoint):
                 mtypes.extend(metadata_type_to_search_scope[arg])
             sanitized['metadata_type'] = frozenset(mtypes)
         return sanitized
+
+    @classmethod
+    def get_next_cursor(cls, entity, entries, sanitized):
+        """
+        Get the cursor for requesting the page that follows the given page of entries (keyset pagination).
+        :return: the cursor, or None if the page is not full, meaning that there are no more entries to get
+        """
+        if not entries or len(entries) < sanitized["last"] - sanitized["first"] + 1:
+            return None
+        return entity.get_entries_cursor(entries[-1], **sanitized)
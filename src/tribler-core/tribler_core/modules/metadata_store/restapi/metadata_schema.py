@@ -13,6 +13,7 @@ class MetadataParameters(Schema):
     exclude_deleted = Boolean(default=False)
     remote_query = Boolean(default=False)
     metadata_type = List(String(description='Limits query to certain metadata types (e.g. "torrent" or "channel")'))
+    cursor = String(description='Continue the listing after the page that returned this "next_cursor"')
 
 
 class RemoteQueryParameters(MetadataParameters):
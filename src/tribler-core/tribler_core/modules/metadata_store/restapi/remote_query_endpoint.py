@@ -21,6 +21,8 @@ class RemoteQueryEndpoint(MetadataEndpointBase):
 
     def sanitize_parameters(self, parameters):
         sanitized = super().sanitize_parameters(parameters)
+        # Cursors only make sense for the local database
+        sanitized.pop("cursor", None)
 
         # Convert frozenset to string
         if "metadata_type" in sanitized:
@@ -6,12 +6,13 @@ from aiohttp_apispec import docs, querystring_schema
 
 from ipv8.REST.schema import schema
 
-from marshmallow.fields import Boolean, Integer, String
+from marshmallow.fields import Boolean, Float, Integer, String
 
 from pony.orm import db_session
 
 from tribler_core.modules.metadata_store.restapi.metadata_endpoint import MetadataEndpointBase
 from tribler_core.modules.metadata_store.restapi.metadata_schema import MetadataParameters
+from tribler_core.modules.metadata_store.search_engine import encode_search_cursor
 from tribler_core.restapi.rest_endpoint import HTTP_BAD_REQUEST, RESTResponse
 
 
@@ -39,7 +40,8 @@ class SearchEndpoint(MetadataEndpointBase):
                             'commit_status': Integer,
                             'num_leechers': Integer,
                             'date': Integer,
-                            'relevance_score': Integer,
+                            'relevance_score': Float,
+                            'name_highlight': String,
                             'id': Integer,
                             'size': Integer,
                             'category': String,
@@ -51,7 +53,10 @@ class SearchEndpoint(MetadataEndpointBase):
                             'type': String,
                         })
                     ],
-                    'chant_dirty': Boolean
+                    'chant_dirty': Boolean,
+                    'total': Integer,
+                    'total_exact': Boolean,
+                    'next_cursor': String
                 })
             }
         }
@@ -70,14 +75,29 @@ class SearchEndpoint(MetadataEndpointBase):
 
         def search_db():
             with db_session:
-                pony_query = self.session.mds.MetadataNode.get_entries(**sanitized)
-                total = self.session.mds.MetadataNode.get_total_count(**sanitized) if include_total else None
-                search_results = [r.to_simple_dict() for r in pony_query]
+                total, total_exact = (self.session.mds.MetadataNode.get_total_count_estimate(**sanitized)
+                                      if include_total else (None, None))
+                if sanitized["sort_by"] is None:
+                    # Without an explicit sort order, the results are ranked by relevance
+                    ranked_results = self.session.mds.MetadataNode.get_search_results(**sanitized)
+                    search_results = []
+                    for entry, score, title_highlight in ranked_results:
+                        result = entry.to_simple_dict()
+                        result.update({"relevance_score": score, "name_highlight": title_highlight})
+                        search_results.append(result)
+                    next_cursor = None
+                    if ranked_results and len(ranked_results) >= sanitized["last"] - sanitized["first"] + 1:
+                        next_cursor = encode_search_cursor(ranked_results[-1])
+                else:
+                    pony_query = self.session.mds.MetadataNode.get_entries(**sanitized)
+                    search_results = [r.to_simple_dict() for r in pony_query]
+                    next_cursor = self.get_next_cursor(self.session.mds.MetadataNode, pony_query, sanitized)
             self.session.mds._db.disconnect()  # DB must be disconnected explicitly if run on a thread
-            return search_results, total
+            return search_results, total, total_exact, next_cursor
 
         try:
-            search_results, total = await asyncio.get_event_loop().run_in_executor(None, search_db)
+            loop = asyncio.get_event_loop()
+            search_results, total, total_exact, next_cursor = await loop.run_in_executor(None, search_db)
         except Exception as e:
             self._logger.error("Error while performing DB search: %s", e)
             return RESTResponse(status=HTTP_BAD_REQUEST)
@@ -90,7 +110,9 @@ class SearchEndpoint(MetadataEndpointBase):
             "sort_desc": sanitized["sort_desc"],
         }
         if total is not None:
-            response_dict.update({"total": total})
+            response_dict.update({"total": total, "total_exact": total_exact})
+        if next_cursor is not None:
+            response_dict.update({"next_cursor": next_cursor})
 
         return RESTResponse(response_dict)
 
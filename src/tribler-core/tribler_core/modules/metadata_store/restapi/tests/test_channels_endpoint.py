@@ -85,6 +85,30 @@ async def test_get_channels_count(enable_chant, enable_api, add_fake_torrents_ch
     assert json_dict['total'] == 5
 
 
+@pytest.mark.asyncio
+async def test_get_channels_with_cursor(enable_chant, enable_api, add_fake_torrents_channels, mock_dlmgr, session):
+    """
+    Test paging through the channels with the cursors returned by the REST API
+    """
+    all_channels = (await do_request(session, 'channels?sort_by=name'))['results']
+
+    json_dict = await do_request(session, 'channels?sort_by=name&first=1&last=4')
+    pages = [json_dict['results']]
+    while 'next_cursor' in json_dict:
+        first = sum(len(page) for page in pages) + 1
+        json_dict = await do_request(
+            session, f'channels?sort_by=name&first={first}&last={first + 3}&cursor={json_dict["next_cursor"]}'
+        )
+        pages.append(json_dict['results'])
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert [channel for page in pages for channel in page] == all_channels
+
+
+@pytest.mark.asyncio
+async def test_get_channels_malformed_cursor(enable_chant, enable_api, add_fake_torrents_channels, session):
+    await do_request(session, 'channels?cursor=bla', expected_code=400)
+
+
 @pytest.mark.asyncio
 async def test_create_channel(enable_chant, enable_api, session):
     """
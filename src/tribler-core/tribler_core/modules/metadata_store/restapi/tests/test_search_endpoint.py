@@ -48,6 +48,8 @@ async def test_search(enable_chant, enable_api, session):
 
     parsed = await do_request(session, 'search?txt_filter=needle&type=torrent', expected_code=200)
     assert parsed["results"][0]['name'] == 'needle'
+    assert parsed["results"][0]['name_highlight'] == '<b>needle</b>'
+    assert parsed["results"][0]['relevance_score'] < 0
 
     parsed = await do_request(session, 'search?txt_filter=needle&sort_by=name', expected_code=200)
     assert len(parsed["results"]) == 1
@@ -59,12 +61,35 @@ async def test_search(enable_chant, enable_api, session):
     # Test getting total count of results
     parsed = await do_request(session, 'search?txt_filter=needle&include_total=1', expected_code=200)
     assert parsed["total"] == 1
+    assert parsed["total_exact"]
 
     # Test getting total count of results
     parsed = await do_request(session, 'search?txt_filter=hay&include_total=1', expected_code=200)
     assert parsed["total"] == 100
 
 
+@pytest.mark.asyncio
+async def test_search_ranked_cursor(enable_chant, enable_api, session):
+    """
+    Test paging through the ranked search results with the cursors returned by the REST API
+    """
+    with db_session:
+        for x in range(10):
+            session.mds.TorrentMetadata(title=f'hay {x}', infohash=random_infohash()).health.seeders = x
+    expected = await do_request(session, 'search?txt_filter=hay', expected_code=200)
+
+    results = []
+    json_dict = await do_request(session, 'search?txt_filter=hay&first=1&last=4', expected_code=200)
+    results.extend(json_dict["results"])
+    while 'next_cursor' in json_dict:
+        first = len(results) + 1
+        json_dict = await do_request(
+            session, f'search?txt_filter=hay&first={first}&last={first + 3}&cursor={json_dict["next_cursor"]}'
+        )
+        results.extend(json_dict["results"])
+    assert [r["name"] for r in results] == [r["name"] for r in expected["results"]]
+
+
 @pytest.mark.asyncio
 async def test_completions_no_query(enable_chant, enable_api, session):
     """
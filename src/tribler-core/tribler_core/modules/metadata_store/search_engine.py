@@ -0,0 +1,203 @@
+# Ranked full-text search over the metadata entries.
+#
+# The search is a single SQL statement: the full-text matches are joined to ChannelNode and TorrentState, filtered,
+# ranked and deduplicated by infohash in SQL, so only a single page of results ever reaches Python. The rank blends
+# the BM25 relevance of the title with the number of seeders of the torrent and the votes of the channel it
+# belongs to. Every result also comes with the title with the matched terms highlighted. The ORM objects for
+# the page of results are then loaded by their primary keys.
+import html
+from collections import namedtuple
+from functools import lru_cache
+from itertools import count
+
+from pony.orm.dbapiprovider import OperationalError
+
+from tribler_core.modules.metadata_store.entries_query import (
+    FTS_MATCHES_LIMIT,
+    QUERY_PLANS_CACHE_SIZE,
+    SELECT_ROWS,
+    build_query_signature,
+    compile_conditions,
+    decode_cursor,
+    encode_cursor,
+    entity_columns,
+)
+from tribler_core.modules.metadata_store.serialization import CHANNEL_TORRENT
+
+# The markup put around the matched terms in the highlighted titles
+HIGHLIGHT_START = "<b>"
+HIGHLIGHT_END = "</b>"
+
+# The markers that SQLite puts around the matched terms. The titles come from remote peers, so they are escaped
+# before the markers are replaced with the markup. Private use characters do not occur in regular titles.
+MATCH_START = "\ue000"
+MATCH_END = "\ue001"
+
+# A torrent with SEEDERS_HALF_BOOST seeders gets half of the SEEDERS_WEIGHT boost. The boost of a channel's votes
+# is proportional to the votes, normalized to [0, 1] the same way as for the REST API.
+SEEDERS_WEIGHT = 1.0
+SEEDERS_HALF_BOOST = 10.0
+VOTES_WEIGHT = 1.0
+
+SearchResult = namedtuple("SearchResult", ["entry", "score", "title_highlight"])
+
+
+@lru_cache(maxsize=QUERY_PLANS_CACHE_SIZE)
+def compile_search_query(signature, keyset=False):
+    """
+    Compile the raw SQL statement of a ranked search with the filters from the given query signature, as produced
+    by build_query_signature for the (rowid) rows with no full-text filter, sort order or pagination.
+    The filter values are referenced as $p0, $p1, ..., the search parameters have their own names.
+    :param keyset: whether to only return the results that follow the ($cursor_score, $cursor_rowid) sort key
+    """
+    table, discriminators, _, _, conditions, _, _ = signature
+    param_names = (f"$p{index}" for index in count())
+    where = " AND ".join(compile_conditions(table, discriminators, conditions, (), param_names))
+    # BM25 scores are negative, with the best matches having the lowest scores, so the boosts multiply the score.
+    # For the entries with the same infohash, SQLite takes the values of the bare columns from the row with
+    # the minimal score, so the best match of every infohash is returned.
+    # Highlighting is relatively expensive, so it is only done for the page of results, by looking up
+    # the full-text match for every returned rowid.
+    # Pony expects raw SELECT statements to start with the SELECT keyword
+    having = ('HAVING "score" > $cursor_score OR ("score" = $cursor_score AND "rowid" < $cursor_rowid)'
+              if keyset else "")
+    return f"""SELECT "r"."rowid",
+            (SELECT highlight(FtsIndex, 0, $highlight_start, $highlight_end) FROM FtsIndex
+             WHERE FtsIndex MATCH $txt_filter AND FtsIndex.rowid = "r"."rowid") AS "title_highlight",
+            "r"."score"
+        FROM (
+            SELECT "rowid",
+                min("rank" * (1.0 + $seeders_weight * "seeders" / ("seeders" + $seeders_half_boost)
+                             + $votes_weight * "votes" / $votes_scaling)) AS "score"
+            FROM (
+                SELECT "g"."rowid" AS "rowid", coalesce("g"."infohash", "g"."rowid") AS "dedup_key",
+                    "m"."rank" AS "rank", ifnull("h"."seeders", 0) AS "seeders",
+                    ifnull("c"."votes", 0) AS "votes"
+                FROM (
+                    SELECT rowid, bm25(FtsIndex) AS "rank" FROM FtsIndex WHERE FtsIndex MATCH $txt_filter
+                    ORDER BY "rank" LIMIT $matches_limit
+                ) "m"
+                JOIN "{table}" "g" ON "g"."rowid" = "m"."rowid"
+                LEFT JOIN "TorrentState" "h" ON "g"."health" = "h"."rowid"
+                LEFT JOIN (
+                    SELECT public_key, max(votes) AS "votes" FROM "{table}"
+                    WHERE metadata_type = {CHANNEL_TORRENT} GROUP BY public_key
+                ) "c" ON "c"."public_key" = "g"."public_key"
+                WHERE {where}
+            )
+            GROUP BY "dedup_key"
+            {having}
+            ORDER BY "score", "rowid" DESC
+            LIMIT $limit OFFSET $offset
+        ) "r"
+    """
+
+
+@lru_cache(maxsize=QUERY_PLANS_CACHE_SIZE)
+def compile_load_query(table, columns, num_entries):
+    """
+    Compile the raw SQL statement that loads the given number of entries by their rowids, bound as $p0, $p1, ...
+    """
+    selected = ", ".join(f'"g"."{column}"' for column in columns)
+    rowids = ", ".join(f"$p{index}" for index in range(num_entries))
+    return f'SELECT {selected} FROM "{table}" "g" WHERE "g"."rowid" IN ({rowids})'
+
+
+def encode_search_cursor(search_result):
+    """
+    Encode the sort key of a search result into a cursor for requesting the results that follow it.
+    """
+    return encode_cursor((search_result.score, search_result.entry.rowid))
+
+
+def decode_search_cursor(cursor):
+    """
+    Decode the cursor produced by encode_search_cursor.
+    :raises ValueError: if the cursor is malformed
+    :return: a tuple of (score, rowid)
+    """
+    values = decode_cursor(cursor)
+    if (len(values) != 2 or isinstance(values[0], bool) or not isinstance(values[0], (int, float))
+            or isinstance(values[1], bool) or not isinstance(values[1], int)):
+        raise ValueError("The cursor does not match the sort order of the search")
+    return values
+
+
+def render_title_highlight(title, title_highlight):
+    """
+    Escape the title for HTML, and put the highlight markup around the terms that matched the search.
+    """
+    if title_highlight is None or MATCH_START in title or MATCH_END in title:
+        return html.escape(title)
+    return html.escape(title_highlight).replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_END, HIGHLIGHT_END)
+
+
+def get_search_query(cls, txt_filter, first=1, last=None, cursor=None, **kwargs):
+    """
+    Get the ranked search query for the given full-text query and MetadataNode.get_entries filters.
+    The sort parameters are ignored: the results are always sorted by their score.
+    The cursor, as produced by encode_search_cursor for the last result of the previous page, makes the query
+    return the results that follow that result.
+    :return: a tuple of (sql, dict of values), or None if the search can return nothing
+    """
+    for p in ["sort_by", "sort_desc"]:
+        kwargs.pop(p, None)
+    if not txt_filter or txt_filter == "*":
+        return None
+    if not isinstance(txt_filter, str):
+        raise OperationalError(None, f"Invalid full-text search query: {txt_filter!r}")
+    cursor_values = None
+    if cursor is not None:
+        cursor_values = decode_search_cursor(cursor)
+        # The cursor replaces the offset, so first and last only define the size of the page
+        first, last = 1, None if last is None else last - (first or 1) + 1
+    offset = (first or 1) - 1
+    if offset < 0:
+        raise TypeError("Parameter 'first' cannot be less than 1")
+    if last is not None and last <= offset:
+        return None
+
+    query_signature = build_query_signature(cls, select=SELECT_ROWS, columns=("rowid",), **kwargs)
+    if query_signature is None:
+        return None
+    signature, filter_values = query_signature
+    params = {f"p{index}": value for index, value in enumerate(filter_values)}
+    params.update(
+        txt_filter=txt_filter,
+        matches_limit=FTS_MATCHES_LIMIT,
+        highlight_start=MATCH_START,
+        highlight_end=MATCH_END,
+        seeders_weight=SEEDERS_WEIGHT,
+        seeders_half_boost=SEEDERS_HALF_BOOST,
+        votes_weight=VOTES_WEIGHT,
+        votes_scaling=max(cls._database_.ChannelMetadata.votes_scaling, 1e-9),
+        limit=-1 if last is None else last - offset,
+        offset=offset,
+    )
+    if cursor_values is not None:
+        params.update(cursor_score=cursor_values[0], cursor_rowid=cursor_values[1])
+    return compile_search_query(signature, cursor_values is not None), params
+
+
+def search(cls, txt_filter, first=1, last=None, **kwargs):
+    """
+    Search for the entries matching the full-text query, ranked by relevance, seeders and votes.
+    Should be run in a db_session.
+    :return: a list of SearchResult tuples of (entry, score, title with highlighted matches, escaped for HTML)
+    """
+    search_query = get_search_query(cls, txt_filter, first=first, last=last, **kwargs)
+    if search_query is None:
+        return []
+    sql, params = search_query
+    db = cls._database_
+    # Raw SQL queries do not flush the pending changes to the database by themselves
+    db.flush()
+    rows = db.select(sql, {}, params)
+    if not rows:
+        return []
+    # The page of entries is loaded by the primary key, which also puts them into the db_session cache
+    load_sql = compile_load_query(cls._table_, entity_columns(cls), len(rows))
+    entries = cls.select_by_sql(load_sql, {}, {f"p{index}": rowid for index, (rowid, _, _) in enumerate(rows)})
+    entries = {entry.rowid: entry for entry in entries}
+    return [SearchResult(entries[rowid], score, render_title_highlight(entries[rowid].title, title_highlight))
+            for rowid, title_highlight, score in rows]
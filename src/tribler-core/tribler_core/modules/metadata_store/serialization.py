@@ -1,10 +1,10 @@
 import struct
 from datetime import datetime, timedelta
+from functools import lru_cache
 
-from ipv8.database import database_blob
 from ipv8.keyvault.crypto import default_eccrypto
 from ipv8.messaging.payload import Payload
-from ipv8.messaging.serialization import default_serializer
+from ipv8.messaging.serialization import VarLen, default_serializer
 
 from tribler_core.exceptions import InvalidSignatureException
 from tribler_core.utilities.unicode import hexlify
@@ -56,26 +56,120 @@ class UnknownBlobTypeException(Exception):
     pass
 
 
-def read_payload_with_offset(data, offset=0):
-    # First we have to determine the actual payload type
-    metadata_type = struct.unpack_from('>H', database_blob(data), offset=offset)[0]
+def get_payload_class(metadata_type):
     if metadata_type == DELETED:
-        return DeletedMetadataPayload.from_signed_blob_with_offset(data, offset=offset)
+        return DeletedMetadataPayload
     elif metadata_type == REGULAR_TORRENT:
-        return TorrentMetadataPayload.from_signed_blob_with_offset(data, offset=offset)
+        return TorrentMetadataPayload
     elif metadata_type == COLLECTION_NODE:
-        return CollectionNodePayload.from_signed_blob_with_offset(data, offset=offset)
+        return CollectionNodePayload
     elif metadata_type == CHANNEL_TORRENT:
-        return ChannelMetadataPayload.from_signed_blob_with_offset(data, offset=offset)
+        return ChannelMetadataPayload
 
     # Unknown metadata type, raise exception
     raise UnknownBlobTypeException
 
 
+def read_payload_with_offset(data, offset=0, check_signature=True):
+    # First we have to determine the actual payload type
+    metadata_type = struct.unpack_from('>H', data, offset=offset)[0]
+    return get_payload_class(metadata_type).from_signed_blob_with_offset(data, check_signature, offset=offset)
+
+
+def get_payload_size(data, offset=0):
+    """
+    Get the size of the payload starting at the offset, with its signature, as declared by its type and the lengths
+    of its variable-length fields. The payload itself is not parsed.
+    :return: the size in bytes, or None if the data ends before the type or one of the lengths
+    """
+    if offset + 2 > len(data):
+        return None
+    payload_class = get_payload_class(struct.unpack_from('>H', data, offset=offset)[0])
+    end = offset
+    for format_str in payload_class.format_list:
+        packer = default_serializer.get_packer_for(format_str)
+        if isinstance(packer, VarLen):
+            if end + packer.length_size > len(data):
+                return None
+            end += packer.length_size + struct.unpack_from(packer.length_format, data, end)[0] * packer.base
+        else:
+            end += packer.size
+    return end + SIGNATURE_SIZE - offset
+
+
 def read_payload(data):
     return read_payload_with_offset(data)[0]
 
 
+def iter_signed_payloads(data, check_signature=True):
+    """
+    Lazily parse a blob of concatenated payloads without copying it.
+    :param data: the blob, either bytes or a memoryview
+    :param check_signature: if False, the signatures are left for the caller to check against the signed data
+    :return: a generator of (payload, signed_data) tuples, where signed_data is a memoryview slice of the original blob
+    covering the signed part of the payload
+    """
+    view = memoryview(data)
+    offset = 0
+    while offset < len(view):
+        start = offset
+        payload, offset = read_payload_with_offset(view, offset, check_signature)
+        yield payload, view[start : offset - SIGNATURE_SIZE]
+
+
+def iter_signed_payloads_from_stream(pieces, check_signature=True):
+    """
+    Incrementally parse payloads from a blob that arrives in pieces, e.g. from a streaming decompressor.
+    Only the unparsed tail of the blob is kept between the pieces, so the memory use does not depend on the blob size.
+    :param pieces: an iterable of bytes objects that form the blob when concatenated together
+    :param check_signature: if False, the signatures are left for the caller to check against the signed data
+    :return: a generator of (payload, signed_data) tuples, see iter_signed_payloads
+    """
+    buffered_pieces, buffered_size, needed_size = [], 0, 0
+    for piece in pieces:
+        buffered_pieces.append(piece)
+        buffered_size += len(piece)
+        # The pieces are only joined once the payload cut short at the end of the previous one can be complete
+        if buffered_size < needed_size:
+            continue
+        view = memoryview(b''.join(buffered_pieces))
+        offset = 0
+        needed_size = 0
+        while offset < len(view):
+            # Only a payload cut short at the end of the piece waits for more data, a malformed one fails right away
+            payload_size = get_payload_size(view, offset)
+            if payload_size is None or offset + payload_size > len(view):
+                needed_size = payload_size or 0
+                break
+            start = offset
+            payload, offset = read_payload_with_offset(view, offset, check_signature=False)
+            signed_data = view[start : offset - SIGNATURE_SIZE]
+            if check_signature and not is_valid_signed_data(payload.public_key, signed_data, payload.signature):
+                raise InvalidSignatureException("Tried to create payload with wrong signature")
+            yield payload, signed_data
+        tail = bytes(view[offset:])
+        buffered_pieces, buffered_size = [tail], len(tail)
+    if buffered_size:
+        raise struct.error("Blob ends with an incomplete payload of %i bytes" % buffered_size)
+
+
+@lru_cache(maxsize=1024)
+def _key_from_public_bin(public_key):
+    # The entries of a blob are mostly signed by the same key, which is worth building once
+    return default_eccrypto.key_from_public_bin(b"LibNaCLPK:" + public_key)
+
+
+def is_valid_signed_data(public_key, signed_data, signature):
+    """
+    Check the signature against the signed data as it was received, so the payload does not have to be packed again.
+    """
+    # Free-for-all entries are allowed to go with zero key and zero signature
+    if public_key == NULL_KEY:
+        return signature == NULL_SIG
+    key = _key_from_public_bin(public_key)
+    return bool(default_eccrypto.is_valid_signature(key, bytes(signed_data), signature))
+
+
 class SignedPayload(Payload):
     """
     Payload for metadata.
@@ -135,15 +229,18 @@ class SignedPayload(Payload):
 
     @classmethod
     def from_signed_blob_with_offset(cls, data, check_signature=True, offset=0):
-        # TODO: stop serializing/deserializing stuff twice
+        start = offset
         unpack_list = []
         for format_str in cls.format_list:
             offset = default_serializer.get_packer_for(format_str).unpack(data, offset, unpack_list)
-        if check_signature:
-            signature = data[offset : offset + SIGNATURE_SIZE]
-            payload = cls.from_unpack_list(*unpack_list, signature=signature)
-        else:
-            payload = cls.from_unpack_list(*unpack_list, skip_key_check=True)
+        # Variable-length fields come out as slices of a memoryview, and must outlive it
+        unpack_list = [bytes(value) if isinstance(value, memoryview) else value for value in unpack_list]
+        signature = bytes(data[offset : offset + SIGNATURE_SIZE])
+        # The signature is checked against the original bytes instead of the payload packed again.
+        # If not checked here, the signature is still attached to the payload, so it could be checked later.
+        payload = cls.from_unpack_list(*unpack_list, signature=signature, skip_key_check=True)
+        if check_signature and not is_valid_signed_data(payload.public_key, data[start:offset], signature):
+            raise InvalidSignatureException("Tried to create payload with wrong signature")
         return payload, offset + SIGNATURE_SIZE
 
     def to_dict(self):
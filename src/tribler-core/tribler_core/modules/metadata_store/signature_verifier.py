@@ -0,0 +1,73 @@
+# Batched verification of metadata signatures.
+#
+# Deserializing a channel blob is dominated by Ed25519 signature checks. Instead of checking each signature while
+# parsing, the blob is parsed without checks, and then the signatures of the whole blob are verified in one go,
+# optionally spread over a pool of worker processes.
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from tribler_core.modules.metadata_store.serialization import is_valid_signed_data
+
+# Sending tiny chunks to worker processes costs more than verifying them locally
+MIN_CHUNK_SIZE = 100
+
+
+def verify_signatures(entries):
+    """
+    Check the signatures of the given entries. Runs in worker processes, so it must stay a top-level function.
+    :param entries: a list of (public_key, signed_data, signature) tuples
+    :return: a list of booleans, one for each entry, indicating if the entry's signature is valid
+    """
+    result = []
+    for public_key, signed_data, signature in entries:
+        try:
+            result.append(is_valid_signed_data(public_key, signed_data, signature))
+        except Exception:  # pylint: disable=broad-except
+            # Malformed public key
+            result.append(False)
+    return result
+
+
+class SignatureVerifier:
+    """
+    This class verifies batches of signatures, either in the calling thread or using a pool of worker processes.
+    """
+
+    def __init__(self, workers=0):
+        """
+        :param workers: the number of worker processes to use. If 0, the signatures are verified in-process.
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.workers = workers
+        # Forking a process that runs several threads can deadlock the child, so the workers are spawned instead.
+        # The spawned workers re-run the frozen executable, which relies on freeze_support() in run_tribler.py.
+        self.pool = (
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            if workers > 0
+            else None
+        )
+
+    def verify(self, entries):
+        """
+        Verify the signatures of the given entries.
+        :param entries: a list of (public_key, signed_data, signature) tuples
+        :return: a list of booleans, one for each entry, indicating if the entry's signature is valid
+        """
+        if self.pool is None or len(entries) < 2 * MIN_CHUNK_SIZE:
+            return verify_signatures(entries)
+
+        # Give every worker a few chunks, so a slow worker does not hold up the whole batch
+        chunk_size = max(MIN_CHUNK_SIZE, len(entries) // (self.workers * 4) + 1)
+        # Memoryview slices of the blob can not be pickled, so they are copied when sent to the workers
+        entries = [(public_key, bytes(signed_data), signature) for public_key, signed_data, signature in entries]
+        chunks = [entries[i : i + chunk_size] for i in range(0, len(entries), chunk_size)]
+        result = []
+        for chunk_result in self.pool.map(verify_signatures, chunks):
+            result.extend(chunk_result)
+        return result
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -2,19 +2,25 @@ import logging
 import threading
 from asyncio import get_event_loop
 from datetime import datetime, timedelta
+from itertools import islice
 from time import sleep
 
 from ipv8.database import database_blob
 
-import lz4.frame
-
 from pony import orm
 from pony.orm import CacheIndexError, TransactionIntegrityError, db_session
 
 from tribler_common.simpledefs import NTFY
 
-from tribler_core.exceptions import InvalidSignatureException
+from tribler_core.modules.category_filter.family_filter import default_xxx_filter
 from tribler_core.modules.category_filter.l2_filter import is_forbidden
+from tribler_core.modules.metadata_store.autocomplete import (
+    AutocompleteIndex,
+    create_terms_index,
+    drop_terms_index,
+    reset_terms_log,
+)
+from tribler_core.modules.metadata_store.entries_count import create_count_tables, drop_count_tables
 from tribler_core.modules.metadata_store.orm_bindings import (
     channel_metadata,
     channel_node,
@@ -28,21 +34,30 @@ from tribler_core.modules.metadata_store.orm_bindings import (
     tracker_state,
     vsids,
 )
-from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import get_mdblob_sequence_number
-from tribler_core.modules.metadata_store.orm_bindings.channel_node import LEGACY_ENTRY
+from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import (
+    SQL_VARIABLES_LIMIT,
+    LZ4DecompressionException,
+    chunks,
+    get_mdblob_sequence_number,
+    lz4_decompress_pieces,
+    read_mdblob_file_pieces,
+)
+from tribler_core.modules.metadata_store.orm_bindings.channel_node import LEGACY_ENTRY, generate_dict_from_pony_args
 from tribler_core.modules.metadata_store.serialization import (
     CHANNEL_TORRENT,
     COLLECTION_NODE,
     DELETED,
     NULL_KEY,
     REGULAR_TORRENT,
-    read_payload_with_offset,
+    iter_signed_payloads,
+    iter_signed_payloads_from_stream,
 )
-from tribler_core.utilities.path_util import str_path
+from tribler_core.modules.metadata_store.signature_verifier import SignatureVerifier
+from tribler_core.utilities.tracker_utils import get_uniformed_tracker_url
 from tribler_core.utilities.unicode import hexlify
 
 BETA_DB_VERSIONS = [0, 1, 2, 3, 4, 5]
-CURRENT_DB_VERSION = 11
+CURRENT_DB_VERSION = 12
 
 NO_ACTION = 0
 UNKNOWN_CHANNEL = 1
@@ -55,6 +70,8 @@ UNKNOWN_COLLECTION = 7
 
 MIN_BATCH_SIZE = 10
 MAX_BATCH_SIZE = 1000
+# Bulk insertion skips the ORM, so it can afford much larger batches for the same time budget
+MAX_BULK_BATCH_SIZE = 10000
 
 
 # This table should never be used from ORM directly.
@@ -86,7 +103,15 @@ sql_add_fts_trigger_update = """
 
 class MetadataStore:
     def __init__(
-        self, db_filename, channels_dir, my_key, disable_sync=False, notifier=None, check_tables=True, db_version=None
+        self,
+        db_filename,
+        channels_dir,
+        my_key,
+        disable_sync=False,
+        notifier=None,
+        check_tables=True,
+        db_version=None,
+        signature_verification_workers=0,
     ):
         self.notifier = notifier  # Reference to app-level notification service
         self.db_filename = db_filename
@@ -99,6 +124,9 @@ class MetadataStore:
         self.batch_size = 10  # reasonable number, a little bit more than typically fits in a single UDP packet
         self.reference_timedelta = timedelta(milliseconds=100)
         self.sleep_on_external_thread = 0.05  # sleep this amount of seconds between batches executed on external thread
+        self.signature_verifier = SignatureVerifier(workers=signature_verification_workers)
+        # The terms of all the titles, for autocompletion. Loaded from the database on the first use.
+        self.autocomplete_index = AutocompleteIndex()
 
         create_db = str(db_filename) == ":memory:" or not self.db_filename.is_file()
 
@@ -133,7 +161,7 @@ class MetadataStore:
 
         self.ChannelNode = channel_node.define_binding(self._db, logger=self._logger, key=my_key)
 
-        self.MetadataNode = metadata_node.define_binding(self._db)
+        self.MetadataNode = metadata_node.define_binding(self._db, self.autocomplete_index)
         self.CollectionNode = collection_node.define_binding(self._db)
         self.TorrentMetadata = torrent_metadata.define_binding(self._db)
         self.ChannelMetadata = channel_metadata.define_binding(self._db)
@@ -152,6 +180,17 @@ class MetadataStore:
                 self._db.execute(sql_create_fts_table)
                 self.create_fts_triggers()
 
+        # The counters are added to the existing databases on the fly, so they are not a part of the DB upgrades.
+        # The databases opened without checking the tables are the old ones that are about to be upgraded.
+        if check_tables:
+            with db_session(ddl=True):
+                if create_count_tables(self._db.get_connection()):
+                    self._logger.info("Created the entries counters")
+                if create_terms_index(self._db.get_connection()):
+                    self._logger.info("Created the autocompletion terms index")
+                # The changes logged for the index of the previous run are of no use to the new index
+                reset_terms_log(self._db.get_connection())
+
         if create_db:
             if db_version is None:
                 db_version = CURRENT_DB_VERSION
@@ -194,6 +233,12 @@ class MetadataStore:
         cursor.execute(sql_add_fts_trigger_delete)
         cursor.execute(sql_add_fts_trigger_update)
 
+    def drop_count_tables(self):
+        drop_count_tables(self._db.get_connection())
+
+    def drop_terms_index(self):
+        drop_terms_index(self._db.get_connection())
+
     def fill_fts_index(self):
         cursor = self._db.get_connection().cursor()
         cursor.execute("insert into FtsIndex(rowid, title) select rowid, title from ChannelNode")
@@ -221,6 +266,7 @@ class MetadataStore:
 
     def shutdown(self):
         self._shutting_down = True
+        self.signature_verifier.shutdown()
         self._db.disconnect()
 
     def disconnect_thread(self):
@@ -306,24 +352,21 @@ class MetadataStore:
                     or blob_sequence_number > channel.timestamp
                 ):
                     continue
-            try:
-                self.process_mdblob_file(str(full_filename), **kwargs, channel_public_key=public_key)
-                # If we stopped mdblob processing due to shutdown flag, we should stop
-                # processing immediately, so that the channel local version will not increase
-                if self._shutting_down:
+            self.process_mdblob_file(str(full_filename), **kwargs, channel_public_key=public_key)
+            # If we stopped mdblob processing due to shutdown flag, we should stop
+            # processing immediately, so that the channel local version will not increase
+            if self._shutting_down:
+                return
+            # We track the local version of the channel while reading blobs
+            with db_session:
+                channel = self.ChannelMetadata.get_for_update(public_key=public_key, id_=id_)
+                if not channel:
                     return
-                # We track the local version of the channel while reading blobs
-                with db_session:
-                    channel = self.ChannelMetadata.get_for_update(public_key=public_key, id_=id_)
-                    if not channel:
-                        return
-                    channel.local_version = blob_sequence_number
-                    if self.notifier:
-                        channel_update_dict = channel.to_simple_dict()
-                        channel_update_dict["progress"] = float(processed_blobs_size) / total_blobs_size
-                        self.notifier.notify(NTFY.CHANNEL_ENTITY_UPDATED, channel_update_dict)
-            except InvalidSignatureException:
-                self._logger.error("Not processing metadata located at %s: invalid signature", full_filename)
+                channel.local_version = blob_sequence_number
+                if self.notifier:
+                    channel_update_dict = channel.to_simple_dict()
+                    channel_update_dict["progress"] = float(processed_blobs_size) / total_blobs_size
+                    self.notifier.notify(NTFY.CHANNEL_ENTITY_UPDATED, channel_update_dict)
 
         with db_session:
             channel = self.ChannelMetadata.get(public_key=public_key, id_=id_)
@@ -337,6 +380,44 @@ class MetadataStore:
                 channel.timestamp,
             )
 
+    def process_verified_channel_blob(self, public_key, id_, blob_sequence_number, payloads, progress=None):
+        """
+        Add the contents of a single channel blob, with signatures already checked, to the database in a single
+        transaction, and advance the local version of the channel to the blob's sequence number.
+        :param public_key: public_key of the channel.
+        :param id_: id_ of the channel.
+        :param blob_sequence_number: the sequence number of the blob, taken from its filename
+        :param payloads: the list of payloads from the blob with valid signatures
+        :param progress: the fraction of the channel processed after this blob, to be reported to the GUI
+        :return: False if the processing of the channel should stop, True otherwise
+        """
+        if self._shutting_down:
+            return False
+        with db_session:
+            channel = self.ChannelMetadata.get(public_key=public_key, id_=id_)
+            if not channel:
+                return False
+            # The blob could have been processed already, see process_channel_dir
+            if (
+                blob_sequence_number <= channel.start_timestamp
+                or blob_sequence_number <= channel.local_version
+                or blob_sequence_number > channel.timestamp
+            ):
+                return True
+
+            self.process_payloads_bulk(payloads, channel_public_key=public_key)
+
+            channel = self.ChannelMetadata.get_for_update(public_key=public_key, id_=id_)
+            if not channel:
+                return False
+            channel.local_version = blob_sequence_number
+            if self.notifier:
+                channel_update_dict = channel.to_simple_dict()
+                if progress is not None:
+                    channel_update_dict["progress"] = progress
+                self.notifier.notify(NTFY.CHANNEL_ENTITY_UPDATED, channel_update_dict)
+        return True
+
     def process_mdblob_file(self, filepath, **kwargs):
         """
         Process a file with metadata in a channel directory.
@@ -346,13 +427,17 @@ class MetadataStore:
         :param external_thread: indicate to the lower lever that we're running in the backround thread,
             to possibly pace down the upload process
         :return: a list of tuples of (<metadata or payload>, <action type>)
-        """
-        with open(str_path(filepath), 'rb') as f:
-            serialized_data = f.read()
 
-        if str(filepath).endswith('.lz4'):
-            return self.process_compressed_mdblob(serialized_data, **kwargs)
-        return self.process_squashed_mdblob(serialized_data, **kwargs)
+        The file is read, decompressed and parsed in bounded pieces, so the memory use does not depend on its size.
+        """
+        pieces = read_mdblob_file_pieces(filepath)
+        try:
+            return self.process_signed_payloads(
+                iter_signed_payloads_from_stream(pieces, check_signature=False), **kwargs
+            )
+        except LZ4DecompressionException:
+            self._logger.warning("Unable to decompress mdblob %s", filepath)
+            return []
 
     async def process_compressed_mdblob_threaded(self, compressed_data, **kwargs):
         def _process_blob():
@@ -374,14 +459,16 @@ class MetadataStore:
         return await get_event_loop().run_in_executor(None, _process_blob)
 
     def process_compressed_mdblob(self, compressed_data, **kwargs):
+        pieces = lz4_decompress_pieces([compressed_data])
         try:
-            decompressed_data = lz4.frame.decompress(compressed_data)
-        except RuntimeError:
+            return self.process_signed_payloads(
+                iter_signed_payloads_from_stream(pieces, check_signature=False), **kwargs
+            )
+        except LZ4DecompressionException:
             self._logger.warning("Unable to decompress mdblob")
             return []
-        return self.process_squashed_mdblob(decompressed_data, **kwargs)
 
-    def process_squashed_mdblob(self, chunk_data, external_thread=False, **kwargs):
+    def process_squashed_mdblob(self, chunk_data, external_thread=False, bulk_insert=False, **kwargs):
         """
         Process raw concatenated payloads blob. This routine breaks the database access into smaller batches.
         It uses a congestion-control like algorithm to determine the optimal batch size, targeting the
@@ -391,32 +478,50 @@ class MetadataStore:
         :param external_thread: if this is set to True, we add some sleep between batches to allow other threads
             to get the database lock. This is an ugly workaround for Python and asynchronous programming (locking)
             imperfections. It only makes sense to use it when this routine runs on a non-reactor thread.
+        :param bulk_insert: if this is set to True, the batches are processed by process_payloads_bulk, which
+            inserts previously unknown entries with raw SQL instead of creating ORM objects for them.
         :return: a list of tuples of (<metadata or payload>, <action type>)
         """
 
-        offset = 0
-        payload_list = []
-        while offset < len(chunk_data):
-            payload, offset = read_payload_with_offset(chunk_data, offset)
-            payload_list.append(payload)
+        return self.process_signed_payloads(
+            iter_signed_payloads(chunk_data, check_signature=False),
+            external_thread=external_thread,
+            bulk_insert=bulk_insert,
+            **kwargs,
+        )
+
+    def process_signed_payloads(self, signed_payloads, external_thread=False, bulk_insert=False, **kwargs):
+        """
+        Process a stream of payloads with not yet checked signatures, batch by batch. The signatures of each batch
+        are verified together before the batch goes to the database.
+
+        :param signed_payloads: an iterable of (payload, signed_data) tuples, as produced by iter_signed_payloads
+        :return: a list of tuples of (<metadata or payload>, <action type>)
+        """
+        max_batch_size = MAX_BULK_BATCH_SIZE if bulk_insert else MAX_BATCH_SIZE
+        self.batch_size = min(self.batch_size, max_batch_size)
 
         result = []
-        total_size = len(payload_list)
-        start = 0
-        while start < total_size:
-            end = start + self.batch_size
-            batch = payload_list[start:end]
+        signed_payloads = iter(signed_payloads)
+        while True:
+            signed_batch = list(islice(signed_payloads, self.batch_size))
+            if not signed_batch:
+                break
+            batch = self.verify_signed_payloads(signed_batch)
             batch_start_time = datetime.now()
 
             # We separate the sessions to minimize database locking.
             with db_session:
-                for payload in batch:
-                    result.extend(self.process_payload(payload, **kwargs))
+                if bulk_insert:
+                    result.extend(self.process_payloads_bulk(batch, **kwargs))
+                else:
+                    for payload in batch:
+                        result.extend(self.process_payload(payload, **kwargs))
 
             # Batch size adjustment
             batch_end_time = datetime.now() - batch_start_time
             target_coeff = batch_end_time.total_seconds() / self.reference_timedelta.total_seconds()
-            if len(batch) == self.batch_size:
+            if len(signed_batch) == self.batch_size:
                 # Adjust batch size only for full batches
                 if target_coeff < 0.8:
                     self.batch_size += self.batch_size
@@ -424,14 +529,13 @@ class MetadataStore:
                     self.batch_size = int(float(self.batch_size) / target_coeff)
                 # we want to guarantee that at least something
                 # will go through, but not too much
-                self.batch_size = min(max(self.batch_size, MIN_BATCH_SIZE), MAX_BATCH_SIZE)
+                self.batch_size = min(max(self.batch_size, MIN_BATCH_SIZE), max_batch_size)
             self._logger.debug(
                 (
                     "Added payload batch to DB (entries, seconds): %i %f",
                     (self.batch_size, float(batch_end_time.total_seconds())),
                 )
             )
-            start = end
             if self._shutting_down:
                 break
 
@@ -440,6 +544,25 @@ class MetadataStore:
 
         return result
 
+    def verify_signed_payloads(self, signed_payloads):
+        """
+        Verify the signatures of a batch of payloads all at once.
+        Payloads with invalid signatures are dropped, while the rest of the batch is still accepted.
+        :param signed_payloads: a list of (payload, signed_data) tuples
+        :return: a list of payloads with valid signatures
+        """
+        payload_list = [payload for payload, _ in signed_payloads]
+        signed_entries = [
+            (payload.public_key, signed_data, payload.signature) for payload, signed_data in signed_payloads
+        ]
+
+        verified = self.signature_verifier.verify(signed_entries)
+        if not all(verified):
+            self._logger.warning(
+                "Dropped %i payloads with invalid signatures out of %i", verified.count(False), len(verified)
+            )
+        return [payload for payload, valid in zip(payload_list, verified) if valid]
+
     @db_session
     def process_payload(self, payload, skip_personal_metadata_payload=True, channel_public_key=None):
         """
@@ -520,9 +643,172 @@ class MetadataStore:
             (self.CollectionNode, UNKNOWN_COLLECTION),
         ):
             if orm_class._discriminator_ == payload.metadata_type:
-                return [(orm_class.from_payload(payload), response)]
+                node = orm_class.from_payload(payload)
+                return [(node, response)]
         return []
 
+    @db_session
+    def process_payloads_bulk(self, payloads, skip_personal_metadata_payload=True, channel_public_key=None):
+        """
+        Bulk version of process_payload, intended for ingesting large channels.
+        The (public_key, id_) pairs already present in the database are fetched for the whole batch in a single query.
+        Payloads introducing entries unknown to the database are then inserted with a few executemany calls,
+        bypassing the ORM (and the repeated signature check it entails). All the other payloads (updates, deletions,
+        personal or forbidden entries, etc.) are handed to process_payload, preserving the original order.
+        Bulk-inserted entries are reported as (None, <action type>), because no ORM objects are created for them.
+        ACHTUNG! The rows are inserted behind Pony's back, so this should run in a separate db_session that
+        does not hold the affected objects in its cache (process_squashed_mdblob does exactly that).
+
+        :param payloads: list of payloads to work on
+        :param skip_personal_metadata_payload: if this is set to True, personal torrent metadata payload received
+                through gossip will be ignored. The default value is True.
+        :param channel_public_key: rejects payloads that do not belong to this key. Without it, the bulk mode is
+               not used, because every payload requires checking the version of its parent channel.
+        :return: a list of tuples of (<metadata or payload>, <action type>)
+        """
+        result = []
+        if channel_public_key is None:
+            for payload in payloads:
+                result.extend(
+                    self.process_payload(payload, skip_personal_metadata_payload=skip_personal_metadata_payload)
+                )
+            return result
+
+        bulk_classes = {
+            orm_class._discriminator_: (orm_class, response)
+            for orm_class, response in (
+                (self.TorrentMetadata, UNKNOWN_TORRENT),
+                (self.ChannelMetadata, UNKNOWN_CHANNEL),
+                (self.CollectionNode, UNKNOWN_COLLECTION),
+            )
+        }
+        skip_personal = skip_personal_metadata_payload and channel_public_key == self.my_public_key_bin
+
+        # The set of ids known to exist at the point of processing each payload. Ids of all the payloads processed
+        # so far are added to it, so duplicate entries inside a single batch go through the regular path.
+        known_ids = self.get_existing_ids(channel_public_key, [getattr(p, "id_", None) for p in payloads])
+        to_insert = []
+        for payload in payloads:
+            bulk_class = bulk_classes.get(payload.metadata_type)
+            if (
+                bulk_class is not None
+                and not skip_personal
+                and payload.public_key == channel_public_key
+                and payload.id_ not in known_ids
+                and not is_forbidden(payload.title + payload.tags)
+            ):
+                orm_class, response = bulk_class
+                to_insert.append((orm_class, payload))
+                result.append((None, response))
+            else:
+                # Inserts must be done before processing anything else to keep the order of operations intact
+                self.bulk_insert_payloads(to_insert)
+                to_insert = []
+                result.extend(
+                    self.process_payload(
+                        payload,
+                        skip_personal_metadata_payload=skip_personal_metadata_payload,
+                        channel_public_key=channel_public_key,
+                    )
+                )
+            known_ids.add(getattr(payload, "id_", None))
+        self.bulk_insert_payloads(to_insert)
+        return result
+
+    @db_session
+    def get_existing_ids(self, public_key, ids):
+        """
+        Get the subset of the given ids that already exist in the database for the given public key.
+        """
+        existing = set()
+        cursor = self._db.get_connection().cursor()
+        for chunk in chunks([id_ for id_ in set(ids) if id_ is not None], SQL_VARIABLES_LIMIT):
+            cursor.execute(
+                f"SELECT id_ FROM ChannelNode WHERE public_key = ? AND id_ IN ({','.join('?' * len(chunk))})",
+                [public_key] + chunk,
+            )
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+
+    @db_session
+    def bulk_insert_payloads(self, entries):
+        """
+        Insert new entries into the database with raw SQL, along with their TorrentState and TrackerState rows.
+        The FTS index is kept consistent by the fts_ai trigger, which fires for every inserted ChannelNode row.
+        The entries must not exist in the database yet!
+        :param entries: a list of (<ORM class>, <payload>) tuples
+        """
+        if not entries:
+            return
+        cursor = self._db.get_connection().cursor()
+
+        # Create the missing TorrentState rows and get the rowids of all of them
+        infohashes = {payload.infohash for _, payload in entries if hasattr(payload, "infohash")}
+        health_ids = {}
+        if infohashes:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO TorrentState (infohash, seeders, leechers, last_check, self_checked) "
+                "VALUES (?, 0, 0, 0, 0)",
+                [(infohash,) for infohash in infohashes],
+            )
+            for chunk in chunks(list(infohashes), SQL_VARIABLES_LIMIT):
+                cursor.execute(
+                    f"SELECT infohash, rowid FROM TorrentState WHERE infohash IN ({','.join('?' * len(chunk))})", chunk
+                )
+                health_ids.update((bytes(infohash), rowid) for infohash, rowid in cursor.fetchall())
+
+        # Rows are grouped by ORM class, because each class has its own set of columns
+        rows_by_class = {}
+        defaults = {}
+        trackers = []
+        sanitized_urls = {}
+        for orm_class, payload in entries:
+            dct = payload.to_dict()
+            if hasattr(payload, "infohash"):
+                dct["health"] = health_ids[payload.infohash]
+                dct["xxx"] = default_xxx_filter.isXXXTorrentMetadataDict(dct)
+                if payload.tracker_info not in sanitized_urls:
+                    sanitized_urls[payload.tracker_info] = get_uniformed_tracker_url(payload.tracker_info)
+                if sanitized_urls[payload.tracker_info]:
+                    trackers.append((dct["health"], sanitized_urls[payload.tracker_info]))
+            if orm_class not in rows_by_class:
+                # Payload values are already typed by the deserializer, so we only have to validate the defaults
+                # once per class. Relation attributes are validated into ORM objects by Pony, so we skip "health".
+                defaults[orm_class] = generate_dict_from_pony_args(orm_class, skip_list=["health"], **dct)
+                rows_by_class[orm_class] = []
+            rows_by_class[orm_class].append(dict(defaults[orm_class], **dct))
+
+        for orm_class, rows in rows_by_class.items():
+            columns = [attr for attr in orm_class._attrs_ if attr.column and attr.name != "rowid"]
+            cursor.executemany(
+                f"INSERT INTO ChannelNode ({','.join(attr.column for attr in columns)}) "
+                f"VALUES ({','.join('?' * len(columns))})",
+                [
+                    [
+                        None if row.get(attr.name) is None else attr.converters[0].py2sql(row[attr.name])
+                        for attr in columns
+                    ]
+                    for row in rows
+                ],
+            )
+
+        if trackers:
+            urls = list({url for _, url in trackers})
+            cursor.executemany(
+                "INSERT OR IGNORE INTO TrackerState (url, last_check, alive, failures) VALUES (?, 0, 1, 0)",
+                [(url,) for url in urls],
+            )
+            tracker_ids = {}
+            for chunk in chunks(urls, SQL_VARIABLES_LIMIT):
+                cursor.execute(
+                    f"SELECT url, rowid FROM TrackerState WHERE url IN ({','.join('?' * len(chunk))})", chunk
+                )
+                tracker_ids.update(cursor.fetchall())
+            cursor.executemany(
+                "INSERT OR IGNORE INTO TorrentState_TrackerState (torrentstate, trackerstate) VALUES (?, ?)",
+                [(health_id, tracker_ids[url]) for health_id, url in trackers],
+            )
+
     @db_session
     def update_channel_node(self, node, payload, skip_personal_metadata_payload=True):
         # The received metadata has newer version than the stuff we got, so we have to update our version.
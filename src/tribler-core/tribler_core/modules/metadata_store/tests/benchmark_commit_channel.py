@@ -0,0 +1,91 @@
+"""
+Benchmark for committing a large personal channel to mdblobs. It compares packing the entries into chunks with
+the single-pass entries_to_chunks against the previous way of calling entries_to_chunk in a loop, which copied
+the rest of the list and re-checked the signature of every entry, and then times the full channel commit.
+
+Usage: python benchmark_commit_channel.py [--entries 100000]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from ipv8.keyvault.crypto import default_eccrypto
+
+import lz4.frame
+
+from pony.orm import db_session
+
+from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import LZ4_END_MARK_SIZE, entries_to_chunks
+from tribler_core.modules.metadata_store.orm_bindings.channel_node import NEW
+from tribler_core.modules.metadata_store.store import MetadataStore
+from tribler_core.utilities.random_utils import random_infohash
+
+
+def legacy_entries_to_chunk(metadata_list, chunk_size, start_index=0):
+    last_entry_index = None
+    with lz4.frame.LZ4FrameCompressor(auto_flush=True) as c:
+        header = c.begin()
+        offset = len(header)
+        out_list = [header]
+        for index, metadata in enumerate(metadata_list[start_index:], start_index):
+            blob = c.compress(metadata.serialized())
+            if offset + len(blob) > (chunk_size - LZ4_END_MARK_SIZE):
+                break
+            offset += len(blob)
+            last_entry_index = index
+            out_list.append(blob)
+        out_list.append(c.flush())
+    return b''.join(out_list), last_entry_index + 1
+
+
+def legacy_chunks(metadata_list, chunk_size):
+    index = 0
+    while index < len(metadata_list):
+        data, index = legacy_entries_to_chunk(metadata_list, chunk_size, start_index=index)
+        yield data, index
+
+
+def run_chunks(name, func, md_list, chunk_size):
+    start = time.time()
+    total_size = sum(len(data) for data, _ in func(md_list, chunk_size))
+    duration = time.time() - start
+    print(
+        f"  {name:7s}: {duration:.2f}s, {len(md_list) / duration:.0f} entries/s, "
+        f"{total_size / duration / 1e6:.2f} MB/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark committing a personal channel')
+    parser.add_argument('--entries', type=int, default=100000, help='number of entries in the channel')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        mds = MetadataStore(
+            Path(tmpdir) / 'benchmark.db', Path(tmpdir), default_eccrypto.generate_key("curve25519"), disable_sync=True
+        )
+        print(f"Generating a channel with {args.entries} entries...")
+        with db_session:
+            channel = mds.ChannelMetadata.create_channel("benchmark channel")
+            for index in range(args.entries):
+                mds.TorrentMetadata(
+                    origin_id=channel.id_, title=f"torrent {index}", status=NEW, infohash=random_infohash()
+                )
+        chunk_size = mds.ChannelMetadata._CHUNK_SIZE_LIMIT
+        with db_session:
+            md_list = mds.ChannelMetadata.get(id_=channel.id_).get_contents_to_commit()
+            print("Packing the entries into chunks")
+            run_chunks("legacy", legacy_chunks, md_list, chunk_size)
+            run_chunks("stream", entries_to_chunks, md_list, chunk_size)
+
+        print("Committing the channel")
+        start = time.time()
+        with db_session:
+            mds.ChannelMetadata.get(id_=channel.id_).commit_channel_torrent()
+        print(f"  commit : {time.time() - start:.2f}s")
+        mds.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark for preparing the commit of a large, deeply nested personal channel. It compares finding the dirty entries
+with their ancestors and recalculating the recursive counts of the collections with recursive SQL queries against
+the previous way of walking up the tree with an ORM query per ancestor and counting the contents of every
+collection with a separate query.
+
+Usage: python benchmark_commit_forest.py [--levels 10] [--nodes 200000] [--dirty 0.05]
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from ipv8.keyvault.crypto import default_eccrypto
+
+from pony.orm import db_session, rollback, select
+
+from tribler_core.modules.metadata_store.discrete_clock import clock
+from tribler_core.modules.metadata_store.orm_bindings.channel_node import COMMITTED, DIRTY_STATUSES, NEW, TODELETE
+from tribler_core.modules.metadata_store.serialization import COLLECTION_NODE
+from tribler_core.modules.metadata_store.store import MetadataStore
+from tribler_core.utilities.random_utils import random_infohash
+
+BRANCHING = 3
+
+
+def legacy_get_commit_queue(mds, channel):
+    children = {}
+    upd_dict = {}
+    for node in mds.ChannelNode.select(
+        lambda g: g.public_key == mds.ChannelNode._my_key.pub().key_to_bin()[10:] and g.status in DIRTY_STATUSES
+    ):
+        while node and node.id_ not in upd_dict:
+            children.setdefault(node.origin_id, set()).add(node)
+            upd_dict[node.id_] = node
+            node = mds.CollectionNode.get(public_key=node.public_key, id_=node.origin_id)
+
+    # Post-order traversal, the same as in get_commit_forest
+    commit_queue = []
+    stack = [(channel, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited or node.id_ not in children:
+            commit_queue.append(node)
+            continue
+        stack.append((node, True))
+        stack.extend((child, False) for child in children[node.id_])
+    return commit_queue
+
+
+def legacy_prepare_commit_queue(mds, commit_queue):
+    for node in commit_queue:
+        if issubclass(type(node), mds.CollectionNode) and node.status != TODELETE:
+            node.num_entries = select(
+                (g.num_entries if g.metadata_type == COLLECTION_NODE else 1) for g in node.actual_contents
+            ).sum()
+            node.timestamp = clock.tick()
+            node.sign()
+
+
+def get_commit_queue(mds, channel):
+    return mds.CollectionNode.get_commit_forest()[channel.id_]
+
+
+def prepare_commit_queue(mds, commit_queue):
+    mds.CollectionNode.prepare_commit_queue_for_channel(commit_queue)
+
+
+def run(name, get_queue_func, prepare_func, mds, channel_id):
+    with db_session:
+        channel = mds.ChannelMetadata.get(id_=channel_id)
+        start = time.time()
+        commit_queue = get_queue_func(mds, channel)
+        queue_time = time.time()
+        prepare_func(mds, commit_queue)
+        end = time.time()
+        print(
+            f"  {name:7s}: {end - start:.2f}s ({queue_time - start:.2f}s finding the queue, "
+            f"{end - queue_time:.2f}s counting and signing), {len(commit_queue)} entries in the queue, "
+            f"{channel.num_entries} torrents"
+        )
+        rollback()
+
+
+def generate_channel(mds, levels, num_nodes, dirty_ratio):
+    num_collections = sum(BRANCHING ** level for level in range(levels - 1))
+    num_torrents = num_nodes - num_collections - 1
+    with db_session:
+        channel = mds.ChannelMetadata.create_channel("benchmark channel")
+        channel.status = COMMITTED
+        level_ids = [channel.id_]
+        leaf_ids = []
+        for _ in range(levels - 1):
+            next_level_ids = []
+            for origin_id in level_ids:
+                for _ in range(BRANCHING):
+                    collection = mds.CollectionNode(origin_id=origin_id, title="collection", status=COMMITTED)
+                    next_level_ids.append(collection.id_)
+            leaf_ids = level_ids = next_level_ids
+        for index in range(num_torrents):
+            status = NEW if random.random() < dirty_ratio else COMMITTED
+            mds.TorrentMetadata(
+                origin_id=leaf_ids[index % len(leaf_ids)],
+                title=f"torrent {index}",
+                status=status,
+                infohash=random_infohash(),
+            )
+        return channel.id_
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark preparing the commit of a nested personal channel')
+    parser.add_argument('--levels', type=int, default=10, help='depth of the channel tree')
+    parser.add_argument('--nodes', type=int, default=200000, help='number of entries in the channel tree')
+    parser.add_argument('--dirty', type=float, default=0.05, help='ratio of the uncommitted torrents')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        mds = MetadataStore(
+            Path(tmpdir) / 'benchmark.db', Path(tmpdir), default_eccrypto.generate_key("curve25519"), disable_sync=True
+        )
+        print(f"Generating a {args.levels}-level channel tree with {args.nodes} entries...")
+        channel_id = generate_channel(mds, args.levels, args.nodes, args.dirty)
+        print("Preparing the commit queue")
+        run("legacy", legacy_get_commit_queue, legacy_prepare_commit_queue, mds, channel_id)
+        run("sql", get_commit_queue, prepare_commit_queue, mds, channel_id)
+        mds.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark for MetadataNode.get_entries, comparing the cached raw SQL query plans with the Pony queries built by
+MetadataNode.get_entries_query, for the common search/sort combinations used by the REST API and remote queries.
+The row mode fetches (rowid, title) tuples with MetadataNode.get_entries_rows instead of creating ORM objects.
+Then, it compares getting a page deep into the listing by its offset and by the cursor of the previous page.
+Finally, it compares the search queries with the single ranked query of MetadataNode.get_search_results.
+
+Usage: python benchmark_entries_query.py [--entries 20000] [--repeat 200] [--page-size 50]
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from ipv8.keyvault.crypto import default_eccrypto
+
+from pony.orm import db_session
+
+from tribler_core.modules.metadata_store.serialization import CHANNEL_TORRENT, COLLECTION_NODE, REGULAR_TORRENT
+from tribler_core.modules.metadata_store.store import MetadataStore
+from tribler_core.utilities.random_utils import random_infohash
+
+WORDS = ["ubuntu", "debian", "linux", "music", "video", "book", "game", "sheep", "lakes", "mountains"]
+
+QUERIES = {
+    "channels by votes": dict(metadata_type=CHANNEL_TORRENT, sort_by="votes", first=1, last=50),
+    "channel contents": dict(sort_by="title", sort_desc=False, first=1, last=50, exclude_deleted=True),
+    "torrents by health": dict(metadata_type=REGULAR_TORRENT, sort_by="HEALTH", first=1, last=50, hide_xxx=True),
+    "search": dict(txt_filter="linux*", first=1, last=50, hide_xxx=True),
+    "search by size": dict(
+        txt_filter="music*",
+        metadata_type=[REGULAR_TORRENT, CHANNEL_TORRENT, COLLECTION_NODE],
+        sort_by="size",
+        first=1,
+        last=50,
+    ),
+    "remote query": dict(txt_filter="video*", first=0, last=100),
+}
+
+SEARCH_QUERIES = {
+    "search": dict(txt_filter="linux*", first=1, last=50, hide_xxx=True),
+    "search torrents": dict(txt_filter="music video", metadata_type=REGULAR_TORRENT, first=1, last=50),
+}
+
+DEEP_PAGINATION_QUERIES = {
+    "channel contents": dict(sort_by="title", sort_desc=False, exclude_deleted=True),
+    "torrents by health": dict(metadata_type=REGULAR_TORRENT, sort_by="HEALTH", hide_xxx=True),
+    "newest torrents": dict(metadata_type=REGULAR_TORRENT),
+}
+
+
+def populate(mds, num_entries):
+    with db_session:
+        channel = mds.ChannelMetadata.create_channel("benchmark channel")
+        for index in range(num_entries):
+            torrent = mds.TorrentMetadata(
+                origin_id=channel.id_,
+                title=" ".join(random.sample(WORDS, 3)) + f" {index}",
+                size=random.randint(1, 2 ** 40),
+                infohash=random_infohash(),
+            )
+            torrent.health.set(seeders=random.randint(0, 1000), leechers=random.randint(0, 1000))
+
+
+def pony_get_entries(cls, first=1, last=None, **kwargs):
+    return cls.get_entries_query(**kwargs)[(first or 1) - 1 : last]
+
+
+def run_query(name, func, kwargs, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        with db_session:
+            func(**kwargs)
+    duration = time.time() - start
+    print(f"  {name:6s}: {duration / repeat * 1000:.2f} ms/query")
+
+
+def run_deep_pages(cls, kwargs, num_entries, page_size, repeat):
+    for depth in (0, num_entries // 2, num_entries - page_size):
+        first, last = depth + 1, depth + page_size
+        cursor = None
+        if depth:
+            with db_session:
+                previous_entry = cls.get_entries(first=depth, last=depth, **kwargs)[0]
+                cursor = cls.get_entries_cursor(previous_entry, **kwargs)
+        print(f"  page at {depth}")
+        run_query("offset", cls.get_entries, dict(kwargs, first=first, last=last), repeat)
+        run_query("cursor", cls.get_entries, dict(kwargs, first=first, last=last, cursor=cursor), repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MetadataNode.get_entries query paths')
+    parser.add_argument('--entries', type=int, default=20000, help='number of torrents in the database')
+    parser.add_argument('--repeat', type=int, default=200, help='number of times to run every query')
+    parser.add_argument('--page-size', type=int, default=50, help='number of entries in a page for deep pagination')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        mds = MetadataStore(
+            Path(tmpdir) / 'benchmark.db', Path(tmpdir), default_eccrypto.generate_key("curve25519"), disable_sync=True
+        )
+        print(f"Generating {args.entries} torrents...")
+        populate(mds, args.entries)
+        cls = mds.MetadataNode
+        for query_name, kwargs in QUERIES.items():
+            print(query_name)
+            run_query("pony", lambda **kw: pony_get_entries(cls, **kw)[:], kwargs, args.repeat)
+            run_query("cached", cls.get_entries, kwargs, args.repeat)
+            run_query("rows", lambda **kw: cls.get_entries_rows(("rowid", "title"), **kw), kwargs, args.repeat)
+        for query_name, kwargs in SEARCH_QUERIES.items():
+            print(f"{query_name}, ranked")
+            run_query("pony", lambda **kw: pony_get_entries(cls, **kw)[:], kwargs, args.repeat)
+            run_query("cached", cls.get_entries, kwargs, args.repeat)
+            run_query("ranked", cls.get_search_results, kwargs, args.repeat)
+        for query_name, kwargs in DEEP_PAGINATION_QUERIES.items():
+            print(f"{query_name}, deep pagination")
+            run_deep_pages(cls, kwargs, args.entries, args.page_size, args.repeat)
+        mds.shutdown()
+
+
+if __name__ == '__main__':
+    main()
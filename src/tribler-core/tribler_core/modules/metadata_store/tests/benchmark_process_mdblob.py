@@ -0,0 +1,101 @@
+"""
+Benchmark for processing a large synthetic channel blob with MetadataStore.process_squashed_mdblob,
+comparing the regular (ORM-based) path with the bulk insertion mode.
+With --from-file, the blob is written to an .mdblob.lz4 file instead, and processed with
+MetadataStore.process_mdblob_file, reporting the growth of the peak RSS during the processing.
+
+Usage: python benchmark_process_mdblob.py [--entries 500000] [--mode regular|bulk|both] [--from-file]
+"""
+import argparse
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from ipv8.keyvault.crypto import default_eccrypto
+
+import lz4.frame
+
+from tribler_core.modules.metadata_store.serialization import REGULAR_TORRENT, TorrentMetadataPayload
+from tribler_core.modules.metadata_store.store import MetadataStore
+from tribler_core.utilities.random_utils import random_infohash
+
+
+def gen_channel_payloads(key, num_entries):
+    public_key = key.pub().key_to_bin()[10:]
+    channel_id = random.getrandbits(63)
+    for index in range(num_entries):
+        payload = TorrentMetadataPayload(
+            REGULAR_TORRENT,
+            0,
+            public_key,
+            random.getrandbits(63),
+            channel_id,
+            index + 1,
+            random_infohash(),
+            random.randint(1, 2 ** 40),
+            random.randint(0, 2 ** 31),
+            f"synthetic torrent {index} {random.getrandbits(32):x}",
+            "video",
+            f"http://tracker{index % 100}.example.com/announce",
+            key=key,
+        )
+        yield payload.serialized()
+
+
+def gen_channel_blob(key, num_entries):
+    return b''.join(gen_channel_payloads(key, num_entries))
+
+
+def gen_channel_file(key, num_entries, filepath):
+    with lz4.frame.open(filepath, 'wb') as f:
+        for serialized in gen_channel_payloads(key, num_entries):
+            f.write(serialized)
+
+
+def run_benchmark(blob, public_key, num_entries, bulk_insert, filepath=None):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        mds = MetadataStore(
+            Path(tmpdir) / 'benchmark.db', Path(tmpdir), default_eccrypto.generate_key("curve25519"), disable_sync=True
+        )
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        if filepath:
+            mds.process_mdblob_file(filepath, bulk_insert=bulk_insert, channel_public_key=public_key)
+        else:
+            mds.process_squashed_mdblob(blob, bulk_insert=bulk_insert, channel_public_key=public_key)
+        duration = time.time() - start
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+        mds.shutdown()
+    print(
+        f"{'bulk' if bulk_insert else 'regular'}: {num_entries} entries in {duration:.2f}s, "
+        f"{num_entries / duration:.0f} entries/s, peak RSS growth {rss_growth // 1024} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark channel blob processing')
+    parser.add_argument('--entries', type=int, default=500000, help='number of entries in the synthetic channel')
+    parser.add_argument('--mode', choices=('regular', 'bulk', 'both'), default='both')
+    parser.add_argument('--from-file', action='store_true', help='process the channel from a compressed file')
+    args = parser.parse_args()
+
+    key = default_eccrypto.generate_key("curve25519")
+    public_key = key.pub().key_to_bin()[10:]
+    print(f"Generating a synthetic channel with {args.entries} entries...")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        blob, filepath = None, None
+        if args.from_file:
+            filepath = Path(tmpdir) / '000000000001.mdblob.lz4'
+            gen_channel_file(key, args.entries, filepath)
+        else:
+            blob = gen_channel_blob(key, args.entries)
+        if args.mode in ('regular', 'both'):
+            run_benchmark(blob, public_key, args.entries, bulk_insert=False, filepath=filepath)
+        if args.mode in ('bulk', 'both'):
+            run_benchmark(blob, public_key, args.entries, bulk_insert=True, filepath=filepath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+from unittest.mock import patch
+
+from tribler_core.modules.metadata_store.autocomplete import AutocompleteIndex, split_terms
+
+
+def test_split_terms():
+    assert split_terms("Pokémon_Red, (1996) v2.0") == ["pokemon", "red", "1996", "v2", "0"]
+
+
+def test_complete():
+    index = AutocompleteIndex()
+    index.load([("sheep", 5), ("sheepish", 2), ("shelter", 9), ("mountain", 1)])
+    assert index.complete("she", 2) == ["shelter", "sheep"]
+    assert index.complete("Lonely Shee", 10) == ["lonely sheep", "lonely sheepish"]
+    assert index.complete("sheep ", 10) == []
+    assert index.complete(".", 10) == []
+    assert index.complete("wolf", 10) == []
+
+
+def test_add_titles():
+    index = AutocompleteIndex()
+    index.add_titles(["ignored until loaded"])
+    assert not index
+
+    index.load([("sheep", 1)])
+    index.add_titles(["sheepish sheepish guy", "black sheepdog", "sheepish"])
+    assert index.complete("sheep", 10) == ["sheepish", "sheep", "sheepdog"]
+
+
+def test_top_terms_cache():
+    """
+    Test that the cached top terms of a prefix are kept up to date when adding titles
+    """
+    index = AutocompleteIndex()
+    index.load([(f"term{i}", i) for i in range(10)])
+    with patch("tribler_core.modules.metadata_store.autocomplete.TOP_TERMS_CACHE_THRESHOLD", 5), patch(
+        "tribler_core.modules.metadata_store.autocomplete.TOP_TERMS_CACHE_SIZE", 3
+    ):
+        assert index.complete("t", 3) == ["term9", "term8", "term7"]
+        index.add_titles(["term1 term5 newterm"] * 4)
+        assert index.complete("t", 3) == ["term5", "term9", "term8"]
+        assert index.complete("te", 2) == ["term5", "term9"]
+        assert index.complete("t", 5) == ["term5", "term9", "term8", "term7", "term6"]
+
+
+def test_update_title():
+    index = AutocompleteIndex()
+    index.load([("sheep", 2), ("sheepdog", 1)])
+    index.update_title("black sheepdog", None)
+    assert index.complete("sheep", 10) == ["sheep"]
+    index.update_title("sheep", "white sheep goat")
+    assert index.complete("sheep", 10) == ["sheep"]
+    assert index.complete("whi", 10) == ["white"]
+    index.update_title("white sheep goat", "goat")
+    index.update_title("sheep", None)
+    assert index.complete("sheep", 10) == []
+    assert index.complete("whi", 10) == []
+    assert len(index) == 1
+
+    # The terms are added back after they were removed
+    index.update_title(None, "sheepdog")
+    assert index.complete("sheep", 10) == ["sheepdog"]
+
+
+def test_merge_new_terms():
+    """
+    Test that the new terms are found both before and after they are merged into the sorted list of terms
+    """
+    index = AutocompleteIndex()
+    index.load([("sheep", 1), ("wolf", 1)])
+    with patch("tribler_core.modules.metadata_store.autocomplete.NEW_TERMS_MERGE_SIZE", 3):
+        index.add_titles(["shepherd", "sheepdog"])
+        index.update_title("wolf", None)
+        assert index.new_terms == ["sheepdog", "shepherd"]
+        assert index.complete("she", 10) == ["sheep", "sheepdog", "shepherd"]
+
+        index.add_titles(["shelter"])
+        assert not index.new_terms
+        assert index.terms == ["sheep", "sheepdog", "shelter", "shepherd"]
+        assert index.complete("she", 10) == ["sheep", "sheepdog", "shelter", "shepherd"]
+
+
+def test_top_terms_cache_remove():
+    """
+    Test that the cached top terms of a prefix are recomputed when a term drops out of them
+    """
+    index = AutocompleteIndex()
+    index.load([(f"term{i}", i) for i in range(1, 10)])
+    with patch("tribler_core.modules.metadata_store.autocomplete.TOP_TERMS_CACHE_THRESHOLD", 5), patch(
+        "tribler_core.modules.metadata_store.autocomplete.TOP_TERMS_CACHE_SIZE", 3
+    ):
+        assert index.complete("t", 3) == ["term9", "term8", "term7"]
+        for _ in range(3):
+            index.update_title("term9", None)
+        assert index.complete("t", 3) == ["term8", "term7", "term6"]
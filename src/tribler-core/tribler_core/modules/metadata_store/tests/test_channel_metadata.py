@@ -1,3 +1,5 @@
+import base64
+import json
 import os
 from binascii import unhexlify
 from datetime import datetime
@@ -8,14 +10,26 @@ from unittest.mock import Mock, patch
 from ipv8.database import database_blob
 from ipv8.keyvault.crypto import default_eccrypto
 
-from pony.orm import ObjectNotFound, db_session
+import lz4.frame
+
+from pony.orm import ObjectNotFound, OperationWithDeletedObjectError, db_session
 
 import pytest
 
 from tribler_core.exceptions import DuplicateTorrentFileError
 from tribler_core.modules.libtorrent.torrentdef import TorrentDef
-from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import CHANNEL_DIR_NAME_LENGTH, entries_to_chunk
+from tribler_core.modules.metadata_store.entries_count import create_count_tables
+from tribler_core.modules.metadata_store.entries_query import compile_query_plan, decode_cursor, encode_cursor
+from tribler_core.modules.metadata_store.orm_bindings.channel_metadata import (
+    CHANNEL_DIR_NAME_LENGTH,
+    LZ4DecompressionException,
+    entries_to_chunk,
+    entries_to_chunks,
+    lz4_decompress_pieces,
+    read_mdblob_file_pieces,
+)
 from tribler_core.modules.metadata_store.orm_bindings.channel_node import COMMITTED, NEW, TODELETE, UPDATED
+from tribler_core.modules.metadata_store.search_engine import encode_search_cursor
 from tribler_core.modules.metadata_store.serialization import CHANNEL_TORRENT, COLLECTION_NODE, REGULAR_TORRENT
 from tribler_core.tests.tools.common import TESTS_DATA_DIR, TORRENT_UBUNTU_FILE
 from tribler_core.utilities import path_util
@@ -436,6 +450,124 @@ def test_recursive_commit_channel_torrent(metadata_store):
     assert chan.num_entries == 363
 
 
+@db_session
+def test_get_commit_forest(metadata_store):
+    """
+    Test that the commit forest contains the dirty entries with their ancestors, that the deleted subtrees
+    and the orphaned subtrees are deleted, and that the recursive counts of the collections are updated
+    """
+    chan = metadata_store.ChannelMetadata.create_channel('root', 'test')
+    chan.status = COMMITTED
+    coll1 = metadata_store.CollectionNode(title='coll1', origin_id=chan.id_, status=COMMITTED)
+    coll2 = metadata_store.CollectionNode(title='coll2', origin_id=coll1.id_, status=COMMITTED, num_entries=1)
+    new_torrent = metadata_store.TorrentMetadata(infohash=random_infohash(), origin_id=coll2.id_, status=NEW)
+    deleted_torrent = metadata_store.TorrentMetadata(infohash=random_infohash(), origin_id=coll2.id_, status=TODELETE)
+    # A clean subcollection keeps its stored count
+    clean_coll = metadata_store.CollectionNode(title='clean', origin_id=coll1.id_, status=COMMITTED, num_entries=5)
+    metadata_store.TorrentMetadata(infohash=random_infohash(), origin_id=coll1.id_, status=COMMITTED)
+
+    # A deleted collection with nested contents
+    deleted_coll = metadata_store.CollectionNode(title='deleted', origin_id=chan.id_, status=TODELETE)
+    deleted_subcoll = metadata_store.CollectionNode(title='deleted sub', origin_id=deleted_coll.id_, status=NEW)
+    deleted_contents = [
+        deleted_subcoll,
+        metadata_store.TorrentMetadata(infohash=random_infohash(), origin_id=deleted_subcoll.id_, status=NEW),
+    ]
+
+    # An orphaned subtree, with a dirty entry deep inside
+    orphan_coll = metadata_store.CollectionNode(title='orphan', origin_id=chan.id_ + 100, status=COMMITTED)
+    orphan_subcoll = metadata_store.CollectionNode(title='orphan sub', origin_id=orphan_coll.id_, status=COMMITTED)
+    orphaned = [
+        orphan_coll,
+        orphan_subcoll,
+        metadata_store.TorrentMetadata(infohash=random_infohash(), origin_id=orphan_subcoll.id_, status=NEW),
+        metadata_store.TorrentMetadata(infohash=random_infohash(), origin_id=orphan_coll.id_, status=COMMITTED),
+    ]
+
+    forest = metadata_store.CollectionNode.get_commit_forest()
+    assert list(forest) == [chan.id_]
+    queue = forest[chan.id_]
+    assert set(queue) == {chan, coll1, coll2, new_torrent, deleted_torrent, deleted_coll}
+    # The children always come before their parents
+    assert queue[-1] == chan
+    for node in queue[:-1]:
+        assert queue.index(node) < queue.index(metadata_store.ChannelNode.get(id_=node.origin_id))
+    removed_rowids = [node.rowid for node in deleted_contents + orphaned]
+    assert not metadata_store.ChannelNode.exists(lambda g: g.rowid in removed_rowids)
+    assert metadata_store.CollectionNode.exists(id_=clean_coll.id_)
+
+    metadata_store.CollectionNode.prepare_commit_queue_for_channel(queue)
+    assert coll2.num_entries == 1
+    assert coll1.num_entries == 1 + 5 + 1
+    assert chan.num_entries == 7
+    assert clean_coll.num_entries == 5
+
+
+@db_session
+def test_collapse_deleted_subtrees_cached_objects(metadata_store):
+    """
+    Test that the cached objects of the entries and the votes deleted with the subtrees are marked as deleted,
+    so they cannot be used or saved again in the same session
+    """
+    chan = metadata_store.ChannelMetadata.create_channel('root', 'test')
+    deleted_coll = metadata_store.CollectionNode(title='deleted', origin_id=chan.id_, status=TODELETE)
+    subchan = metadata_store.ChannelMetadata(title='subchannel', origin_id=deleted_coll.id_, infohash=random_infohash())
+    torrent = metadata_store.TorrentMetadata(title='torrent', origin_id=subchan.id_, infohash=random_infohash())
+    vote = metadata_store.upsert_vote(subchan, b"1" * 64)
+    voter, health = vote.voter, torrent.health
+    assert list(voter.individual_votes) == [vote]
+    assert list(health.metadata) == [torrent]
+    subchan_rowid, torrent_id, deleted_coll_id = subchan.rowid, torrent.id_, deleted_coll.id_
+
+    metadata_store.CollectionNode.collapse_deleted_subtrees()
+
+    for obj in (subchan, torrent):
+        with pytest.raises(OperationWithDeletedObjectError):
+            obj.title = 'changed'
+    with pytest.raises(OperationWithDeletedObjectError):
+        vote.vote_date = datetime.utcnow()
+    with pytest.raises(ObjectNotFound):
+        metadata_store.ChannelNode[subchan_rowid]
+    assert not metadata_store.TorrentMetadata.get(public_key=chan.public_key, id_=torrent_id)
+    assert not voter.individual_votes
+    assert not metadata_store.ChannelVote.select().count()
+    assert not health.metadata
+
+    # The deleted collection itself is kept for the commit, which still works
+    assert metadata_store.CollectionNode.get_commit_forest()[chan.id_][0] == deleted_coll
+    chan.commit_channel_torrent()
+    assert not metadata_store.CollectionNode.exists(id_=deleted_coll_id)
+
+
+@db_session
+def test_commit_all_channels_deleted_subtree_objects(metadata_store):
+    """
+    Test that the cached objects of a subtree deleted by commit_all_channels are marked as deleted,
+    and that their parent's contents no longer include them
+    """
+    chan = metadata_store.ChannelMetadata.create_channel('root', 'test')
+    coll = metadata_store.CollectionNode(title='collection', origin_id=chan.id_)
+    subcoll = metadata_store.CollectionNode(title='subcollection', origin_id=coll.id_)
+    torrents = [
+        metadata_store.TorrentMetadata(title=f'torrent{i}', origin_id=origin_id, infohash=random_infohash())
+        for i, origin_id in enumerate((chan.id_, coll.id_, subcoll.id_))
+    ]
+    metadata_store.CollectionNode.commit_all_channels()
+    assert set(chan.contents_list) == {coll, torrents[0]}
+
+    coll.soft_delete()
+    metadata_store.CollectionNode.commit_all_channels()
+
+    assert chan.contents_list == [torrents[0]]
+    assert torrents[0].title == 'torrent0'
+    for obj in (coll, subcoll, *torrents[1:]):
+        with pytest.raises(OperationWithDeletedObjectError):
+            _ = obj.title
+        with pytest.raises(OperationWithDeletedObjectError):
+            obj.title = 'changed'
+    assert metadata_store.ChannelNode.select().count() == 2
+
+
 @db_session
 def test_consolidate_channel_torrent(torrent_template, metadata_store):
     """
@@ -475,6 +607,122 @@ def test_consolidate_channel_torrent(torrent_template, metadata_store):
     assert len(channel.contents[:]) == 1
 
 
+@db_session
+def test_compact_channel_torrent(metadata_store):
+    """
+    Test compacting a channel torrent: only the blobs with few live entries should be rewritten, and the entries
+    should keep their signatures
+    """
+    channel = metadata_store.ChannelMetadata.create_channel('test', 'test')
+    my_dir = path_util.abspath(metadata_store.ChannelMetadata._channels_dir / channel.dirname)
+
+    def add_torrents(num):
+        torrents = [
+            metadata_store.TorrentMetadata(origin_id=channel.id_, status=NEW, infohash=random_infohash())
+            for _ in range(num)
+        ]
+        channel.commit_channel_torrent()
+        return torrents
+
+    # Nothing is dead yet
+    blob1_torrents = add_torrents(4)
+    blob2_torrents = add_torrents(4)
+    assert channel.compact_channel_torrent() is None
+
+    # All the entries of the first blob are dead, half of the entries of the second one are dead
+    for torrent in blob1_torrents[:3]:
+        torrent.soft_delete()
+    blob2_torrents[0].soft_delete()
+    channel.commit_channel_torrent()
+    blob1_torrents[3].update_properties({"title": "updated"})
+    blob2_torrents[1].update_properties({"title": "updated"})
+    channel.commit_channel_torrent()
+    assert len(os.listdir(my_dir)) == 4
+    kept_blob = sorted(os.listdir(my_dir))[1]
+    kept_blob_data = (my_dir / kept_blob).read_bytes()
+
+    signatures = {torrent.id_: torrent.signature for torrent in channel.contents}
+    old_timestamp = channel.timestamp
+    assert channel.compact_channel_torrent()
+    assert channel.timestamp == channel.local_version > old_timestamp
+
+    # The second blob is kept as it is. The first one is rewritten, and so is the blob with the deletions, as
+    # only one of them is for an entry of the kept blob. The blob with the updates is fully live, so it is kept.
+    blobs = sorted(os.listdir(my_dir))
+    assert len(blobs) == 3
+    assert blobs[0] == kept_blob
+    assert (my_dir / kept_blob).read_bytes() == kept_blob_data
+    assert {torrent.id_: torrent.signature for torrent in channel.contents} == signatures
+    assert channel.compact_channel_torrent() is None
+
+    # The channel can be restored from the compacted blobs
+    metadata_store.TorrentMetadata.select(lambda g: g.metadata_type == REGULAR_TORRENT).delete()
+    channel.local_version = 0
+    metadata_store.process_channel_dir(my_dir, channel.public_key, channel.id_, skip_personal_metadata_payload=False)
+    assert {torrent.id_: torrent.signature for torrent in channel.contents} == signatures
+    assert channel.local_version == channel.timestamp
+
+    # With no live entries left, the channel is compacted into an empty blob, which is not compacted again
+    for torrent in channel.contents:
+        torrent.soft_delete()
+    assert channel.compact_channel_torrent()
+    assert len(os.listdir(my_dir)) == 1
+    old_timestamp = channel.timestamp
+    assert channel.compact_channel_torrent() is None
+    assert channel.timestamp == old_timestamp
+    assert len(os.listdir(my_dir)) == 1
+
+    # The empty blob is removed along with the next rewritten blobs
+    add_torrents(1)[0].soft_delete()
+    channel.commit_channel_torrent()
+    assert len(os.listdir(my_dir)) == 3
+    assert channel.compact_channel_torrent()
+    assert len(os.listdir(my_dir)) == 1
+
+
+@db_session
+def test_rebuild_channel_torrent(metadata_store):
+    """
+    Test rebuilding a channel torrent: the channel is compacted if needed, the intact blobs are reused, and the
+    channel is only consolidated if its blobs are missing
+    """
+    channel = metadata_store.ChannelMetadata.create_channel('test', 'test')
+    my_dir = path_util.abspath(metadata_store.ChannelMetadata._channels_dir / channel.dirname)
+    torrents = [
+        metadata_store.TorrentMetadata(origin_id=channel.id_, status=NEW, infohash=random_infohash()) for _ in range(4)
+    ]
+    channel.commit_channel_torrent()
+    metadata_store.TorrentMetadata(origin_id=channel.id_, status=NEW, infohash=random_infohash())
+    committed_torrent = channel.commit_channel_torrent()
+    blobs = sorted(os.listdir(my_dir))
+    signatures = {torrent.id_: torrent.signature for torrent in channel.contents}
+
+    # The blobs are all live, so the same torrent is made out of them
+    infohash, timestamp = channel.infohash, channel.timestamp
+    assert channel.rebuild_channel_torrent()[b'info'] == committed_torrent[b'info']
+    assert (channel.infohash, channel.timestamp) == (infohash, timestamp)
+    assert sorted(os.listdir(my_dir)) == blobs
+
+    # The pending changes are committed and the dead blob is compacted, without re-signing the entries
+    deleted_ids = {torrent.id_ for torrent in torrents[:3]}
+    for torrent in torrents[:3]:
+        torrent.soft_delete()
+    assert channel.rebuild_channel_torrent()
+    assert channel.infohash != infohash
+    assert channel.timestamp == channel.local_version > timestamp
+    assert blobs[1] in os.listdir(my_dir)
+    signatures = {id_: signature for id_, signature in signatures.items() if id_ not in deleted_ids}
+    assert {torrent.id_: torrent.signature for torrent in channel.contents} == signatures
+
+    # The channel is consolidated anew if the blobs are lost
+    for filename in os.listdir(my_dir):
+        os.unlink(my_dir / filename)
+    assert channel.rebuild_channel_torrent()
+    assert channel.timestamp == channel.local_version
+    assert os.listdir(my_dir)
+    assert {torrent.id_: torrent.signature for torrent in channel.contents} != signatures
+
+
 @db_session
 def test_mdblob_dont_fit_exception(metadata_store):
     with pytest.raises(Exception):
@@ -484,6 +732,71 @@ def test_mdblob_dont_fit_exception(metadata_store):
         entries_to_chunk(md_list, chunk_size=1)
 
 
+@db_session
+def test_entries_to_chunks(metadata_store):
+    """
+    Test packing entries into several chunks in a single pass, serializing every entry once
+    """
+    md_list = [metadata_store.TorrentMetadata(title='test' + str(x), infohash=random_infohash()) for x in range(0, 20)]
+    md_list[-1].status = TODELETE
+    serialize = metadata_store.ChannelNode.serialized
+    with patch.object(metadata_store.TorrentMetadata, 'serialized', autospec=True, side_effect=serialize) as serialized:
+        chunks = list(entries_to_chunks(md_list, chunk_size=1000))
+    assert serialized.call_count == len(md_list) - 1
+
+    assert len(chunks) > 1
+    assert [end_index for _, end_index in chunks] == sorted({end_index for _, end_index in chunks})
+    assert chunks[-1][1] == len(md_list)
+    assert all(len(chunk) <= 1000 for chunk, _ in chunks)
+
+    # The chunks are the same as produced by packing them one by one
+    start_index = 0
+    for chunk, end_index in chunks:
+        assert entries_to_chunk(md_list, chunk_size=1000, start_index=start_index) == (chunk, end_index)
+        start_index = end_index
+
+    signatures = [md.signature for md in md_list]
+    for md in md_list[:-1]:
+        md.delete()
+    processed = []
+    for chunk, _ in chunks:
+        processed.extend(metadata_store.process_compressed_mdblob(chunk, skip_personal_metadata_payload=False))
+    assert [md.signature for md, _ in processed if md is not None] == signatures[:-1]
+
+
+def test_lz4_decompress_pieces():
+    """
+    Test decompressing an LZ4 frame in bounded pieces, no matter how the compressed data is split
+    """
+    data = os.urandom(1000) * 50
+    compressed = lz4.frame.compress(data)
+    compressed_pieces = [compressed[i : i + 100] for i in range(0, len(compressed), 100)]
+    pieces = list(lz4_decompress_pieces(compressed_pieces, max_piece_size=3000))
+    assert b''.join(pieces) == data
+    assert max(len(piece) for piece in pieces) <= 3000
+
+    with pytest.raises(LZ4DecompressionException):
+        list(lz4_decompress_pieces(compressed_pieces[:-1]))
+    with pytest.raises(LZ4DecompressionException):
+        list(lz4_decompress_pieces([b"abcdefg"]))
+
+
+def test_read_mdblob_file_pieces(tmpdir):
+    """
+    Test reading both compressed and uncompressed mdblob files in pieces
+    """
+    data = os.urandom(1000) * 50
+    plain_path = tmpdir / "000000000001.mdblob"
+    plain_path.write_binary(data)
+    compressed_path = tmpdir / "000000000002.mdblob.lz4"
+    compressed_path.write_binary(lz4.frame.compress(data))
+
+    for path in (plain_path, compressed_path):
+        pieces = list(read_mdblob_file_pieces(path, max_piece_size=4096))
+        assert b''.join(pieces) == data
+        assert max(len(piece) for piece in pieces) <= 4096
+
+
 @db_session
 def test_get_channels(metadata_store):
     """
@@ -769,6 +1082,266 @@ def test_sort_by_health_with_fts(mds_with_some_torrents):
     assert titles == ['folder1', 'folder2', 'torrent2', 'torrent1']
 
 
+@pytest.mark.parametrize(
+    "query",
+    [
+        {},
+        {"first": 3, "last": 7},
+        {"first": 5},
+        {"sort_by": "title", "sort_desc": False},
+        {"sort_by": "size"},
+        {"sort_by": "votes"},
+        {"sort_by": "HEALTH", "first": 2, "last": 6},
+        {"txt_filter": "aaa"},
+        {"txt_filter": "aaa", "sort_by": "HEALTH", "sort_desc": False},
+        {"txt_filter": "bbb", "metadata_type": [CHANNEL_TORRENT, COLLECTION_NODE]},
+        {"metadata_type": REGULAR_TORRENT, "hide_xxx": True, "exclude_deleted": True, "exclude_legacy": True},
+        {"subscribed": True, "sort_by": "title"},
+        {"attribute_ranges": (("num_entries", 0, 10), ("timestamp", None, 1 << 40))},
+        {"self_checked_torrent": False, "sort_by": "HEALTH"},
+        {"complete_channel": True},
+        {"category": "video"},
+    ],
+)
+@db_session
+def test_get_entries_matches_pony_query(mds_with_some_torrents, query):
+    """
+    Test that the cached raw SQL query plans return the same entries in the same order as the Pony queries
+    """
+    metadata_store, _ = mds_with_some_torrents
+    metadata_store.TorrentMetadata.select(lambda g: g.title.startswith('torrent3')).first().xxx = 1
+
+    for cls in (metadata_store.MetadataNode, metadata_store.TorrentMetadata, metadata_store.ChannelMetadata):
+        first, last = query.get("first", 1), query.get("last")
+        pony_kwargs = {k: v for k, v in query.items() if k not in ("first", "last")}
+        expected = cls.get_entries_query(**pony_kwargs)[(first or 1) - 1 : last]
+        assert cls.get_entries(**query) == list(expected)
+        assert cls.get_entries_count(**pony_kwargs) == cls.get_entries_query(**pony_kwargs).count()
+
+        rows = cls.get_entries_rows(("rowid", "title"), **query)
+        assert rows == [(entry.rowid, entry.title) for entry in expected]
+
+
+@db_session
+def test_get_entries_query_plans_cache(mds_with_some_torrents):
+    """
+    Test that the queries of the same shape share the same query plan, and that illegal queries are rejected
+    """
+    metadata_store, channel = mds_with_some_torrents
+    compile_query_plan.cache_clear()
+    metadata_store.MetadataNode.get_entries(txt_filter='aaa', first=1, last=10)
+    metadata_store.MetadataNode.get_entries(txt_filter='bbb', first=11, last=20)
+    metadata_store.MetadataNode.get_entries(txt_filter='bbb', channel_pk=channel.public_key)
+    assert compile_query_plan.cache_info().hits == 1
+    assert compile_query_plan.cache_info().misses == 2
+
+    assert metadata_store.MetadataNode.get_entries(txt_filter='*') == []
+    assert metadata_store.MetadataNode.get_entries(first=10, last=5) == []
+    assert metadata_store.MetadataNode.get_entries_rows(("title",), last=1) == [("torrent6 aaa zzz",)]
+    with pytest.raises(AttributeError):
+        metadata_store.MetadataNode.get_entries(sort_by="title; DROP TABLE ChannelNode")
+    with pytest.raises(ValueError):
+        metadata_store.MetadataNode.get_entries(id_=1 << 64)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {},
+        {"sort_by": "title", "sort_desc": False},
+        {"sort_by": "size"},
+        {"sort_by": "votes", "sort_desc": False},
+        {"sort_by": "HEALTH"},
+        {"sort_by": "HEALTH", "sort_desc": False},
+        {"txt_filter": "aaa"},
+        {"txt_filter": "bbb", "sort_by": "HEALTH"},
+    ],
+)
+@db_session
+def test_get_entries_keyset_pagination(mds_with_some_torrents, query):
+    """
+    Test that walking through the pages with cursors returns the same entries as a single query
+    """
+    metadata_store, _ = mds_with_some_torrents
+    expected = metadata_store.MetadataNode.get_entries(**query)
+
+    entries, cursor = [], None
+    while True:
+        # The cursor replaces the offset, so the following pages can be requested by their positions as well
+        first = len(entries) + 1
+        page = metadata_store.MetadataNode.get_entries(first=first, last=first + 2, cursor=cursor, **query)
+        entries.extend(page)
+        if len(page) < 3:
+            break
+        cursor = metadata_store.MetadataNode.get_entries_cursor(page[-1], **query)
+    assert entries == expected
+    assert metadata_store.MetadataNode.get_total_count(cursor=cursor, **query) == len(expected)
+
+
+def test_get_entries_malformed_cursor(metadata_store):
+    with pytest.raises(ValueError):
+        metadata_store.MetadataNode.get_entries(cursor="bla")
+    with pytest.raises(ValueError):
+        metadata_store.MetadataNode.get_entries(cursor=encode_cursor((1, 2)))
+    with pytest.raises(ValueError):
+        metadata_store.MetadataNode.get_entries(cursor=base64.urlsafe_b64encode(b'[[1]]').decode())
+    with pytest.raises(ValueError):
+        # Only JSON lists of values are accepted
+        metadata_store.MetadataNode.get_entries(cursor=base64.urlsafe_b64encode(b"print(1),").decode())
+    with pytest.raises(ValueError):
+        metadata_store.MetadataNode.get_entries(cursor=base64.urlsafe_b64encode(b'{"a": 1}').decode())
+    with pytest.raises(ValueError):
+        metadata_store.MetadataNode.get_entries(cursor=base64.urlsafe_b64encode(b'[{"hex": "zz"}]').decode())
+    with pytest.raises(ValueError):
+        metadata_store.MetadataNode.get_entries(cursor=base64.urlsafe_b64encode(b'[NaN]').decode())
+
+
+def test_encode_decode_cursor():
+    values = (1, 2.5, "text", b"\x00\xff", None)
+    cursor = encode_cursor(values)
+    assert json.loads(base64.urlsafe_b64decode(cursor)) == [1, 2.5, "text", {"hex": "00ff"}, None]
+    assert decode_cursor(cursor) == values
+    with pytest.raises(TypeError):
+        encode_cursor(([1],))
+
+
+@db_session
+def test_get_total_count_from_counters(mds_with_some_torrents):
+    """
+    Test that the counts taken from the counters maintained by the triggers match the counts of the queries
+    """
+    metadata_store, channel = mds_with_some_torrents
+    torrent = metadata_store.TorrentMetadata.select(lambda g: g.title.startswith('torrent3')).first()
+    torrent.xxx = 1
+    metadata_store.TorrentMetadata.select(lambda g: g.title.startswith('torrent4')).first().status = TODELETE
+    metadata_store.TorrentMetadata.select(lambda g: g.title.startswith('torrent5')).first().delete()
+    metadata_store.CollectionNode.select(lambda g: g.title.startswith('folder2_1')).first().origin_id = torrent.id_
+
+    queries = [
+        {},
+        {"origin_id": 0},
+        {"channel_pk": channel.public_key},
+        {"channel_pk": channel.public_key, "origin_id": channel.id_},
+        {"channel_pk": channel.public_key, "origin_id": channel.id_, "exclude_deleted": True, "hide_xxx": True},
+        {"metadata_type": REGULAR_TORRENT, "exclude_legacy": True},
+        {"metadata_type": [CHANNEL_TORRENT, COLLECTION_NODE], "origin_id": 0, "sort_by": "title"},
+    ]
+    for query in queries:
+        for cls in (metadata_store.MetadataNode, metadata_store.TorrentMetadata, metadata_store.ChannelMetadata):
+            assert cls.get_total_count_estimate(**query) == (cls.get_entries_count(**query), True)
+
+    # The counters are filled in when they are added to an existing database
+    connection = metadata_store._db.get_connection()  # pylint: disable=W0212
+    metadata_store.drop_count_tables()
+    assert create_count_tables(connection)
+    assert not create_count_tables(connection)
+    for query in queries:
+        assert metadata_store.MetadataNode.get_total_count(**query) == metadata_store.MetadataNode.get_entries_count(
+            **query
+        )
+
+
+@db_session
+def test_get_total_count_false_filters(mds_with_some_torrents):
+    """
+    Test that the filters set to False are applied to the counts like they are to the entries
+    """
+    metadata_store, _ = mds_with_some_torrents
+    key = default_eccrypto.generate_key("curve25519")
+    metadata_store.ChannelMetadata(title='unsubscribed', subscribed=False, infohash=random_infohash(), sign_with=key)
+    queries = [
+        {"subscribed": False},
+        {"subscribed": True},
+        {"self_checked_torrent": False},
+        {"complete_channel": False},
+        {"metadata_type": CHANNEL_TORRENT, "subscribed": False, "complete_channel": False},
+    ]
+    for query in queries:
+        for cls in (metadata_store.MetadataNode, metadata_store.TorrentMetadata, metadata_store.ChannelMetadata):
+            count = len(cls.get_entries(last=1000, **query))
+            assert cls.get_total_count_estimate(**query) == (count, True)
+
+
+@db_session
+def test_get_total_count_estimate_txt_filter(metadata_store):
+    """
+    Test that the counts of full-text queries are reported as estimates if the search has too many matches
+    """
+    for index in range(20):
+        metadata_store.TorrentMetadata(title=f'needle {index}', infohash=random_infohash())
+    assert metadata_store.TorrentMetadata.get_total_count_estimate(txt_filter='needle') == (20, True)
+    with patch('tribler_core.modules.metadata_store.entries_count.FTS_MATCHES_LIMIT', 10):
+        assert metadata_store.TorrentMetadata.get_total_count_estimate(txt_filter='needle') == (20, False)
+
+
+@db_session
+def test_get_search_results_ranking(metadata_store):
+    """
+    Test that the search results are ranked by relevance, seeders and channel votes, deduplicated by infohash
+    and come with highlighted titles
+    """
+    infohash = random_infohash()
+    metadata_store.TorrentMetadata(title='needle duplicate', infohash=infohash)
+    metadata_store.TorrentMetadata(title='needle duplicate copy', infohash=infohash)
+    metadata_store.TorrentMetadata(title='needle', infohash=random_infohash()).health.set(seeders=100)
+    metadata_store.TorrentMetadata(title='needle in a haystack', infohash=random_infohash())
+    metadata_store.TorrentMetadata(title='hay', infohash=random_infohash())
+
+    results = metadata_store.MetadataNode.get_search_results('needle')
+    assert [r.entry.title for r in results] == ['needle', 'needle duplicate', 'needle in a haystack']
+    assert [r.title_highlight for r in results][:2] == ['<b>needle</b>', '<b>needle</b> duplicate']
+    assert all(r1.score <= r2.score for r1, r2 in zip(results, results[1:]))
+
+    # Same filters and pagination as get_entries
+    assert [r.entry.title for r in metadata_store.MetadataNode.get_search_results('needle', 2, 2)] == [
+        'needle duplicate'
+    ]
+    assert not metadata_store.ChannelMetadata.get_search_results('needle')
+    assert not metadata_store.MetadataNode.get_search_results('*')
+
+    # Torrents of the channels with more votes rank higher
+    key = default_eccrypto.generate_key("curve25519")
+    metadata_store.ChannelMetadata(title='channel', votes=10.0, infohash=random_infohash(), sign_with=key)
+    voted = metadata_store.TorrentMetadata(title='needle in a haystack', infohash=random_infohash(), sign_with=key)
+    with patch.object(metadata_store.ChannelMetadata, 'votes_scaling', 10.0):
+        assert metadata_store.MetadataNode.get_search_results('haystack')[0].entry == voted
+
+
+@db_session
+def test_get_search_results_cursor(metadata_store):
+    """
+    Test that walking through the ranked search results with cursors returns the same results as a single search
+    """
+    for index in range(10):
+        metadata_store.TorrentMetadata(title=f'needle {index}', infohash=random_infohash()).health.seeders = index % 3
+    expected = metadata_store.MetadataNode.get_search_results('needle')
+
+    results, cursor = [], None
+    while True:
+        first = len(results) + 1
+        page = metadata_store.MetadataNode.get_search_results('needle', first, first + 2, cursor=cursor)
+        results.extend(page)
+        if len(page) < 3:
+            break
+        cursor = encode_search_cursor(page[-1])
+    assert [r.entry for r in results] == [r.entry for r in expected]
+
+    with pytest.raises(ValueError):
+        metadata_store.MetadataNode.get_search_results('needle', cursor=encode_cursor(("a", 1)))
+
+
+@db_session
+def test_get_search_results_highlight_escaped(metadata_store):
+    """
+    Test that the titles are escaped before the matched terms are highlighted
+    """
+    metadata_store.TorrentMetadata(title='<script>needle</script> & co', infohash=random_infohash())
+    metadata_store.TorrentMetadata(title='needle \ue001 marker', infohash=random_infohash())
+    highlights = {r.entry.title: r.title_highlight for r in metadata_store.MetadataNode.get_search_results('needle')}
+    assert highlights['<script>needle</script> & co'] == '&lt;script&gt;<b>needle</b>&lt;/script&gt; &amp; co'
+    assert highlights['needle \ue001 marker'] == 'needle \ue001 marker'
+
+
 @db_session
 def test_get_channel_name(metadata_store):
     """
@@ -0,0 +1,88 @@
+import shutil
+from pathlib import Path
+from unittest.mock import Mock
+
+from ipv8.keyvault.crypto import default_eccrypto
+
+from pony.orm import db_session
+
+import pytest
+
+from tribler_common.simpledefs import NTFY
+
+from tribler_core.modules.metadata_store.channel_processing import ChannelProcessingScheduler, load_verified_payloads
+from tribler_core.modules.metadata_store.orm_bindings.channel_node import NEW
+from tribler_core.modules.metadata_store.serialization import ChannelMetadataPayload
+from tribler_core.modules.metadata_store.store import MetadataStore
+from tribler_core.modules.metadata_store.tests.test_store import CHANNEL_DIR, CHANNEL_METADATA
+from tribler_core.utilities.random_utils import random_infohash
+
+NUM_OTHER_CHANNEL_ENTRIES = 20
+
+
+@pytest.fixture
+def other_channel(tmpdir):
+    """
+    Create a channel signed by another key, split into several blobs, in the same channels dir as metadata_store uses
+    """
+    other_mds = MetadataStore(
+        Path(tmpdir) / 'other.db', tmpdir, default_eccrypto.generate_key("curve25519"), disable_sync=True
+    )
+    other_mds.ChannelMetadata._CHUNK_SIZE_LIMIT = 1000
+    with db_session:
+        channel = other_mds.ChannelMetadata.create_channel('other channel')
+        for x in range(NUM_OTHER_CHANNEL_ENTRIES):
+            other_mds.TorrentMetadata(
+                origin_id=channel.id_, title='test' + str(x), status=NEW, infohash=random_infohash()
+            )
+        channel.commit_channel_torrent()
+        serialized, dirname = channel.serialized(), channel.dirname
+    other_mds.shutdown()
+    return serialized, dirname
+
+
+def test_load_verified_payloads(tmpdir, other_channel):
+    _, dirname = other_channel
+    blob_files = sorted((Path(tmpdir) / dirname).iterdir())
+    assert len(blob_files) > 1
+
+    num_payloads = 0
+    for blob_file in blob_files:
+        payloads, num_rejected = load_verified_payloads(str(blob_file))
+        assert not num_rejected
+        num_payloads += len(payloads)
+    assert num_payloads == NUM_OTHER_CHANNEL_ENTRIES
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(20)
+@pytest.mark.parametrize("workers", [0, 1])
+async def test_process_channels(metadata_store, tmpdir, other_channel, workers):
+    """
+    Test processing several channel dirs at once, reporting the progress for each of them
+    """
+    shutil.copytree(CHANNEL_DIR, Path(tmpdir) / CHANNEL_DIR.name)
+    metadata_store.channels_dir = Path(tmpdir)
+    metadata_store.notifier = Mock()
+    with db_session:
+        sample_channel = metadata_store.process_payload(ChannelMetadataPayload.from_file(CHANNEL_METADATA))[0][0]
+        other_channel = metadata_store.process_payload(ChannelMetadataPayload.from_signed_blob(other_channel[0]))[0][0]
+
+    scheduler = ChannelProcessingScheduler(metadata_store, workers=workers)
+    await scheduler.process_channels([sample_channel, other_channel])
+    await scheduler.shutdown()
+
+    with db_session:
+        sample_channel = metadata_store.ChannelMetadata.get(public_key=sample_channel.public_key)
+        assert len(sample_channel.contents_list) == 4
+        assert sample_channel.local_version == sample_channel.timestamp
+        other_channel = metadata_store.ChannelMetadata.get(public_key=other_channel.public_key)
+        assert len(other_channel.contents_list) == NUM_OTHER_CHANNEL_ENTRIES
+        assert other_channel.local_version == other_channel.timestamp
+
+    last_progress = {}
+    for (subject, channel_dict), _ in metadata_store.notifier.notify.call_args_list:
+        assert subject == NTFY.CHANNEL_ENTITY_UPDATED
+        last_progress[channel_dict["public_key"]] = channel_dict["progress"]
+    assert len(last_progress) == 2
+    assert all(progress == 1.0 for progress in last_progress.values())
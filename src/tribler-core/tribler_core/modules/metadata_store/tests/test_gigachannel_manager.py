@@ -13,11 +13,13 @@ import pytest
 
 from tribler_common.simpledefs import DLSTATUS_SEEDING
 
+from tribler_core.modules.libtorrent.download_config import DownloadConfig
 from tribler_core.modules.libtorrent.torrentdef import TorrentDef
 from tribler_core.modules.metadata_store.gigachannel_manager import GigaChannelManager
 from tribler_core.modules.metadata_store.orm_bindings.channel_node import NEW
 from tribler_core.tests.tools.base_test import MockObject
 from tribler_core.tests.tools.common import TORRENT_UBUNTU_FILE
+from tribler_core.utilities.libtorrent_helper import libtorrent as lt
 from tribler_core.utilities.random_utils import random_infohash
 
 update_metainfo = None
@@ -107,6 +109,83 @@ async def test_regenerate_channel_torrent(enable_chant, personal_channel, channe
         channel_manager.updated_my_channel.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_regenerate_channel_torrent_compacts(
+    enable_chant, personal_channel, channel_manager, mock_dlmgr, session
+):
+    """
+    Test that regenerating a personal channel torrent compacts the channel instead of re-signing all its contents
+    """
+    with db_session:
+        chan_pk, chan_id = personal_channel.public_key, personal_channel.id_
+        channel = session.mds.ChannelMetadata.get(public_key=chan_pk, id_=chan_id)
+        torrent = session.mds.TorrentMetadata(origin_id=chan_id, status=NEW, infohash=random_infohash())
+        channel.commit_channel_torrent()
+        signature = torrent.signature
+        channel_dir = Path(session.mds.ChannelMetadata._channels_dir) / Path(channel.dirname)
+        first_blob, kept_blob = sorted(channel_dir.iterdir())
+        channel.contents.filter(lambda g: g.id_ != torrent.id_).first().soft_delete()
+        old_infohash = channel.infohash
+
+    session.dlmgr.get_downloads_by_name = lambda *_: []
+    channel_manager.updated_my_channel = Mock()
+    tdef = await channel_manager.regenerate_channel_torrent(chan_pk, chan_id)
+    channel_manager.updated_my_channel.assert_called_once_with(tdef)
+
+    with db_session:
+        channel = session.mds.ChannelMetadata.get(public_key=chan_pk, id_=chan_id)
+        assert channel.infohash != old_infohash
+        torrent_file = Path(session.mds.ChannelMetadata._channels_dir) / (channel.dirname + ".torrent")
+        assert tdef.get_metainfo()[b'info'] == TorrentDef.load(torrent_file).get_metainfo()[b'info']
+        assert session.mds.TorrentMetadata.get(id_=torrent.id_).signature == signature
+    assert not first_blob.exists()
+    assert kept_blob.exists()
+
+
+@pytest.mark.skipif(
+    int(lt.__version__.split('.')[0]) > 1,
+    reason="libtorrent 2 creates hybrid torrents, whose alerts do not match the infohash of their TorrentDef",
+)
+@pytest.mark.asyncio
+@pytest.mark.timeout(20)
+async def test_regenerate_channel_torrent_seeding(
+    enable_chant, enable_libtorrent, personal_channel, channel_manager, session
+):
+    """
+    Test that regenerating a personal channel torrent that is being seeded keeps the files of the channel
+    """
+    with db_session:
+        chan_pk, chan_id = personal_channel.public_key, personal_channel.id_
+        channel = session.mds.ChannelMetadata.get(public_key=chan_pk, id_=chan_id)
+        torrent = session.mds.TorrentMetadata(origin_id=chan_id, status=NEW, infohash=random_infohash())
+        channel.commit_channel_torrent()
+        channel_dir = Path(session.mds.ChannelMetadata._channels_dir) / Path(channel.dirname)
+        torrent_file = Path(session.mds.ChannelMetadata._channels_dir) / (channel.dirname + ".torrent")
+        channel.contents.filter(lambda g: g.id_ != torrent.id_).first().soft_delete()
+
+    # Do not wait for the DHT, the files are seeded locally
+    session.dlmgr.dht_readiness_timeout = 0
+
+    def start_seeding(tdef):
+        config = DownloadConfig(state_dir=session.config.get_state_dir())
+        config.set_dest_dir(session.mds.channels_dir)
+        config.set_channel_download(True)
+        return session.dlmgr.start_download(tdef=tdef, config=config)
+
+    download = start_seeding(TorrentDef.load(torrent_file))
+    await asyncio.wait_for(download.wait_for_status(DLSTATUS_SEEDING), timeout=10)
+
+    channel_manager.updated_my_channel = Mock()
+    tdef = await channel_manager.regenerate_channel_torrent(chan_pk, chan_id)
+    channel_manager.updated_my_channel.assert_called_once_with(tdef)
+    assert not session.dlmgr.get_downloads_by_name(channel_dir.name)
+    # Give libtorrent the time to delete the files, if it were told to
+    await asyncio.sleep(0.5)
+    assert all((channel_dir / path).exists() for path in tdef.get_files())
+    new_download = start_seeding(tdef)
+    await asyncio.wait_for(new_download.wait_for_status(DLSTATUS_SEEDING), timeout=10)
+
+
 def test_updated_my_channel(enable_chant, personal_channel, channel_manager, mock_dlmgr, session, tmpdir):
     tdef = TorrentDef.load_from_dict(update_metainfo)
     session.dlmgr.start_download = Mock()
@@ -1,3 +1,5 @@
+import struct
+
 from ipv8.database import database_blob
 from ipv8.keyvault.crypto import default_eccrypto
 
@@ -13,7 +15,12 @@ from tribler_core.modules.metadata_store.serialization import (
     KeysMismatchException,
     NULL_KEY,
     NULL_SIG,
+    SIGNATURE_SIZE,
+    get_payload_size,
+    iter_signed_payloads,
+    iter_signed_payloads_from_stream,
 )
+from tribler_core.utilities.random_utils import random_infohash
 from tribler_core.utilities.unicode import hexlify
 
 
@@ -54,6 +61,79 @@ def test_serialization(metadata_store):
         md_type._payload_class.from_signed_blob(serialized3, check_signature=False)
 
 
+@db_session
+def test_iter_signed_payloads(metadata_store):
+    """
+    Test lazily reading payloads from a concatenated blob, with signatures checked against the original bytes
+    """
+    md_list = [metadata_store.TorrentMetadata(title="test" + str(i), infohash=random_infohash()) for i in range(3)]
+    md_list.append(metadata_store.CollectionNode(title="collection"))
+    serialized_list = [md.serialized() for md in md_list]
+    blob = b"".join(serialized_list)
+
+    offset = 0
+    for serialized, (payload, signed_data) in zip(serialized_list, iter_signed_payloads(blob)):
+        assert isinstance(signed_data, memoryview)
+        assert bytes(signed_data) == blob[offset : offset + len(serialized) - SIGNATURE_SIZE]
+        assert payload.serialized() == serialized
+        offset += len(serialized)
+    assert offset == len(blob)
+
+    # Break the signature of the third entry
+    broken_list = list(serialized_list)
+    broken_list[2] = broken_list[2][:-1] + b"\xee"
+    payloads = iter_signed_payloads(b"".join(broken_list))
+    next(payloads)
+    next(payloads)
+    with pytest.raises(InvalidSignatureException):
+        next(payloads)
+    assert len(list(iter_signed_payloads(b"".join(broken_list), check_signature=False))) == len(md_list)
+
+
+@db_session
+def test_iter_signed_payloads_from_stream(metadata_store):
+    """
+    Test parsing payloads from a blob that is split into pieces at arbitrary points
+    """
+    md_list = [metadata_store.TorrentMetadata(title="test" + str(i), infohash=random_infohash()) for i in range(10)]
+    blob = b"".join(md.serialized() for md in md_list)
+
+    for piece_size in (1, 7, 100, len(blob)):
+        pieces = [blob[i : i + piece_size] for i in range(0, len(blob), piece_size)]
+        parsed = [payload.serialized() for payload, _ in iter_signed_payloads_from_stream(pieces)]
+        assert parsed == [md.serialized() for md in md_list]
+
+    with pytest.raises(struct.error):
+        list(iter_signed_payloads_from_stream([blob[:100], blob[100:-1]]))
+
+
+@db_session
+def test_iter_signed_payloads_from_stream_malformed(metadata_store):
+    """
+    Test that a malformed payload in the middle of a blob fails right away, instead of waiting for more pieces
+    """
+    md_list = [metadata_store.TorrentMetadata(title="test" + str(i), infohash=random_infohash()) for i in range(10)]
+    serialized = [md.serialized() for md in md_list]
+    assert get_payload_size(serialized[0]) == len(serialized[0])
+    assert get_payload_size(serialized[0][:10]) is None
+
+    # The title of the second payload is not valid UTF-8
+    title_offset = len(serialized[0]) + serialized[1].index(b"test1")
+    blob = bytearray(b"".join(serialized))
+    blob[title_offset] = 0xFF
+    pieces_read = []
+
+    def pieces():
+        for i in range(0, len(blob), 100):
+            pieces_read.append(i)
+            yield bytes(blob[i : i + 100])
+
+    payloads = iter_signed_payloads_from_stream(pieces())
+    with pytest.raises(UnicodeDecodeError):
+        list(payloads)
+    assert len(pieces_read) < len(blob) // 100
+
+
 @db_session
 def test_ffa_serialization(metadata_store):
     """
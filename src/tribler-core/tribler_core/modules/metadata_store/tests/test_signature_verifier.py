@@ -0,0 +1,56 @@
+from ipv8.keyvault.crypto import default_eccrypto
+
+import pytest
+
+from tribler_core.modules.metadata_store.serialization import NULL_KEY, NULL_SIG
+from tribler_core.modules.metadata_store.signature_verifier import MIN_CHUNK_SIZE, SignatureVerifier
+
+
+def make_entries(num_entries):
+    key = default_eccrypto.generate_key("curve25519")
+    public_key = key.pub().key_to_bin()[10:]
+    entries = []
+    for i in range(num_entries):
+        data = b"data%i" % i
+        entries.append((public_key, data, default_eccrypto.create_signature(key, data)))
+    return entries
+
+
+@pytest.fixture(params=[0, 2], ids=["in-process", "pool"])
+def verifier(request):
+    signature_verifier = SignatureVerifier(workers=request.param)
+    yield signature_verifier
+    signature_verifier.shutdown()
+
+
+def test_verify_valid_signatures(verifier):
+    entries = make_entries(MIN_CHUNK_SIZE * 3)
+    assert verifier.verify(entries) == [True] * len(entries)
+
+
+def test_verify_invalid_signatures(verifier):
+    entries = make_entries(MIN_CHUNK_SIZE * 3)
+    public_key, data, signature = entries[MIN_CHUNK_SIZE + 1]
+    entries[MIN_CHUNK_SIZE + 1] = (public_key, data + b"x", signature)
+    entries[-1] = (b"\x00" * len(public_key), data, signature)
+
+    result = verifier.verify(entries)
+    assert len(result) == len(entries)
+    assert not result[MIN_CHUNK_SIZE + 1]
+    assert not result[-1]
+    assert result.count(False) == 2
+
+
+def test_verify_free_for_all_entries(verifier):
+    assert verifier.verify([(NULL_KEY, b"data", NULL_SIG), (NULL_KEY, b"data", b"\x01" * 64)]) == [True, False]
+
+
+def test_verify_empty(verifier):
+    assert verifier.verify([]) == []
+
+
+def test_verify_malformed_public_key(verifier):
+    entries = make_entries(2)
+    public_key, data, signature = entries[0]
+    entries[0] = (b"\x01" * 10, data, signature)
+    assert verifier.verify(entries) == [False, True]
@@ -29,6 +29,7 @@ from tribler_core.modules.metadata_store.store import (
     UNKNOWN_CHANNEL,
     UNKNOWN_COLLECTION,
     UNKNOWN_TORRENT,
+    UPDATED_OUR_VERSION,
 )
 from tribler_core.modules.metadata_store.tests.test_channel_download import CHANNEL_METADATA_UPDATED
 from tribler_core.tests.tools.common import TESTS_DATA_DIR
@@ -169,6 +170,81 @@ def test_multiple_squashed_commit_and_read(metadata_store):
     assert num_entries == len(channel.contents)
 
 
+def test_multiple_squashed_commit_and_read_bulk(metadata_store):
+    """
+    Test reading back a committed channel with the bulk insertion mode
+    """
+    metadata_store.ChannelMetadata._CHUNK_SIZE_LIMIT = 500
+
+    num_entries = 10
+    with db_session:
+        channel = metadata_store.ChannelMetadata.create_channel('testchan')
+        coll = metadata_store.CollectionNode(origin_id=channel.id_, title='test collection', status=NEW)
+        md_list = [
+            metadata_store.TorrentMetadata(
+                origin_id=coll.id_,
+                title='bulk' + str(x),
+                status=NEW,
+                infohash=database_blob(random_infohash()),
+                tracker_info="http://tracker.example.com/announce",
+            )
+            for x in range(0, num_entries)
+        ]
+        md_dicts = [md.to_dict() for md in md_list]
+        coll_id = coll.id_
+        channel.commit_channel_torrent()
+
+        channel.local_version = 0
+        for md in md_list + [coll]:
+            md.delete()
+        channel_dir = Path(metadata_store.ChannelMetadata._channels_dir) / channel.dirname
+
+    # The bulk mode bypasses Pony cache, so it must run in its own db_session
+    metadata_store.process_channel_dir(
+        channel_dir, channel.public_key, channel.id_, skip_personal_metadata_payload=False, bulk_insert=True
+    )
+    with db_session:
+        coll = metadata_store.CollectionNode.get(public_key=channel.public_key, id_=coll_id)
+        assert len(coll.contents) == num_entries
+        for md_dict in md_dicts:
+            md = metadata_store.TorrentMetadata.get(signature=md_dict["signature"])
+            assert md.has_valid_signature()
+            assert md.title == md_dict["title"]
+            assert md.size == md_dict["size"]
+            assert md.health.infohash == md_dict["infohash"]
+            assert [t.url for t in md.health.trackers] == ["http://tracker.example.com/announce"]
+
+        # The FTS index must be updated by the bulk insert as well
+        assert len(metadata_store.TorrentMetadata.search_keyword("bulk*")[:]) == num_entries
+
+
+@db_session
+def test_process_payloads_bulk(metadata_store):
+    """
+    Test that the bulk mode falls back to regular processing for known, duplicate or forbidden entries
+    """
+    key = default_eccrypto.generate_key("curve25519")
+    public_key = key.pub().key_to_bin()[10:]
+
+    known = metadata_store.TorrentMetadata(title='known', infohash=random_infohash(), sign_with=key)
+    known_payload = known._payload_class(**known.to_dict())
+    known.timestamp -= 1
+
+    new = metadata_store.TorrentMetadata(title='new', infohash=random_infohash(), sign_with=key)
+    new_payload = new._payload_class(**new.to_dict())
+    forbidden = metadata_store.TorrentMetadata(title='12yo', infohash=random_infohash(), sign_with=key)
+    forbidden_payload = forbidden._payload_class(**forbidden.to_dict())
+    new.delete()
+    forbidden.delete()
+
+    results = metadata_store.process_payloads_bulk(
+        [new_payload, known_payload, new_payload, forbidden_payload], channel_public_key=public_key
+    )
+    assert [action for _, action in results] == [UNKNOWN_TORRENT, UPDATED_OUR_VERSION, GOT_NEWER_VERSION, NO_ACTION]
+    assert metadata_store.TorrentMetadata.get(title='new')
+    assert not metadata_store.TorrentMetadata.get(title='12yo')
+
+
 @db_session
 def test_skip_processing_of_received_personal_channel_torrents(metadata_store):
     """
@@ -210,6 +286,26 @@ def test_skip_processing_mdblob_with_forbidden_terms(metadata_store):
     assert metadata_store.process_payload(chan_payload) == [(None, NO_ACTION)]
 
 
+@db_session
+def test_process_squashed_mdblob_invalid_signature(metadata_store):
+    """
+    Test that an entry with a broken signature is dropped, while the rest of the squashed blob is still processed
+    """
+    md_list = [metadata_store.TorrentMetadata(title='test' + str(x), infohash=random_infohash()) for x in range(3)]
+    blobs = [md.serialized() for md in md_list]
+    infohashes = [md.infohash for md in md_list]
+    for md in md_list:
+        md.delete()
+    # Flip a bit in the signature of the second entry
+    blobs[1] = blobs[1][:-1] + bytes([blobs[1][-1] ^ 1])
+
+    result = metadata_store.process_squashed_mdblob(b''.join(blobs), skip_personal_metadata_payload=False)
+    assert [r[1] for r in result] == [UNKNOWN_TORRENT, UNKNOWN_TORRENT]
+    assert metadata_store.TorrentMetadata.get(infohash=infohashes[0])
+    assert not metadata_store.TorrentMetadata.get(infohash=infohashes[1])
+    assert metadata_store.TorrentMetadata.get(infohash=infohashes[2])
+
+
 @db_session
 def test_process_invalid_compressed_mdblob(metadata_store):
     """
@@ -217,6 +313,12 @@ def test_process_invalid_compressed_mdblob(metadata_store):
     """
     assert not metadata_store.process_compressed_mdblob(b"abcdefg")
 
+    # Only the decompression errors are swallowed
+    chunk = entries_to_chunk([metadata_store.TorrentMetadata(title="test", infohash=random_infohash())], 1000)[0]
+    with patch.object(metadata_store, "process_signed_payloads", side_effect=RuntimeError("unrelated")):
+        with pytest.raises(RuntimeError, match="unrelated"):
+            metadata_store.process_compressed_mdblob(chunk)
+
 
 @db_session
 def test_process_channel_dir(metadata_store):
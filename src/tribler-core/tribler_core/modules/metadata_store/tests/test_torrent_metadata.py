@@ -1,4 +1,5 @@
 from datetime import datetime
+from pathlib import Path
 
 from ipv8.database import database_blob
 from ipv8.keyvault.crypto import default_eccrypto
@@ -13,6 +14,7 @@ from tribler_core.modules.metadata_store.discrete_clock import clock
 from tribler_core.modules.metadata_store.orm_bindings.channel_node import TODELETE
 from tribler_core.modules.metadata_store.orm_bindings.torrent_metadata import tdef_to_metadata_dict
 from tribler_core.modules.metadata_store.serialization import CHANNEL_TORRENT, REGULAR_TORRENT
+from tribler_core.modules.metadata_store.store import MetadataStore
 from tribler_core.tests.tools.common import TORRENT_UBUNTU_FILE
 from tribler_core.utilities.random_utils import random_infohash
 
@@ -188,6 +190,113 @@ def test_get_autocomplete_terms_max(metadata_store):
     autocomplete_terms = metadata_store.TorrentMetadata.get_auto_complete_terms(".", 2)
 
 
+@db_session
+def test_get_autocomplete_terms_not_stemmed(metadata_store):
+    """
+    Test that the autocompletion terms are the words of the titles, not their stems
+    """
+    for title in ["Movies collection", "Moving pictures", "Series downloading"]:
+        metadata_store.TorrentMetadata.from_dict(dict(rnd_torrent(), title=title))
+    assert metadata_store.TorrentMetadata.get_auto_complete_terms("mov", 10) == ["movies", "moving"]
+    assert metadata_store.TorrentMetadata.get_auto_complete_terms("ser", 10) == ["series"]
+
+
+@db_session
+def test_get_autocomplete_terms_local_changes(metadata_store):
+    """
+    Test that the autocompletion terms follow the entries created, renamed and deleted locally
+    """
+    metadata_store.TorrentMetadata.from_dict(dict(rnd_torrent(), title="Movies"))
+    assert metadata_store.TorrentMetadata.get_auto_complete_terms("mov", 10) == ["movies"]
+
+    torrent = metadata_store.TorrentMetadata(title="Movies Moviestar", infohash=random_infohash())
+    assert metadata_store.TorrentMetadata.get_auto_complete_terms("mov", 10) == ["movies", "moviestar"]
+
+    torrent.update_properties({"title": "Moviemaker"})
+    assert metadata_store.TorrentMetadata.get_auto_complete_terms("mov", 10) == ["moviemaker", "movies"]
+
+    torrent.delete()
+    assert metadata_store.TorrentMetadata.get_auto_complete_terms("mov", 10) == ["movies"]
+
+
+def test_get_autocomplete_terms_rollback(metadata_store):
+    """
+    Test that the titles of the transactions that were rolled back do not reach the autocompletion terms
+    """
+    with db_session:
+        torrent = metadata_store.TorrentMetadata(title="sheep", infohash=random_infohash())
+        assert metadata_store.TorrentMetadata.get_auto_complete_terms("shee", 10) == ["sheep"]
+
+    with pytest.raises(ZeroDivisionError), db_session:
+        metadata_store.TorrentMetadata(title="sheepdog", infohash=random_infohash())
+        metadata_store.TorrentMetadata.get(rowid=torrent.rowid).delete()
+        orm.flush()
+        _ = 1 / 0
+
+    with db_session:
+        assert metadata_store.TorrentMetadata.get_auto_complete_terms("shee", 10) == ["sheep"]
+
+
+def test_get_autocomplete_terms_log(metadata_store):
+    """
+    Test that the changes of the titles are only logged while the autocompletion terms are loaded, and that
+    the terms are reloaded once the changes stop being logged
+    """
+    with db_session:
+        metadata_store.TorrentMetadata(title="sheep", infohash=random_infohash())
+        assert not metadata_store._db.select("SELECT * FROM AutocompleteLog")
+        assert metadata_store.TorrentMetadata.get_auto_complete_terms("shee", 10) == ["sheep"]
+
+    with db_session:
+        metadata_store.TorrentMetadata(title="sheepdog", infohash=random_infohash())
+        orm.flush()
+        assert metadata_store._db.select("SELECT old_title, new_title FROM AutocompleteLog") == [(None, "sheepdog")]
+    with db_session:
+        assert metadata_store.TorrentMetadata.get_auto_complete_terms("shee", 10) == ["sheep", "sheepdog"]
+        assert not metadata_store._db.select("SELECT * FROM AutocompleteLog")
+
+    # This is what happens when the log overflows
+    with db_session:
+        metadata_store._db.execute("DELETE FROM AutocompleteLogEnabled")
+        metadata_store.TorrentMetadata(title="sheepish", infohash=random_infohash())
+    with db_session:
+        assert metadata_store.TorrentMetadata.get_auto_complete_terms("shee", 10) == ["sheep", "sheepdog", "sheepish"]
+
+
+def test_autocomplete_index_per_store(metadata_store, tmpdir):
+    """
+    Test that every MetadataStore has its own autocompletion terms
+    """
+    other_store = MetadataStore(Path(tmpdir) / "other.db", tmpdir, default_eccrypto.generate_key("curve25519"))
+    with db_session:
+        metadata_store.TorrentMetadata.from_dict(dict(rnd_torrent(), title="sheep"))
+        assert metadata_store.TorrentMetadata.get_auto_complete_terms("shee", 10) == ["sheep"]
+    with db_session:
+        other_store.TorrentMetadata.from_dict(dict(rnd_torrent(), title="sheepdog"))
+        assert other_store.TorrentMetadata.get_auto_complete_terms("shee", 10) == ["sheepdog"]
+    other_store.shutdown()
+
+
+@db_session
+def test_get_autocomplete_terms_process_payload(metadata_store):
+    """
+    Test that the terms of the entries received by process_payload are added to the autocompletion terms
+    """
+    metadata_store.TorrentMetadata.from_dict(dict(rnd_torrent(), title="mountains sheep", tags="video"))
+    assert metadata_store.TorrentMetadata.get_auto_complete_terms("lonely sheep", 10) == ["lonely sheep"]
+
+    key = default_eccrypto.generate_key("curve25519")
+    for title in ["sheepdog", "black sheepdog", "sheep"]:
+        torrent = metadata_store.TorrentMetadata(title=title, infohash=random_infohash(), sign_with=key)
+        payload = torrent._payload_class.from_signed_blob(torrent.serialized())
+        torrent.delete()
+        metadata_store.process_payload(payload)
+    assert metadata_store.TorrentMetadata.get_auto_complete_terms("lonely sheep", 10) == [
+        "lonely sheep",
+        "lonely sheepdog",
+    ]
+
+
 @db_session
 def test_get_entries(metadata_store):
     """
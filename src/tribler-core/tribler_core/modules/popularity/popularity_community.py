@@ -5,10 +5,11 @@ from binascii import unhexlify
 
 from ipv8.lazy_community import lazy_wrapper
 
-from pony.orm import db_session
+from pony.orm import db_session, select
 
 from tribler_core.modules.metadata_store.community.remote_query_community import RemoteQueryCommunity
 from tribler_core.modules.popularity.payload import TorrentsHealthPayload
+from tribler_core.modules.torrent_checker.health_write_buffer import HealthWriteBuffer
 from tribler_core.utilities.unicode import hexlify
 
 
@@ -32,6 +33,7 @@ class PopularityCommunity(RemoteQueryCommunity):
 
         super().__init__(*args, **kwargs)
 
+        self.health_write_buffer = HealthWriteBuffer(self.mds)
         self.add_message_handler(TorrentsHealthPayload, self.on_torrents_health)
 
         self.logger.info('Popularity Community initialized (peer mid %s)',
@@ -104,22 +106,22 @@ class PopularityCommunity(RemoteQueryCommunity):
         asyncio.create_task(self.process_torrents_health(peer, torrents))
 
     async def process_torrents_health(self, peer, torrent_healths):
-        infohashes_to_resolve = []
+        infohashes = [infohash for infohash, *_ in torrent_healths]
         with db_session:
-            for infohash, seeders, leechers, last_check in torrent_healths:
-                torrent_state = self.mds.TorrentState.get(infohash=infohash)
-                if torrent_state and last_check > torrent_state.last_check:
-                    # Replace current information
-                    torrent_state.seeders = seeders
-                    torrent_state.leechers = leechers
-                    torrent_state.last_check = last_check
-                    self.logger.info(f"{hexlify(infohash)} updated ({seeders},{leechers})")
-                elif not torrent_state:
-                    self.mds.TorrentState(infohash=infohash, seeders=seeders,
-                                          leechers=leechers, last_check=last_check)
-                    self.logger.info(f"{hexlify(infohash)} added ({seeders},{leechers})")
-                    infohashes_to_resolve.append(infohash)
+            known_infohashes = set(select(ts.infohash for ts in self.mds.TorrentState if ts.infohash in infohashes))
+
+        # The health is written in a batch together with the other updates, only if it is more recent
+        infohashes_to_resolve = []
+        for infohash, seeders, leechers, last_check in torrent_healths:
+            if infohash not in known_infohashes and infohash not in self.health_write_buffer.pending:
+                self.logger.info(f"{hexlify(infohash)} added ({seeders},{leechers})")
+                infohashes_to_resolve.append(infohash)
+            self.health_write_buffer.add(infohash, seeders, leechers, last_check, create=True)
 
         for infohash in infohashes_to_resolve:
             # Get a single result per infohash to avoid duplicates
             self.send_remote_select(peer=peer, infohash=hexlify(infohash), last=1)
+
+    async def unload(self):
+        await self.health_write_buffer.shutdown()
+        await super().unload()
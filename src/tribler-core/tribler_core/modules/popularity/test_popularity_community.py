@@ -52,6 +52,9 @@ class TestPopularityCommunity(TestBase):
         self.nodes[0].overlay.gossip_torrents_health()
 
         await self.deliver_messages(timeout=deliver_timeout)
+        # The received health is written in batches, write it right away
+        for node in self.nodes:
+            node.overlay.health_write_buffer.flush()
 
     async def test_torrents_health_gossip(self):
         """
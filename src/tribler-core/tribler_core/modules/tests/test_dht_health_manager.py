@@ -86,3 +86,75 @@ async def test_receive_bloomfilters(dht_health_manager):
                                              bf_peers=bytearray(b'\xff' * 256))
     assert dht_health_manager.bf_seeders[infohash] == bytearray(b'\xee' * 256)
     assert dht_health_manager.bf_peers[infohash] == bytearray(b'\xff' * 256)
+
+
+@pytest.mark.asyncio
+async def test_receive_bloomfilters_concurrent_lookups(dht_health_manager):
+    """
+    Test whether the bloom filters are matched to the right lookup by the transaction ID of the get_peers request
+    """
+    for infohash in (b'a' * 20, b'b' * 20):
+        dht_health_manager.lookup_futures[infohash] = Future()
+        dht_health_manager.bf_seeders[infohash] = bytearray(256)
+        dht_health_manager.bf_peers[infohash] = bytearray(256)
+    dht_health_manager.sent_get_peers(b'ta', b'a' * 20)
+    dht_health_manager.sent_get_peers(b'tb', b'b' * 20)
+    dht_health_manager.sent_get_peers(b'tc', b'c' * 20)
+    assert b'tc' not in dht_health_manager.lookup_transactions
+
+    # The node is closer to the other infohash, but the transaction ID decides
+    dht_health_manager.received_bloomfilters(b'b' * 20,
+                                             bf_seeds=bytearray(b'\xee' * 256),
+                                             bf_peers=bytearray(b'\xff' * 256),
+                                             transaction_id=b'ta')
+    assert dht_health_manager.bf_seeders[b'a' * 20] == bytearray(b'\xee' * 256)
+    assert dht_health_manager.bf_seeders[b'b' * 20] == bytearray(256)
+
+    # Unknown transactions can not be matched when multiple lookups are in progress
+    dht_health_manager.received_bloomfilters(b'b' * 20,
+                                             bf_seeds=bytearray(b'\x11' * 256),
+                                             bf_peers=bytearray(b'\x11' * 256),
+                                             transaction_id=b'ta')
+    assert dht_health_manager.bf_seeders[b'a' * 20] == bytearray(b'\xee' * 256)
+    assert dht_health_manager.bf_seeders[b'b' * 20] == bytearray(256)
+
+    dht_health_manager.finalize_lookup(b'b' * 20)
+    assert dht_health_manager.lookup_transactions == {}
+
+
+@pytest.mark.asyncio
+async def test_receive_bloomfilters_overlapping_transactions(dht_health_manager):
+    """
+    Test that the bloom filters are dropped if their transaction ID is used by several lookups, and that the requests
+    of other nodes for other infohashes do not affect the transactions of our lookups
+    """
+    for infohash in (b'a' * 20, b'b' * 20):
+        dht_health_manager.lookup_futures[infohash] = Future()
+        dht_health_manager.bf_seeders[infohash] = bytearray(256)
+        dht_health_manager.bf_peers[infohash] = bytearray(256)
+    dht_health_manager.sent_get_peers(b'ta', b'a' * 20)
+    dht_health_manager.sent_get_peers(b'ta', b'b' * 20)
+    dht_health_manager.sent_get_peers(b'tb', b'b' * 20)
+    # Incoming requests of other nodes, with transaction IDs of their own choosing
+    dht_health_manager.sent_get_peers(b'tb', b'c' * 20)
+    dht_health_manager.sent_get_peers(b'tc', b'c' * 20)
+    assert dht_health_manager.lookup_transactions == {b'ta': {b'a' * 20, b'b' * 20}, b'tb': {b'b' * 20}}
+
+    dht_health_manager.received_bloomfilters(b'b' * 20,
+                                             bf_seeds=bytearray(b'\xee' * 256),
+                                             bf_peers=bytearray(b'\xff' * 256),
+                                             transaction_id=b'ta')
+    assert dht_health_manager.bf_seeders[b'a' * 20] == bytearray(256)
+    assert dht_health_manager.bf_seeders[b'b' * 20] == bytearray(256)
+
+    dht_health_manager.received_bloomfilters(b'b' * 20,
+                                             bf_seeds=bytearray(b'\xee' * 256),
+                                             bf_peers=bytearray(b'\xff' * 256),
+                                             transaction_id=b'tb')
+    assert dht_health_manager.bf_seeders[b'a' * 20] == bytearray(256)
+    assert dht_health_manager.bf_seeders[b'b' * 20] == bytearray(b'\xee' * 256)
+
+    dht_health_manager.sent_get_peers(b'td', b'a' * 20)
+    dht_health_manager.sent_get_peers(b'td', b'b' * 20)
+    dht_health_manager.finalize_lookup(b'b' * 20)
+    assert dht_health_manager.lookup_transactions == {b'td': {b'a' * 20}}
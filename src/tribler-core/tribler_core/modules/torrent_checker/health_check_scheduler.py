@@ -0,0 +1,195 @@
+import heapq
+import itertools
+import time
+from asyncio import CancelledError, Future, Semaphore
+from collections import deque
+
+from ipv8.taskmanager import TaskManager
+
+from tribler_core.utilities.unicode import hexlify
+
+# The priorities of the health checks, a lower value is checked first
+PRIORITY_USER = 0     # The user is looking at the torrent (e.g., a REST request)
+PRIORITY_POPULAR = 1  # A popular torrent from the local database
+PRIORITY_STALE = 2    # A torrent that has not been checked for a long time
+
+PRIORITY_NAMES = {PRIORITY_USER: 'user', PRIORITY_POPULAR: 'popular', PRIORITY_STALE: 'stale'}
+
+MAX_HEALTH_CHECKS_IN_FLIGHT = 20   # Maximum number of torrent health checks running at the same time
+MAX_REQUESTS_PER_TRACKER = 2       # Maximum number of requests to a single tracker running at the same time
+THROUGHPUT_WINDOW = 60             # The number of seconds over which the throughput is measured
+
+
+class HealthCheckJob:
+    """
+    A torrent health check waiting in the queue of the scheduler, or running.
+    """
+
+    def __init__(self, infohash, check, priority):
+        self.infohash = infohash
+        self.check = check
+        self.priority = priority
+        self.future = Future()
+        self.queued_time = time.time()
+        self.started = False
+
+
+class HealthCheckScheduler(TaskManager):
+    """
+    The HealthCheckScheduler runs the torrent health checks in order of priority, with a limited number of checks
+    in flight. A check for a torrent that is already queued or running is not scheduled again. It also limits the
+    number of requests that run at the same time per tracker.
+    """
+
+    def __init__(self, max_in_flight=MAX_HEALTH_CHECKS_IN_FLIGHT, max_in_flight_per_tracker=MAX_REQUESTS_PER_TRACKER):
+        super().__init__()
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_tracker = max_in_flight_per_tracker
+
+        self.jobs = {}  # infohash -> job, for the queued and running health checks
+        self.queue = []  # heap of (priority, sequence number, job)
+        self.sequence = itertools.count()
+        self.in_flight = 0
+
+        self.tracker_semaphores = {}  # tracker URL -> semaphore
+        self.tracker_users = {}  # tracker URL -> number of requests waiting for the semaphore or in flight
+        self.tracker_requests = {}  # tracker URL -> number of requests in flight
+
+        # Metrics
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_time = 0
+        self.completion_times = deque()
+
+    def schedule(self, infohash, check, priority=PRIORITY_STALE):
+        """
+        Schedule a health check of a torrent.
+        :param infohash: The infohash of the torrent.
+        :param check: A coroutine function without arguments that performs the health check.
+        :param priority: The priority of the health check.
+        :return: A future that fires with the result of the health check. The future is shared by all the callers
+        that schedule a check for the same torrent while it is queued or running.
+        """
+        job = self.jobs.get(infohash)
+        if job:
+            if not job.started and priority < job.priority:
+                # Move the queued check forward, the old entry in the queue is skipped
+                job.priority = priority
+                heapq.heappush(self.queue, (priority, next(self.sequence), job))
+            return job.future
+
+        job = self.jobs[infohash] = HealthCheckJob(infohash, check, priority)
+        heapq.heappush(self.queue, (priority, next(self.sequence), job))
+        self._start_jobs()
+        return job.future
+
+    def _start_jobs(self):
+        while self.queue and self.in_flight < self.max_in_flight:
+            priority, _, job = heapq.heappop(self.queue)
+            if job.started or priority != job.priority or self.jobs.get(job.infohash) is not job:
+                continue
+            job.started = True
+            self.in_flight += 1
+            self.total_wait_time += time.time() - job.queued_time
+            self.register_anonymous_task(f"health check {hexlify(job.infohash)}", self._run_job, job)
+
+    async def _run_job(self, job):
+        try:
+            result = await job.check()
+        except CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:  # pylint: disable=broad-except
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.completed += 1
+            now = time.time()
+            self.completion_times.append(now)
+            self._prune_completion_times(now)
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            self.jobs.pop(job.infohash, None)
+            self._start_jobs()
+
+    async def acquire_tracker(self, tracker_url):
+        """
+        Wait until a request to the given tracker is allowed. Every call must be followed by release_tracker.
+        :param tracker_url: The URL of the tracker.
+        """
+        semaphore = self.tracker_semaphores.get(tracker_url)
+        if semaphore is None:
+            semaphore = self.tracker_semaphores[tracker_url] = Semaphore(self.max_in_flight_per_tracker)
+        self.tracker_users[tracker_url] = self.tracker_users.get(tracker_url, 0) + 1
+        try:
+            await semaphore.acquire()
+        except CancelledError:
+            self._remove_tracker_user(tracker_url)
+            raise
+        self.tracker_requests[tracker_url] = self.tracker_requests.get(tracker_url, 0) + 1
+
+    def release_tracker(self, tracker_url):
+        """
+        Release the request to the given tracker that was acquired with acquire_tracker.
+        :param tracker_url: The URL of the tracker.
+        """
+        self.tracker_requests[tracker_url] -= 1
+        if not self.tracker_requests[tracker_url]:
+            self.tracker_requests.pop(tracker_url)
+        self.tracker_semaphores[tracker_url].release()
+        self._remove_tracker_user(tracker_url)
+
+    def _remove_tracker_user(self, tracker_url):
+        # The semaphore is only dropped when no request is waiting for it, otherwise the next request to the tracker
+        # would create another semaphore and exceed the limit
+        self.tracker_users[tracker_url] -= 1
+        if not self.tracker_users[tracker_url]:
+            self.tracker_users.pop(tracker_url)
+            self.tracker_semaphores.pop(tracker_url)
+
+    def _prune_completion_times(self, now):
+        window_start = now - THROUGHPUT_WINDOW
+        while self.completion_times and self.completion_times[0] < window_start:
+            self.completion_times.popleft()
+
+    def get_throughput(self):
+        """
+        Return the number of completed health checks per second over the last THROUGHPUT_WINDOW seconds.
+        """
+        self._prune_completion_times(time.time())
+        return len(self.completion_times) / THROUGHPUT_WINDOW
+
+    def get_stats(self):
+        """
+        Return the metrics of the scheduler.
+        """
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for job in self.jobs.values():
+            if not job.started:
+                queued[PRIORITY_NAMES[job.priority]] += 1
+        started = self.completed + self.failed + self.in_flight
+        return {
+            'queue_depth': sum(queued.values()),
+            'queued': queued,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'tracker_requests': sum(self.tracker_requests.values()),
+            'max_in_flight_per_tracker': self.max_in_flight_per_tracker,
+            'completed': self.completed,
+            'failed': self.failed,
+            'throughput': self.get_throughput(),
+            'mean_wait_time': self.total_wait_time / started if started else 0,
+        }
+
+    async def shutdown(self):
+        """
+        Cancel the queued and running health checks.
+        """
+        for job in self.jobs.values():
+            job.future.cancel()
+        self.jobs.clear()
+        self.queue.clear()
+        await self.shutdown_task_manager()
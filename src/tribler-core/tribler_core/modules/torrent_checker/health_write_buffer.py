@@ -0,0 +1,89 @@
+import logging
+
+from ipv8.taskmanager import TaskManager
+
+from pony.orm import db_session
+
+from tribler_core.utilities.unicode import hexlify
+
+HEALTH_FLUSH_INTERVAL = 1.0  # Seconds that a health update can wait in the buffer before it is written
+HEALTH_FLUSH_SIZE = 500      # Number of buffered torrents that triggers a write right away
+
+
+class HealthWriteBuffer(TaskManager):
+    """
+    The HealthWriteBuffer collects the torrent health updates and writes them to the TorrentState table in a single
+    transaction every HEALTH_FLUSH_INTERVAL seconds, or as soon as HEALTH_FLUSH_SIZE torrents are buffered.
+    Only the freshest update of a torrent is written.
+    """
+
+    def __init__(self, mds, flush_interval=HEALTH_FLUSH_INTERVAL, flush_size=HEALTH_FLUSH_SIZE):
+        super().__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.mds = mds
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.pending = {}  # infohash -> health update
+
+    def add(self, infohash, seeders, leechers, last_check, self_checked=False, create=False):
+        """
+        Buffer a health update of a torrent.
+        :param infohash: The binary infohash of the torrent.
+        :param self_checked: Whether we checked the health ourselves. Our own checks overwrite the stored health,
+        other updates are only written if they are more recent than the stored health.
+        :param create: Whether to add the torrent to the database if it is unknown.
+        """
+        update = self.pending.get(infohash)
+        create = create or bool(update and update['create'])
+        if update is None or last_check >= update['last_check']:
+            self.pending[infohash] = {'seeders': seeders, 'leechers': leechers, 'last_check': last_check,
+                                      'self_checked': self_checked, 'create': create}
+        else:
+            update['create'] = create
+
+        if len(self.pending) >= self.flush_size:
+            self.cancel_pending_task("flush")
+            self.flush()
+        elif not self.is_pending_task_active("flush"):
+            self.register_task("flush", self.flush, delay=self.flush_interval)
+
+    def flush(self):
+        """
+        Write the buffered health updates to the database in a single transaction.
+        :return: The number of written torrents.
+        """
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+
+        written = 0
+        with db_session:
+            infohashes = list(pending)
+            torrent_states = {bytes(ts.infohash): ts for ts in
+                              self.mds.TorrentState.select(lambda g: g.infohash in infohashes)}
+            for infohash, update in pending.items():
+                torrent_state = torrent_states.get(infohash)
+                if torrent_state is None:
+                    if not update['create']:
+                        self._logger.warning("Tried to update torrent health data in DB for an unknown torrent: %s",
+                                             hexlify(infohash))
+                        continue
+                    self.mds.TorrentState(infohash=infohash, seeders=update['seeders'], leechers=update['leechers'],
+                                          last_check=update['last_check'], self_checked=update['self_checked'])
+                elif update['self_checked'] or update['last_check'] > torrent_state.last_check:
+                    torrent_state.seeders = update['seeders']
+                    torrent_state.leechers = update['leechers']
+                    torrent_state.last_check = update['last_check']
+                    torrent_state.self_checked = torrent_state.self_checked or update['self_checked']
+                else:
+                    continue
+                written += 1
+        self._logger.debug("Wrote the health of %d torrents", written)
+        return written
+
+    async def shutdown(self):
+        """
+        Write the remaining health updates and stop the buffer.
+        """
+        await self.shutdown_task_manager()
+        self.flush()
@@ -0,0 +1,188 @@
+from asyncio import CancelledError, Future, ensure_future, sleep
+from unittest.mock import patch
+
+import pytest
+
+from tribler_core.modules.torrent_checker.health_check_scheduler import (
+    HealthCheckScheduler,
+    PRIORITY_POPULAR,
+    PRIORITY_STALE,
+    PRIORITY_USER,
+    THROUGHPUT_WINDOW,
+)
+
+
+@pytest.fixture(name="scheduler")
+async def fixture_scheduler():
+    scheduler = HealthCheckScheduler(max_in_flight=1, max_in_flight_per_tracker=1)
+    yield scheduler
+    await scheduler.shutdown()
+
+
+class ControlledCheck:
+    """
+    A health check that finishes when the test says so.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.future = Future()
+
+    async def __call__(self):
+        self.started.append(self)
+        return await self.future
+
+
+@pytest.mark.asyncio
+async def test_priority_order(scheduler):
+    """
+    Test whether the queued health checks are started in order of priority
+    """
+    started = []
+    checks = {name: ControlledCheck(started) for name in ('first', 'stale', 'popular', 'user')}
+    scheduler.schedule(b'1' * 20, checks['first'], priority=PRIORITY_STALE)
+    scheduler.schedule(b'2' * 20, checks['stale'], priority=PRIORITY_STALE)
+    scheduler.schedule(b'3' * 20, checks['popular'], priority=PRIORITY_POPULAR)
+    user_future = scheduler.schedule(b'4' * 20, checks['user'], priority=PRIORITY_USER)
+    await sleep(0)
+    assert started == [checks['first']]
+    assert scheduler.get_stats()['queued'] == {'user': 1, 'popular': 1, 'stale': 1}
+
+    for expected in ('user', 'popular', 'stale'):
+        started[-1].future.set_result(None)
+        await sleep(0)
+        await sleep(0)
+        assert started[-1] is checks[expected]
+
+    checks['stale'].future.set_result(None)
+    assert await user_future is None
+    await sleep(0)
+    stats = scheduler.get_stats()
+    assert stats['completed'] == 4
+    assert stats['queue_depth'] == 0
+    assert stats['in_flight'] == 0
+    assert stats['throughput'] > 0
+
+
+@pytest.mark.asyncio
+async def test_deduplication(scheduler):
+    """
+    Test whether a torrent that is already queued or checked is not checked again, and can be moved forward
+    """
+    started = []
+    running_check = ControlledCheck(started)
+    scheduler.schedule(b'1' * 20, running_check)
+    future1 = scheduler.schedule(b'2' * 20, ControlledCheck(started), priority=PRIORITY_STALE)
+    scheduler.schedule(b'3' * 20, ControlledCheck(started), priority=PRIORITY_POPULAR)
+    future2 = scheduler.schedule(b'2' * 20, ControlledCheck(started), priority=PRIORITY_USER)
+    assert future1 is future2
+    assert scheduler.schedule(b'1' * 20, ControlledCheck(started)) is scheduler.jobs[b'1' * 20].future
+
+    await sleep(0)
+    running_check.future.set_result(None)
+    await sleep(0)
+    await sleep(0)
+    assert len(started) == 2
+    assert scheduler.jobs[b'2' * 20].started
+    started[-1].future.set_result('result')
+    assert await future1 == 'result'
+
+
+@pytest.mark.asyncio
+async def test_failed_check(scheduler):
+    """
+    Test whether a failing health check is reported to the caller and does not block the queue
+    """
+    async def failing_check():
+        raise RuntimeError("check failed")
+
+    async def check():
+        return 'result'
+
+    future1 = scheduler.schedule(b'1' * 20, failing_check)
+    future2 = scheduler.schedule(b'2' * 20, check)
+    with pytest.raises(RuntimeError):
+        await future1
+    assert await future2 == 'result'
+    assert scheduler.failed == 1
+    assert scheduler.completed == 1
+
+
+@pytest.mark.asyncio
+async def test_tracker_limit(scheduler):
+    """
+    Test whether the number of requests per tracker in flight is limited
+    """
+    await scheduler.acquire_tracker("http://tracker/announce")
+    waiting = ensure_future(scheduler.acquire_tracker("http://tracker/announce"))
+    await scheduler.acquire_tracker("http://other_tracker/announce")
+    await sleep(0)
+    assert not waiting.done()
+    assert scheduler.get_stats()['tracker_requests'] == 2
+
+    scheduler.release_tracker("http://tracker/announce")
+    await waiting
+    assert scheduler.tracker_requests == {"http://tracker/announce": 1, "http://other_tracker/announce": 1}
+
+    # The semaphore of a tracker is dropped once no request is waiting for it or in flight
+    scheduler.release_tracker("http://other_tracker/announce")
+    assert list(scheduler.tracker_semaphores) == ["http://tracker/announce"]
+    cancelled = ensure_future(scheduler.acquire_tracker("http://tracker/announce"))
+    await sleep(0)
+    cancelled.cancel()
+    with pytest.raises(CancelledError):
+        await cancelled
+    scheduler.release_tracker("http://tracker/announce")
+    assert not scheduler.tracker_semaphores
+    assert not scheduler.tracker_users
+    assert not scheduler.tracker_requests
+
+
+@pytest.mark.asyncio
+async def test_tracker_limit_with_woken_request(scheduler):
+    """
+    Test whether the limit holds when a request arrives while another one is woken up, but is not running yet
+    """
+    await scheduler.acquire_tracker("http://tracker/announce")
+    waiting = ensure_future(scheduler.acquire_tracker("http://tracker/announce"))
+    await sleep(0)
+    scheduler.release_tracker("http://tracker/announce")
+    late = ensure_future(scheduler.acquire_tracker("http://tracker/announce"))
+    await waiting
+    await sleep(0)
+    assert not late.done()
+    scheduler.release_tracker("http://tracker/announce")
+    await late
+    scheduler.release_tracker("http://tracker/announce")
+    assert not scheduler.tracker_semaphores
+
+
+@pytest.mark.asyncio
+async def test_completion_times_pruned(scheduler):
+    """
+    Test whether the completion times outside of the throughput window are dropped when checks complete
+    """
+    async def check():
+        return 'result'
+
+    with patch("tribler_core.modules.torrent_checker.health_check_scheduler.time.time", lambda: 1000):
+        await scheduler.schedule(b'1' * 20, check)
+        await scheduler.schedule(b'2' * 20, check)
+    with patch("tribler_core.modules.torrent_checker.health_check_scheduler.time.time",
+               lambda: 1001 + THROUGHPUT_WINDOW):
+        await scheduler.schedule(b'3' * 20, check)
+        await sleep(0)
+        assert list(scheduler.completion_times) == [1001 + THROUGHPUT_WINDOW]
+        assert scheduler.get_throughput() == 1 / THROUGHPUT_WINDOW
+
+
+@pytest.mark.asyncio
+async def test_shutdown_cancels_queued_checks(scheduler):
+    """
+    Test whether the queued health checks are cancelled on shutdown
+    """
+    started = []
+    scheduler.schedule(b'1' * 20, ControlledCheck(started))
+    future = scheduler.schedule(b'2' * 20, ControlledCheck(started))
+    await scheduler.shutdown()
+    assert future.cancelled()
@@ -0,0 +1,74 @@
+from asyncio import sleep
+
+from pony.orm import db_session
+
+import pytest
+
+from tribler_core.modules.torrent_checker.health_write_buffer import HealthWriteBuffer
+
+
+@pytest.fixture(name="health_write_buffer")
+async def fixture_health_write_buffer(metadata_store):
+    health_write_buffer = HealthWriteBuffer(metadata_store, flush_interval=0.1, flush_size=3)
+    yield health_write_buffer
+    await health_write_buffer.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_merge_updates(health_write_buffer, metadata_store):
+    """
+    Test whether only the freshest update of a torrent is written, and unknown torrents are only added if requested
+    """
+    with db_session:
+        metadata_store.TorrentState(infohash=b'a' * 20, seeders=1, leechers=1, last_check=10)
+
+    health_write_buffer.flush_size = 10
+    health_write_buffer.add(b'a' * 20, 5, 5, 20)
+    health_write_buffer.add(b'a' * 20, 3, 3, 15)
+    health_write_buffer.add(b'b' * 20, 7, 7, 20, create=True)
+    health_write_buffer.add(b'c' * 20, 9, 9, 20)
+    assert len(health_write_buffer.pending) == 3
+    assert health_write_buffer.flush() == 2
+
+    with db_session:
+        assert metadata_store.TorrentState.get(infohash=b'a' * 20).seeders == 5
+        assert metadata_store.TorrentState.get(infohash=b'b' * 20).seeders == 7
+        assert not metadata_store.TorrentState.get(infohash=b'c' * 20)
+
+
+@pytest.mark.asyncio
+async def test_stale_updates(health_write_buffer, metadata_store):
+    """
+    Test whether an older health is only written if we checked it ourselves
+    """
+    with db_session:
+        metadata_store.TorrentState(infohash=b'a' * 20, seeders=1, leechers=1, last_check=10)
+
+    health_write_buffer.add(b'a' * 20, 5, 5, 5)
+    assert health_write_buffer.flush() == 0
+    health_write_buffer.add(b'a' * 20, 5, 5, 5, self_checked=True)
+    assert health_write_buffer.flush() == 1
+
+    with db_session:
+        torrent_state = metadata_store.TorrentState.get(infohash=b'a' * 20)
+        assert torrent_state.seeders == 5
+        assert torrent_state.self_checked
+
+
+@pytest.mark.asyncio
+async def test_flush_triggers(health_write_buffer, metadata_store):
+    """
+    Test whether the buffer is written after the flush interval, when it is full, and on shutdown
+    """
+    health_write_buffer.add(b'a' * 20, 1, 1, 1, create=True)
+    await sleep(0.2)
+    assert not health_write_buffer.pending
+
+    for infohash in (b'b' * 20, b'c' * 20, b'd' * 20):
+        health_write_buffer.add(infohash, 1, 1, 1, create=True)
+    assert not health_write_buffer.pending
+
+    health_write_buffer.add(b'e' * 20, 1, 1, 1, create=True)
+    await health_write_buffer.shutdown()
+    with db_session:
+        assert metadata_store.TorrentState.select().count() == 5
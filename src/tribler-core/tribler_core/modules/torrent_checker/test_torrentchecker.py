@@ -2,8 +2,9 @@ import os
 import random
 import secrets
 import time
+from asyncio import gather, sleep
 
-from ipv8.util import succeed
+from ipv8.util import fail, succeed
 
 from pony.orm import db_session
 
@@ -198,6 +199,68 @@ async def test_tracker_test_error_resolve(enable_chant, torrent_checker, session
     assert len(torrent_checker._session_list) == 1
 
 
+
+@pytest.mark.asyncio
+async def test_scrape_tracker_coalesced(enable_chant, torrent_checker):  # pylint: disable=unused-argument
+    """
+    Test whether the health requests for the same tracker are merged into a single scrape
+    """
+    scraped_sessions = []
+
+    def connect_to_tracker(session):
+        scraped_sessions.append(session)
+        return succeed({"http://localhost/tracker": [
+            {'infohash': hexlify(b'a' * 20), 'seeders': 1, 'leechers': 2},
+            {'infohash': hexlify(b'b' * 20), 'seeders': 3, 'leechers': 4}
+        ]})
+    torrent_checker.connect_to_tracker = connect_to_tracker
+
+    results = await gather(torrent_checker.scrape_tracker("http://localhost/tracker", b'a' * 20),
+                           torrent_checker.scrape_tracker("http://localhost/tracker", b'b' * 20),
+                           torrent_checker.scrape_tracker("http://localhost/tracker", b'b' * 20),
+                           torrent_checker.scrape_tracker("http://localhost/tracker", b'c' * 20))
+
+    assert len(scraped_sessions) == 1
+    assert scraped_sessions[0].infohash_list == [b'a' * 20, b'b' * 20, b'c' * 20]
+    assert results[0]["http://localhost/tracker"][0]['seeders'] == 1
+    assert results[1] == results[2]
+    assert results[1]["http://localhost/tracker"][0]['leechers'] == 4
+    assert results[3]["http://localhost/tracker"][0]['seeders'] == 0
+
+
+@pytest.mark.asyncio
+async def test_scrape_tracker_coalesced_error(enable_chant, torrent_checker):  # pylint: disable=unused-argument
+    """
+    Test whether the failure of a merged scrape is reported to every health request
+    """
+    torrent_checker.connect_to_tracker = lambda _: fail(ValueError("tracker failed"))
+
+    results = await gather(torrent_checker.scrape_tracker("http://localhost/tracker", b'a' * 20),
+                           torrent_checker.scrape_tracker("http://localhost/tracker", b'b' * 20),
+                           return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert all(result.tracker_url == "http://localhost/tracker" for result in results)
+
+
+@pytest.mark.asyncio
+async def test_scrape_tracker_full_batch(enable_chant, torrent_checker):  # pylint: disable=unused-argument
+    """
+    Test whether a batch of health requests is scraped right away once it reaches the maximum scrape size
+    """
+    scraped_sessions = []
+    torrent_checker.connect_to_tracker = lambda session: scraped_sessions.append(session) or succeed(None)
+
+    max_infohashes = torrent_checker_module.MAX_INFOHASHES_IN_SCRAPE
+    futures = [torrent_checker.scrape_tracker("http://localhost/tracker", bytes([i]) * 20)
+               for i in range(max_infohashes + 1)]
+    await sleep(0)
+
+    assert len(scraped_sessions) == 1
+    assert len(scraped_sessions[0].infohash_list) == max_infohashes
+    assert all(future.done() for future in futures[:max_infohashes])
+    assert not futures[-1].done()
+
 @pytest.mark.asyncio
 async def test_tracker_no_infohashes(enable_chant, torrent_checker, session):
     """
@@ -269,6 +332,7 @@ def test_on_health_check_completed(enable_chant, torrent_checker, session):
         ts = session.mds.TorrentState(infohash=infohash_bin)
         previous_check = ts.last_check
         torrent_checker.on_torrent_health_check_completed(infohash_bin, result)
+        torrent_checker.health_write_buffer.flush()
         assert 1 == len(torrent_checker.torrents_checked)
         assert result[2]['DHT'][0]['leechers'] == ts.leechers
         assert result[2]['DHT'][0]['seeders'] == ts.seeders
@@ -295,7 +359,7 @@ def test_check_local_torrents(enable_chant, torrent_checker, session):
         return os.urandom(20)
 
     num_torrents = 20
-    torrent_checker.check_torrent_health = lambda _: succeed(None)
+    torrent_checker.check_torrent_health = lambda *_, **__: succeed(None)
 
     # No torrents yet, the selected torrents should be empty
     selected_torrents = torrent_checker.check_local_torrents()
@@ -335,3 +399,28 @@ def test_check_local_torrents(enable_chant, torrent_checker, session):
 
     for infohash in selected_torrents:
         assert infohash in selection_range
+
+
+@db_session
+def test_torrents_to_check_candidates(enable_chant, torrent_checker, session):
+    """
+    Test that the torrents to check are taken from the candidates, and that fresh or checked candidates are dropped
+    """
+    stale_time = int(time.time()) - torrent_checker_module.HEALTH_FRESHNESS_SECONDS - 100
+    torrents = [session.mds.TorrentState(infohash=bytes([index]) * 20, seeders=index, last_check=stale_time + index)
+                for index in range(10)]
+
+    selected_torrents = torrent_checker.torrents_to_check()
+    assert len(selected_torrents) == torrent_checker_module.TORRENT_SELECTION_POOL_SIZE
+    assert set(selected_torrents) <= {torrents[0], torrents[1], torrents[8], torrents[9]}
+    for torrent in selected_torrents:
+        assert torrent.rowid not in torrent_checker._popular_candidates
+        assert torrent.rowid not in torrent_checker._old_candidates
+
+    # A torrent that was checked in the meantime is no longer a candidate
+    for torrent in torrents:
+        if torrent not in selected_torrents:
+            torrent.last_check = int(time.time())
+    assert not torrent_checker.torrents_to_check()
+    assert not torrent_checker._popular_candidates
+    assert not torrent_checker._old_candidates
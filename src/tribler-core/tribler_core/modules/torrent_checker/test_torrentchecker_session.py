@@ -11,9 +11,11 @@ from libtorrent import bencode
 
 import pytest
 
+import tribler_core.modules.torrent_checker.torrentchecker_session as torrentchecker_session_module
 from tribler_core.modules.torrent_checker.torrentchecker_session import (
     FakeBep33DHTSession,
     FakeDHTSession,
+    HttpSessionPool,
     HttpTrackerSession,
     UdpSocketManager,
     UdpTrackerSession,
@@ -27,6 +29,7 @@ class FakeUdpSocketManager:
     def __init__(self):
         self.response = None
         self.tracker_sessions = {}
+        self.connection_ids = {}
 
     def send_request(self, *args):
         return succeed(self.response)
@@ -122,6 +125,30 @@ async def test_httpsession_timeout():
     server.close()
 
 
+
+@pytest.mark.asyncio
+async def test_http_session_pool():
+    """
+    Test that the HTTP tracker sessions share a client session per proxy, which outlives the tracker sessions
+    """
+    pool = HttpSessionPool()
+    session1 = HttpTrackerSession("localhost", ("localhost", 8475), "/announce", 5, None, session_pool=pool)
+    session2 = HttpTrackerSession("localhost", ("localhost", 8475), "/announce", 5, None, session_pool=pool)
+    session3 = HttpTrackerSession("localhost", ("localhost", 8475), "/announce", 5, ('127.0.0.1', 1080),
+                                  session_pool=pool)
+
+    assert session1._session is session2._session
+    assert session1._session is not session3._session
+
+    await session1.cleanup()
+    assert not session2._session.closed
+
+    await pool.close()
+    assert session2._session.closed
+    assert session3._session.closed
+    await session2.cleanup()
+    await session3.cleanup()
+
 @pytest.mark.asyncio
 async def test_udpsession_timeout(fake_udp_socket_manager):
     sleep_future = Future()
@@ -176,6 +203,24 @@ async def test_proxy_transport():
     mgr.tracker_sessions[123].cancel()
 
 
+
+@pytest.mark.asyncio
+async def test_retransmit_request(monkeypatch):
+    """
+    Test that the UdpSocketManager retransmits a request until it gets a response
+    """
+    monkeypatch.setattr(torrentchecker_session_module, 'UDP_RETRANSMIT_INTERVAL', 0.01)
+    mgr = UdpSocketManager()
+    mgr.connection_made(Mock())
+    tracker_session = Mock(proxy=None, transaction_id=123, ip_address='127.0.0.1', port=6969)
+    task = ensure_future(mgr.send_request(b'', tracker_session))
+    await sleep(0.05)
+    assert mgr.transport.sendto.call_count >= 2
+
+    data = struct.pack("!iiq", 0, 123, 126)
+    mgr.datagram_received(data, None)
+    assert await task == data
+
 @pytest.mark.asyncio
 async def test_httpsession_cancel_operation():
     session = HttpTrackerSession("127.0.0.1", ("localhost", 8475), "/announce", 5, None)
@@ -327,6 +372,60 @@ async def test_big_correct_run(fake_udp_socket_manager):
     await session.cleanup()
 
 
+
+@pytest.mark.asyncio
+async def test_udpsession_cached_connection_id(fake_udp_socket_manager):
+    """
+    Test that the sessions for the same tracker reuse the connection ID until it expires
+    """
+    session = UdpTrackerSession("localhost", ("localhost", 4782), "/announce", 5, None, fake_udp_socket_manager)
+    session.ip_address = "127.0.0.1"
+    assert not session.use_cached_connection_id()
+    fake_udp_socket_manager.response = struct.pack("!iiq", 0, session.transaction_id, 2)
+    await session.connect()
+    await session.cleanup()
+
+    session = UdpTrackerSession("localhost", ("localhost", 4782), "/announce", 5, None, fake_udp_socket_manager)
+    session.ip_address = "127.0.0.1"
+    assert session.use_cached_connection_id()
+    assert session._connection_id == 2
+    assert session.action == 2
+
+    # The tracker rejects the connection ID, so the next session should connect again
+    fake_udp_socket_manager.response = struct.pack("!ii5s", 3, session.transaction_id, b"error")
+    with pytest.raises(ValueError):
+        await session.scrape()
+    assert not session.use_cached_connection_id()
+    await session.cleanup()
+
+    fake_udp_socket_manager.connection_ids[session.connection_key] = (2, 0)
+    assert not session.use_cached_connection_id()
+
+
+@pytest.mark.asyncio
+async def test_udpsession_scrape_multiple_packets(fake_udp_socket_manager):
+    """
+    Test that a UDP session scrapes at most 74 infohashes per packet
+    """
+    requests = []
+
+    def send_request(data, session):
+        num_infohashes = (len(data) - 16) // 20
+        requests.append(num_infohashes)
+        return succeed(struct.pack("!ii", 2, session.transaction_id) + struct.pack("!iii", 1, 2, 3) * num_infohashes)
+
+    fake_udp_socket_manager.send_request = send_request
+    session = UdpTrackerSession("localhost", ("localhost", 4782), "/announce", 5, None, fake_udp_socket_manager)
+    session.action = 2
+    for index in range(100):
+        session.add_infohash(index.to_bytes(20, 'big'))
+    result = await session.scrape()
+
+    assert requests == [74, 26]
+    assert len(result["localhost"]) == 100
+    assert result["localhost"][99] == {'infohash': hexlify((99).to_bytes(20, 'big')), 'seeders': 1, 'leechers': 3}
+    await session.cleanup()
+
 @pytest.mark.asyncio
 async def test_http_unprocessed_infohashes():
     session = HttpTrackerSession("localhost", ("localhost", 8475), "/announce", 5, None)
@@ -2,7 +2,8 @@ import asyncio
 import logging
 import random
 import time
-from asyncio import CancelledError, gather
+from asyncio import CancelledError, Future, gather, shield
+from functools import partial
 
 from ipv8.database import database_blob
 from ipv8.taskmanager import TaskManager, task
@@ -11,10 +12,21 @@ from pony.orm import db_session, desc, select
 
 from tribler_common.simpledefs import NTFY
 
+from tribler_core.modules.torrent_checker.health_check_scheduler import (
+    HealthCheckScheduler,
+    PRIORITY_POPULAR,
+    PRIORITY_STALE,
+    PRIORITY_USER,
+)
+from tribler_core.modules.torrent_checker.health_write_buffer import HealthWriteBuffer
 from tribler_core.modules.torrent_checker.torrentchecker_session import (
     FakeBep33DHTSession,
     FakeDHTSession,
+    HttpSessionPool,
+    MAX_INFOHASHES_IN_SCRAPE,
+    MAX_INFOHASHES_IN_UDP_SCRAPE,
     UdpSocketManager,
+    UdpTrackerSession,
     create_tracker_session,
 )
 from tribler_core.modules.tracker_manager import MAX_TRACKER_FAILURES
@@ -27,10 +39,13 @@ TORRENT_SELECTION_INTERVAL = 120   # The interval for checking the health of a r
 MIN_TORRENT_CHECK_INTERVAL = 900   # How much time we should wait before checking a torrent again
 TORRENT_CHECK_RETRY_INTERVAL = 30  # Interval when the torrent was successfully checked for the last time
 MAX_TORRENTS_CHECKED_PER_SESSION = 50
+MAX_TORRENTS_CHECKED_PER_UDP_SESSION = UdpTrackerSession.max_infohashes
 
 TORRENT_SELECTION_POOL_SIZE = 2      # How many torrents to check (popular or random) during periodic check
 HEALTH_FRESHNESS_SECONDS = 4 * 3600  # Number of seconds before a torrent health is considered stale. Default: 4 hours
 TORRENTS_CHECKED_RETURN_SIZE = 240   # Estimated torrents checked on default 4 hours idle run
+TORRENT_CANDIDATES_SIZE = 100        # How many popular and old torrents are kept as candidates for the periodic check
+SCRAPE_COALESCING_WINDOW = 0.5       # Seconds to wait for more torrents to scrape from the same tracker at once
 
 
 class TorrentChecker(TaskManager):
@@ -44,11 +59,23 @@ class TorrentChecker(TaskManager):
         self._session_list = {'DHT': []}
 
         self.socket_mgr = self.udp_transport = None
+        self.http_session_pool = HttpSessionPool()
+        self.health_check_scheduler = HealthCheckScheduler()
+        self.health_write_buffer = HealthWriteBuffer(session.mds)
+
+        # The health requests waiting to be merged into a single scrape per tracker:
+        # (tracker_url, proxy) -> {infohash: [(future, timeout), ...]}
+        self._pending_scrapes = {}
 
         # We keep track of the results of popular torrents checked by you.
         # The popularity community gossips this information around.
         self._torrents_checked = dict()
 
+        # The row ids of the stale torrents that are candidates for the periodic check, in order of preference.
+        # These are refilled from the database when they run low, so we do not have to sort the table every time.
+        self._popular_candidates = []
+        self._old_candidates = []
+
     async def initialize(self):
         self.register_task("tracker_check", self.check_random_tracker, interval=TRACKER_SELECTION_INTERVAL)
         self.register_task("torrent_check", self.check_local_torrents, interval=TORRENT_SELECTION_INTERVAL)
@@ -84,7 +111,10 @@ class TorrentChecker(TaskManager):
             self.udp_transport.close()
             self.udp_transport = None
 
+        await self.health_check_scheduler.shutdown()
         await self.shutdown_task_manager()
+        await self.http_session_pool.close()
+        await self.health_write_buffer.shutdown()
 
     async def check_random_tracker(self):
         """
@@ -111,7 +141,10 @@ class TorrentChecker(TaskManager):
                 self.update_tracker_info(tracker.url, False)
                 return False
             torrents = select(ts for ts in tracker.torrents if ts.last_check + dynamic_interval < int(time.time()))
-            infohashes = [t.infohash for t in torrents[:MAX_TORRENTS_CHECKED_PER_SESSION]]
+            # UDP trackers are scraped with multiple infohashes per packet over a cached connection
+            max_torrents = MAX_TORRENTS_CHECKED_PER_UDP_SESSION if tracker.url.startswith('udp') \
+                else MAX_TORRENTS_CHECKED_PER_SESSION
+            infohashes = [t.infohash for t in torrents[:max_torrents]]
 
         if len(infohashes) == 0:
             # We have no torrent to recheck for this tracker. Still update the last_check for this tracker.
@@ -134,11 +167,14 @@ class TorrentChecker(TaskManager):
             session.add_infohash(infohash)
 
         self._logger.info("Selected %d new torrents to check on tracker: %s", len(infohashes), tracker.url)
+        await self.health_check_scheduler.acquire_tracker(tracker.url)
         try:
             await self.connect_to_tracker(session)
             return True
         except:
             return False
+        finally:
+            self.health_check_scheduler.release_tracker(tracker.url)
 
     async def connect_to_tracker(self, session):
         try:
@@ -185,18 +221,47 @@ class TorrentChecker(TaskManager):
 
         2. Old torrents (50%)
         By old torrents, we refer to those checked quite farther in the past, sorted by the last_check value.
-        """
-        last_fresh_time = time.time() - HEALTH_FRESHNESS_SECONDS
-        popular_torrents = list(self.tribler_session.mds.TorrentState.select(lambda g: g.last_check < last_fresh_time).
-                                order_by(lambda g: (desc(g.seeders), g.last_check)).limit(TORRENT_SELECTION_POOL_SIZE))
 
-        old_torrents = list(self.tribler_session.mds.TorrentState.select(lambda g: g.last_check < last_fresh_time).
-                            order_by(lambda g: (g.last_check, desc(g.seeders))).limit(TORRENT_SELECTION_POOL_SIZE))
+        The candidates of both categories are taken from the front of the candidate lists, which are refilled
+        from the database when they run low. Candidates that became fresh in the meantime are dropped.
+        """
+        if min(len(self._popular_candidates), len(self._old_candidates)) < TORRENT_SELECTION_POOL_SIZE:
+            self.refresh_torrent_candidates()
 
-        selected_torrents = popular_torrents + old_torrents
-        selected_torrents = random.sample(selected_torrents, min(TORRENT_SELECTION_POOL_SIZE, len(selected_torrents)))
+        last_fresh_time = time.time() - HEALTH_FRESHNESS_SECONDS
+        selected_torrents = {}
+        for candidates in (self._popular_candidates, self._old_candidates):
+            index = 0
+            while index < len(candidates) and index < TORRENT_SELECTION_POOL_SIZE:
+                torrent = self.tribler_session.mds.TorrentState.get(rowid=candidates[index])
+                if torrent is None or torrent.last_check >= last_fresh_time:
+                    del candidates[index]
+                    continue
+                selected_torrents[torrent.rowid] = torrent
+                index += 1
+
+        selected_torrents = random.sample(list(selected_torrents.values()),
+                                          min(TORRENT_SELECTION_POOL_SIZE, len(selected_torrents)))
+        for torrent in selected_torrents:
+            for candidates in (self._popular_candidates, self._old_candidates):
+                if torrent.rowid in candidates:
+                    candidates.remove(torrent.rowid)
         return selected_torrents
 
+    @db_session
+    def refresh_torrent_candidates(self):
+        """
+        Load the row ids of the most popular and the oldest stale torrents from the database. These queries only
+        touch the (last_check, seeders) index of the TorrentState table.
+        """
+        last_fresh_time = time.time() - HEALTH_FRESHNESS_SECONDS
+        torrents = select((g.rowid, g.seeders, g.last_check) for g in self.tribler_session.mds.TorrentState
+                          if g.last_check < last_fresh_time)
+        self._popular_candidates = [rowid for rowid, _, _ in
+                                    torrents.order_by(desc(2), 3).limit(TORRENT_CANDIDATES_SIZE)]
+        self._old_candidates = [rowid for rowid, _, _ in
+                                torrents.order_by(3, desc(2)).limit(TORRENT_CANDIDATES_SIZE)]
+
     @db_session
     def check_local_torrents(self):
         """
@@ -206,7 +271,8 @@ class TorrentChecker(TaskManager):
 
         infohashes = []
         for random_torrent in selected_torrents:
-            self.check_torrent_health(bytes(random_torrent.infohash))
+            priority = PRIORITY_POPULAR if random_torrent.seeders > 0 else PRIORITY_STALE
+            self.check_torrent_health(bytes(random_torrent.infohash), priority=priority)
             infohashes.append(random_torrent.infohash)
         return infohashes
 
@@ -292,12 +358,13 @@ class TorrentChecker(TaskManager):
         return final_response
 
     @task
-    async def check_torrent_health(self, infohash, timeout=20, scrape_now=False):
+    async def check_torrent_health(self, infohash, timeout=20, scrape_now=False, priority=PRIORITY_USER):
         """
         Check the health of a torrent with a given infohash.
         :param infohash: Torrent infohash.
         :param timeout: The timeout to use in the performed requests
         :param scrape_now: Flag whether we want to force scraping immediately
+        :param priority: The priority of the check in the queue of the health check scheduler
         """
         tracker_set = []
 
@@ -322,15 +389,17 @@ class TorrentChecker(TaskManager):
                 # get torrent's tracker list from DB
                 tracker_set = self.get_valid_trackers_of_torrent(torrent_id)
 
+        # The check is shared with the other callers that check this torrent at the same time
+        check = partial(self._check_torrent_health, infohash, tracker_set, timeout)
+        return await shield(self.health_check_scheduler.schedule(infohash, check, priority=priority))
+
+    async def _check_torrent_health(self, infohash, tracker_set, timeout):
         hops = self.tribler_session.config.get_default_number_hops()
         socks_listen_ports = self.tribler_session.config.get_tunnel_community_socks5_listen_ports()
         proxy = ('127.0.0.1', socks_listen_ports[hops - 1]) if hops > 0 else None
 
-        tasks = []
-        for tracker_url in tracker_set:
-            session = self._create_session_for_request(tracker_url, timeout=timeout, proxy=proxy)
-            session.add_infohash(infohash)
-            tasks.append(self.connect_to_tracker(session))
+        tasks = [self.scrape_tracker(tracker_url, infohash, timeout=timeout, proxy=proxy)
+                 for tracker_url in tracker_set]
 
         if has_bep33_support():
             # Create a (fake) DHT session for the lookup if we have support for BEP33.
@@ -346,8 +415,72 @@ class TorrentChecker(TaskManager):
         res = await gather(*tasks, return_exceptions=True)
         return self.on_torrent_health_check_completed(infohash, res)
 
+    def scrape_tracker(self, tracker_url, infohash, timeout=20, proxy=None):
+        """
+        Schedule a scrape of the given infohash on the given tracker. The requests for the same tracker that arrive
+        within SCRAPE_COALESCING_WINDOW seconds are merged into a single scrape of multiple infohashes, which is sent
+        right away once it fills a scrape request.
+        :param tracker_url: The URL of the tracker.
+        :param infohash: Torrent infohash.
+        :param timeout: The timeout to use in the scrape request
+        :param proxy: The SOCKS5 proxy to use, or None
+        :return: A future that fires with the health of the torrent on this tracker.
+        """
+        key = (tracker_url, proxy)
+        batch = self._pending_scrapes.setdefault(key, {})
+        future = Future()
+        batch.setdefault(infohash, []).append((future, timeout))
+
+        task_name = f"flush scrapes {tracker_url} {proxy}"
+        max_infohashes = MAX_INFOHASHES_IN_UDP_SCRAPE if tracker_url.startswith('udp') else MAX_INFOHASHES_IN_SCRAPE
+        if len(batch) >= max_infohashes:
+            self.cancel_pending_task(task_name)
+            self._flush_pending_scrapes(key)
+        elif not self.is_pending_task_active(task_name):
+            self.register_task(task_name, self._flush_pending_scrapes, key, delay=SCRAPE_COALESCING_WINDOW)
+        return future
+
+    def _flush_pending_scrapes(self, key):
+        batch = self._pending_scrapes.pop(key, None)
+        if batch:
+            tracker_url, proxy = key
+            self.register_anonymous_task(f"scrape {tracker_url}", self._scrape_batch, tracker_url, proxy, batch)
+
+    async def _scrape_batch(self, tracker_url, proxy, batch):
+        requests = [request for infohash_requests in batch.values() for request in infohash_requests]
+
+        try:
+            session = self._create_session_for_request(tracker_url, timeout=max(timeout for _, timeout in requests),
+                                                       proxy=proxy)
+            for infohash in batch:
+                session.add_infohash(infohash)
+            await self.health_check_scheduler.acquire_tracker(tracker_url)
+            try:
+                result = await self.connect_to_tracker(session)
+            finally:
+                self.health_check_scheduler.release_tracker(tracker_url)
+        except CancelledError:
+            for future, _ in requests:
+                future.cancel()
+            raise
+        except Exception as e:
+            e.tracker_url = tracker_url
+            for future, _ in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Split the result of the scrape over the requests of the individual torrents
+        health = {entry['infohash']: entry for entry in result[tracker_url]} if result else {}
+        for infohash, infohash_requests in batch.items():
+            entry = health.get(hexlify(infohash), {'infohash': hexlify(infohash), 'seeders': 0, 'leechers': 0})
+            for future, _ in infohash_requests:
+                if not future.done():
+                    future.set_result({tracker_url: [entry]} if result else None)
+
     def _create_session_for_request(self, tracker_url, timeout=20, proxy=None):
-        session = create_tracker_session(tracker_url, timeout, proxy, self.socket_mgr)
+        session = create_tracker_session(tracker_url, timeout, proxy, self.socket_mgr,
+                                         http_session_pool=self.http_session_pool)
 
         if tracker_url not in self._session_list:
             self._session_list[tracker_url] = []
@@ -381,14 +514,5 @@ class TorrentChecker(TaskManager):
 
         self._logger.debug("Update result %s/%s for %s", seeders, leechers, hexlify(infohash))
 
-        with db_session:
-            # Update torrent state
-            torrent = self.tribler_session.mds.TorrentState.get(infohash=database_blob(infohash))
-            if not torrent:
-                self._logger.warning(
-                    "Tried to update torrent health data in DB for an unknown torrent: %s", hexlify(infohash))
-                return
-            torrent.seeders = seeders
-            torrent.leechers = leechers
-            torrent.last_check = last_check
-            torrent.self_checked = True
+        # The torrent state is updated in a batch together with the other results
+        self.health_write_buffer.add(infohash, seeders, leechers, last_check, self_checked=True)
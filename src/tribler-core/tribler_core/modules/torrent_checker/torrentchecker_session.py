@@ -2,12 +2,11 @@ import logging
 import random
 import socket
 import struct
-import sys
 import time
 from abc import ABCMeta, abstractmethod
-from asyncio import DatagramProtocol, Future, TimeoutError, ensure_future, get_event_loop
+from asyncio import DatagramProtocol, Future, TimeoutError, ensure_future, get_event_loop, shield, wait_for
 
-from aiohttp import ClientResponseError, ClientSession, ClientTimeout
+from aiohttp import ClientResponseError, ClientSession, ClientTimeout, TCPConnector
 
 import async_timeout
 
@@ -31,24 +30,72 @@ UDP_TRACKER_INIT_CONNECTION_ID = 0x41727101980
 
 MAX_INFOHASHES_IN_SCRAPE = 60
 
+# BEP15 limits a UDP scrape to about 74 infohashes, so that the response fits into a single packet
+MAX_INFOHASHES_IN_UDP_SCRAPE = 74
+MAX_UDP_SCRAPES_PER_SESSION = 4
 
-def create_tracker_session(tracker_url, timeout, proxy, socket_manager):
+UDP_CONNECTION_ID_LIFETIME = 60  # Seconds that a UDP tracker accepts a connection ID (BEP15)
+UDP_RETRANSMIT_INTERVAL = 15     # Seconds before the first retransmission of a UDP tracker request (BEP15)
+UDP_MAX_RETRANSMIT_EXPONENT = 8  # The retransmission interval doubles up to 15 * 2 ^ 8 seconds (BEP15)
+
+HTTP_CONNECTIONS_PER_TRACKER = 2  # Maximum number of simultaneous connections to a single HTTP tracker
+HTTP_KEEPALIVE_TIMEOUT = 60       # Seconds to keep an idle connection to an HTTP tracker open
+
+
+def create_tracker_session(tracker_url, timeout, proxy, socket_manager, http_session_pool=None):
     """
     Creates a tracker session with the given tracker URL.
     :param tracker_url: The given tracker URL.
     :param timeout: The timeout for the session.
+    :param http_session_pool: The pool with the shared HTTP client sessions (optional).
     :return: The tracker session.
     """
     tracker_type, tracker_address, announce_page = parse_tracker_url(tracker_url)
 
     if tracker_type == 'udp':
         return UdpTrackerSession(tracker_url, tracker_address, announce_page, timeout, proxy, socket_manager)
-    return HttpTrackerSession(tracker_url, tracker_address, announce_page, timeout, proxy)
+    return HttpTrackerSession(tracker_url, tracker_address, announce_page, timeout, proxy,
+                              session_pool=http_session_pool)
+
+
+class HttpSessionPool:
+    """
+    The HttpSessionPool keeps one aiohttp client session per proxy, so that the HTTP scrapes reuse the (keep-alive)
+    connections to the trackers instead of opening a new connection for every request.
+    """
+
+    def __init__(self, limit_per_host=HTTP_CONNECTIONS_PER_TRACKER, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT):
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._sessions = {}
+
+    def get_session(self, proxy=None):
+        """
+        Returns the client session for the given proxy, creating it if needed.
+        :param proxy: The SOCKS5 proxy address or None for a direct connection.
+        """
+        session = self._sessions.get(proxy)
+        if session is None or session.closed:
+            connector_args = {'limit_per_host': self.limit_per_host, 'keepalive_timeout': self.keepalive_timeout}
+            connector = Socks5Connector(proxy, **connector_args) if proxy else TCPConnector(**connector_args)
+            session = self._sessions[proxy] = ClientSession(connector=connector, raise_for_status=True)
+        return session
+
+    async def close(self):
+        """
+        Closes all client sessions and their connections.
+        """
+        sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            await session.close()
 
 
 class TrackerSession(TaskManager):
     __meta__ = ABCMeta
 
+    # The maximum number of infohashes that can be added to the session
+    max_infohashes = MAX_INFOHASHES_IN_SCRAPE
+
     def __init__(self, tracker_type, tracker_url, tracker_address, announce_page, timeout):
         super().__init__()
 
@@ -89,7 +136,7 @@ class TrackerSession(TaskManager):
         """
         assert not self.is_initiated, "Must not add request to an initiated session."
         assert not self.has_infohash(infohash), "Must not add duplicate requests"
-        if len(self.infohash_list) < MAX_INFOHASHES_IN_SCRAPE:
+        if len(self.infohash_list) < self.max_infohashes:
             self.infohash_list.append(infohash)
 
     def failed(self, msg=None):
@@ -110,11 +157,16 @@ class TrackerSession(TaskManager):
 
 
 class HttpTrackerSession(TrackerSession):
-    def __init__(self, tracker_url, tracker_address, announce_page, timeout, proxy):
+    def __init__(self, tracker_url, tracker_address, announce_page, timeout, proxy, session_pool=None):
         super().__init__('http', tracker_url, tracker_address, announce_page, timeout)
-        self._session = ClientSession(connector=Socks5Connector(proxy) if proxy else None,
-                                      raise_for_status=True,
-                                      timeout=ClientTimeout(total=self.timeout))
+        # Without a pool, the session owns a client session that is closed during the cleanup
+        self._owns_session = session_pool is None
+        if session_pool:
+            self._session = session_pool.get_session(proxy)
+        else:
+            self._session = ClientSession(connector=Socks5Connector(proxy) if proxy else None,
+                                          raise_for_status=True,
+                                          timeout=ClientTimeout(total=self.timeout))
 
     async def connect_to_tracker(self):
         # create the HTTP GET message
@@ -134,9 +186,9 @@ class HttpTrackerSession(TrackerSession):
 
         try:
             self._logger.debug("%s HTTP SCRAPE message sent: %s", self, url)
-            async with self._session:
-                async with self._session.get(url.encode('ascii').decode('utf-8')) as response:
-                    body = await response.read()
+            async with self._session.get(url.encode('ascii').decode('utf-8'),
+                                         timeout=ClientTimeout(total=self.timeout)) as response:
+                body = await response.read()
         except UnicodeEncodeError as e:
             raise e
         except ClientResponseError as e:
@@ -199,7 +251,8 @@ class HttpTrackerSession(TrackerSession):
         Cleans the session by cancelling all deferreds and closing sockets.
         :return: A deferred that fires once the cleanup is done.
         """
-        await self._session.close()
+        if self._owns_session:
+            await self._session.close()
         await super().cleanup()
 
 
@@ -213,6 +266,9 @@ class UdpSocketManager(DatagramProtocol):
         self.tracker_sessions = {}
         self.transport = None
         self.proxy_transports = {}
+        # The connection IDs that the trackers have handed out, shared by all the sessions:
+        # (ip_address, port, proxy) -> (connection_id, expiration time)
+        self.connection_ids = {}
 
     def connection_made(self, transport):
         self.transport = transport
@@ -229,9 +285,17 @@ class UdpSocketManager(DatagramProtocol):
                 self.proxy_transports[proxy] = transport
 
         try:
-            transport.sendto(data, (tracker_session.ip_address, tracker_session.port))
             f = self.tracker_sessions[tracker_session.transaction_id] = Future()
-            return await f
+            # Retransmit the request after 15 * 2 ^ n seconds, until the session times out
+            attempt = 0
+            while True:
+                transport.sendto(data, (tracker_session.ip_address, tracker_session.port))
+                try:
+                    return await wait_for(shield(f), UDP_RETRANSMIT_INTERVAL * 2 ** attempt)
+                except TimeoutError:
+                    attempt = min(attempt + 1, UDP_MAX_RETRANSMIT_EXPONENT)
+                    self._logger.debug("Retransmitting request to %s:%d", tracker_session.ip_address,
+                                       tracker_session.port)
         except OSError as e:
             self._logger.warning("Unable to write data to %s:%d - %s",
                                  tracker_session.ip_address, tracker_session.port, e)
@@ -257,6 +321,9 @@ class UdpTrackerSession(TrackerSession):
     # A list of transaction IDs that have been used in order to avoid conflict.
     _active_session_dict = dict()
 
+    # The infohashes are scraped in multiple packets if needed
+    max_infohashes = MAX_UDP_SCRAPES_PER_SESSION * MAX_INFOHASHES_IN_UDP_SCRAPE
+
     def __init__(self, tracker_url, tracker_address, announce_page, timeout, proxy, socket_mgr):
         super().__init__('udp', tracker_url, tracker_address, announce_page, timeout)
 
@@ -280,7 +347,7 @@ class UdpTrackerSession(TrackerSession):
         while True:
             # make sure there is no duplicated transaction IDs
             transaction_id = random.randint(0, MAX_INT32)
-            if transaction_id not in UdpTrackerSession._active_session_dict.items():
+            if transaction_id not in UdpTrackerSession._active_session_dict.values():
                 UdpTrackerSession._active_session_dict[self] = transaction_id
                 self.transaction_id = transaction_id
                 break
@@ -328,13 +395,31 @@ class UdpTrackerSession(TrackerSession):
                 else:
                     infos = await self.register_anonymous_task("resolve", ensure_future(coro))
                 self.ip_address = infos[0][-1][0]
-                await self.connect()
+                if not self.use_cached_connection_id():
+                    await self.connect()
                 return await self.scrape()
         except TimeoutError:
             self.failed(msg='request timed out')
         except socket.gaierror as e:
             self.failed(msg=str(e))
 
+    @property
+    def connection_key(self):
+        return self.ip_address, self.port, self.proxy
+
+    def use_cached_connection_id(self):
+        """
+        Skips the connect handshake if the tracker has handed out a connection ID recently.
+        :return: True if a cached connection ID is used, False otherwise.
+        """
+        connection_id, expiration_time = self.socket_mgr.connection_ids.get(self.connection_key, (None, 0))
+        if connection_id is None or expiration_time < time.time():
+            return False
+        self._connection_id = connection_id
+        self.action = TRACKER_ACTION_SCRAPE
+        self.generate_transaction_id()
+        return True
+
     async def connect(self):
         """
         Creates a connection message and calls the socket manager to send it.
@@ -364,18 +449,36 @@ class UdpTrackerSession(TrackerSession):
 
         # update action and IDs
         self._connection_id = struct.unpack_from('!q', response, 8)[0]
+        self.socket_mgr.connection_ids[self.connection_key] = (self._connection_id,
+                                                               time.time() + UDP_CONNECTION_ID_LIFETIME)
         self.action = TRACKER_ACTION_SCRAPE
         self.generate_transaction_id()
         self.last_contact = int(time.time())
 
     async def scrape(self):
-        # pack and send the message
-        if sys.version_info.major > 2:
-            infohash_list = self.infohash_list
-        else:
-            infohash_list = [str(infohash) for infohash in self.infohash_list]
+        response_list = []
+        for offset in range(0, len(self.infohash_list) or 1, MAX_INFOHASHES_IN_UDP_SCRAPE):
+            if offset:
+                # Every scrape packet is a separate request with its own transaction ID
+                self.remove_transaction_id()
+                self.generate_transaction_id()
+            infohash_list = self.infohash_list[offset:offset + MAX_INFOHASHES_IN_UDP_SCRAPE]
+            response_list.extend(await self.scrape_infohashes(infohash_list))
+
+        # close this socket and remove its transaction ID from the list
+        self.remove_transaction_id()
+        self.last_contact = int(time.time())
+        self.is_finished = True
+
+        return {self.tracker_url: response_list}
 
-        fmt = '!qii' + ('20s' * len(self.infohash_list))
+    async def scrape_infohashes(self, infohash_list):
+        """
+        Scrapes the given infohashes with a single request.
+        :return: A list with the seeders and leechers per infohash.
+        """
+        # pack and send the message
+        fmt = '!qii' + ('20s' * len(infohash_list))
         message = struct.pack(fmt, self._connection_id, self.action, self.transaction_id, *infohash_list)
 
         # Send the scrape message
@@ -395,10 +498,12 @@ class UdpTrackerSession(TrackerSession):
 
             self._logger.info("%s Error response for UDP SCRAPE: [%s] [%s]",
                               self, repr(response), repr(error_message))
+            # The connection ID might have expired, so the next session should connect again
+            self.socket_mgr.connection_ids.pop(self.connection_key, None)
             self.failed(msg=error_message.decode('utf8', errors='ignore'))
 
         # get results
-        if len(response) - 8 != len(self.infohash_list) * 12:
+        if len(response) - 8 != len(infohash_list) * 12:
             self._logger.info("%s UDP SCRAPE response mismatch: %s", self, len(response))
             self.failed(msg="invalid response size")
 
@@ -406,7 +511,7 @@ class UdpTrackerSession(TrackerSession):
 
         response_list = []
 
-        for infohash in self.infohash_list:
+        for infohash in infohash_list:
             complete, _downloaded, incomplete = struct.unpack_from('!iii', response, offset)
             offset += 12
 
@@ -416,12 +521,7 @@ class UdpTrackerSession(TrackerSession):
             response_list.append({'infohash': hexlify(infohash),
                                   'seeders': complete, 'leechers': incomplete})
 
-        # close this socket and remove its transaction ID from the list
-        self.remove_transaction_id()
-        self.last_contact = int(time.time())
-        self.is_finished = True
-
-        return {self.tracker_url: response_list}
+        return response_list
 
 
 class FakeDHTSession(TrackerSession):
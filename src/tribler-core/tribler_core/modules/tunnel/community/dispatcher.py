@@ -10,7 +10,42 @@ from ipv8.messaging.anonymization.tunnel import (
 )
 from ipv8.taskmanager import TaskManager, task
 
-from tribler_core.modules.tunnel.socks5.conversion import UdpPacket, socks5_serializer
+from tribler_core.modules.tunnel.socks5.conversion import encode_udp_header
+
+MAX_CACHED_UDP_HEADERS = 10000  # Maximum number of encoded SOCKS5 UDP headers that we keep
+
+
+class CircuitPool:
+    """
+    A set of circuits that supports adding, removing and picking a random circuit in constant time.
+    """
+
+    def __init__(self):
+        self.circuits = []
+        self.positions = {}  # circuit id -> index in self.circuits
+
+    def __len__(self):
+        return len(self.circuits)
+
+    def __contains__(self, circuit):
+        return circuit.circuit_id in self.positions
+
+    def __getitem__(self, index):
+        return self.circuits[index]
+
+    def add(self, circuit):
+        if circuit.circuit_id not in self.positions:
+            self.positions[circuit.circuit_id] = len(self.circuits)
+            self.circuits.append(circuit)
+
+    def remove(self, circuit):
+        index = self.positions.pop(circuit.circuit_id, None)
+        if index is None:
+            return
+        last = self.circuits.pop()
+        if index < len(self.circuits):
+            self.circuits[index] = last
+            self.positions[last.circuit_id] = index
 
 
 class TunnelDispatcher(TaskManager):
@@ -30,6 +65,20 @@ class TunnelDispatcher(TaskManager):
         # Map to keep track of the circuit id to UDP connection.
         self.cid_to_con = {}
 
+        # Map to keep track of the circuit ids claimed by each connection (the reverse of cid_to_con).
+        self.con_to_cids = {}
+
+        # The ready data circuits, by number of hops. Circuits that are claimed by a connection are kept apart,
+        # so selecting a circuit for a connection does not have to look at the circuits claimed by others.
+        self.unclaimed_circuits = defaultdict(CircuitPool)
+        self.claimed_circuits = defaultdict(lambda: defaultdict(CircuitPool))
+
+        # The last SOCKS5 session with an UDP associate that we have seen, by number of hops.
+        self.hops_to_con = {}
+
+        # The encoded SOCKS5 UDP headers, by origin of the data.
+        self.udp_headers = {}
+
         self.register_task('check_connections', self.check_connections, interval=30)
 
     def set_socks_servers(self, socks_servers):
@@ -49,16 +98,23 @@ class TunnelDispatcher(TaskManager):
             if session_hops > len(self.socks_servers) or not self.socks_servers[session_hops - 1].sessions:
                 self._logger.error("No connection found for %d hops", session_hops)
                 return False
-            connection = next((s for s in self.socks_servers[session_hops - 1].sessions
-                               if s.udp_connection and s.udp_connection.remote_udp_address), None)
+            connection = self.hops_to_con.get(session_hops)
+            if not (connection and connection.udp_connection and connection.udp_connection.remote_udp_address):
+                connection = next((s for s in self.socks_servers[session_hops - 1].sessions
+                                   if s.udp_connection and s.udp_connection.remote_udp_address), None)
+                self.hops_to_con[session_hops] = connection
 
         if connection is None or connection.udp_connection is None:
             self._logger.error("Connection has closed or has not gotten an UDP associate")
             self.connection_dead(connection)
             return False
 
-        packet = socks5_serializer.pack_serializable(UdpPacket(0, 0, origin, data))
-        connection.udp_connection.send_datagram(packet)
+        header = self.udp_headers.get(origin)
+        if header is None:
+            if len(self.udp_headers) >= MAX_CACHED_UDP_HEADERS:
+                self.udp_headers.clear()
+            header = self.udp_headers[origin] = encode_udp_header(origin)
+        connection.udp_connection.send_datagram(header + data)
         return True
 
     def on_socks5_udp_data(self, udp_connection, request):
@@ -66,12 +122,11 @@ class TunnelDispatcher(TaskManager):
         We received some data from the SOCKS5 server (from the SOCKS5 client). This method
         selects a circuit to send this data over to the final destination.
         """
-        circuit = None
         connection = udp_connection.socksconnection
         try:
             circuit = self.con_to_cir[connection][request.destination]
         except KeyError:
-            circuit = circuit or self.select_circuit(connection, request)
+            circuit = self.select_circuit(connection, request)
             if circuit is None:
                 return False
 
@@ -106,12 +161,10 @@ class TunnelDispatcher(TaskManager):
                 return circuit
 
         hops = self.socks_servers.index(connection.socksserver) + 1
-        options = [c for c in self.tunnels.circuits.values()
-                   if c.goal_hops == hops and c.state == CIRCUIT_STATE_READY and c.ctype == CIRCUIT_TYPE_DATA
-                   and self.cid_to_con.get(c.circuit_id, connection) == connection]
-        if not options:
+        circuit = self.pick_circuit(connection, hops)
+        if circuit is None:
             # We allow each connection to claim at least 1 circuit. If no such circuit exists we'll create one.
-            if connection in self.cid_to_con.values():
+            if connection in self.con_to_cids:
                 self._logger.debug("No circuit for sending data to %s", request.destination)
                 return None
 
@@ -120,22 +173,63 @@ class TunnelDispatcher(TaskManager):
                 self._logger.debug("Failed to create circuit for data to %s", request.destination)
                 return None
             self._logger.debug("Creating circuit for data to %s. Retrying later..", request.destination)
-            self.cid_to_con[circuit.circuit_id] = connection
+            self.claim_circuit(circuit, connection)
             circuit.ready.add_done_callback(lambda f, c=connection.udp_connection, r=request:
                                             self.on_socks5_udp_data(c, r) if f.result() else None)
             return None
 
-        circuit = random.choice(options)
-        self.cid_to_con[circuit.circuit_id] = connection
+        self.claim_circuit(circuit, connection)
         self.con_to_cir[connection][request.destination] = circuit
         self._logger.debug("Select circuit %d for %s", circuit.circuit_id, request.destination)
         return circuit
 
+    def pick_circuit(self, connection, hops):
+        """
+        Pick a random ready data circuit with the given number of hops that is not claimed by another connection.
+        Circuits that are no longer ready are dropped from the pools.
+        """
+        unclaimed = self.unclaimed_circuits[hops]
+        claimed = self.claimed_circuits[connection][hops] if connection in self.con_to_cids else ()
+        while unclaimed or claimed:
+            index = random.randrange(len(unclaimed) + len(claimed))
+            pool = unclaimed if index < len(unclaimed) else claimed
+            circuit = pool[index if pool is unclaimed else index - len(unclaimed)]
+            if circuit.state == CIRCUIT_STATE_READY:
+                return circuit
+            pool.remove(circuit)
+        return None
+
+    def claim_circuit(self, circuit, connection):
+        """
+        Associate a circuit with a SOCKS5 connection, after which it is no longer used by other connections.
+        """
+        self.cid_to_con[circuit.circuit_id] = connection
+        self.con_to_cids.setdefault(connection, set()).add(circuit.circuit_id)
+        if circuit in self.unclaimed_circuits[circuit.goal_hops]:
+            self.unclaimed_circuits[circuit.goal_hops].remove(circuit)
+            self.claimed_circuits[connection][circuit.goal_hops].add(circuit)
+
+    def circuit_ready(self, circuit):
+        """
+        A circuit has become ready. If it is a data circuit, it can be selected for sending data.
+        """
+        if circuit.ctype != CIRCUIT_TYPE_DATA or circuit.state != CIRCUIT_STATE_READY:
+            return
+        connection = self.cid_to_con.get(circuit.circuit_id)
+        if connection is None:
+            self.unclaimed_circuits[circuit.goal_hops].add(circuit)
+        else:
+            self.claimed_circuits[connection][circuit.goal_hops].add(circuit)
+
     def circuit_dead(self, broken_circuit):
         """
         When a circuit dies, we update the destinations dictionary and remove all peers that are affected.
         """
         con = self.cid_to_con.pop(broken_circuit.circuit_id, None)
+        self.unclaimed_circuits[broken_circuit.goal_hops].remove(broken_circuit)
+        if con is not None:
+            self.claimed_circuits[con][broken_circuit.goal_hops].remove(broken_circuit)
+            self._release_circuit_id(con, broken_circuit.circuit_id)
 
         destinations = set()
         destination_to_circuit = self.con_to_cir.get(con, {})
@@ -149,12 +243,23 @@ class TunnelDispatcher(TaskManager):
 
     def connection_dead(self, connection):
         self.con_to_cir.pop(connection, None)
-        for cid, con in list(self.cid_to_con.items()):
-            if con == connection:
-                self.cid_to_con.pop(cid, None)
+        for cid in self.con_to_cids.pop(connection, ()):
+            self.cid_to_con.pop(cid, None)
+        # The circuits of this connection can be used by other connections again
+        for hops, pool in self.claimed_circuits.pop(connection, {}).items():
+            for circuit in pool.circuits:
+                self.unclaimed_circuits[hops].add(circuit)
         self._logger.error("Detected closed connection")
 
+    def _release_circuit_id(self, connection, circuit_id):
+        circuit_ids = self.con_to_cids.get(connection)
+        if circuit_ids is not None:
+            circuit_ids.discard(circuit_id)
+            if not circuit_ids:
+                self.con_to_cids.pop(connection)
+                self.claimed_circuits.pop(connection, None)
+
     def check_connections(self):
-        for connection in list(self.cid_to_con.values()):
+        for connection in list(self.con_to_cids):
             if not connection.udp_connection:
                 self.connection_dead(connection)
@@ -441,6 +441,7 @@ class TriblerTunnelCommunity(HiddenTunnelCommunity):
         super()._ours_on_created_extended(circuit, payload)
 
         if circuit.state == CIRCUIT_STATE_READY:
+            self.dispatcher.circuit_ready(circuit)
             # Re-add BitTorrent peers, if needed.
             self.readd_bittorrent_peers()
 
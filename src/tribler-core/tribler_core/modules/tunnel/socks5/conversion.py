@@ -115,3 +115,24 @@ class IPV6AddrError(NotImplementedError):
 socks5_serializer = Serializer()
 socks5_serializer.add_packer('list_of_chars', ListOf(DefaultStruct('>B')))
 socks5_serializer.add_packer('socks5_address', Socks5Address())
+
+UDP_IPV4_HEADER = struct.Struct('>HBB4sH')
+
+
+def decode_udp_packet(data):
+    """
+    Decode a SOCKS5 UDP packet. Packets with an IPv4 destination, which is the common case, are decoded without
+    going through the serializer.
+    """
+    if len(data) >= UDP_IPV4_HEADER.size and data[3] == ADDRESS_TYPE_IPV4:
+        rsv, frag, _, host, port = UDP_IPV4_HEADER.unpack_from(data)
+        return UdpPacket(rsv, frag, UDPv4Address(socket.inet_ntoa(host), port), data[UDP_IPV4_HEADER.size:])
+    request, _ = socks5_serializer.unpack_serializable(UdpPacket, data)
+    return request
+
+
+def encode_udp_header(address):
+    """
+    Encode the header of a SOCKS5 UDP packet from the given address, which can be prepended to the data.
+    """
+    return socks5_serializer.pack_serializable(UdpPacket(0, 0, address, b''))
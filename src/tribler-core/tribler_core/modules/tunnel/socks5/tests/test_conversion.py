@@ -1,6 +1,6 @@
 import struct
 
-from ipv8.messaging.interfaces.udp.endpoint import DomainAddress
+from ipv8.messaging.interfaces.udp.endpoint import DomainAddress, UDPv4Address
 from ipv8.messaging.serialization import PackError
 
 import pytest
@@ -10,6 +10,8 @@ from tribler_core.modules.tunnel.socks5.conversion import (
     CommandRequest,
     CommandResponse,
     UdpPacket,
+    decode_udp_packet,
+    encode_udp_header,
     socks5_serializer,
 )
 
@@ -42,6 +44,27 @@ def test_decode_udp_packet_fail():
         socks5_serializer.unpack_serializable(UdpPacket, badly_encoded_packet)
 
 
+def test_decode_udp_packet_ipv4():
+    encoded = socks5_serializer.pack_serializable(UdpPacket(0, 1, UDPv4Address('1.2.3.4', 8084), b'0x000'))
+    decoded = decode_udp_packet(encoded)
+    assert decoded.frag == 1
+    assert decoded.destination == UDPv4Address('1.2.3.4', 8084)
+    assert decoded.data == b'0x000'
+
+    address = DomainAddress('tracker1.good-tracker.com', 8084)
+    encoded = socks5_serializer.pack_serializable(UdpPacket(0, 0, address, b'0x000'))
+    assert decode_udp_packet(encoded).destination == address
+
+    with pytest.raises(PackError):
+        decode_udp_packet(b'\x00\x00\x00\x01\x01\x02')
+
+
+def test_encode_udp_header():
+    for address in [('1.2.3.4', 8084), DomainAddress('tracker1.good-tracker.com', 8084)]:
+        packet = socks5_serializer.pack_serializable(UdpPacket(0, 0, address, b'0x000'))
+        assert encode_udp_header(address) + b'0x000' == packet
+
+
 def test_encode_decode_command_request():
     rsv = 0
     address = DomainAddress('tracker1.good-tracker.com', 8084)
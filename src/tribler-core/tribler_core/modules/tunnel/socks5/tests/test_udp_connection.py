@@ -1,3 +1,7 @@
+import socket
+from asyncio import sleep
+from unittest.mock import Mock
+
 import pytest
 
 from tribler_core.modules.tunnel.socks5.udp_connection import SocksUDPConnection
@@ -37,3 +41,28 @@ def test_send_diagram(connection):
     assert connection.send_datagram(b'a')
     connection.remote_udp_address = None
     assert not connection.send_datagram(b'a')
+
+
+@pytest.mark.asyncio
+async def test_datagram_burst(connection):
+    """
+    Test whether the datagrams that are waiting in the socket are handled in a single burst
+    """
+    connection.socksconnection = Mock()
+    on_socks5_udp_data = connection.socksconnection.socksserver.output_stream.on_socks5_udp_data
+    connection.datagram_received = Mock(wraps=connection.datagram_received)
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        connection.remote_udp_address = sock.getsockname()
+        for index in range(10):
+            sock.sendto(b'\x00\x00\x00\x01\x01\x02\x03\x04\x1f\x90' + bytes([index]),
+                        ('127.0.0.1', connection.get_listen_port()))
+        for _ in range(10):
+            await sleep(0.01)
+            if on_socks5_udp_data.call_count == 10:
+                break
+
+    assert connection.datagram_received.call_count == 1
+    assert [call[0][1].data for call in on_socks5_udp_data.call_args_list] == [bytes([i]) for i in range(10)]
+    assert on_socks5_udp_data.call_args[0][1].destination == ('1.2.3.4', 8080)
@@ -1,9 +1,13 @@
 import logging
-from asyncio import DatagramProtocol, get_event_loop
+import socket
+from asyncio import DatagramProtocol, SelectorEventLoop, get_event_loop
 
 from ipv8.messaging.serialization import PackError
 
-from tribler_core.modules.tunnel.socks5.conversion import UdpPacket, socks5_serializer
+from tribler_core.modules.tunnel.socks5.conversion import decode_udp_packet
+
+UDP_BURST_SIZE = 64          # Maximum number of datagrams that are handled per event loop iteration
+MAX_UDP_DATAGRAM_SIZE = 65535
 
 
 class SocksUDPConnection(DatagramProtocol):
@@ -12,11 +16,22 @@ class SocksUDPConnection(DatagramProtocol):
         self._logger = logging.getLogger(self.__class__.__name__)
         self.socksconnection = socksconnection
         self.transport = None
+        self.sock = None
+        self.burst_size = UDP_BURST_SIZE
         self.remote_udp_address = remote_udp_address if remote_udp_address != ("0.0.0.0", 0) else None
 
     async def open(self):
-        self.transport, _ = await get_event_loop().create_datagram_endpoint(lambda: self,
-                                                                            local_addr=('0.0.0.0', 0))
+        loop = get_event_loop()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.bind(('0.0.0.0', 0))
+            self.transport, _ = await loop.create_datagram_endpoint(lambda: self, sock=self.sock)
+        except OSError:
+            self.sock.close()
+            raise
+        # We can only read from the socket ourselves if the event loop is selector based
+        if not isinstance(loop, SelectorEventLoop):
+            self.burst_size = 1
 
     def get_listen_port(self):
         _, port = self.transport.get_extra_info('sockname')
@@ -31,13 +46,32 @@ class SocksUDPConnection(DatagramProtocol):
             return False
 
     def datagram_received(self, data, source):
+        result = self.process_datagram(data, source)
+
+        # The event loop hands us a single datagram per iteration. We also handle the datagrams that are already
+        # waiting in the socket, which saves an iteration of the event loop for each of them.
+        for _ in range(self.burst_size - 1):
+            if not self.transport:
+                break
+            try:
+                data, source = self.sock.recvfrom(MAX_UDP_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self._logger.warning("Error while reading from the UDP socket: %s", e)
+                break
+            self.process_datagram(data, source)
+
+        return result
+
+    def process_datagram(self, data, source):
         # If remote_address was not set before, use first one
         if self.remote_udp_address is None:
             self.remote_udp_address = source
 
         if self.remote_udp_address == source:
             try:
-                request, _ = socks5_serializer.unpack_serializable(UdpPacket, data)
+                request = decode_udp_packet(data)
             except PackError:
                 self._logger.warning("Cannot serialize UDP packet")
                 return False
@@ -0,0 +1,116 @@
+"""
+Benchmark for the TunnelDispatcher. It pushes synthetic UDP datagrams from SOCKS5 sessions to many destinations
+through the dispatcher, and the same number of datagrams from the circuits back to the SOCKS5 sessions, while
+circuits break and are replaced.
+
+Usage: python benchmark_dispatcher.py [--datagrams 1000000] [--circuits 500] [--destinations 5000]
+"""
+import argparse
+import random
+import time
+
+from ipv8.messaging.anonymization.tunnel import CIRCUIT_STATE_CLOSING, CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA
+
+from tribler_core.modules.tunnel.community.dispatcher import TunnelDispatcher
+
+HOPS = 3
+CIRCUIT_CHURN = 1000  # A circuit breaks every so many datagrams
+
+
+class FakeCircuit:
+    def __init__(self, circuit_id, goal_hops):
+        self.circuit_id = circuit_id
+        self.goal_hops = goal_hops
+        self.ctype = CIRCUIT_TYPE_DATA
+        self.state = CIRCUIT_STATE_READY
+        self.peer = None
+
+
+class FakeTunnels:
+    def __init__(self):
+        self.circuits = {}
+        self.next_circuit_id = 0
+        self.sent = 0
+
+    def create_circuit(self, goal_hops):
+        self.next_circuit_id += 1
+        circuit = self.circuits[self.next_circuit_id] = FakeCircuit(self.next_circuit_id, goal_hops)
+        return circuit
+
+    def send_data(self, *_):
+        self.sent += 1
+
+
+class FakeUdpConnection:
+    def __init__(self, connection):
+        self.socksconnection = connection
+        self.remote_udp_address = ("127.0.0.1", 1234)
+        self.received = 0
+
+    def send_datagram(self, _):
+        self.received += 1
+
+
+class FakeSocksConnection:
+    def __init__(self, socksserver):
+        self.socksserver = socksserver
+        self.udp_connection = FakeUdpConnection(self)
+
+
+class FakeSocksServer:
+    def __init__(self):
+        self.sessions = []
+
+
+class FakeRequest:
+    def __init__(self, destination, data):
+        self.destination = destination
+        self.data = data
+
+
+def run(num_datagrams, num_circuits, num_destinations):
+    rand = random.Random(42)
+    tunnels = FakeTunnels()
+    dispatcher = TunnelDispatcher(tunnels)
+    dispatcher.cancel_all_pending_tasks()
+
+    socks_servers = [FakeSocksServer() for _ in range(HOPS)]
+    dispatcher.set_socks_servers(socks_servers)
+    connection = FakeSocksConnection(socks_servers[HOPS - 1])
+    socks_servers[HOPS - 1].sessions.append(connection)
+
+    for _ in range(num_circuits):
+        dispatcher.circuit_ready(tunnels.create_circuit(HOPS))
+
+    requests = [FakeRequest(("10.0.%d.%d" % divmod(index, 256), 6881), b'x' * 1024)
+                for index in range(num_destinations)]
+    circuits = list(tunnels.circuits.values())
+
+    start = time.perf_counter()
+    for index in range(num_datagrams):
+        dispatcher.on_socks5_udp_data(connection.udp_connection, requests[rand.randrange(num_destinations)])
+        dispatcher.on_incoming_from_tunnel(tunnels, circuits[rand.randrange(len(circuits))], ("10.0.0.1", 6881),
+                                           b'x' * 1024)
+        if index % CIRCUIT_CHURN == 0:
+            broken = circuits.pop(rand.randrange(len(circuits)))
+            dispatcher.circuit_dead(broken)
+            broken.state = CIRCUIT_STATE_CLOSING
+            tunnels.circuits.pop(broken.circuit_id)
+            circuit = tunnels.create_circuit(HOPS)
+            circuits.append(circuit)
+            dispatcher.circuit_ready(circuit)
+    duration = time.perf_counter() - start
+
+    total = 2 * num_datagrams
+    print(f"{num_circuits} circuits, {num_destinations} destinations: {total} datagrams in {duration:.2f}s "
+          f"({total / duration:.0f} datagrams/s, {duration / total * 1e6:.2f} us/datagram)")
+    print(f"Sent over circuits: {tunnels.sent}, delivered to SOCKS5: {connection.udp_connection.received}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datagrams", type=int, default=1000000)
+    parser.add_argument("--circuits", type=int, default=500)
+    parser.add_argument("--destinations", type=int, default=5000)
+    args = parser.parse_args()
+    run(args.datagrams, args.circuits, args.destinations)
@@ -0,0 +1,123 @@
+"""
+Benchmark for the SOCKS5 UDP datapath over loopback. A client sends SOCKS5 UDP packets to a SocksUDPConnection,
+which passes them through the TunnelDispatcher to a fake tunnel community that echoes the data back over the same
+circuit. The client keeps a window of packets in flight and measures the echoed throughput.
+
+Usage: python benchmark_socks5_udp.py [--packets 200000] [--size 1400] [--window 64] [--burst 64]
+"""
+import argparse
+import asyncio
+import time
+
+from ipv8.messaging.anonymization.tunnel import CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA
+
+from tribler_core.modules.tunnel.community.dispatcher import TunnelDispatcher
+from tribler_core.modules.tunnel.socks5.conversion import UdpPacket, socks5_serializer
+from tribler_core.modules.tunnel.socks5.udp_connection import SocksUDPConnection
+
+
+class FakeCircuit:
+    def __init__(self):
+        self.circuit_id = 1
+        self.goal_hops = 1
+        self.ctype = CIRCUIT_TYPE_DATA
+        self.state = CIRCUIT_STATE_READY
+        self.peer = None
+
+
+class EchoTunnels:
+    """
+    Sends the data that should go over a circuit straight back to the dispatcher.
+    """
+
+    def __init__(self):
+        self.circuit = FakeCircuit()
+        self.circuits = {self.circuit.circuit_id: self.circuit}
+        self.dispatcher = None
+
+    def send_data(self, _, __, destination, ___, data):
+        self.dispatcher.on_incoming_from_tunnel(self, self.circuit, destination, data)
+
+
+class FakeSocksServer:
+    def __init__(self, output_stream):
+        self.output_stream = output_stream
+        self.sessions = []
+
+
+class FakeSocksConnection:
+    def __init__(self, socksserver):
+        self.socksserver = socksserver
+        self.udp_connection = None
+
+
+class Client(asyncio.DatagramProtocol):
+
+    def __init__(self, packet, num_packets, window):
+        self.packet = packet
+        self.num_packets = num_packets
+        self.window = window
+        self.transport = None
+        self.sent = 0
+        self.received = 0
+        self.done = asyncio.get_event_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self):
+        while self.sent < self.num_packets and self.sent - self.received < self.window:
+            self.transport.sendto(self.packet)
+            self.sent += 1
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+        if self.received == self.num_packets:
+            self.done.set_result(None)
+        else:
+            self.send()
+
+
+async def run(num_packets, size, window, burst_size):
+    tunnels = EchoTunnels()
+    dispatcher = tunnels.dispatcher = TunnelDispatcher(tunnels)
+    socks_server = FakeSocksServer(dispatcher)
+    dispatcher.set_socks_servers([socks_server])
+    connection = FakeSocksConnection(socks_server)
+    socks_server.sessions.append(connection)
+    dispatcher.circuit_ready(tunnels.circuit)
+
+    udp_connection = connection.udp_connection = SocksUDPConnection(connection, ("0.0.0.0", 0))
+    await udp_connection.open()
+    udp_connection.burst_size = burst_size
+
+    packet = socks5_serializer.pack_serializable(UdpPacket(0, 0, ("127.0.0.1", 6881), b'x' * size))
+    transport, client = await asyncio.get_event_loop().create_datagram_endpoint(
+        lambda: Client(packet, num_packets, window), remote_addr=('127.0.0.1', udp_connection.get_listen_port()))
+
+    start = time.perf_counter()
+    client.send()
+    try:
+        # Packets may get lost on the loopback interface if the socket buffers overflow
+        await asyncio.wait_for(client.done, 60)
+    except asyncio.TimeoutError:
+        pass
+    duration = time.perf_counter() - start
+
+    print(f"Burst size {burst_size}: {client.received}/{num_packets} packets of {size} bytes echoed in "
+          f"{duration:.2f}s ({client.received / duration:.0f} packets/s, "
+          f"{client.received * size / duration / 1024 / 1024:.1f} MiB/s)")
+
+    transport.close()
+    udp_connection.close()
+    await dispatcher.shutdown_task_manager()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packets", type=int, default=200000)
+    parser.add_argument("--size", type=int, default=1400)
+    parser.add_argument("--window", type=int, default=64)
+    parser.add_argument("--burst", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(run(args.packets, args.size, args.window, args.burst))
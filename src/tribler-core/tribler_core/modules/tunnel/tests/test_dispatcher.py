@@ -1,6 +1,11 @@
 from unittest.mock import Mock
 
-from ipv8.messaging.anonymization.tunnel import CIRCUIT_STATE_EXTENDING, CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA
+from ipv8.messaging.anonymization.tunnel import (
+    CIRCUIT_STATE_CLOSING,
+    CIRCUIT_STATE_EXTENDING,
+    CIRCUIT_STATE_READY,
+    CIRCUIT_TYPE_DATA,
+)
 from ipv8.util import succeed
 
 import pytest
@@ -74,6 +79,7 @@ def test_on_socks_in_udp(dispatcher, mock_circuit):
     assert not dispatcher.on_socks5_udp_data(mock_udp_connection, mock_request)
 
     mock_circuit.state = CIRCUIT_STATE_READY
+    dispatcher.circuit_ready(mock_circuit)
 
     # Circuit ready, should be able to tunnel data
     assert dispatcher.on_socks5_udp_data(mock_udp_connection, mock_request)
@@ -123,9 +129,61 @@ def test_check_connections(dispatcher, mock_circuit):
     dispatcher.con_to_cir = {connection: {1: mock_circuit,
                                           2: mock_circuit,
                                           3: mock_circuit}}
-    dispatcher.cid_to_con = {mock_circuit.circuit_id: connection, 2: Mock()}
+    dispatcher.claim_circuit(mock_circuit, connection)
+    dispatcher.claim_circuit(Mock(circuit_id=2), Mock())
 
     dispatcher.check_connections()
     assert connection not in dispatcher.con_to_cir
+    assert connection not in dispatcher.con_to_cids
     assert mock_circuit.circuit_id not in dispatcher.cid_to_con
     assert 2 in dispatcher.cid_to_con
+
+
+def test_select_circuit(dispatcher):
+    """
+    Test whether only ready data circuits that are not claimed by another connection are selected
+    """
+    connection1, connection2 = Mock(), Mock()
+    dispatcher.set_socks_servers([connection1.socksserver])
+    connection2.socksserver = connection1.socksserver
+    request = Mock(destination=("1.2.3.4", 1024))
+    circuit1 = Mock(circuit_id=1, goal_hops=1, state=CIRCUIT_STATE_READY, ctype=CIRCUIT_TYPE_DATA)
+    circuit2 = Mock(circuit_id=2, goal_hops=1, state=CIRCUIT_STATE_READY, ctype=CIRCUIT_TYPE_DATA)
+    dispatcher.circuit_ready(circuit1)
+
+    assert dispatcher.select_circuit(connection1, request) is circuit1
+    assert dispatcher.cid_to_con[1] is connection1
+    assert dispatcher.con_to_cids[connection1] == {1}
+
+    # The circuit of connection1 is not used for connection2
+    assert dispatcher.pick_circuit(connection2, 1) is None
+    dispatcher.circuit_ready(circuit2)
+    assert dispatcher.pick_circuit(connection2, 1) is circuit2
+
+    # A closing circuit is dropped from the pool
+    circuit2.state = CIRCUIT_STATE_CLOSING
+    assert dispatcher.pick_circuit(connection2, 1) is None
+    assert not dispatcher.unclaimed_circuits[1]
+
+    # The circuits of a dead connection can be used by other connections
+    dispatcher.connection_dead(connection1)
+    assert dispatcher.pick_circuit(connection2, 1) is circuit1
+
+    dispatcher.circuit_dead(circuit1)
+    assert dispatcher.pick_circuit(connection2, 1) is None
+
+
+def test_on_tunnel_in_cached_connection(dispatcher):
+    """
+    Test whether the SOCKS5 session used for data from unknown circuits is remembered
+    """
+    mock_circuit = Mock(goal_hops=1, circuit_id=123, ctype=CIRCUIT_TYPE_DATA)
+    mock_session = Mock()
+    dispatcher.set_socks_servers([Mock(sessions=[Mock(udp_connection=None), mock_session])])
+
+    assert dispatcher.on_incoming_from_tunnel(dispatcher.tunnels, mock_circuit, ("0.0.0.0", 1024), b'a')
+    assert dispatcher.hops_to_con[1] is mock_session
+    # The remembered session is used, rather than the first session of the SOCKS5 server
+    dispatcher.socks_servers[0].sessions = [Mock()]
+    assert dispatcher.on_incoming_from_tunnel(dispatcher.tunnels, mock_circuit, ("0.0.0.0", 1024), b'a')
+    assert mock_session.udp_connection.send_datagram.call_count == 2
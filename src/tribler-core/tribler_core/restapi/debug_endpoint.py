@@ -42,6 +42,8 @@ class DebugEndpoint(RESTEndpoint):
 
     def setup_routes(self):
         self.app.add_routes([web.get('/circuits/slots', self.get_circuit_slots),
+                             web.get('/eva/transfers', self.get_eva_transfers),
+                             web.get('/health_checks', self.get_health_checks),
                              web.get('/open_files', self.get_open_files),
                              web.get('/open_sockets', self.get_open_sockets),
                              web.get('/threads', self.get_threads),
@@ -76,6 +78,69 @@ class DebugEndpoint(RESTEndpoint):
             }
         })
 
+    @docs(
+        tags=['Debug'],
+        summary="Return information about the current EVA transfers of the communities.",
+        responses={
+            200: {
+                'schema': schema(EVATransfersResponse={'transfers': [
+                    schema(EVATransfer={
+                        'community': String,
+                        'peer': String,
+                        'type': String,
+                        'nonce': Integer,
+                        'data_size': Integer,
+                        'transferred_size': Integer,
+                        'throughput': (Float, 'Bytes per second'),
+                        'window_size': Integer,
+                        'rtt': (Float, 'Smoothed round-trip time in seconds, measured on the incoming transfers only'),
+                        'min_rtt': Float,
+                        'attempt': Integer
+                    })
+                ]})
+            }
+        }
+    )
+    async def get_eva_transfers(self, request):
+        transfers = []
+        overlays = self.session.ipv8.overlays if self.session.ipv8 else []
+        for overlay in overlays:
+            eva_protocol = getattr(overlay, 'eva_protocol', None)
+            if not eva_protocol:
+                continue
+            community = overlay.__class__.__name__
+            transfers.extend(dict(stats, community=community) for stats in eva_protocol.get_transfers_stats())
+        return RESTResponse({"transfers": transfers})
+
+    @docs(
+        tags=['Debug'],
+        summary="Return the queue and throughput metrics of the torrent health check scheduler.",
+        responses={
+            200: {
+                'schema': schema(HealthChecksResponse={'health_checks': schema(HealthCheckStats={
+                    'queue_depth': Integer,
+                    'queued': schema(HealthChecksQueued={
+                        'user': Integer,
+                        'popular': Integer,
+                        'stale': Integer
+                    }),
+                    'in_flight': Integer,
+                    'max_in_flight': Integer,
+                    'tracker_requests': Integer,
+                    'max_in_flight_per_tracker': Integer,
+                    'completed': Integer,
+                    'failed': Integer,
+                    'throughput': (Float, 'Completed health checks per second'),
+                    'mean_wait_time': (Float, 'Mean time in seconds that a health check waited in the queue')
+                })})
+            }
+        }
+    )
+    async def get_health_checks(self, request):
+        torrent_checker = self.session.torrent_checker
+        stats = torrent_checker.health_check_scheduler.get_stats() if torrent_checker else {}
+        return RESTResponse({"health_checks": stats})
+
     @docs(
         tags=['Debug'],
         summary="Return information about files opened by Tribler.",
@@ -26,6 +26,41 @@ async def test_get_slots(enable_api, session):
     assert len(response_json["slots"]["random"]) == 4
 
 
+@pytest.mark.asyncio
+async def test_get_eva_transfers(enable_api, session):
+    """
+    Test whether we can get the stats of the EVA transfers from the API
+    """
+    stats = {'peer': 'aa', 'type': 'incoming', 'window_size': 16, 'rtt': 0.1}
+    eva_overlay = Mock()
+    eva_overlay.eva_protocol.get_transfers_stats = lambda: [stats]
+    session.ipv8 = Mock(overlays=[Mock(spec=[]), eva_overlay])
+    response_json = await do_request(session, 'debug/eva/transfers', expected_code=200)
+    session.ipv8 = None
+    assert response_json['transfers'] == [dict(stats, community='Mock')]
+
+
+@pytest.mark.asyncio
+async def test_get_eva_transfers_no_ipv8(enable_api, session):
+    """
+    Test whether the API returns no EVA transfers if IPv8 is not available
+    """
+    response_json = await do_request(session, 'debug/eva/transfers', expected_code=200)
+    assert response_json['transfers'] == []
+
+
+@pytest.mark.asyncio
+async def test_get_health_checks(enable_api, session):
+    """
+    Test whether we can get the metrics of the health check scheduler from the API
+    """
+    session.torrent_checker = Mock()
+    session.torrent_checker.health_check_scheduler.get_stats = lambda: {'queue_depth': 3, 'in_flight': 1}
+    response_json = await do_request(session, 'debug/health_checks', expected_code=200)
+    session.torrent_checker = None
+    assert response_json['health_checks'] == {'queue_depth': 3, 'in_flight': 1}
+
+
 @pytest.mark.asyncio
 async def test_get_open_files(enable_api, session, tmpdir):
     """
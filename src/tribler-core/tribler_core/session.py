@@ -311,9 +311,11 @@ class Session(TaskManager):
             channels_dir = self.config.get_chant_channels_dir()
             metadata_db_name = 'metadata.db' if not self.config.get_chant_testnet() else 'metadata_testnet.db'
             database_path = self.config.get_state_dir() / 'sqlite' / metadata_db_name
+            verification_workers = self.config.get_chant_signature_verification_workers()
             self.mds = MetadataStore(database_path, channels_dir, self.trustchain_keypair,
                                      notifier=self.notifier,
-                                     disable_sync=self.core_test_mode)
+                                     disable_sync=self.core_test_mode,
+                                     signature_verification_workers=verification_workers)
             if self.core_test_mode:
                 generate_test_channels(self.mds)
 
@@ -176,6 +176,23 @@ async def test_upgrade_pony_10to11(upgrader, session):
         assert int(mds.MiscData.get(name="db_version").value) == 11
     mds.shutdown()
 
+@pytest.mark.asyncio
+async def test_upgrade_pony_11to12(upgrader, session):
+    old_db_sample = TESTS_DATA_DIR / 'upgrade_databases' / 'pony_v10.db'
+    database_path = session.config.get_state_dir() / 'sqlite' / 'metadata.db'
+    shutil.copyfile(old_db_sample, database_path)
+
+    upgrader.upgrade_pony_db_10to11()
+    upgrader.upgrade_pony_db_11to12()
+    channels_dir = session.config.get_chant_channels_dir()
+    mds = MetadataStore(database_path, channels_dir, session.trustchain_keypair)
+    with db_session:
+        # pylint: disable=protected-access
+        assert list(mds._db.execute('PRAGMA index_info("idx_torrentstate__last_check_seeders")'))
+        assert list(mds._db.execute('PRAGMA index_info("idx_torrentstate__self_checked_last_check")'))
+        assert int(mds.MiscData.get(name="db_version").value) == 12
+    mds.shutdown()
+
 def test_calc_progress():
     EPSILON = 0.001
     assert calc_progress(0) == pytest.approx(0.0, abs=EPSILON)
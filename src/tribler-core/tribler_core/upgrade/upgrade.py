@@ -95,6 +95,7 @@ class TriblerUpgrader:
         self.upgrade_pony_db_7to8()
         await self.upgrade_pony_db_8to10()
         self.upgrade_pony_db_10to11()
+        self.upgrade_pony_db_11to12()
         convert_config_to_tribler74(self.session.config.get_state_dir())
         convert_config_to_tribler75(self.session.config.get_state_dir())
         convert_config_to_tribler76(self.session.config.get_state_dir())
@@ -116,6 +117,22 @@ class TriblerUpgrader:
         self.do_upgrade_pony_db_10to11(mds)
         mds.shutdown()
 
+    def upgrade_pony_db_11to12(self):
+        """
+        Upgrade GigaChannel DB from version 11 to version 12.
+        Version 12 adds the indexes on the TorrentState table that are used
+        to select the torrents to check.
+        """
+        # We have to create the Metadata Store object because Session-managed Store has not been started yet
+        database_path = self.session.config.get_state_dir() / 'sqlite' / 'metadata.db'
+        channels_dir = self.session.config.get_chant_channels_dir()
+        if not database_path.exists():
+            return
+        mds = MetadataStore(database_path, channels_dir, self.session.trustchain_keypair,
+                            disable_sync=True, check_tables=False)
+        self.do_upgrade_pony_db_11to12(mds)
+        mds.shutdown()
+
     def upgrade_bw_accounting_db_8to9(self):
         """
         Upgrade the database with bandwidth accounting information from 8 to 9.
@@ -167,6 +184,31 @@ class TriblerUpgrader:
             db_version = mds.MiscData.get(name="db_version")
             db_version.value = str(to_version)
 
+    def do_upgrade_pony_db_11to12(self, mds):
+        from_version = 11
+        to_version = 12
+
+        indexes = {
+            "idx_torrentstate__last_check_seeders": ("last_check", "seeders"),
+            "idx_torrentstate__self_checked_last_check": ("self_checked", "last_check"),
+        }
+
+        with db_session:
+            db_version = mds.MiscData.get(name="db_version")
+            if int(db_version.value) != from_version:
+                return
+
+            # pylint: disable=protected-access
+            for index_name, columns in indexes.items():
+                # Just in case, we skip index creation if it is somehow already there
+                if not list(mds._db.execute(f'PRAGMA index_info("{index_name}")')):
+                    columns_sql = ", ".join(f'"{column}"' for column in columns)
+                    sql = f'CREATE INDEX "{index_name}" ON "TorrentState" ({columns_sql})'
+                    mds._db.execute(sql)
+
+            db_version = mds.MiscData.get(name="db_version")
+            db_version.value = str(to_version)
+
     async def upgrade_pony_db_8to10(self):
         """
         Upgrade GigaChannel DB from version 8 (7.5.x) to version 10 (7.6.x).
@@ -192,6 +234,10 @@ class TriblerUpgrader:
         with db_session(ddl=True):
             mds.drop_indexes()
             mds.drop_fts_triggers()
+            # The counters and the autocompletion terms are recreated from the upgraded data
+            # when the database is opened next time
+            mds.drop_count_tables()
+            mds.drop_terms_index()
         mds.shutdown()
 
         self._pony2pony = PonyToPonyMigration(database_path, tmp_database_path, self.update_status, logger=self._logger)
@@ -394,12 +394,14 @@ class ChannelContentsWidget(AddBreadcrumbOnShowMixin, widget_form, widget_class)
 
         if "total" in self.model.channel_info:
             self.channel_num_torrents_label.setHidden(False)
+            # Estimated totals (e.g. for search queries with too many matches) are shown as "1000+"
+            total = str(self.model.channel_info['total'])
+            if not self.model.channel_info.get('total_exact', True):
+                total += "+"
             if "torrents" in self.model.channel_info:
-                self.channel_num_torrents_label.setText(
-                    f"{self.model.channel_info['total']}/{self.model.channel_info['torrents']} items"
-                )
+                self.channel_num_torrents_label.setText(f"{total}/{self.model.channel_info['torrents']} items")
             else:
-                self.channel_num_torrents_label.setText(f"{self.model.channel_info['total']} items")
+                self.channel_num_torrents_label.setText(f"{total} items")
         else:
             self.channel_num_torrents_label.setHidden(True)
 
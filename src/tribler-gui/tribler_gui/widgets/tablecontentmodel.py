@@ -207,6 +207,7 @@ class RemoteTableModel(QAbstractTableModel):
             self.add_items(response['results'], on_top=remote or on_top)
             if "total" in response:
                 self.channel_info["total"] = response["total"]
+                self.channel_info["total_exact"] = response.get("total_exact", True)
                 update_labels = True
             elif remote and uuid.UUID(response.get('uuid')) == CHANNELS_VIEW_UUID:
                 # This is a discovered channel (from a remote peer), update the total number of channels and the labels